@@ -0,0 +1,194 @@
+"""
+Модуль уровней деградации обслуживания при перегрузке.
+
+Когда очередь генерации глубока, лучше отдать чуть более дешёвую речь, чем
+ответить по таймауту. Уровни деградации (degradation_tiers в
+ai/serving_parameters.py) перечисляются по возрастанию тяжести; действует
+самый тяжёлый уровень, порог которого достигнут. Порог - глубина очереди
+(queue_depth) и/или ожидаемое время ожидания в очереди (predicted_wait_s).
+Каждый уровень задаёт все свои действия:
+- do_sample: False - жадное декодирование вместо семплирования;
+- max_new_tokens: более короткий лимит новых токенов;
+- model: генерация меньшей моделью реестра (если запрос не указал модель сам);
+- use_cache: ответ из кэша ответов, если недавно генерировалась речь
+  для близкого запроса (ai/response_cache.py).
+
+Пример:
+    degradation_tiers = [
+        {"name": "greedy", "queue_depth": 8, "do_sample": False},
+        {"name": "short", "queue_depth": 16, "do_sample": False, "max_new_tokens": 1024},
+        {"name": "small", "predicted_wait_s": 120, "do_sample": False, "max_new_tokens": 1024,
+         "model": "phi-3-mini-small", "use_cache": True}
+    ]
+"""
+
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from schemas.model import SpeechRequest
+
+# Уровень без деградации
+NORMAL_TIER = "normal"
+
+
+@dataclass
+class DegradationTier:
+
+    """
+    Уровень деградации: порог срабатывания и удешевления генерации.
+
+    Attributes:
+        name (str): Имя уровня, которым помечаются ответы.
+        queue_depth (Optional[int]): Глубина очереди, с которой уровень действует.
+        predicted_wait_s (Optional[float]): Ожидаемое время ожидания в очереди, с которого уровень действует.
+        do_sample (Optional[bool]): Режим декодирования запросов уровня (False - жадное).
+        max_new_tokens (Optional[int]): Лимит новых токенов запросов уровня.
+        model (Optional[str]): Модель реестра для запросов, не указавших модель.
+        use_cache (bool): Отдавать ответ из кэша ответов, если есть близкий запрос.
+    """
+
+    name: str
+    queue_depth: Optional[int] = None
+    predicted_wait_s: Optional[float] = None
+    do_sample: Optional[bool] = None
+    max_new_tokens: Optional[int] = None
+    model: Optional[str] = None
+    use_cache: bool = False
+
+    def __post_init__(self):
+        if self.queue_depth is None and self.predicted_wait_s is None:
+            raise ValueError(f"У уровня деградации '{self.name}' не задан порог queue_depth или predicted_wait_s")
+
+    def triggered(self, queue_depth: int, predicted_wait_s: float) -> bool:
+        """Достигнут ли порог уровня."""
+        return (
+            (self.queue_depth is not None and queue_depth >= self.queue_depth)
+            or (self.predicted_wait_s is not None and predicted_wait_s >= self.predicted_wait_s)
+        )
+
+    def apply(self, request: SpeechRequest) -> SpeechRequest:
+
+        """
+        Удешевляет запрос по действиям уровня.
+
+        Собственные параметры запроса только ужесточаются: более короткий лимит
+        токенов запроса сохраняется.
+
+        Args:
+            request (SpeechRequest): Исходный запрос.
+
+        Returns:
+            SpeechRequest: Копия запроса с параметрами уровня.
+        """
+
+        update = {}
+        if self.do_sample is not None:
+            update["do_sample"] = self.do_sample
+        if self.max_new_tokens is not None:
+            update["max_new_tokens"] = min(self.max_new_tokens, request.max_new_tokens or self.max_new_tokens)
+        if self.model is not None and request.model is None:
+            update["model"] = self.model
+        return request.model_copy(update=update)
+
+
+@dataclass
+class DegradationStats:
+
+    """
+    Метрики уровней деградации.
+
+    Attributes:
+        tier (str): Текущий уровень.
+        since (float): Время перехода на текущий уровень (Unix time, секунды).
+        requests (Dict[str, int]): Количество запросов, обслуженных на каждом уровне.
+        transitions (Dict[str, int]): Количество переходов между уровнями: "из->в" -> количество.
+        cache_hits (int): Количество ответов из кэша ответов.
+    """
+
+    tier: str
+    since: float
+    requests: Dict[str, int] = field(default_factory=dict)
+    transitions: Dict[str, int] = field(default_factory=dict)
+    cache_hits: int = 0
+
+
+class DegradationPolicy:
+
+    """
+    Выбор уровня деградации для очередного запроса и учёт переходов между уровнями.
+
+    Attributes:
+        tiers (List[DegradationTier]): Уровни по возрастанию тяжести.
+    """
+
+    def __init__(self, tiers: List[DegradationTier]):
+        self.tiers = list(tiers)
+        self._stats = DegradationStats(tier=NORMAL_TIER, since=time.time())
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, tiers: List[dict]) -> "DegradationPolicy":
+
+        """
+        Создаёт политику из описаний уровней в формате degradation_tiers.
+
+        Raises:
+            ValueError: Если описание уровня некорректно.
+        """
+
+        try:
+            return cls([DegradationTier(**tier) for tier in tiers])
+        except TypeError as e:
+            raise ValueError(f"Некорректное описание уровня деградации: {e}")
+
+    @property
+    def uses_cache(self) -> bool:
+        """Отдаёт ли какой-либо уровень ответы из кэша ответов."""
+        return any(tier.use_cache for tier in self.tiers)
+
+    def select(self, queue_depth: int, predicted_wait_s: float) -> Optional[DegradationTier]:
+
+        """
+        Выбирает уровень для запроса по текущей нагрузке и учитывает его.
+
+        Args:
+            queue_depth (int): Количество запросов, ожидающих генерации.
+            predicted_wait_s (float): Ожидаемое время ожидания в очереди, в секундах.
+
+        Returns:
+            Optional[DegradationTier]: Самый тяжёлый сработавший уровень или None без деградации.
+        """
+
+        selected = None
+        for tier in self.tiers:
+            if tier.triggered(queue_depth, predicted_wait_s):
+                selected = tier
+        name = selected.name if selected is not None else NORMAL_TIER
+
+        with self._lock:
+            stats = self._stats
+            if name != stats.tier:
+                transition = f"{stats.tier}->{name}"
+                stats.transitions[transition] = stats.transitions.get(transition, 0) + 1
+                stats.tier, stats.since = name, time.time()
+                print(f"Уровень деградации: {transition} (очередь {queue_depth}, ожидание {predicted_wait_s:.0f} с)")
+            stats.requests[name] = stats.requests.get(name, 0) + 1
+        return selected
+
+    def record_cache_hit(self):
+        with self._lock:
+            self._stats.cache_hits += 1
+
+    def stats(self) -> DegradationStats:
+        """Возвращает копию метрик уровней деградации."""
+        with self._lock:
+            stats = self._stats
+            return DegradationStats(
+                tier=stats.tier,
+                since=stats.since,
+                requests=dict(stats.requests),
+                transitions=dict(stats.transitions),
+                cache_hits=stats.cache_hits
+            )
@@ -0,0 +1,230 @@
+"""
+Модуль пакетных заданий на генерацию речей.
+
+Пакетное задание - это набор запросов SpeechRequest, загруженный одним JSONL-файлом.
+Все запросы задания ставятся в общую очередь генерации и обрабатываются батчами,
+а результаты накапливаются в порядке готовности для потоковой выдачи клиенту.
+
+При остановке экземпляра (drain.py) ещё не начатые запросы заданий можно
+передать в JSONL-файл (handoff): его принимают POST /api/jobs другого
+экземпляра и batch_cli.py.
+
+Завершённые задания вместе с результатами хранятся jobs_ttl_s секунд и не
+больше jobs_max_retained штук (ai/serving_parameters.py), после чего
+удаляются; идентификаторы недавно удалённых заданий запоминаются, чтобы
+отличать истёкшее задание от несуществующего.
+"""
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+from ai.scheduler import GenerationScheduler
+from schemas.model import SpeechRequest
+import ai.serving_parameters as serving_parameters
+
+
+class BatchJob:
+
+    """
+    Состояние одного пакетного задания.
+
+    Attributes:
+        job_id (str): Уникальный идентификатор задания.
+        total (int): Общее количество запросов в задании.
+        completed (int): Количество успешно сгенерированных речей.
+        failed (int): Количество запросов, завершившихся ошибкой.
+        results (List[dict]): Строки результатов в порядке готовности,
+            каждая вида {"index": 0, "speech": "..."} или {"index": 0, "error": "..."}.
+        speeches (List[Optional[str]]): Речи по номеру запроса (None - ещё нет или ошибка);
+            по их статистике сверяется расход квоты задания.
+        finished_at (Optional[float]): Момент завершения задания по time.monotonic.
+        on_finished (Optional[Callable[[BatchJob], None]]): Вызывается по завершении задания.
+    """
+
+    def __init__(self, total: int):
+        self.job_id = uuid.uuid4().hex
+        self.total = total
+        self.completed = 0
+        self.failed = 0
+        self.results: List[dict] = []
+        self.speeches: List[Optional[str]] = [None] * total
+        self.finished_at: Optional[float] = None
+        self.on_finished: Optional[Callable[["BatchJob"], None]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        """Признак того, что все запросы задания обработаны."""
+        return self.completed + self.failed >= self.total
+
+    @property
+    def status(self) -> str:
+        """Статус задания: queued, running или completed."""
+        if self.done:
+            return "completed"
+        return "running" if self.results else "queued"
+
+    def record(self, index: int, speech: Optional[str] = None, error: Optional[str] = None) -> bool:
+
+        """
+        Сохраняет результат одного запроса задания.
+
+        Args:
+            index (int): Номер запроса в исходном JSONL (с нуля).
+            speech (Optional[str]): Текст речи при успешной генерации.
+            error (Optional[str]): Текст ошибки, если генерация не удалась.
+
+        Returns:
+            bool: Завершил ли этот результат задание.
+        """
+
+        # Результат добавляется раньше счётчика: завершённое задание всегда содержит все строки
+        with self._lock:
+            if error is None:
+                self.results.append({"index": index, "speech": speech})
+                self.speeches[index] = speech
+                self.completed += 1
+            else:
+                self.results.append({"index": index, "error": error})
+                self.failed += 1
+            if self.done:
+                self.finished_at = time.monotonic()
+            return self.done
+
+
+class JobManager:
+
+    """
+    Реестр пакетных заданий, хранящихся в памяти процесса.
+
+    Attributes:
+        scheduler (GenerationScheduler): Очередь генерации, в которую ставятся запросы.
+    """
+
+    def __init__(self, scheduler: GenerationScheduler):
+        self.scheduler = scheduler
+        self._jobs: Dict[str, BatchJob] = {}
+        self._expired: OrderedDict[str, None] = OrderedDict()
+        self._pending: Dict[Future, int] = {}
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        requests: List[SpeechRequest],
+        models: List[object],
+        on_finished: Optional[Callable[[BatchJob], None]] = None
+    ) -> BatchJob:
+
+        """
+        Создаёт задание и ставит все его запросы в очередь генерации.
+
+        Args:
+            requests (List[SpeechRequest]): Запросы задания.
+            models (List[object]): Ключ модели для каждого запроса.
+            on_finished (Optional[Callable[[BatchJob], None]]): Вызывается один раз,
+                когда обработан последний запрос задания (в потоке генерации).
+
+        Returns:
+            BatchJob: Созданное задание.
+        """
+
+        job = BatchJob(total=len(requests))
+        job.on_finished = on_finished
+        with self._lock:
+            self._evict()
+            self._jobs[job.job_id] = job
+        for index, (request, model) in enumerate(zip(requests, models)):
+            future = self.scheduler.submit(model, request)
+            with self._lock:
+                self._pending[future] = index
+            future.add_done_callback(lambda f, index=index: self._on_done(job, index, f))
+        return job
+
+    def handoff(self, path: str) -> int:
+
+        """
+        Забирает из очереди ещё не начатые запросы заданий и дописывает их в JSONL-файл.
+
+        Каждая строка файла - исходный SpeechRequest. Переданные запросы
+        завершаются в своих заданиях ошибкой со ссылкой на файл.
+
+        Args:
+            path (str): JSONL-файл для переданных запросов.
+
+        Returns:
+            int: Количество переданных запросов.
+        """
+
+        with self._lock:
+            futures = list(self._pending)
+        withdrawn = self.scheduler.withdraw(futures)
+        if not withdrawn:
+            return 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            for _, request, _ in withdrawn:
+                f.write(request.model_dump_json(exclude_unset=True) + "\n")
+        for _, _, future in withdrawn:
+            future.set_exception(RuntimeError(f"Запрос передан в {path} при остановке экземпляра"))
+        return len(withdrawn)
+
+    def get(self, job_id: str) -> Optional[BatchJob]:
+
+        """
+        Возвращает задание по идентификатору.
+
+        Args:
+            job_id (str): Идентификатор задания.
+
+        Returns:
+            Optional[BatchJob]: Задание или None, если оно не найдено или уже удалено.
+        """
+
+        with self._lock:
+            self._evict()
+            return self._jobs.get(job_id)
+
+    def expired(self, job_id: str) -> bool:
+        """Признак того, что задание было, но удалено по истечении срока хранения."""
+        with self._lock:
+            return job_id in self._expired
+
+    def _evict(self):
+        # Вызывается под self._lock. Удаляются завершённые задания старше jobs_ttl_s,
+        # затем самые давние завершённые сверх jobs_max_retained
+        finished = sorted(
+            (job for job in self._jobs.values() if job.finished_at is not None), key=lambda job: job.finished_at
+        )
+        deadline = time.monotonic() - serving_parameters.jobs_ttl_s
+        excess = len(finished) - serving_parameters.jobs_max_retained
+        for position, job in enumerate(finished):
+            if job.finished_at > deadline and position >= excess:
+                break
+            del self._jobs[job.job_id]
+            self._expired[job.job_id] = None
+        # Список удалённых идентификаторов тоже ограничен
+        while len(self._expired) > 10 * max(serving_parameters.jobs_max_retained, 1):
+            self._expired.popitem(last=False)
+
+    def _on_done(self, job: BatchJob, index: int, future):
+        with self._lock:
+            self._pending.pop(future, None)
+        if future.cancelled():
+            finished = job.record(index, error="Генерация отменена")
+        elif future.exception() is not None:
+            finished = job.record(index, error=str(future.exception()))
+        else:
+            finished = job.record(index, speech=future.result())
+        if finished and job.on_finished is not None:
+            try:
+                job.on_finished(job)
+            except Exception as e:
+                print(f"Ошибка завершения задания {job.job_id}: {e}")
@@ -0,0 +1,152 @@
+"""
+Модуль предсказания длины ответа модели.
+
+Очередь генерации (ai/scheduler.py) упорядочивает запросы по ожидаемой
+стоимости, чтобы короткие речи не ждали за длинными докладами. Стоимость -
+ожидаемое количество сгенерированных токенов; LengthPredictor учится ему
+на завершённых запросах, без предварительного обучения.
+
+Признаки запроса: стиль, длительность, язык и количество ключевых моментов.
+Для сочетания признаков, которое ещё не встречалось, используется более
+общая оценка: сначала по языку - токенов на минуту речи, затем по всем
+запросам, затем априорная length_prior_tokens_per_minute
+(ai/serving_parameters.py).
+"""
+
+import threading
+from dataclasses import dataclass
+from typing import Dict, Tuple
+
+from schemas.model import SpeechRequest
+import ai.model_parameters as model_parameters
+import ai.serving_parameters as serving_parameters
+
+# Ключевых моментов больше этого числа считаются одним значением признака
+_MAX_KEY_POINTS = 10
+
+
+@dataclass
+class PredictorStats:
+
+    """
+    Точность предсказаний длины ответа.
+
+    Attributes:
+        observations (int): Количество завершённых запросов, на которых учился предсказатель.
+        keys (int): Количество различных сочетаний признаков.
+        mean_absolute_error (float): Средняя абсолютная ошибка предсказания, в токенах.
+        mean_absolute_percentage_error (float): Средняя абсолютная ошибка относительно
+            фактической длины, в процентах.
+        recent_absolute_error (float): Экспоненциально сглаженная абсолютная ошибка
+            последних предсказаний, в токенах.
+    """
+
+    observations: int
+    keys: int
+    mean_absolute_error: float
+    mean_absolute_percentage_error: float
+    recent_absolute_error: float
+
+
+class LengthPredictor:
+
+    """
+    Онлайн-предсказатель количества сгенерированных токенов запроса.
+
+    Каждая оценка - экспоненциальное скользящее среднее: недавние запросы
+    весят больше, поэтому предсказатель следует за сменой параметров генерации.
+
+    Attributes:
+        smoothing (float): Вес нового наблюдения в скользящих средних.
+    """
+
+    def __init__(self, smoothing: float = 0.2):
+        self.smoothing = smoothing
+        self._tokens: Dict[Tuple[str, int, str, int], float] = {}
+        self._tokens_per_minute: Dict[str, float] = {}
+        self._global_tokens_per_minute = None
+        self._observations = 0
+        self._absolute_error = 0.0
+        self._percentage_error = 0.0
+        self._recent_error = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def features(request: SpeechRequest) -> Tuple[str, int, str, int]:
+        """Признаки запроса: стиль, длительность, язык и количество ключевых моментов."""
+        key_points = min(len(request.key_points or []), _MAX_KEY_POINTS)
+        return request.style, request.duration_minutes, request.language, key_points
+
+    def _average(self, previous, value: float) -> float:
+        return value if previous is None else previous + self.smoothing * (value - previous)
+
+    def predict(self, request: SpeechRequest) -> float:
+
+        """
+        Предсказывает количество сгенерированных токенов одного варианта речи.
+
+        Args:
+            request (SpeechRequest): Запрос с параметрами речи.
+
+        Returns:
+            float: Ожидаемое количество токенов, не больше лимита max_new_tokens (общего и запроса).
+        """
+
+        features = self.features(request)
+        with self._lock:
+            tokens = self._tokens.get(features)
+            if tokens is None:
+                tokens_per_minute = self._tokens_per_minute.get(request.language, self._global_tokens_per_minute)
+                if tokens_per_minute is None:
+                    tokens_per_minute = serving_parameters.length_prior_tokens_per_minute
+                tokens = tokens_per_minute * request.duration_minutes
+        limit = model_parameters.max_new_tokens
+        if request.max_new_tokens is not None:
+            limit = min(limit, request.max_new_tokens)
+        return min(tokens, limit)
+
+    def observe(self, request: SpeechRequest, completion_tokens: int):
+
+        """
+        Учится на завершённом запросе и учитывает ошибку своего предсказания.
+
+        Args:
+            request (SpeechRequest): Запрос с параметрами речи.
+            completion_tokens (int): Фактическое количество сгенерированных токенов.
+        """
+
+        error = abs(self.predict(request) - completion_tokens)
+        features = self.features(request)
+        tokens_per_minute = completion_tokens / max(1, request.duration_minutes)
+        with self._lock:
+            self._observations += 1
+            self._absolute_error += error
+            self._percentage_error += error / max(1, completion_tokens)
+            self._recent_error = self._average(self._recent_error, error)
+
+            self._tokens[features] = self._average(self._tokens.get(features), completion_tokens)
+            self._tokens_per_minute[request.language] = self._average(
+                self._tokens_per_minute.get(request.language), tokens_per_minute
+            )
+            self._global_tokens_per_minute = self._average(self._global_tokens_per_minute, tokens_per_minute)
+
+    def stats(self) -> PredictorStats:
+
+        """
+        Возвращает точность предсказаний на завершённых запросах.
+
+        Ошибка каждого запроса считается по предсказанию, сделанному до того,
+        как предсказатель узнал его фактическую длину.
+        """
+
+        with self._lock:
+            observations = self._observations
+            return PredictorStats(
+                observations=observations,
+                keys=len(self._tokens),
+                mean_absolute_error=round(self._absolute_error / observations, 1) if observations else 0.0,
+                mean_absolute_percentage_error=(
+                    round(100 * self._percentage_error / observations, 1) if observations else 0.0
+                ),
+                recent_absolute_error=round(self._recent_error or 0.0, 1)
+            )
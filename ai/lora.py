@@ -0,0 +1,284 @@
+"""
+Модуль LoRA-адаптеров стилей поверх одной базовой модели.
+
+Стиль выступления может ссылаться на небольшой LoRA-адаптер
+(serving_parameters.style_adapters): вместо описания стиля в промпте модель
+получает добавку к весам, обученную на речах этого стиля. Адаптеры читаются
+в формате PEFT (adapter_config.json и adapter_model.safetensors), но
+применяются без peft: на целевые линейные слои модели ставится хук
+MultiLoRAHook, который к выходу слоя прибавляет x·Aᵀ·Bᵀ·scale только для
+строк батча своего адаптера. Поэтому запросы разных стилей генерируются
+одним батчем, а веса, состав модулей и state_dict базовой модели не меняются.
+
+В памяти держится не больше lora_max_adapters адаптеров; давно не
+использованный адаптер выгружается при загрузке нового (LRU).
+"""
+
+import json
+import math
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import torch
+from torch import nn
+from safetensors.torch import load_file
+
+ADAPTER_CONFIG_FILE = "adapter_config.json"
+ADAPTER_WEIGHTS_FILE = "adapter_model.safetensors"
+# Префикс имён весов в адаптерах PEFT перед именем модуля базовой модели
+PEFT_PREFIX = "base_model.model."
+
+
+@dataclass
+class LoRAAdapter:
+
+    """
+    Веса LoRA-адаптера.
+
+    Attributes:
+        path (str): Каталог адаптера.
+        scaling (float): Множитель добавки: lora_alpha / r (lora_alpha / √r при use_rslora).
+        modules (Dict[str, Tuple[torch.Tensor, torch.Tensor]]): Имя линейного слоя
+            базовой модели -> матрицы A (r × in) и B (out × r).
+        base_model (Optional[str]): Базовая модель, для которой обучен адаптер.
+    """
+
+    path: str
+    scaling: float
+    modules: Dict[str, Tuple[torch.Tensor, torch.Tensor]] = field(default_factory=dict)
+    base_model: Optional[str] = None
+
+    @property
+    def nbytes(self) -> int:
+        """Объём весов адаптера в байтах."""
+        return sum(a.nbytes + b.nbytes for a, b in self.modules.values())
+
+
+def read_adapter_config(path: str) -> dict:
+    """Читает adapter_config.json адаптера."""
+    with open(os.path.join(path, ADAPTER_CONFIG_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_adapter(path: str) -> LoRAAdapter:
+
+    """
+    Загружает LoRA-адаптер в формате PEFT.
+
+    Args:
+        path (str): Каталог с adapter_config.json и adapter_model.safetensors.
+
+    Returns:
+        LoRAAdapter: Веса адаптера по слоям базовой модели.
+
+    Raises:
+        ValueError: Если адаптер не LoRA или у слоя нет одной из матриц A и B.
+    """
+
+    config = read_adapter_config(path)
+    if config.get("peft_type", "LORA") != "LORA":
+        raise ValueError(f"Адаптер {path}: поддерживаются только LoRA-адаптеры, а не {config['peft_type']}")
+    rank = config["r"]
+    alpha = config.get("lora_alpha", rank)
+    scaling = alpha / math.sqrt(rank) if config.get("use_rslora") else alpha / rank
+
+    pairs: Dict[str, Dict[str, torch.Tensor]] = {}
+    for key, tensor in load_file(os.path.join(path, ADAPTER_WEIGHTS_FILE)).items():
+        name = key[len(PEFT_PREFIX):] if key.startswith(PEFT_PREFIX) else key
+        for matrix in ("lora_A", "lora_B"):
+            # Имена вида <модуль>.lora_A.weight или <модуль>.lora_A.<имя адаптера>.weight
+            marker = f".{matrix}."
+            if marker in name:
+                pairs.setdefault(name.split(marker)[0], {})[matrix] = tensor
+    modules = {}
+    for name, pair in pairs.items():
+        if set(pair) != {"lora_A", "lora_B"}:
+            raise ValueError(f"Адаптер {path}: у слоя {name} нет одной из матриц lora_A, lora_B")
+        modules[name] = (pair["lora_A"], pair["lora_B"])
+    return LoRAAdapter(path=path, scaling=scaling, modules=modules, base_model=config.get("base_model_name_or_path"))
+
+
+class _RowPlan:
+    """Какие адаптеры применяются к строкам текущего батча; общий для всех хуков модели."""
+
+    def __init__(self):
+        # [(адаптер, индексы строк или None - все строки)]
+        self.groups: List[Tuple[str, Optional[torch.Tensor]]] = []
+
+
+class MultiLoRAHook:
+
+    """
+    Хук прямого прохода линейного слоя: добавки нескольких LoRA-адаптеров по строкам батча.
+
+    Attributes:
+        layer (nn.Linear): Слой модели, на который установлен хук.
+        adapters (Dict[str, Tuple[torch.Tensor, torch.Tensor, float]]): Загруженные
+            адаптеры этого слоя: A, B и множитель.
+    """
+
+    def __init__(self, layer: nn.Linear, plan: _RowPlan):
+        self.layer = layer
+        self.adapters: Dict[str, Tuple[torch.Tensor, torch.Tensor, float]] = {}
+        self._plan = plan
+        self.handle = layer.register_forward_hook(self)
+
+    def __call__(self, layer: nn.Linear, inputs: Tuple[torch.Tensor, ...], output: torch.Tensor) -> torch.Tensor:
+        x = inputs[0]
+        for name, rows in self._plan.groups:
+            if name not in self.adapters:
+                continue
+            a, b, scaling = self.adapters[name]
+            if rows is None:
+                output = output + nn.functional.linear(nn.functional.linear(x, a), b) * scaling
+            else:
+                rows = rows.to(x.device)
+                delta = nn.functional.linear(nn.functional.linear(x.index_select(0, rows), a), b) * scaling
+                output = output.index_add(0, rows, delta)
+        return output
+
+
+class AdapterManager:
+
+    """
+    LRU загруженных LoRA-адаптеров одной модели и их применение к батчу.
+
+    Attributes:
+        model (nn.Module): Базовая модель.
+        model_name (str): Идентификатор базовой модели; адаптеры, обученные
+            для другой модели, не применяются.
+        capacity (int): Максимальное количество адаптеров в памяти.
+        loads (int): Загрузки адаптеров с диска.
+        hits (int): Использования уже загруженных адаптеров.
+        evictions (int): Выгрузки адаптеров из памяти.
+    """
+
+    def __init__(
+        self,
+        model: nn.Module,
+        model_name: str,
+        capacity: int,
+        loader: Callable[[str], LoRAAdapter] = load_adapter
+    ):
+        self.model = model
+        self.model_name = model_name
+        self.capacity = capacity
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+        self._loader = loader
+        self._plan = _RowPlan()
+        self._layers: Dict[str, MultiLoRAHook] = {}
+        self._loaded: "OrderedDict[str, LoRAAdapter]" = OrderedDict()
+        self._compatible: Dict[str, bool] = {}
+        self._lock = threading.RLock()
+
+    def compatible(self, path: str) -> bool:
+
+        """
+        Проверяет, что адаптер существует и обучен для этой базовой модели.
+
+        Результат запоминается, поэтому вызов дёшев и при построении промпта.
+
+        Args:
+            path (str): Каталог адаптера.
+
+        Returns:
+            bool: False, если конфигурации адаптера нет или он обучен для другой модели;
+                тогда стиль описывается в промпте, как без адаптера.
+        """
+
+        if path not in self._compatible:
+            try:
+                base_model = read_adapter_config(path).get("base_model_name_or_path")
+                self._compatible[path] = not base_model or base_model == self.model_name
+            except (OSError, ValueError) as e:
+                print(f"Адаптер {path} недоступен: {e}")
+                self._compatible[path] = False
+            if not self._compatible[path]:
+                print(f"Адаптер {path} не применяется к модели {self.model_name}")
+        return self._compatible[path]
+
+    @property
+    def loaded(self) -> List[str]:
+        """Загруженные адаптеры, от давно не использованного к последнему."""
+        with self._lock:
+            return list(self._loaded)
+
+    @property
+    def nbytes(self) -> int:
+        """Объём весов загруженных адаптеров в байтах."""
+        with self._lock:
+            return sum(adapter.nbytes for adapter in self._loaded.values())
+
+    def _ensure(self, path: str, pinned: set):
+        if path in self._loaded:
+            self.hits += 1
+            self._loaded.move_to_end(path)
+            return
+        while len(self._loaded) >= self.capacity:
+            victim = next((name for name in self._loaded if name not in pinned), None)
+            if victim is None:
+                raise ValueError(f"В одном батче больше адаптеров, чем lora_max_adapters ({self.capacity})")
+            self._evict(victim)
+
+        adapter = self._loader(path)
+        for module_name, (a, b) in adapter.modules.items():
+            layer = self._layer(module_name)
+            weight = layer.layer.weight
+            layer.adapters[path] = (a.to(weight.device, weight.dtype), b.to(weight.device, weight.dtype), adapter.scaling)
+        self._loaded[path] = adapter
+        self.loads += 1
+        print(f"Загружен адаптер {path}: {len(adapter.modules)} слоёв, {adapter.nbytes / 1024 ** 2:.1f} МБ")
+
+    def _evict(self, path: str):
+        self._loaded.pop(path)
+        for layer in self._layers.values():
+            layer.adapters.pop(path, None)
+        self.evictions += 1
+        print(f"Адаптер {path} выгружен из памяти")
+
+    def _layer(self, module_name: str) -> MultiLoRAHook:
+        # Хук ставится при первой загрузке адаптера, который затрагивает слой
+        if module_name not in self._layers:
+            module = self.model.get_submodule(module_name)
+            if not isinstance(module, nn.Linear):
+                raise ValueError(f"Слой {module_name} не линейный, LoRA к нему не применяется")
+            self._layers[module_name] = MultiLoRAHook(module, self._plan)
+        return self._layers[module_name]
+
+    @contextmanager
+    def activate(self, row_adapters: List[Optional[str]]):
+
+        """
+        Применяет адаптеры к строкам батча на время вызова модели.
+
+        Недостающие адаптеры загружаются, при переполнении LRU выгружаются
+        давно не использованные. Строки без адаптера (None) генерируются базовой
+        моделью. Если у всех строк один адаптер, добавка считается для всего
+        батча сразу - так выполняется и общий проход по промпту нескольких вариантов.
+
+        Args:
+            row_adapters (List[Optional[str]]): Каталог адаптера для каждой строки батча.
+        """
+
+        with self._lock:
+            names = [name for name in dict.fromkeys(row_adapters) if name is not None]
+            for name in names:
+                self._ensure(name, set(names))
+            if len(set(row_adapters)) == 1:
+                groups = [(names[0], None)] if names else []
+            else:
+                groups = [
+                    (name, torch.tensor([row for row, adapter in enumerate(row_adapters) if adapter == name]))
+                    for name in names
+                ]
+            self._plan.groups = groups
+            try:
+                yield
+            finally:
+                self._plan.groups = []
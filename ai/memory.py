@@ -0,0 +1,281 @@
+"""
+Модуль измерения памяти процесса.
+
+Резидентная память (RSS) читается из /proc/self/statm; на системах без procfs
+используется пиковое значение из resource.getrusage. Пиковая RSS за отрезок
+времени (например, за загрузку модели) измеряется фоновым потоком-сэмплером.
+
+MemoryAccountant записывает память каждой генерации: пиковую RSS, RSS,
+оставшуюся после неё (удержанную), и объём живых тензоров. Медленный рост
+удержанной памяти от запроса к запросу - признак утечки; его наклон
+считает linear_trend. allocation_sites показывает места выделения памяти
+Python по tracemalloc.
+"""
+
+import gc
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+import torch
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_bytes() -> int:
+
+    """
+    Возвращает текущую резидентную память процесса.
+
+    Returns:
+        int: RSS в байтах.
+    """
+
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss в килобайтах на Linux и в байтах на macOS
+        return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+class RSSSampler:
+
+    """
+    Контекстный менеджер, измеряющий пиковую RSS процесса внутри блока.
+
+    Attributes:
+        peak_bytes (int): Максимальная RSS, замеченная за время блока.
+        interval (float): Период опроса RSS в секундах.
+
+    Example:
+        >>> with RSSSampler() as sampler:
+        ...     data = bytearray(10 ** 6)
+        >>> sampler.peak_bytes > 0
+        True
+    """
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self) -> "RSSSampler":
+        self.peak_bytes = rss_bytes()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, name="rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak_bytes = max(self.peak_bytes, rss_bytes())
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak_bytes = max(self.peak_bytes, rss_bytes())
+
+
+def live_tensor_bytes() -> int:
+
+    """
+    Считает память живых тензоров torch процесса.
+
+    Обходит объекты сборщика мусора, поэтому занимает десятки и сотни
+    миллисекунд. Представления одного хранилища учитываются один раз,
+    тензоры на устройстве meta (выгруженные на диск слои) не учитываются.
+
+    Returns:
+        int: Объём хранилищ живых тензоров в байтах.
+    """
+
+    seen = set()
+    total = 0
+    for obj in gc.get_objects():
+        # type() вместо isinstance: isinstance обращается к __class__ ленивых объектов
+        if not issubclass(type(obj), torch.Tensor) or obj.device.type == "meta":
+            continue
+        storage = obj.untyped_storage()
+        key = (obj.device, storage.data_ptr())
+        if key not in seen:
+            seen.add(key)
+            total += storage.nbytes()
+    return total
+
+
+def linear_trend(values: Sequence[float]) -> float:
+
+    """
+    Наклон прямой, приближающей ряд по методу наименьших квадратов.
+
+    Args:
+        values (Sequence[float]): Значения по порядку (например, удержанная RSS после каждого запроса).
+
+    Returns:
+        float: Прирост значения на один шаг ряда; 0 для рядов короче двух значений.
+    """
+
+    count = len(values)
+    if count < 2:
+        return 0.0
+    mean_x = (count - 1) / 2
+    mean_y = sum(values) / count
+    covariance = sum((x - mean_x) * (y - mean_y) for x, y in enumerate(values))
+    variance = sum((x - mean_x) ** 2 for x in range(count))
+    return covariance / variance
+
+
+@dataclass
+class MemoryRecord:
+
+    """
+    Память одной генерации.
+
+    Attributes:
+        label (str): Что генерировалось (например, тема речи).
+        requests (int): Запросов в вызове (больше одного - батч).
+        finished_at (float): Время окончания (Unix time, секунды).
+        seconds (float): Длительность вызова.
+        rss_before_bytes (int): RSS перед вызовом.
+        peak_rss_bytes (int): Пиковая RSS во время вызова.
+        rss_after_bytes (int): RSS после вызова.
+        retained_rss_bytes (int): Насколько RSS после вызова больше, чем до него.
+        tensor_bytes (Optional[int]): Живые тензоры после вызова; None без подсчёта тензоров.
+        retained_tensor_bytes (Optional[int]): Насколько живых тензоров стало больше.
+    """
+
+    label: str
+    requests: int
+    finished_at: float
+    seconds: float
+    rss_before_bytes: int
+    peak_rss_bytes: int
+    rss_after_bytes: int
+    retained_rss_bytes: int
+    tensor_bytes: Optional[int] = None
+    retained_tensor_bytes: Optional[int] = None
+
+
+class MemoryAccountant:
+
+    """
+    Журнал памяти последних генераций.
+
+    Вложенные измерения в том же потоке (generate_speech вызывает generate_batch)
+    не записываются: память учитывается один раз, внешним вызовом.
+
+    Attributes:
+        history_size (int): Сколько последних записей хранится.
+        count_tensors (bool): Считать ли живые тензоры до и после генерации.
+    """
+
+    def __init__(self, history_size: int, count_tensors: bool = True):
+        self.history_size = history_size
+        self.count_tensors = count_tensors
+        self._records: "deque[MemoryRecord]" = deque(maxlen=history_size)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def measure(self, label: str, requests: int = 1):
+
+        """
+        Измеряет память блока и добавляет запись в журнал.
+
+        Args:
+            label (str): Что генерируется.
+            requests (int): Запросов в вызове.
+        """
+
+        if getattr(self._local, "active", False):
+            yield
+            return
+        self._local.active = True
+        # Подсчёт могут включить или выключить во время генерации: решение принимается один раз
+        count_tensors = self.count_tensors
+        try:
+            tensors_before = live_tensor_bytes() if count_tensors else None
+            started = time.perf_counter()
+            with RSSSampler() as sampler:
+                rss_before = sampler.peak_bytes
+                yield
+            rss_after = rss_bytes()
+            tensors_after = live_tensor_bytes() if count_tensors else None
+        finally:
+            self._local.active = False
+
+        record = MemoryRecord(
+            label=label,
+            requests=requests,
+            finished_at=time.time(),
+            seconds=round(time.perf_counter() - started, 3),
+            rss_before_bytes=rss_before,
+            peak_rss_bytes=sampler.peak_bytes,
+            rss_after_bytes=rss_after,
+            retained_rss_bytes=rss_after - rss_before,
+            tensor_bytes=tensors_after,
+            retained_tensor_bytes=tensors_after - tensors_before if count_tensors else None
+        )
+        with self._lock:
+            self._records.append(record)
+        print(
+            f"Память генерации '{label}': пик +{(record.peak_rss_bytes - rss_before) / 1024 ** 2:.1f} МБ, "
+            f"удержано {record.retained_rss_bytes / 1024 ** 2:+.1f} МБ"
+            + (f", тензоры {record.retained_tensor_bytes / 1024 ** 2:+.1f} МБ" if count_tensors else "")
+        )
+
+    @property
+    def records(self) -> List[MemoryRecord]:
+        """Записи журнала от старых к новым."""
+        with self._lock:
+            return list(self._records)
+
+    def trend(self) -> Tuple[float, Optional[float]]:
+        """Наклон RSS и живых тензоров после генерации по журналу, байт на генерацию."""
+        records = self.records
+        tensors = [record.tensor_bytes for record in records if record.tensor_bytes is not None]
+        return (
+            linear_trend([record.rss_after_bytes for record in records]),
+            linear_trend(tensors) if tensors else None
+        )
+
+
+def allocation_sites(limit: int, group_by: str = "lineno", frames: int = 1) -> Tuple[bool, list, int, int]:
+
+    """
+    Возвращает места, где Python выделил больше всего памяти, по tracemalloc.
+
+    tracemalloc замедляет выделение памяти, поэтому включается только первым
+    вызовом: этот вызов начинает трассировку и возвращает пустой список, а
+    следующие показывают выделения, сделанные после включения. Память тензоров
+    выделяется вне аллокатора Python и в tracemalloc не видна.
+
+    Args:
+        limit (int): Сколько мест вернуть.
+        group_by (str): Группировка: "lineno", "filename" или "traceback".
+        frames (int): Глубина стека, запоминаемая для каждого выделения (при включении).
+
+    Returns:
+        Tuple[bool, list, int, int]: Включена ли трассировка этим вызовом, статистика
+            tracemalloc.Statistic по убыванию размера, текущий и пиковый объём
+            отслеживаемой памяти в байтах.
+    """
+
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+        return True, [], *tracemalloc.get_traced_memory()
+    statistics = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    )).statistics(group_by)
+    return False, statistics[:limit], *tracemalloc.get_traced_memory()
@@ -9,6 +9,9 @@
 - top_p: Диапазон слов, из которых модель выбирает ответ
 - top_k: Ограничение выбора топ-k токенов
 - repetition_penalty: Подавление повторяющихся фраз
+
+settings_version увеличивается при каждом изменении параметров через API
+и возвращается в метаданных сгенерированной речи.
 """
 
 do_sample = True
@@ -18,3 +21,5 @@ temperature = 0.7
 top_p = 0.9
 top_k = 50
 repetition_penalty = 1.1
+
+settings_version = 0
@@ -0,0 +1,261 @@
+"""
+Модуль реестра моделей генерации речей.
+
+Реестр хранит несколько сконфигурированных моделей под короткими именами
+(например, быструю маленькую модель для коротких тостов и большую для докладов).
+Модели загружаются при первом обращении и выгружаются в порядке давности
+использования (LRU), когда суммарный объём загруженных моделей превышает
+бюджет памяти.
+
+Загрузка и прогрев модели идут минуты, поэтому выполняются вне блокировки
+реестра: пока одна модель загружается, уже загруженные модели и счётчики
+реестра доступны без ожидания. Одновременные обращения к загружаемой модели
+ждут одну и ту же загрузку.
+"""
+
+import gc
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import torch
+
+from ai.speech_generator import SpeechGenerator
+from schemas.model import SpeechRequest
+
+
+@dataclass
+class ModelStats:
+    """Счётчики использования одной модели реестра."""
+    loads: int = 0
+    hits: int = 0
+    evictions: int = 0
+    memory_bytes: int = 0
+    last_load_seconds: float = 0.0
+    load_peak_rss_bytes: int = 0
+    load_rss_bytes: int = 0
+    offloaded_modules: int = 0
+
+
+def _default_loader(model_id: str) -> SpeechGenerator:
+    generator = SpeechGenerator(model_id)
+    generator.load_model()
+    return generator
+
+
+def _memory_footprint(generator) -> int:
+    """Объём памяти весов модели в байтах (0, если его нельзя определить)."""
+    try:
+        return int(generator.model.get_memory_footprint())
+    except (AttributeError, TypeError, ValueError):
+        return 0
+
+
+def _load_memory(generator) -> Tuple[int, int, int]:
+    """Пиковая и итоговая RSS загрузки и число выгруженных на диск модулей (нули, если неизвестны)."""
+    try:
+        return int(generator.load_peak_rss_bytes), int(generator.load_rss_bytes), len(generator.offloaded_modules)
+    except (AttributeError, TypeError, ValueError):
+        return 0, 0, 0
+
+
+def _close(generator):
+    """Останавливает генератор, если ему есть что освобождать (процесс генерации ai/sidecar.py)."""
+    close = getattr(generator, "close", None)
+    if callable(close):
+        close()
+
+
+class ModelRegistry:
+
+    """
+    Реестр моделей с ленивой загрузкой и LRU-выгрузкой по бюджету памяти.
+
+    Attributes:
+        models (Dict[str, str]): Имя модели в реестре -> идентификатор на Hugging Face.
+        default_model (str): Имя модели по умолчанию.
+        routes (List[Tuple[int, str]]): Маршруты по длительности речи: пары
+            (максимальная длительность в минутах, имя модели), проверяются по возрастанию.
+        memory_budget_bytes (int): Бюджет памяти на все загруженные модели.
+    """
+
+    def __init__(
+        self,
+        models: Dict[str, str],
+        default_model: str,
+        routes: Optional[List[Tuple[int, str]]] = None,
+        memory_budget_bytes: int = 0,
+        loader: Callable[[str], object] = _default_loader
+    ):
+
+        """
+        Инициализирует реестр. Модели при этом не загружаются.
+
+        Args:
+            models (Dict[str, str]): Имя модели в реестре -> идентификатор модели.
+            default_model (str): Имя модели, используемой без явного выбора и маршрута.
+            routes (Optional[List[Tuple[int, str]]]): Маршруты по длительности речи.
+            memory_budget_bytes (int): Бюджет памяти в байтах; 0 - без ограничения.
+            loader (Callable[[str], object]): Функция загрузки генератора по
+                идентификатору модели.
+
+        Raises:
+            ValueError: Если модель по умолчанию или модель маршрута не сконфигурирована.
+        """
+
+        for name in [default_model] + [name for _, name in routes or []]:
+            if name not in models:
+                raise ValueError(f"Модель '{name}' не сконфигурирована")
+
+        self.models = dict(models)
+        self.default_model = default_model
+        self.routes = sorted(routes or [])
+        self.memory_budget_bytes = memory_budget_bytes
+        self._loader = loader
+        self._loaded: "OrderedDict[str, object]" = OrderedDict()
+        self._loading: Dict[str, Future] = {}
+        self._stats = {name: ModelStats() for name in self.models}
+        self._lock = threading.RLock()
+
+    def resolve(self, request: SpeechRequest) -> str:
+
+        """
+        Выбирает модель для запроса, не загружая её.
+
+        Приоритет: явно указанная в запросе модель, затем маршрут по длительности,
+        затем модель по умолчанию.
+
+        Args:
+            request (SpeechRequest): Запрос с параметрами речи.
+
+        Returns:
+            str: Имя модели в реестре.
+
+        Raises:
+            ValueError: Если запрошенная модель не сконфигурирована.
+        """
+
+        if request.model is not None:
+            if request.model not in self.models:
+                raise ValueError(
+                    f"Модель '{request.model}' не найдена. Доступные модели: {', '.join(self.models.keys())}"
+                )
+            return request.model
+        for max_duration, name in self.routes:
+            if request.duration_minutes <= max_duration:
+                return name
+        return self.default_model
+
+    def get(self, name: str):
+
+        """
+        Возвращает генератор модели, при необходимости загружая её.
+
+        Перед загрузкой выгружаются давно не использованные модели, чтобы новая
+        поместилась в бюджет (размер известен по предыдущей загрузке). Если после
+        загрузки бюджет всё равно превышен, выгружаются следующие по давности.
+        Выгруженная модель освобождает память, когда её перестают использовать
+        уже выполняющиеся генерации. Загрузка идёт вне блокировки реестра;
+        одновременные обращения к загружаемой модели ждут её загрузку.
+
+        Args:
+            name (str): Имя модели в реестре.
+
+        Returns:
+            SpeechGenerator: Загруженный генератор модели.
+
+        Raises:
+            ValueError: Если модель не сконфигурирована.
+            Exception: Если произошла ошибка при загрузке модели.
+        """
+
+        if name not in self.models:
+            raise ValueError(f"Модель '{name}' не сконфигурирована")
+
+        with self._lock:
+            stats = self._stats[name]
+            if name in self._loaded:
+                stats.hits += 1
+                self._loaded.move_to_end(name)
+                return self._loaded[name]
+            loading = self._loading.get(name)
+            if loading is None:
+                self._evict_for(stats.memory_bytes)
+                self._loading[name] = Future()
+        if loading is not None:
+            return loading.result()
+        return self._load(name)
+
+    def _load(self, name: str):
+        stats = self._stats[name]
+        print(f"Загрузка модели '{name}' ({self.models[name]})...")
+        started = time.perf_counter()
+        try:
+            generator = self._loader(self.models[name])
+        except Exception as e:
+            with self._lock:
+                self._loading.pop(name).set_exception(e)
+            raise
+        with self._lock:
+            stats.last_load_seconds = time.perf_counter() - started
+            stats.loads += 1
+            stats.memory_bytes = _memory_footprint(generator)
+            stats.load_peak_rss_bytes, stats.load_rss_bytes, stats.offloaded_modules = _load_memory(generator)
+            self._loaded[name] = generator
+            loading = self._loading.pop(name)
+            self._evict_for(0, keep=name)
+        loading.set_result(generator)
+        print(f"Модель '{name}' загружена за {stats.last_load_seconds:.1f} с")
+        return generator
+
+    def close(self):
+        """Выгружает все модели при остановке приложения и возвращает их память."""
+        with self._lock:
+            while self._loaded:
+                _close(self._loaded.popitem(last=False)[1])
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def loaded_models(self) -> List[str]:
+        """Имена загруженных моделей от давно использованной к недавней."""
+        with self._lock:
+            return list(self._loaded.keys())
+
+    def loaded_generators(self) -> Dict[str, object]:
+        """Загруженные генераторы по именам моделей; модели при этом не загружаются."""
+        with self._lock:
+            return dict(self._loaded)
+
+    def stats(self) -> Dict[str, ModelStats]:
+        """Счётчики загрузок, попаданий и выгрузок по каждой модели."""
+        with self._lock:
+            return {name: ModelStats(**vars(stats)) for name, stats in self._stats.items()}
+
+    def _used_bytes(self) -> int:
+        # Загружаемые сейчас модели учитываются по размеру с прошлой загрузки
+        return sum(self._stats[name].memory_bytes for name in list(self._loaded) + list(self._loading))
+
+    def _evict_for(self, required_bytes: int, keep: Optional[str] = None):
+        if not self.memory_budget_bytes:
+            return
+        while self._used_bytes() + required_bytes > self.memory_budget_bytes:
+            candidates = [name for name in self._loaded if name != keep]
+            if not candidates and self._loading:
+                print("Бюджет памяти занят загружаемыми моделями, модель загружается сверх бюджета")
+                return
+            if not candidates:
+                print("Бюджет памяти меньше размера единственной модели, модель оставлена загруженной")
+                return
+            self._evict(candidates[0])
+
+    def _evict(self, name: str):
+        print(f"Выгрузка модели '{name}' по бюджету памяти")
+        _close(self._loaded.pop(name))
+        self._stats[name].evictions += 1
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
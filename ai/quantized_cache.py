@@ -0,0 +1,273 @@
+"""
+Модуль квантованного KV-кэша для длинных речей и больших батчей.
+
+На CPU KV-кэш одной последовательности Phi-3 с контекстом 4k занимает сотни
+мегабайт в float16, и именно он ограничивает число одновременных длинных
+генераций. QuantizedKVCache хранит ключи и значения в int8 или int4
+(два значения в байте) с масштабом и нулевой точкой:
+- ключи - по каналам (масштаб на каждый канал головы внимания по блоку токенов),
+  потому что выбросы в ключах сосредоточены в отдельных каналах;
+- значения - по токенам (масштаб на каждый токен головы).
+
+Последние kv_cache_residual_tokens токенов хранятся без квантования; когда
+их набирается столько, они квантуются блоком со своими масштабами. Уже квантованные блоки
+не переквантуются, поэтому ошибка не накапливается с длиной речи. На каждом
+шаге декодирования кэш слоя разворачивается в исходную точность только на
+время вычисления внимания этого слоя. Обрезка кэша (crop) отбрасывает целые
+блоки, а блок, на который приходится новая граница, разворачивается и
+становится хвостом; при заполнении хвост квантуется заново.
+
+Встроенный QuantizedCache transformers требует пакетов optimum-quanto или
+hqq; этот кэш написан на torch и работает с любой моделью с полным вниманием.
+"""
+
+from dataclasses import dataclass
+from typing import Callable, List, Tuple
+
+import torch
+from transformers import Cache, DynamicCache
+from transformers.cache_utils import DynamicLayer
+
+# Поддерживаемые форматы: название -> бит на значение
+KV_CACHE_FORMATS = {"int8": 8, "int4": 4}
+
+
+@dataclass
+class QuantizedTensor:
+
+    """
+    Тензор, квантованный с масштабом и нулевой точкой вдоль одной оси.
+
+    Attributes:
+        data (torch.Tensor): Уровни в uint8; в int4 два соседних значения
+            последней оси упакованы в один байт.
+        scale (torch.Tensor): Шаг квантования, в исходном типе тензора.
+        zero (torch.Tensor): Минимум (нулевая точка), в исходном типе тензора.
+        nbits (int): Бит на значение: 8 или 4.
+        last_dim (int): Размер последней оси до упаковки.
+    """
+
+    data: torch.Tensor
+    scale: torch.Tensor
+    zero: torch.Tensor
+    nbits: int
+    last_dim: int
+
+    @property
+    def nbytes(self) -> int:
+        """Объём тензора в памяти вместе с масштабами."""
+        return self.data.nbytes + self.scale.nbytes + self.zero.nbytes
+
+    def map(self, function: Callable[[torch.Tensor], torch.Tensor]) -> "QuantizedTensor":
+        """Применяет одно и то же преобразование батча (повтор, выбор строк) ко всем частям."""
+        return QuantizedTensor(function(self.data), function(self.scale), function(self.zero), self.nbits, self.last_dim)
+
+
+def quantize(tensor: torch.Tensor, nbits: int, dim: int) -> QuantizedTensor:
+
+    """
+    Квантует тензор асимметрично: минимум и максимум берутся вдоль оси dim.
+
+    Args:
+        tensor (torch.Tensor): Ключи или значения [батч, головы, токены, канал].
+        nbits (int): 8 или 4 бита на значение.
+        dim (int): Ось, вдоль которой общий масштаб: -2 - по каналам, -1 - по токенам.
+
+    Returns:
+        QuantizedTensor: Квантованный тензор.
+    """
+
+    values = tensor.float()
+    minimum = values.amin(dim=dim, keepdim=True)
+    levels = 2 ** nbits - 1
+    scale = (values.amax(dim=dim, keepdim=True) - minimum).clamp(min=1e-8) / levels
+    data = ((values - minimum) / scale).round_().clamp_(0, levels).to(torch.uint8)
+    last_dim = data.shape[-1]
+    if nbits == 4:
+        if last_dim % 2:
+            data = torch.nn.functional.pad(data, (0, 1))
+        data = data[..., 0::2] | (data[..., 1::2] << 4)
+    return QuantizedTensor(data, scale.to(tensor.dtype), minimum.to(tensor.dtype), nbits, last_dim)
+
+
+def dequantize(quantized: QuantizedTensor) -> torch.Tensor:
+    """Восстанавливает тензор в исходном типе."""
+    data = quantized.data
+    if quantized.nbits == 4:
+        data = torch.stack([data & 0x0F, data >> 4], dim=-1).flatten(-2)[..., :quantized.last_dim]
+    return data.to(quantized.scale.dtype) * quantized.scale + quantized.zero
+
+
+class QuantizedKVLayer(DynamicLayer):
+
+    """
+    Слой KV-кэша: квантованные блоки и хвост последних токенов в исходной точности.
+
+    Attributes:
+        nbits (int): Бит на значение.
+        residual_length (int): Сколько последних токенов хранится без квантования.
+        blocks (List[Tuple[QuantizedTensor, QuantizedTensor]]): Квантованные ключи
+            и значения блоков токенов по порядку.
+    """
+
+    is_croppable = True
+
+    def __init__(self, nbits: int, residual_length: int):
+        super().__init__()
+        self.nbits = nbits
+        self.residual_length = residual_length
+        self.blocks: List[Tuple[QuantizedTensor, QuantizedTensor]] = []
+        self.cumulative_length = 0
+
+    def update(
+        self, key_states: torch.Tensor, value_states: torch.Tensor, *args, **kwargs
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        if not self.is_initialized:
+            self.lazy_initialization(key_states, value_states)
+        self.cumulative_length += key_states.shape[-2]
+        self.keys = torch.cat([self.keys, key_states], dim=-2)
+        self.values = torch.cat([self.values, value_states], dim=-2)
+
+        keys = torch.cat([dequantize(block_keys) for block_keys, _ in self.blocks] + [self.keys], dim=-2)
+        values = torch.cat([dequantize(block_values) for _, block_values in self.blocks] + [self.values], dim=-2)
+        # Текущий шаг видит хвост точным, квантуется он только для следующих шагов.
+        # Длинный промпт квантуется блоками по residual_length токенов, чтобы
+        # масштаб канала ключей не растягивался выбросами далёких токенов. Все блоки
+        # ровно по residual_length токенов (на этом основана обрезка в crop),
+        # остаток промпта остаётся в хвосте
+        quantized = self.keys.shape[-2] // self.residual_length * self.residual_length
+        if quantized:
+            for block_keys, block_values in zip(
+                self.keys[..., :quantized, :].split(self.residual_length, dim=-2),
+                self.values[..., :quantized, :].split(self.residual_length, dim=-2)
+            ):
+                self.blocks.append((quantize(block_keys, self.nbits, dim=-2), quantize(block_values, self.nbits, dim=-1)))
+            self.keys = self.keys[..., quantized:, :]
+            self.values = self.values[..., quantized:, :]
+        return keys, values
+
+    def get_seq_length(self) -> int:
+        return self.cumulative_length
+
+    def reset(self) -> None:
+        self.blocks = []
+        self.cumulative_length = 0
+        super().reset()
+
+    def _map_batch(self, function: Callable[[torch.Tensor], torch.Tensor]):
+        self.blocks = [(block_keys.map(function), block_values.map(function)) for block_keys, block_values in self.blocks]
+        if self.is_initialized and self.keys.dim() == 4:
+            self.keys = function(self.keys)
+            self.values = function(self.values)
+
+    def batch_repeat_interleave(self, repeats: int) -> None:
+        self._map_batch(lambda tensor: tensor.repeat_interleave(repeats, dim=0))
+
+    def batch_select_indices(self, indices: torch.Tensor) -> None:
+        self._map_batch(lambda tensor: tensor[indices, ...])
+
+    def reorder_cache(self, beam_idx: torch.LongTensor) -> None:
+        self._map_batch(lambda tensor: tensor.index_select(0, beam_idx.to(tensor.device)))
+
+    def crop(self, tokens_to_remove: int) -> None:
+
+        """
+        Удаляет последние токены кэша.
+
+        Args:
+            tokens_to_remove (int): Отрицательное число - сколько токенов удалить;
+                положительное - до какой длины обрезать (как в DynamicLayer.crop).
+        """
+
+        length = tokens_to_remove if tokens_to_remove > 0 else self.cumulative_length + tokens_to_remove
+        if tokens_to_remove == 0 or length >= self.cumulative_length:
+            return
+        length = max(0, length)
+        quantized_length = len(self.blocks) * self.residual_length
+        if length >= quantized_length:
+            self.keys = self.keys[..., :length - quantized_length, :]
+            self.values = self.values[..., :length - quantized_length, :]
+        else:
+            kept_blocks, kept_tokens = divmod(length, self.residual_length)
+            if kept_tokens:
+                block_keys, block_values = self.blocks[kept_blocks]
+                self.keys = dequantize(block_keys)[..., :kept_tokens, :]
+                self.values = dequantize(block_values)[..., :kept_tokens, :]
+            else:
+                self.keys = self.keys[..., :0, :]
+                self.values = self.values[..., :0, :]
+            self.blocks = self.blocks[:kept_blocks]
+        self.cumulative_length = length
+
+    @property
+    def nbytes(self) -> int:
+        """Объём слоя в памяти: квантованные блоки, их масштабы и хвост."""
+        nbytes = sum(block_keys.nbytes + block_values.nbytes for block_keys, block_values in self.blocks)
+        if self.is_initialized:
+            nbytes += self.keys.nbytes + self.values.nbytes
+        return nbytes
+
+
+class QuantizedKVCache(Cache):
+
+    """
+    KV-кэш модели с квантованными слоями QuantizedKVLayer.
+
+    Передаётся в model.generate через past_key_values вместо DynamicCache.
+    """
+
+    def __init__(self, config, nbits: int, residual_length: int):
+
+        """
+        Args:
+            config: Конфигурация модели (нужно число слоёв декодера).
+            nbits (int): 8 или 4 бита на значение.
+            residual_length (int): Сколько последних токенов хранить без квантования.
+
+        Raises:
+            ValueError: Если nbits не 8 и не 4.
+        """
+
+        if nbits not in KV_CACHE_FORMATS.values():
+            raise ValueError(f"KV-кэш квантуется в {', '.join(KV_CACHE_FORMATS)}, а не в {nbits} бит")
+        num_layers = config.get_text_config(decoder=True).num_hidden_layers
+        super().__init__(layers=[QuantizedKVLayer(nbits, residual_length) for _ in range(num_layers)])
+
+    @property
+    def nbytes(self) -> int:
+        """Объём кэша в памяти, в байтах."""
+        return sum(layer.nbytes for layer in self.layers)
+
+
+def cache_nbytes(cache: Cache) -> int:
+    """Объём KV-кэша в памяти: квантованного или обычного DynamicCache."""
+    if isinstance(cache, QuantizedKVCache):
+        return cache.nbytes
+    return sum(
+        layer.keys.nbytes + layer.values.nbytes
+        for layer in cache.layers if layer.is_initialized and layer.keys is not None
+    )
+
+
+def new_cache(config, kv_format: str, residual_length: int) -> Cache:
+
+    """
+    Создаёт KV-кэш для model.generate.
+
+    Args:
+        config: Конфигурация модели.
+        kv_format (str): "" - обычный DynamicCache, "int8" или "int4" - QuantizedKVCache.
+        residual_length (int): Сколько последних токенов хранить без квантования.
+
+    Returns:
+        Cache: Пустой KV-кэш.
+
+    Raises:
+        ValueError: Если формат не поддерживается.
+    """
+
+    if not kv_format:
+        return DynamicCache()
+    if kv_format not in KV_CACHE_FORMATS:
+        raise ValueError(f"Неизвестный формат KV-кэша '{kv_format}', доступны: {', '.join(KV_CACHE_FORMATS)}")
+    return QuantizedKVCache(config, KV_CACHE_FORMATS[kv_format], residual_length)
@@ -0,0 +1,80 @@
+"""
+Модуль локального ранжирования вариантов речи.
+
+Варианты оцениваются без модели, по трём дешёвым признакам:
+- соответствие длины длительности выступления (WORDS_PER_MINUTE слов в минуту);
+- покрытие ключевых моментов: доля значимых слов каждого момента, встречающихся
+  в речи (сравниваются основы - первые STEM_LENGTH букв, чтобы не зависеть от падежа);
+- отсутствие повторов: доля неповторяющихся словесных триграмм.
+Итоговая оценка - взвешенная сумма признаков от 0 до 1.
+"""
+
+import re
+from typing import List, Optional
+
+from schemas.model import SpeechRequest
+
+WORDS_PER_MINUTE = 130
+STEM_LENGTH = 5
+# Слова короче не учитываются в покрытии ключевых моментов (предлоги, союзы)
+MIN_WORD_LENGTH = 4
+SCORE_WEIGHTS = {"length": 0.4, "coverage": 0.4, "repetition": 0.2}
+
+_WORD = re.compile(r"\w+")
+
+
+def _words(text: str) -> List[str]:
+    return _WORD.findall(text.lower())
+
+
+def _stems(words: List[str]) -> set:
+    return {word[:STEM_LENGTH] for word in words if len(word) >= MIN_WORD_LENGTH}
+
+
+def length_fit(words: List[str], duration_minutes: int) -> float:
+    """Близость числа слов к ожидаемому для длительности: 1 - точное попадание, 0 - отклонение вдвое."""
+    target = max(1, duration_minutes) * WORDS_PER_MINUTE
+    return max(0.0, 1.0 - abs(len(words) - target) / target)
+
+
+def key_points_coverage(words: List[str], key_points: Optional[List[str]]) -> float:
+    """Средняя по ключевым моментам доля их значимых слов, встречающихся в речи."""
+    points = [_stems(_words(point)) for point in key_points or []]
+    points = [point for point in points if point]
+    if not points:
+        return 1.0
+    speech_stems = _stems(words)
+    return sum(len(point & speech_stems) / len(point) for point in points) / len(points)
+
+
+def repetition_free(words: List[str]) -> float:
+    """Доля уникальных словесных триграмм; 1 - повторов нет."""
+    trigrams = list(zip(words, words[1:], words[2:]))
+    return len(set(trigrams)) / len(trigrams) if trigrams else 1.0
+
+
+def score_speech(speech: str, request: SpeechRequest) -> float:
+
+    """
+    Оценивает вариант речи по запросу.
+
+    Args:
+        speech (str): Текст варианта.
+        request (SpeechRequest): Запрос, по которому сгенерирован вариант.
+
+    Returns:
+        float: Оценка от 0 до 1, больше - лучше.
+
+    Example:
+        >>> request = SpeechRequest(topic="Тест", duration_minutes=1, key_points=["Инновации"])
+        >>> score_speech("Инновации " * 130, request) > score_speech("Привет", request)
+        True
+    """
+
+    words = _words(speech)
+    return round(
+        SCORE_WEIGHTS["length"] * length_fit(words, request.duration_minutes)
+        + SCORE_WEIGHTS["coverage"] * key_points_coverage(words, request.key_points)
+        + SCORE_WEIGHTS["repetition"] * repetition_free(words),
+        4
+    )
@@ -0,0 +1,106 @@
+"""
+Модуль кэша недавних ответов для уровней деградации.
+
+В отличие от объединения одновременных запросов (ai/singleflight.py), кэш
+хранит уже завершённые генерации и используется только уровнем деградации
+с use_cache (ai/degradation.py): при перегрузке запрос получает недавнюю речь
+для близкого запроса вместо новой генерации.
+
+Запросы близки, если у них совпадают модель, стиль, язык, длительность
+и режим генерации, а слова темы, ключевых моментов и дополнительных
+требований совпадают не меньше чем на response_cache_min_similarity
+(коэффициент Жаккара, ai/serving_parameters.py).
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from typing import FrozenSet, Optional, Tuple
+
+from schemas.model import SpeechRequest
+
+_WORD = re.compile(r"\w+")
+
+
+def _words(request: SpeechRequest) -> FrozenSet[str]:
+    text = " ".join([request.topic, *(request.key_points or []), request.custom_instructions or ""])
+    return frozenset(_WORD.findall(text.lower()))
+
+
+def similarity(first: FrozenSet[str], second: FrozenSet[str]) -> float:
+    """Коэффициент Жаккара двух множеств слов."""
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+
+class ResponseCache:
+
+    """
+    LRU-кэш недавних речей с поиском по близости запроса.
+
+    Attributes:
+        size (int): Максимальное количество речей в кэше.
+        min_similarity (float): Минимальная близость слов запросов для попадания.
+    """
+
+    def __init__(self, size: int, min_similarity: float):
+        self.size = size
+        self.min_similarity = min_similarity
+        self._entries: "OrderedDict[Tuple, Tuple[FrozenSet[str], str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _bucket(model_name: str, request: SpeechRequest) -> Tuple:
+        return model_name, request.style, request.language, request.duration_minutes, request.structured
+
+    def put(self, model_name: str, request: SpeechRequest, speech: str):
+
+        """
+        Запоминает сгенерированную речь.
+
+        Args:
+            model_name (str): Модель, сгенерировавшая речь.
+            request (SpeechRequest): Запрос речи.
+            speech (str): Текст речи (SpeechText со статистикой генерации).
+        """
+
+        if self.size <= 0 or request.n > 1:
+            return
+        words = _words(request)
+        key = (self._bucket(model_name, request), words)
+        with self._lock:
+            self._entries[key] = (words, speech)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def find(self, model_name: str, request: SpeechRequest) -> Optional[str]:
+
+        """
+        Ищет речь самого близкого запроса.
+
+        Args:
+            model_name (str): Модель, которая генерировала бы речь.
+            request (SpeechRequest): Запрос речи.
+
+        Returns:
+            Optional[str]: Речь из кэша или None, если близкого запроса нет.
+        """
+
+        if request.n > 1:
+            return None
+        bucket = self._bucket(model_name, request)
+        words = _words(request)
+        with self._lock:
+            best, best_similarity = None, self.min_similarity
+            for key, (cached_words, speech) in self._entries.items():
+                if key[0] != bucket:
+                    continue
+                score = similarity(words, cached_words)
+                if score >= best_similarity:
+                    best, best_similarity = key, score
+            if best is None:
+                return None
+            self._entries.move_to_end(best)
+            return self._entries[best][1]
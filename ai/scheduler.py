@@ -0,0 +1,337 @@
+"""
+Модуль очереди генерации речей.
+
+Все запросы на генерацию (из HTTP-эндпоинта и из пакетных заданий) попадают
+в общую очередь. Фоновый поток собирает из неё батчи запросов к одной модели
+и выполняет их одним вызовом SpeechGenerator.generate_batch, что заметно
+повышает утилизацию модели при одновременных запросах.
+
+Запросы ставятся в очередь с ключом модели (например, именем в реестре моделей),
+а сам генератор получается только при выполнении батча. Поэтому ожидающие
+запросы не удерживают в памяти модели, выгруженные из реестра.
+
+При scheduling_policy = "sjf" (ai/serving_parameters.py) очередь выбирает
+сначала запросы с наименьшей ожидаемой длиной ответа (ai/length_predictor.py),
+и короткие речи не ждут за длинными докладами. Чтобы длинные запросы не
+голодали, их стоимость уменьшается на sjf_aging_tokens_per_second за каждую
+секунду ожидания. При "fifo" запросы выполняются в порядке поступления.
+
+При остановке экземпляра (drain.py) очередь дожидается выполнения принятых
+запросов (wait_idle), а ещё не начатые запросы можно забрать из неё (withdraw).
+"""
+
+import asyncio
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from ai.length_predictor import LengthPredictor
+from schemas.model import SpeechRequest
+import ai.serving_parameters as serving_parameters
+
+
+@dataclass
+class _WorkItem:
+    """Запрос в очереди вместе с ключом модели, которая должна его обработать."""
+    model: object
+    request: SpeechRequest
+    on_text: Optional[Callable[[str], None]] = None
+    future: Future = field(default_factory=Future)
+    predicted_tokens: float = 0.0
+    enqueued_at: float = 0.0
+    sequence: int = 0
+
+    @property
+    def batchable(self) -> bool:
+        """Потоковые запросы, запросы с seed и с несколькими вариантами генерируются отдельно от других."""
+        return self.on_text is None and self.request.seed is None and self.request.n == 1
+
+
+def run_batch(generator, requests: List[SpeechRequest], available_styles: Dict[str, str]) -> List[Union[str, Exception]]:
+
+    """
+    Генерирует батч речей, изолируя ошибки отдельных запросов.
+
+    Если батч целиком завершился ошибкой (например, у одного запроса неизвестный стиль),
+    запросы повторяются по одному, чтобы ошибка досталась только виновнику.
+
+    Args:
+        generator: Генератор речей (SpeechGenerator или совместимый объект).
+        requests (List[SpeechRequest]): Запросы для генерации.
+        available_styles (Dict[str, str]): Словарь доступных стилей выступления.
+
+    Returns:
+        List[Union[str, Exception]]: Текст речи или исключение для каждого запроса.
+    """
+
+    if len(requests) == 1:
+        try:
+            return [generator.generate_speech(requests[0], available_styles)]
+        except Exception as e:
+            return [e]
+
+    try:
+        return list(generator.generate_batch(requests, available_styles))
+    except Exception:
+        return [run_batch(generator, [request], available_styles)[0] for request in requests]
+
+
+class GenerationScheduler:
+
+    """
+    Очередь генерации с динамическим батчингом.
+
+    Первый по приоритету запрос ждёт попутчиков не дольше batch_window_ms, после чего
+    вместе с ними (не более batch_size, только к той же модели) уходит в генерацию.
+    Потоковые запросы и запросы с seed генерируются по одному.
+
+    Attributes:
+        styles_provider (Callable[[], Dict[str, str]]): Источник актуальных стилей.
+        model_provider (Callable[[object], object]): Возвращает генератор по ключу модели.
+        predictor (LengthPredictor): Предсказатель длины ответа, обучаемый
+            на выполненных запросах.
+        seconds_per_token (Optional[float]): Скользящая оценка длительности шага
+            декодирования по выполненным батчам.
+    """
+
+    # Вес нового батча в скользящей оценке длительности шага декодирования
+    DECODE_SPEED_SMOOTHING = 0.2
+
+    def __init__(
+        self,
+        styles_provider: Callable[[], Dict[str, str]],
+        model_provider: Optional[Callable[[object], object]] = None,
+        predictor: Optional[LengthPredictor] = None
+    ):
+
+        """
+        Инициализирует очередь. Рабочий поток запускается при первом запросе.
+
+        Args:
+            styles_provider (Callable[[], Dict[str, str]]): Функция, возвращающая
+                словарь стилей на момент генерации батча.
+            model_provider (Optional[Callable[[object], object]]): Функция, возвращающая
+                генератор по ключу модели. По умолчанию ключом служит сам генератор.
+            predictor (Optional[LengthPredictor]): Предсказатель длины ответа.
+        """
+
+        self.styles_provider = styles_provider
+        self.model_provider = model_provider or (lambda model: model)
+        self.predictor = predictor or LengthPredictor()
+        self.seconds_per_token = None
+        self._sequence = itertools.count()
+        self._pending: List[_WorkItem] = []
+        self._active = 0
+        self._condition = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+
+    @property
+    def queue_depth(self) -> int:
+        """Количество запросов, ожидающих генерации."""
+        with self._condition:
+            return len(self._pending)
+
+    @property
+    def in_flight(self) -> int:
+        """Количество принятых и ещё не выполненных запросов: ожидающих и генерируемых."""
+        with self._condition:
+            return len(self._pending) + self._active
+
+    @property
+    def predicted_wait_seconds(self) -> float:
+        """
+        Ожидаемое время до начала генерации нового запроса.
+
+        Оценка грубая: предсказанные токены ожидающих запросов декодируются
+        батчами по batch_size со скоростью выполненных батчей.
+        """
+        if self.seconds_per_token is None:
+            return 0.0
+        with self._condition:
+            pending_tokens = sum(item.predicted_tokens for item in self._pending)
+        return pending_tokens * self.seconds_per_token / max(1, serving_parameters.batch_size)
+
+    def submit(self, model, request: SpeechRequest, on_text: Optional[Callable[[str], None]] = None) -> Future:
+
+        """
+        Ставит запрос в очередь генерации.
+
+        Args:
+            model: Ключ модели, которая должна обработать запрос.
+            request (SpeechRequest): Запрос с параметрами речи.
+            on_text (Optional[Callable[[str], None]]): Функция, получающая фрагменты
+                текста по мере генерации. Вызывается из рабочего потока очереди.
+
+        Returns:
+            Future: Будущий результат с текстом речи или исключением генерации.
+        """
+
+        item = _WorkItem(
+            model=model,
+            request=request,
+            on_text=on_text,
+            predicted_tokens=self.predictor.predict(request) * request.n,
+            enqueued_at=time.monotonic(),
+            sequence=next(self._sequence)
+        )
+        with self._condition:
+            self._ensure_worker()
+            self._pending.append(item)
+            # Кроме рабочего потока условия ждёт и wait_idle
+            self._condition.notify_all()
+        return item.future
+
+    async def generate(self, model, request: SpeechRequest) -> str:
+
+        """
+        Асинхронно дожидается генерации речи через очередь.
+
+        Args:
+            model: Ключ модели, которая должна обработать запрос.
+            request (SpeechRequest): Запрос с параметрами речи.
+
+        Returns:
+            str: Сгенерированный текст речи.
+        """
+
+        return await asyncio.wrap_future(self.submit(model, request))
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+
+        """
+        Ждёт, пока очередь не выполнит все принятые запросы.
+
+        Args:
+            timeout (Optional[float]): Максимальное время ожидания в секундах.
+
+        Returns:
+            bool: True, если очередь пуста и генерация не идёт; False по таймауту.
+        """
+
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._pending and not self._active, timeout)
+
+    def withdraw(self, futures: Optional[Iterable[Future]] = None) -> List[Tuple[object, SpeechRequest, Future]]:
+
+        """
+        Забирает из очереди запросы, генерация которых ещё не началась.
+
+        Будущие результаты забранных запросов остаются незавершёнными: их
+        завершает вызывающий (например, ошибкой или после передачи запроса
+        на другой экземпляр).
+
+        Args:
+            futures (Optional[Iterable[Future]]): Забрать только запросы с этими
+                будущими результатами; по умолчанию - все ожидающие.
+
+        Returns:
+            List[Tuple[object, SpeechRequest, Future]]: Ключ модели, запрос и будущий
+                результат каждого забранного запроса в порядке поступления.
+        """
+
+        selected = set(futures) if futures is not None else None
+        withdrawn, remaining = [], []
+        with self._condition:
+            for item in self._pending:
+                (withdrawn if selected is None or item.future in selected else remaining).append(item)
+            self._pending = remaining
+            self._condition.notify_all()
+        return [(item.model, item.request, item.future) for item in withdrawn]
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="generation-scheduler", daemon=True)
+            self._worker.start()
+
+    @staticmethod
+    def _priority(item: _WorkItem, now: float) -> tuple:
+        """Ключ порядка выполнения: меньше - раньше."""
+        if serving_parameters.scheduling_policy == "fifo":
+            return (item.sequence,)
+        waited = now - item.enqueued_at
+        return item.predicted_tokens - waited * serving_parameters.sjf_aging_tokens_per_second, item.sequence
+
+    def _next_batch(self) -> List[_WorkItem]:
+
+        """
+        Забирает из очереди следующий батч запросов к одной модели.
+
+        Returns:
+            List[_WorkItem]: Список запросов к одной модели.
+        """
+
+        with self._condition:
+            while not self._pending:
+                self._condition.wait()
+
+            deadline = time.monotonic() + serving_parameters.batch_window_ms / 1000
+            while True:
+                now = time.monotonic()
+                head = min(self._pending, key=lambda item: self._priority(item, now))
+                if not head.batchable:
+                    batch = [head]
+                    break
+                batch = sorted(
+                    (item for item in self._pending if item.batchable and item.model == head.model),
+                    key=lambda item: self._priority(item, now)
+                )
+                remaining = deadline - time.monotonic()
+                if len(batch) >= serving_parameters.batch_size or remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            batch = batch[:serving_parameters.batch_size]
+            for item in batch:
+                self._pending.remove(item)
+
+            # Запросы, чьи клиенты уже отключились, не генерируются
+            batch = [item for item in batch if item.future.set_running_or_notify_cancel()]
+            self._active = len(batch)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                self._finish_batch()
+                continue
+
+            try:
+                generator = self.model_provider(batch[0].model)
+                available_styles = self.styles_provider()
+                if batch[0].on_text is not None:
+                    results = [generator.generate_speech(batch[0].request, available_styles, on_text=batch[0].on_text)]
+                else:
+                    results = run_batch(generator, [item.request for item in batch], available_styles)
+            except Exception as e:
+                results = [e] * len(batch)
+
+            self._record_decode_speed(results)
+            for item, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    item.future.set_exception(result)
+                else:
+                    # Ответы с собственным лимитом токенов (уровни деградации) обрезаны и не учат предсказатель
+                    if hasattr(result, "completion_tokens") and item.request.max_new_tokens is None:
+                        self.predictor.observe(item.request, result.completion_tokens)
+                    item.future.set_result(result)
+            self._finish_batch()
+
+    def _finish_batch(self):
+        with self._condition:
+            self._active = 0
+            self._condition.notify_all()
+
+    def _record_decode_speed(self, results: list):
+        # Строки батча декодируются параллельно, шагов столько, сколько токенов у самого длинного ответа
+        speeches = [result for result in results if getattr(result, "completion_tokens", 0) > 0]
+        if not speeches or not getattr(speeches[0], "generation_seconds", 0):
+            return
+        seconds_per_token = speeches[0].generation_seconds / max(speech.completion_tokens for speech in speeches)
+        if self.seconds_per_token is None:
+            self.seconds_per_token = seconds_per_token
+        else:
+            self.seconds_per_token += self.DECODE_SPEED_SMOOTHING * (seconds_per_token - self.seconds_per_token)
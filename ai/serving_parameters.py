@@ -0,0 +1,156 @@
+"""
+Параметры обслуживания запросов генерации
+
+Настройки влияют на пропускную способность и задержку сервиса:
+- batch_size: Максимальное количество запросов, генерируемых одним батчем
+- batch_window_ms: Сколько миллисекунд очередь ждёт попутные запросы для батча
+- scheduling_policy: Порядок очереди генерации: "sjf" (сначала короткие ответы) или "fifo"
+- sjf_aging_tokens_per_second: На сколько токенов в секунду ожидания снижается стоимость запроса в очереди
+- length_prior_tokens_per_minute: Оценка токенов на минуту речи, пока предсказатель длины не обучен
+- degradation_tiers: Уровни деградации при перегрузке по возрастанию тяжести (ai/degradation.py)
+- response_cache_size: Сколько недавних речей хранит кэш ответов для уровней деградации с use_cache
+- response_cache_min_similarity: Минимальная близость слов запросов для ответа из кэша (0..1)
+- torch_threads: Количество потоков torch для генерации (0 - по умолчанию torch)
+- model_dtype: Тип весов модели в памяти (float16, bfloat16, float32)
+- attn_implementation: Реализация внимания модели (eager, sdpa)
+- profile_path: Профиль параметров узла (autotune_cli.py), применяемый при старте
+- outline_max_new_tokens: Лимит токенов плана речи в структурном режиме генерации
+- static_cache: Заранее выделенный KV-кэш для одиночных запросов: промпт и max_new_tokens,
+  округлённые вверх до степени двойки, в пределах контекстного окна модели
+- compile_decode: Компиляция шага декодирования через torch.compile (вместе со static_cache)
+- compile_cache_dir: Каталог кэша скомпилированных графов, переживающего перезапуски
+- kv_cache_format: Формат KV-кэша генерации: "" (исходная точность), "int8" или "int4"
+  (ai/quantized_cache.py); квантованный кэш не используется вместе со static_cache
+- kv_cache_residual_tokens: Сколько последних токенов квантованный KV-кэш хранит без квантования
+- models: Реестр моделей: имя -> идентификатор модели на Hugging Face
+- default_model: Имя модели по умолчанию
+- model_routes: Маршруты по длительности: [(максимум минут, имя модели), ...]
+- model_memory_budget_gb: Бюджет памяти на загруженные модели (0 - без ограничения)
+- style_adapters: LoRA-адаптеры стилей: стиль -> каталог адаптера в формате PEFT (ai/lora.py)
+- lora_max_adapters: Сколько LoRA-адаптеров одной модели держать в памяти (LRU)
+- compression_min_size: Минимальный размер ответа в байтах, начиная с которого он сжимается
+- compression_encodings: Кодировки сжатия в порядке предпочтения сервера
+- compression_levels: Уровни сжатия для каждой кодировки
+- warmup: Прогревать ли модель после загрузки, до готовности принимать запросы
+- warmup_prompt_tokens: Длины промптов прогревочных генераций, в токенах
+- warmup_batch_sizes: Размеры батчей прогревочных генераций
+- warmup_max_new_tokens: Лимит новых токенов одной прогревочной генерации
+- low_memory: Загрузка модели в пределах бюджета памяти с выгрузкой части слоёв на диск
+- load_memory_budget_gb: Бюджет оперативной памяти на веса одной модели в режиме low_memory
+- offload_folder: Каталог для слоёв, не поместившихся в бюджет
+- gateway_backends: Базовые URL экземпляров сервиса за шлюзом (gateway:app)
+- gateway_health_interval_s: Период проверки готовности экземпляров шлюзом, в секундах
+- gateway_timeout_s: Таймаут ответа экземпляра на запрос генерации, в секундах
+- gateway_tokens_per_minute: Оценка токенов на минуту речи для балансировки
+- gateway_affinity_slack_tokens: Допустимый перевес нагрузки экземпляра, уже обслуживавшего стиль
+- stop_tokens: Специальные токены, которыми, кроме EOS, заканчивается ответ модели
+- stop_strings: Строки, на которых генерация останавливается, а ответ обрезается
+- completion_phrases: Фразы заключения; генерация останавливается в конце предложения с ними,
+  если им заканчивается абзац
+- capture_enabled: Записывать запросы генерации для воспроизведения (traffic_capture.py)
+- capture_path: Файл записи трафика в формате JSONL
+- capture_max_bytes: Размер файла записи, после которого он ротируется
+- capture_backup_count: Сколько ротированных файлов записи хранить
+- max_candidates: Максимальное количество вариантов речи в одном запросе (n)
+- sidecar: Выполнять генерацию в отдельном процессе (ai/sidecar.py), а не в процессе API
+- sidecar_ring_bytes: Объём каждого кольцевого буфера общей памяти между процессами
+- sidecar_inline_bytes: Полезная нагрузка до этого размера передаётся в самом сообщении сокета
+- sidecar_start_timeout_s: Время на запуск процесса генерации и загрузку модели, в секундах
+- sidecar_max_retries: Сколько раз повторять запрос, который процесс генерации не успел начать
+  до аварийного завершения (начатые запросы не повторяются)
+- sidecar_call_timeout_s: Сколько секунд без ответа и фрагментов по начатому вызову процесс
+  генерации считается зависшим и перезапускается (ожидание в очереди процесса не ограничено)
+- quota_enabled: Ограничивать расход токенов по API-ключам (quotas.py)
+- quota_tokens_per_minute: Скорость пополнения квоты ключа, токенов в минуту
+- quota_burst_tokens: Максимальный запас токенов ключа
+- quota_keys: Отдельные квоты ключей: ключ -> (токенов в минуту, максимальный запас);
+  остальные ключи делят квоту запросов без ключа
+- quota_backend: Хранилище квот: "memory" (в процессе) или "sqlite" (общее для обработчиков узла)
+- quota_sqlite_path: Файл SQLite с квотами для quota_backend = "sqlite"
+- styles_page_size: Количество стилей на странице списка стилей по умолчанию
+- styles_page_max: Максимальное количество стилей на одной странице списка стилей
+- jobs_ttl_s: Сколько секунд завершённое пакетное задание и его результаты хранятся в памяти
+- jobs_max_retained: Сколько завершённых пакетных заданий хранится в памяти не больше
+- drain_on_sigterm: Останавливаться плавно по SIGTERM (drain.py)
+- drain_grace_period_s: Сколько секунд при остановке дорабатываются принятые запросы
+- drain_handoff: Передавать при остановке не начатые запросы пакетных заданий в JSONL-файл
+- drain_handoff_path: JSONL-файл для переданных запросов (формат POST /api/jobs и batch_cli.py)
+- memory_accounting: Записывать память каждой генерации: пиковую и удержанную RSS (ai/memory.py)
+- memory_count_tensors: Считать живые тензоры до и после генерации (обход объектов, до сотен мс
+  на генерацию); включается на время поиска утечки POST /api/admin/memory/tensors
+- memory_history_size: Сколько последних генераций хранит журнал памяти модели
+- admin_token: Токен административных эндпоинтов (заголовок X-Admin-Token);
+  пустой - административные эндпоинты доступны только с локального адреса
+"""
+
+batch_size = 8
+batch_window_ms = 20
+scheduling_policy = "sjf"
+sjf_aging_tokens_per_second = 50
+length_prior_tokens_per_minute = 350
+degradation_tiers = []
+response_cache_size = 256
+response_cache_min_similarity = 0.8
+torch_threads = 0
+model_dtype = "float16"
+attn_implementation = "eager"
+profile_path = "serving_profile.json"
+outline_max_new_tokens = 128
+static_cache = False
+compile_decode = False
+compile_cache_dir = "model_cache/compile"
+kv_cache_format = ""
+kv_cache_residual_tokens = 128
+models = {"phi-3-mini": "microsoft/Phi-3-mini-4k-instruct"}
+default_model = "phi-3-mini"
+model_routes = []
+model_memory_budget_gb = 0
+style_adapters = {}
+lora_max_adapters = 8
+compression_min_size = 1024
+compression_encodings = ["zstd", "br", "gzip"]
+compression_levels = {"zstd": 3, "br": 5, "gzip": 6}
+warmup = True
+warmup_prompt_tokens = [128, 768]
+warmup_batch_sizes = [1, 8]
+warmup_max_new_tokens = 16
+low_memory = False
+load_memory_budget_gb = 6
+offload_folder = "model_cache/offload"
+gateway_backends = ["http://127.0.0.1:8001", "http://127.0.0.1:8002"]
+gateway_health_interval_s = 2
+gateway_timeout_s = 600
+gateway_tokens_per_minute = 350
+gateway_affinity_slack_tokens = 1000
+stop_tokens = ["<|end|>", "<|user|>", "<|endoftext|>"]
+stop_strings = ["\n\nПримечание:", "\n\nКомментарий:", "\n\nNote:", "\n\nРечь 2"]
+completion_phrases = ["Спасибо за внимание", "Благодарю за внимание", "Thank you for your attention"]
+capture_enabled = False
+capture_path = "captures/requests.jsonl"
+capture_max_bytes = 64 * 1024 ** 2
+capture_backup_count = 10
+max_candidates = 4
+sidecar = False
+sidecar_ring_bytes = 16 * 1024 ** 2
+sidecar_inline_bytes = 4096
+sidecar_start_timeout_s = 600
+sidecar_max_retries = 1
+sidecar_call_timeout_s = 600
+quota_enabled = False
+quota_tokens_per_minute = 20000
+quota_burst_tokens = 40000
+quota_keys = {}
+quota_backend = "memory"
+quota_sqlite_path = "quotas.sqlite3"
+styles_page_size = 100
+styles_page_max = 1000
+jobs_ttl_s = 3600
+jobs_max_retained = 100
+drain_on_sigterm = True
+drain_grace_period_s = 300
+drain_handoff = False
+drain_handoff_path = "handoff/requests.jsonl"
+memory_accounting = True
+memory_count_tensors = False
+memory_history_size = 1000
+admin_token = ""
@@ -0,0 +1,85 @@
+"""
+Модуль профиля параметров обслуживания, подобранного под конкретный узел.
+
+Профиль - JSON-файл, который пишет autotune_cli.py после перебора параметров
+на этом узле. При старте приложение (и процесс генерации ai/sidecar.py)
+переопределяет им значения ai/serving_parameters.py. Настраиваются только
+параметры TUNABLE; прочие ключи профиля игнорируются.
+
+Пример профиля:
+    {
+        "model": "microsoft/Phi-3-mini-4k-instruct",
+        "created_at": "2026-10-19T12:00:00+00:00",
+        "parameters": {"torch_threads": 8, "batch_size": 4, "batch_window_ms": 20,
+                       "model_dtype": "bfloat16", "attn_implementation": "sdpa"},
+        "measurements": [...]
+    }
+"""
+
+import json
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import ai.serving_parameters as serving_parameters
+
+TUNABLE = ("torch_threads", "batch_size", "batch_window_ms", "model_dtype", "attn_implementation")
+
+
+def load_profile(path: Optional[str] = None) -> Dict[str, object]:
+
+    """
+    Применяет профиль к параметрам обслуживания, если файл профиля существует.
+
+    Args:
+        path (Optional[str]): Путь к профилю; по умолчанию serving_parameters.profile_path.
+
+    Returns:
+        Dict[str, object]: Применённые параметры (пустой словарь, если профиля нет).
+
+    Raises:
+        ValueError: Если файл профиля повреждён.
+    """
+
+    path = path or serving_parameters.profile_path
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            parameters = json.load(f)["parameters"]
+    except (json.JSONDecodeError, KeyError, TypeError) as e:
+        raise ValueError(f"Профиль параметров '{path}' повреждён: {e}")
+
+    applied = {name: value for name, value in parameters.items() if name in TUNABLE}
+    for name, value in applied.items():
+        setattr(serving_parameters, name, value)
+    print(f"Применён профиль параметров '{path}': {applied}")
+    return applied
+
+
+def save_profile(path: str, model: str, parameters: Dict[str, object], measurements: List[dict]):
+
+    """
+    Записывает профиль параметров обслуживания.
+
+    Args:
+        path (str): Путь к файлу профиля.
+        model (str): Модель, на которой подбирались параметры.
+        parameters (Dict[str, object]): Выбранные значения параметров TUNABLE.
+        measurements (List[dict]): Замеры всех проверенных конфигураций.
+    """
+
+    profile = {
+        "model": model,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "parameters": {name: parameters[name] for name in TUNABLE if name in parameters},
+        "measurements": measurements
+    }
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Профиль заменяется целиком, приложение не прочитает его наполовину записанным
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(profile, f, ensure_ascii=False, indent=2)
+    os.replace(temporary, path)
@@ -0,0 +1,784 @@
+"""
+Модуль процесса генерации (sidecar), отделённого от HTTP-процесса.
+
+Модель живёт в отдельном процессе, поэтому GIL, паузы сборщика мусора и падения
+генерации по нехватке памяти не останавливают обработку HTTP-запросов. Процесс
+API управляет им через SidecarGenerator - объект с интерфейсом SpeechGenerator,
+который реестр моделей использует вместо загруженной в процесс модели.
+
+Процессы обмениваются короткими JSON-сообщениями по Unix-сокету. Полезная
+нагрузка больше sidecar_inline_bytes (запросы с длинными требованиями, тексты
+речей) передаётся через кольцевые буферы в общей памяти, по одному на каждое
+направление; в сообщении остаётся только её место в буфере. Если буфер
+заполнен, нагрузка передаётся в самом сообщении. Фрагменты потока - несколько
+токенов текста - всегда меньше порога и передаются в сообщении: сообщение
+о фрагменте отправляется в любом случае, и буфер добавил бы только лишнее
+копирование.
+
+При аварийном завершении процесса генерации он перезапускается. Вызовы, которые
+процесс генерации ещё не начал выполнять, повторяются после перезапуска (не более
+sidecar_max_retries раз). Начатые вызовы завершаются ошибкой SidecarCrashed и не
+повторяются: запрос, из-за которого процесс упал, уронил бы его снова. Если
+процесс генерации не присылает ничего по начатому вызову sidecar_call_timeout_s
+секунд, он считается зависшим и перезапускается, а вызов завершается той же
+ошибкой. Вызов, ждущий в очереди процесса за долгой генерацией, таймаутом не
+ограничен: до сообщения о начале по нему и не должно быть вестей.
+
+Запуск процесса генерации вручную (обычно его запускает SidecarGenerator):
+    python -m ai.sidecar --socket /tmp/sidecar.sock --model-id microsoft/Phi-3-mini-4k-instruct \\
+        --ring-in <имя буфера запросов> --ring-out <имя буфера ответов>
+"""
+
+import argparse
+import atexit
+import dataclasses
+import importlib
+import json
+import os
+import queue
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from multiprocessing import resource_tracker, shared_memory
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ai.serving_profile import load_profile
+from schemas.model import SpeechRequest
+import ai.model_parameters as model_parameters
+import ai.serving_parameters as serving_parameters
+
+# ai.speech_generator (и вместе с ним torch) импортируется только там, где нужен:
+# процесс генерации загружает его через фабрику генератора
+DEFAULT_FACTORY = "ai.speech_generator:SpeechGenerator"
+# Параметры генерации передаются с каждым вызовом: их меняет /set_model_settings в процессе API
+MODEL_SETTINGS = (
+    "temperature", "top_p", "top_k", "max_length", "max_new_tokens",
+    "repetition_penalty", "do_sample", "settings_version"
+)
+
+_FRAME = struct.Struct(">I")
+
+
+class SidecarCrashed(RuntimeError):
+    """Процесс генерации завершился аварийно во время выполнения запроса."""
+
+
+class ShmRing:
+
+    """
+    Кольцевой буфер в общей памяти с одним писателем и одним читателем.
+
+    В заголовке буфера хранятся монотонные позиции записи и чтения. Читатель
+    забирает данные в том же порядке, в каком они записаны (порядок задают
+    сообщения в сокете), и освобождает место сдвигом позиции чтения.
+
+    Attributes:
+        name (str): Имя сегмента общей памяти.
+        capacity (int): Объём области данных в байтах.
+    """
+
+    _HEADER = struct.Struct("<QQ")
+
+    def __init__(self, name: Optional[str] = None, capacity: int = 0):
+
+        """
+        Создаёт новый буфер (если задан capacity) или подключается к существующему.
+
+        Args:
+            name (Optional[str]): Имя сегмента общей памяти; для нового буфера - случайное.
+            capacity (int): Объём области данных нового буфера в байтах.
+        """
+
+        if capacity:
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=self._HEADER.size + capacity)
+            self._owner = True
+            self.reset()
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            self._owner = False
+            # Сегментом владеет создавший его процесс, подключившийся не удаляет его при выходе
+            resource_tracker.unregister(self._shm._name, "shared_memory")
+        self.name = self._shm.name
+        self.capacity = self._shm.size - self._HEADER.size
+
+    def _positions(self) -> Tuple[int, int]:
+        return self._HEADER.unpack_from(self._shm.buf, 0)
+
+    def reset(self):
+        """Опустошает буфер; вызывается, только когда второй процесс не работает с ним."""
+        self._HEADER.pack_into(self._shm.buf, 0, 0, 0)
+
+    def write(self, data: bytes) -> Optional[Tuple[int, int]]:
+
+        """
+        Записывает данные в буфер.
+
+        Args:
+            data (bytes): Данные для передачи.
+
+        Returns:
+            Optional[Tuple[int, int]]: Позиция и длина записанных данных или None,
+                если свободного места не хватает.
+        """
+
+        head, tail = self._positions()
+        if len(data) > self.capacity - (head - tail):
+            return None
+        start = head % self.capacity
+        first = min(len(data), self.capacity - start)
+        data_offset = self._HEADER.size
+        self._shm.buf[data_offset + start:data_offset + start + first] = data[:first]
+        if first < len(data):
+            self._shm.buf[data_offset:data_offset + len(data) - first] = data[first:]
+        # Позицию записи меняет только писатель, позицию чтения - только читатель
+        struct.pack_into("<Q", self._shm.buf, 0, head + len(data))
+        return head, len(data)
+
+    def read(self, position: int, length: int) -> bytes:
+
+        """
+        Читает данные, записанные write, и освобождает занятое ими место.
+
+        Args:
+            position (int): Позиция данных, которую вернул write.
+            length (int): Длина данных.
+
+        Returns:
+            bytes: Прочитанные данные.
+        """
+
+        start = position % self.capacity
+        first = min(length, self.capacity - start)
+        data_offset = self._HEADER.size
+        data = bytes(self._shm.buf[data_offset + start:data_offset + start + first])
+        if first < length:
+            data += bytes(self._shm.buf[data_offset:data_offset + length - first])
+        struct.pack_into("<Q", self._shm.buf, 8, position + length)
+        return data
+
+    def close(self):
+        """Отключается от буфера; создавший буфер процесс также удаляет его."""
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+class _Channel:
+
+    """
+    Канал сообщений поверх Unix-сокета и пары кольцевых буферов.
+
+    Отправка защищена блокировкой, поэтому запись в буфер и отправка сообщения
+    о ней происходят в одном порядке для всех потоков процесса.
+    """
+
+    def __init__(self, sock: socket.socket, ring_out: ShmRing, ring_in: ShmRing):
+        self.sock = sock
+        self.ring_out = ring_out
+        self.ring_in = ring_in
+        self._send_lock = threading.Lock()
+
+    def send(self, message: dict, data: Optional[str] = None):
+
+        """
+        Отправляет сообщение с необязательной полезной нагрузкой.
+
+        Args:
+            message (dict): Служебные поля сообщения.
+            data (Optional[str]): Полезная нагрузка; крупная передаётся через буфер.
+        """
+
+        with self._send_lock:
+            if data is not None:
+                payload = data.encode("utf-8")
+                place = None
+                if len(payload) > serving_parameters.sidecar_inline_bytes:
+                    place = self.ring_out.write(payload)
+                if place is None:
+                    message = dict(message, data=data)
+                else:
+                    message = dict(message, ring=list(place))
+            body = json.dumps(message, ensure_ascii=False).encode("utf-8")
+            self.sock.sendall(_FRAME.pack(len(body)) + body)
+
+    def receive(self) -> Optional[Tuple[dict, Optional[str]]]:
+
+        """
+        Принимает следующее сообщение.
+
+        Returns:
+            Optional[Tuple[dict, Optional[str]]]: Сообщение и его полезная нагрузка
+                или None, если соединение закрыто.
+        """
+
+        header = self._read_exactly(_FRAME.size)
+        if header is None:
+            return None
+        body = self._read_exactly(_FRAME.unpack(header)[0])
+        if body is None:
+            return None
+        message = json.loads(body)
+        if "ring" in message:
+            return message, self.ring_in.read(*message.pop("ring")).decode("utf-8")
+        return message, message.pop("data", None)
+
+    def _read_exactly(self, size: int) -> Optional[bytes]:
+        chunks = []
+        while size:
+            chunk = self.sock.recv(min(size, 1 << 20))
+            if not chunk:
+                return None
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+
+def speech_to_dict(speech: str) -> dict:
+    """Сериализует текст речи вместе со статистикой генерации и вариантами."""
+    return {
+        "text": str(speech),
+        "prompt_tokens": getattr(speech, "prompt_tokens", 0),
+        "completion_tokens": getattr(speech, "completion_tokens", 0),
+        "generation_seconds": getattr(speech, "generation_seconds", 0.0),
+        "stop_reason": getattr(speech, "stop_reason", "eos"),
+        "tokens_saved": getattr(speech, "tokens_saved", 0),
+        "settings_version": getattr(speech, "settings_version", model_parameters.settings_version),
+        "score": getattr(speech, "score", None),
+        "candidates": [speech_to_dict(candidate) for candidate in getattr(speech, "candidates", [])[1:]]
+    }
+
+
+def speech_from_dict(data: dict):
+    """Восстанавливает SpeechText, сериализованный speech_to_dict."""
+    from ai.speech_generator import SpeechText
+
+    speech = SpeechText(
+        data["text"], data["prompt_tokens"], data["completion_tokens"],
+        data["generation_seconds"], data["stop_reason"], data["tokens_saved"]
+    )
+    speech.settings_version = data["settings_version"]
+    speech.score = data["score"]
+    if data["candidates"]:
+        # Первый вариант - сама речь, он не сериализуется повторно
+        speech.candidates = [speech] + [speech_from_dict(candidate) for candidate in data["candidates"]]
+    return speech
+
+
+def _error_payload(error: Exception) -> dict:
+    return {"error": type(error).__name__, "message": str(error), "value_error": isinstance(error, ValueError)}
+
+
+def _raise_error(payload: dict):
+    if payload["value_error"]:
+        raise ValueError(payload["message"])
+    raise RuntimeError(f"{payload['error']}: {payload['message']}")
+
+
+class _RemoteModel:
+    """Сведения о модели, загруженной в процессе генерации (для бюджета памяти реестра)."""
+
+    def __init__(self, memory_bytes: int):
+        self.memory_bytes = memory_bytes
+
+    def get_memory_footprint(self) -> int:
+        return self.memory_bytes
+
+
+@dataclasses.dataclass
+class _Call:
+    """Выполняющийся вызов процесса генерации."""
+    method: str
+    on_text: Optional[Callable[[str], None]] = None
+    done: threading.Event = dataclasses.field(default_factory=threading.Event)
+    result: Optional[str] = None
+    error: Optional[dict] = None
+    started: bool = False
+    crashed: bool = False
+    last_activity: float = dataclasses.field(default_factory=time.monotonic)
+
+
+class SidecarGenerator:
+
+    """
+    Генератор речей, выполняющий генерацию в отдельном процессе.
+
+    Повторяет интерфейс SpeechGenerator, который используют реестр моделей,
+    очередь генерации и эндпоинты: generate_speech, generate_batch, token_budget,
+    warm_up. Процесс генерации запускается в конструкторе и перезапускается
+    после аварийного завершения.
+
+    Attributes:
+        model_id (str): Идентификатор модели на Hugging Face или путь к ней.
+        model_loaded (bool): Работает ли процесс генерации с загруженной моделью.
+        model (_RemoteModel): Объём весов модели в процессе генерации.
+        restarts (int): Количество перезапусков процесса после аварийного завершения.
+    """
+
+    def __init__(self, model_id: str, factory: str = DEFAULT_FACTORY):
+
+        """
+        Запускает процесс генерации и дожидается загрузки модели.
+
+        Args:
+            model_id (str): Идентификатор модели на Hugging Face или путь к ней.
+            factory (str): Класс генератора в процессе генерации, "модуль:имя".
+
+        Raises:
+            RuntimeError: Если процесс генерации не запустился за sidecar_start_timeout_s.
+        """
+
+        self.model_id = model_id
+        self.factory = factory
+        self.model_loaded = False
+        self.model = _RemoteModel(0)
+        self.load_peak_rss_bytes = 0
+        self.load_rss_bytes = 0
+        self.offloaded_modules = []
+        self.restarts = 0
+
+        self._socket_path = os.path.join(tempfile.gettempdir(), f"speech-sidecar-{uuid.uuid4().hex}.sock")
+        self._ring_requests = ShmRing(capacity=serving_parameters.sidecar_ring_bytes)
+        self._ring_responses = ShmRing(capacity=serving_parameters.sidecar_ring_bytes)
+        self._process: Optional[subprocess.Popen] = None
+        self._channel: Optional[_Channel] = None
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._closing = False
+        self._start()
+        # При завершении процесса API процесс генерации останавливается, а не перезапускается
+        atexit.register(self.close)
+
+    def _start(self):
+
+        """Запускает процесс генерации и подключается к нему (вызывается под _start_lock или в конструкторе)."""
+
+        self._ring_requests.reset()
+        self._ring_responses.reset()
+        if os.path.exists(self._socket_path):
+            os.unlink(self._socket_path)
+
+        environment = dict(os.environ, PYTHONPATH=os.pathsep.join(path for path in sys.path if path))
+        self._process = subprocess.Popen(
+            [
+                sys.executable, "-m", "ai.sidecar", "--socket", self._socket_path,
+                "--model-id", self.model_id, "--factory", self.factory, "--parent-pid", str(os.getpid()),
+                "--ring-in", self._ring_requests.name, "--ring-out", self._ring_responses.name
+            ],
+            env=environment
+        )
+
+        deadline = time.monotonic() + serving_parameters.sidecar_start_timeout_s
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        while True:
+            if self._process.poll() is not None:
+                raise RuntimeError(f"Процесс генерации завершился при запуске с кодом {self._process.returncode}")
+            try:
+                sock.connect(self._socket_path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    self._process.kill()
+                    raise RuntimeError("Процесс генерации не запустился вовремя")
+                time.sleep(0.05)
+
+        channel = _Channel(sock, self._ring_requests, self._ring_responses)
+        # Первое сообщение процесс генерации присылает после загрузки модели
+        sock.settimeout(max(1.0, deadline - time.monotonic()))
+        try:
+            received = channel.receive()
+        except socket.timeout:
+            received = None
+        sock.settimeout(None)
+        if received is None or "error" in received[0]:
+            self._process.kill()
+            self._process.wait()
+            detail = received[0]["error"]["message"] if received else "нет ответа"
+            raise RuntimeError(f"Процесс генерации не загрузил модель: {detail}")
+
+        ready = received[0]
+        self.model = _RemoteModel(ready["memory_bytes"])
+        self.load_peak_rss_bytes = ready["load_peak_rss_bytes"]
+        self.load_rss_bytes = ready["load_rss_bytes"]
+        self.offloaded_modules = [None] * ready["offloaded_modules"]
+        self._channel = channel
+        self.model_loaded = True
+        threading.Thread(target=self._read_responses, args=(channel, self._process), daemon=True,
+                         name="sidecar-reader").start()
+        print(f"Процесс генерации модели '{self.model_id}' запущен (pid {self._process.pid})")
+
+    def _ensure_running(self):
+        with self._start_lock:
+            if self._closing:
+                raise RuntimeError("Процесс генерации остановлен")
+            if self._process is not None and self._process.poll() is None and self.model_loaded:
+                return
+            self._start()
+
+    def _read_responses(self, channel: _Channel, process: subprocess.Popen):
+
+        """Разбирает ответы процесса генерации, пока он работает."""
+
+        try:
+            while True:
+                received = channel.receive()
+                if received is None:
+                    break
+                self._deliver(*received)
+        except (OSError, ValueError) as e:
+            if not self._closing:
+                print(f"Ошибка чтения ответа процесса генерации: {e}")
+
+        channel.sock.close()
+        process.wait()
+        if not self._closing:
+            self._on_crash(process)
+
+    def _deliver(self, message: dict, data: Optional[str]):
+        with self._lock:
+            call = self._calls.get(message["id"])
+        if call is None:
+            return
+        call.last_activity = time.monotonic()
+        if message["type"] == "started":
+            call.started = True
+        elif message["type"] == "chunk":
+            if call.on_text is not None:
+                call.on_text(data)
+        else:
+            call.result = data
+            call.error = message.get("error")
+            call.done.set()
+
+    def _on_crash(self, process: subprocess.Popen):
+        print(f"Процесс генерации модели '{self.model_id}' завершился с кодом {process.returncode}, перезапуск")
+        with self._start_lock:
+            if self._process is process:
+                self.model_loaded = False
+                self.restarts += 1
+        with self._lock:
+            calls = list(self._calls.values())
+        for call in calls:
+            call.crashed = True
+            call.done.set()
+        # Процесс перезапускается сразу, даже если повторять нечего
+        try:
+            self._ensure_running()
+        except RuntimeError as e:
+            print(f"Не удалось перезапустить процесс генерации: {e}")
+
+    def _wait(self, call: _Call):
+        # Ожидание начатого вызова ограничено временем без вестей от процесса генерации:
+        # длинная генерация с потоком не прерывается, а зависший процесс перезапускается.
+        # Вызов в очереди процесса ждёт без таймаута: если процесс завис на другом
+        # вызове, тот вызов перезапустит процесс, а этот будет повторён
+        process = self._process
+        while not call.done.wait(min(1.0, serving_parameters.sidecar_call_timeout_s)):
+            if call.started and time.monotonic() - call.last_activity > serving_parameters.sidecar_call_timeout_s:
+                print(f"Процесс генерации не отвечает на '{call.method}' "
+                      f"{serving_parameters.sidecar_call_timeout_s} с, перезапуск")
+                call.started = True
+                if process is not None:
+                    process.kill()
+                call.done.wait(10)
+                call.crashed = True
+                return
+
+    def _call(self, method: str, arguments: dict, on_text: Optional[Callable[[str], None]] = None) -> Optional[str]:
+
+        """
+        Выполняет метод генератора в процессе генерации.
+
+        Args:
+            method (str): Имя метода генератора.
+            arguments (dict): Аргументы вызова, сериализуемые в JSON.
+            on_text (Optional[Callable[[str], None]]): Получатель фрагментов потока.
+
+        Returns:
+            Optional[str]: Результат вызова в JSON.
+
+        Raises:
+            SidecarCrashed: Если процесс завершился аварийно или завис во время
+                выполнения вызова.
+            ValueError: Ошибка проверки запроса в генераторе.
+            RuntimeError: Другая ошибка генерации.
+        """
+
+        data = json.dumps(arguments, ensure_ascii=False)
+        for attempt in range(serving_parameters.sidecar_max_retries + 1):
+            self._ensure_running()
+            call_id = uuid.uuid4().hex
+            call = _Call(method=method, on_text=on_text)
+            with self._lock:
+                self._calls[call_id] = call
+            try:
+                try:
+                    self._channel.send({"id": call_id, "type": "call", "method": method}, data)
+                except OSError:
+                    call.crashed = True
+                else:
+                    self._wait(call)
+            finally:
+                with self._lock:
+                    self._calls.pop(call_id, None)
+                    last = not self._calls
+                if self._closing and last:
+                    self._shutdown()
+
+            if not call.crashed:
+                if call.error is not None:
+                    _raise_error(call.error)
+                return call.result
+            # Начатый вызов мог сам уронить процесс, а клиент потока уже получил часть текста
+            if call.started:
+                break
+            print(f"Повтор запроса '{method}' после перезапуска процесса генерации (попытка {attempt + 1})")
+        raise SidecarCrashed("Процесс генерации завершился аварийно во время выполнения запроса")
+
+    @staticmethod
+    def _settings() -> dict:
+        return _current_settings()
+
+    @staticmethod
+    def _styles_for(requests: List[SpeechRequest], available_styles: Dict[str, str]) -> Dict[str, str]:
+        # Передаются только стили запросов, а не весь каталог
+        return {request.style: available_styles[request.style] for request in requests if request.style in available_styles}
+
+    def generate_speech(
+        self,
+        request: SpeechRequest,
+        available_styles: Dict[str, str],
+        on_text: Optional[Callable[[str], None]] = None
+    ):
+        """Генерирует речь в процессе генерации, см. SpeechGenerator.generate_speech."""
+        result = self._call("generate_speech", {
+            "request": request.model_dump(),
+            "styles": self._styles_for([request], available_styles),
+            "settings": self._settings(),
+            "stream": on_text is not None
+        }, on_text)
+        return speech_from_dict(json.loads(result))
+
+    def generate_batch(self, requests: List[SpeechRequest], available_styles: Dict[str, str]) -> list:
+        """Генерирует батч речей в процессе генерации, см. SpeechGenerator.generate_batch."""
+        result = self._call("generate_batch", {
+            "requests": [request.model_dump() for request in requests],
+            "styles": self._styles_for(requests, available_styles),
+            "settings": self._settings()
+        })
+        return [speech_from_dict(speech) for speech in json.loads(result)]
+
+    def token_budget(self, request: SpeechRequest, available_styles: Dict[str, str]):
+        """Считает бюджет токенов запроса в процессе генерации, см. SpeechGenerator.token_budget."""
+        from ai.speech_generator import TokenBudget
+
+        result = self._call("token_budget", {
+            "request": request.model_dump(),
+            "styles": self._styles_for([request], available_styles),
+            "settings": self._settings()
+        })
+        return TokenBudget(**json.loads(result))
+
+    def warm_up(self, available_styles: Dict[str, str]) -> list:
+        """Прогревает модель в процессе генерации, см. SpeechGenerator.warm_up."""
+        from ai.speech_generator import WarmupStep
+
+        result = self._call("warm_up", {"styles": available_styles, "settings": self._settings()})
+        return [WarmupStep(**step) for step in json.loads(result)]
+
+    def close(self):
+
+        """
+        Останавливает процесс генерации и освобождает буферы общей памяти.
+
+        Выполняющиеся вызовы (например, при выгрузке модели из реестра) завершаются,
+        и процесс останавливается после последнего из них; новые вызовы отклоняются.
+        """
+
+        with self._start_lock:
+            self._closing = True
+            self.model_loaded = False
+        with self._lock:
+            if self._calls:
+                return
+        self._shutdown()
+
+    def _shutdown(self):
+        with self._start_lock:
+            if self._process is None:
+                return
+            if self._channel is not None:
+                self._channel.sock.close()
+            if self._process.poll() is None:
+                self._process.terminate()
+                try:
+                    self._process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    self._process.kill()
+            self._process = None
+            self._ring_requests.close()
+            self._ring_responses.close()
+            if os.path.exists(self._socket_path):
+                os.unlink(self._socket_path)
+            atexit.unregister(self.close)
+            print(f"Процесс генерации модели '{self.model_id}' остановлен")
+
+
+def _load_factory(factory: str):
+    module_name, _, name = factory.partition(":")
+    return getattr(importlib.import_module(module_name), name)
+
+
+def _apply_settings(settings: dict):
+    for name, value in settings.items():
+        setattr(model_parameters, name, value)
+
+
+def _current_settings() -> dict:
+    return {name: getattr(model_parameters, name) for name in MODEL_SETTINGS}
+
+
+class _SidecarServer:
+
+    """
+    Обслуживание вызовов в процессе генерации.
+
+    Вызовы выполняются по одному в рабочем потоке; только он меняет параметры
+    генерации model_parameters. Подсчёт бюджета токенов с теми же параметрами,
+    что уже действуют, выполняется сразу в потоке чтения, чтобы не ждать за
+    длинной генерацией: он не меняет параметры, а токены считает отдельным
+    экземпляром токенизатора (SpeechGenerator.budget_tokenizer). Бюджет с новыми
+    параметрами встаёт в очередь рабочего потока.
+    """
+
+    def __init__(self, generator, channel: _Channel):
+        self.generator = generator
+        self.channel = channel
+        self._work = queue.Queue()
+        self._settings = _current_settings()
+
+    def serve(self):
+        threading.Thread(target=self._run_work, daemon=True, name="sidecar-generation").start()
+        while True:
+            received = self.channel.receive()
+            if received is None:
+                break
+            message, data = received
+            arguments = json.loads(data)
+            if message["method"] == "token_budget" and arguments["settings"] == self._settings:
+                self._execute(message, arguments)
+            else:
+                self._work.put((message, arguments))
+
+    def _run_work(self):
+        while True:
+            message, arguments = self._work.get()
+            if arguments["settings"] != self._settings:
+                _apply_settings(arguments["settings"])
+                self._settings = _current_settings()
+            self._execute(message, arguments)
+
+    def _execute(self, message: dict, arguments: dict):
+        call_id = message["id"]
+        self.channel.send({"id": call_id, "type": "started"})
+        try:
+            result = self._dispatch(call_id, message["method"], arguments)
+        except Exception as e:
+            self.channel.send({"id": call_id, "type": "result", "error": _error_payload(e)})
+        else:
+            self.channel.send({"id": call_id, "type": "result"}, json.dumps(result, ensure_ascii=False))
+
+    def _dispatch(self, call_id: str, method: str, arguments: dict):
+        styles = arguments["styles"]
+        if method == "generate_speech":
+            def send_chunk(text: str):
+                self.channel.send({"id": call_id, "type": "chunk"}, text)
+
+            request = SpeechRequest(**arguments["request"])
+            on_text = send_chunk if arguments["stream"] else None
+            return speech_to_dict(self.generator.generate_speech(request, styles, on_text=on_text))
+        if method == "generate_batch":
+            requests = [SpeechRequest(**request) for request in arguments["requests"]]
+            return [speech_to_dict(speech) for speech in self.generator.generate_batch(requests, styles)]
+        if method == "token_budget":
+            return dataclasses.asdict(self.generator.token_budget(SpeechRequest(**arguments["request"]), styles))
+        if method == "warm_up":
+            return [dataclasses.asdict(step) for step in self.generator.warm_up(styles)]
+        raise ValueError(f"Неизвестный метод '{method}'")
+
+
+def serve(socket_path: str, model_id: str, factory: str, ring_in: str, ring_out: str, parent_pid: int = 0):
+
+    """
+    Загружает модель и обслуживает вызовы процесса API до закрытия соединения.
+
+    Args:
+        socket_path (str): Путь Unix-сокета, к которому подключается процесс API.
+        model_id (str): Идентификатор модели на Hugging Face или путь к ней.
+        factory (str): Класс генератора, "модуль:имя".
+        ring_in (str): Имя буфера запросов от процесса API.
+        ring_out (str): Имя буфера ответов процессу API.
+        parent_pid (int): Процесс API; если он завершится до подключения, процесс
+            генерации тоже завершается. 0 - не проверять.
+    """
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen(1)
+    listener.settimeout(1.0)
+    deadline = time.monotonic() + serving_parameters.sidecar_start_timeout_s
+    while True:
+        try:
+            connection, _ = listener.accept()
+            break
+        except socket.timeout:
+            if (parent_pid and os.getppid() != parent_pid) or time.monotonic() > deadline:
+                print("Процесс API не подключился, процесс генерации завершается")
+                return
+    listener.close()
+    connection.settimeout(None)
+    channel = _Channel(connection, ShmRing(ring_out), ShmRing(ring_in))
+
+    try:
+        generator = _load_factory(factory)(model_id)
+        generator.load_model()
+    except Exception as e:
+        channel.send({"type": "ready", "error": _error_payload(e)})
+        return
+
+    model = getattr(generator, "model", None)
+    try:
+        memory_bytes = int(model.get_memory_footprint())
+    except (AttributeError, TypeError, ValueError):
+        memory_bytes = 0
+    channel.send({
+        "type": "ready",
+        "memory_bytes": memory_bytes,
+        "load_peak_rss_bytes": int(getattr(generator, "load_peak_rss_bytes", 0)),
+        "load_rss_bytes": int(getattr(generator, "load_rss_bytes", 0)),
+        "offloaded_modules": len(getattr(generator, "offloaded_modules", []))
+    })
+    _SidecarServer(generator, channel).serve()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Процесс генерации речей (sidecar)")
+    parser.add_argument("--socket", required=True, help="Путь Unix-сокета")
+    parser.add_argument("--model-id", required=True, help="Идентификатор модели")
+    parser.add_argument("--factory", default=DEFAULT_FACTORY, help="Класс генератора, модуль:имя")
+    parser.add_argument("--ring-in", required=True, help="Буфер общей памяти с запросами")
+    parser.add_argument("--ring-out", required=True, help="Буфер общей памяти с ответами")
+    parser.add_argument("--parent-pid", type=int, default=0, help="Процесс API, запустивший процесс генерации")
+    args = parser.parse_args()
+    # Процесс генерации применяет тот же профиль параметров узла, что и процесс API
+    load_profile()
+    serve(args.socket, args.model_id, args.factory, args.ring_in, args.ring_out, args.parent_pid)
+
+
+if __name__ == "__main__":
+    main()
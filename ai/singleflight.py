@@ -0,0 +1,226 @@
+"""
+Модуль объединения одинаковых одновременных запросов на генерацию (singleflight).
+
+Когда популярная страница события одновременно присылает один и тот же запрос
+от множества клиентов, запускается только одна генерация. Остальные клиенты
+присоединяются к ней и получают тот же результат или тот же поток токенов.
+
+Объединяются только запросы, результат которых определяется входными данными:
+жадное декодирование (do_sample=False, в том числе собственный do_sample запроса)
+или семплирование с явно заданным seed.
+"""
+
+import asyncio
+import hashlib
+import json
+from concurrent.futures import Future
+from typing import AsyncIterator, Callable, Dict, Optional
+
+from schemas.model import SpeechRequest
+import ai.model_parameters as model_parameters
+
+
+def coalescing_key(request: SpeechRequest, style_description: Optional[str], model_name: str) -> Optional[str]:
+
+    """
+    Вычисляет ключ объединения запроса.
+
+    В ключ входят канонический запрос, текст его стиля, модель и текущие
+    параметры генерации, поэтому изменение любого из них даёт новую генерацию.
+
+    Args:
+        request (SpeechRequest): Запрос с параметрами речи.
+        style_description (Optional[str]): Описание стиля запроса на момент генерации.
+        model_name (str): Модель, которая будет генерировать речь.
+
+    Returns:
+        Optional[str]: Ключ объединения или None, если результат генерации случаен
+            и запрос объединять нельзя.
+    """
+
+    # Несколько вариантов семплируются всегда, даже при жадном декодировании
+    do_sample = model_parameters.do_sample if request.do_sample is None else request.do_sample
+    if (do_sample or request.n > 1) and request.seed is None:
+        return None
+
+    canonical = {
+        "request": request.model_dump(),
+        "style": style_description,
+        "model": model_name,
+        "settings": {
+            "do_sample": model_parameters.do_sample,
+            "max_length": model_parameters.max_length,
+            "max_new_tokens": model_parameters.max_new_tokens,
+            "temperature": model_parameters.temperature,
+            "top_p": model_parameters.top_p,
+            "top_k": model_parameters.top_k,
+            "repetition_penalty": model_parameters.repetition_penalty
+        }
+    }
+    payload = json.dumps(canonical, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Flight:
+
+    """
+    Одна выполняющаяся генерация и все её ожидающие.
+
+    Фрагменты текста и итоговый результат поступают из рабочего потока очереди
+    генерации и пересылаются в цикл событий. Каждый ожидающий читает фрагменты
+    с начала, поэтому присоединившийся позже клиент получает поток целиком.
+
+    Attributes:
+        chunks (List[str]): Фрагменты текста, полученные на данный момент.
+        result (Optional[str]): Итоговый текст речи после завершения.
+        error (Optional[BaseException]): Исключение, если генерация не удалась.
+        done (bool): Признак завершения генерации.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.chunks = []
+        self.result = None
+        self.error = None
+        self.done = False
+        self.future: Optional[Future] = None
+        self._loop = loop
+        self._changed = asyncio.Event()
+        self._waiters = 0
+
+    def push_threadsafe(self, text: str):
+        """Передаёт фрагмент текста из рабочего потока в цикл событий."""
+        self._loop.call_soon_threadsafe(self._push, text)
+
+    def attach(self, future: Future):
+        """Связывает полёт с запросом в очереди генерации."""
+        self.future = future
+        future.add_done_callback(lambda f: self._loop.call_soon_threadsafe(self._finish, f))
+
+    def _notify(self):
+        # Каждое ожидание подписывается на текущее событие, новое создаётся после срабатывания
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _push(self, text: str):
+        self.chunks.append(text)
+        self._notify()
+
+    def _finish(self, future: Future):
+        if future.cancelled():
+            self.error = asyncio.CancelledError()
+        elif future.exception() is not None:
+            self.error = future.exception()
+        else:
+            self.result = future.result()
+            # Генерация без потока отдаёт подключившимся к потоку весь текст одним фрагментом
+            if not self.chunks:
+                self.chunks.append(self.result)
+        self.done = True
+        self._notify()
+
+    async def wait(self) -> str:
+
+        """
+        Дожидается итогового текста речи.
+
+        Returns:
+            str: Сгенерированный текст речи.
+
+        Raises:
+            Exception: Исключение генерации, общее для всех ожидающих.
+        """
+
+        self._waiters += 1
+        try:
+            while not self.done:
+                await self._changed.wait()
+        finally:
+            self._leave()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    async def stream(self) -> AsyncIterator[str]:
+
+        """
+        Отдаёт фрагменты текста с начала генерации по мере их появления.
+
+        Yields:
+            str: Очередной фрагмент текста речи.
+
+        Raises:
+            Exception: Исключение генерации, общее для всех ожидающих.
+        """
+
+        self._waiters += 1
+        sent = 0
+        try:
+            while True:
+                while sent < len(self.chunks):
+                    yield self.chunks[sent]
+                    sent += 1
+                if self.done:
+                    break
+                await self._changed.wait()
+        finally:
+            self._leave()
+        if self.error is not None:
+            raise self.error
+
+    def _leave(self):
+        # Отключение одного клиента не отменяет генерацию для остальных;
+        # запрос снимается из очереди, только если ждать его больше некому
+        self._waiters -= 1
+        if self._waiters == 0 and not self.done and self.future is not None:
+            self.future.cancel()
+
+
+class SingleFlight:
+
+    """
+    Реестр выполняющихся генераций по ключу объединения.
+
+    Полёт существует, пока идёт генерация: после завершения следующий
+    одинаковый запрос запускает новую генерацию (это не кэш ответов).
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, Flight] = {}
+
+    @property
+    def in_flight(self) -> int:
+        """Количество выполняющихся объединяемых генераций."""
+        return len(self._flights)
+
+    def run(
+        self,
+        key: Optional[str],
+        submit: Callable[[Optional[Callable[[str], None]]], Future],
+        stream: bool = False
+    ) -> Flight:
+
+        """
+        Присоединяется к генерации с тем же ключом или запускает новую.
+
+        Args:
+            key (Optional[str]): Ключ объединения; None - запрос не объединяется.
+            submit (Callable[[Optional[Callable[[str], None]]], Future]): Ставит генерацию
+                в очередь, принимая функцию для фрагментов текста (или None), и
+                возвращает её Future.
+            stream (bool): Нужен ли запускающему клиенту поток фрагментов. Генерация
+                без потока может попасть в общий батч с другими запросами.
+
+        Returns:
+            Flight: Полёт, результат или поток которого нужно ожидать.
+        """
+
+        if key is not None and key in self._flights:
+            return self._flights[key]
+
+        loop = asyncio.get_running_loop()
+        flight = Flight(loop)
+        flight.attach(submit(flight.push_threadsafe if stream else None))
+        if key is not None:
+            self._flights[key] = flight
+            flight.future.add_done_callback(lambda f: loop.call_soon_threadsafe(self._flights.pop, key, None))
+        return flight
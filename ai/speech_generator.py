@@ -3,11 +3,134 @@
 Включает класс SpeechGenerator для работы с моделью и генерации речей на основе запросов.
 """
 
-from typing import Dict
+import copy
+import gc
+import os
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
 from schemas.model import SpeechRequest
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from transformers import (
+    AutoTokenizer, AutoModelForCausalLM, CompileConfig, DynamicCache, StaticCache, StoppingCriteriaList, TextStreamer
+)
 import torch
+from ai.lora import AdapterManager
+from ai.memory import MemoryAccountant, RSSSampler, rss_bytes
+from ai.quantized_cache import cache_nbytes, new_cache
+from ai.ranking import score_speech
+from ai.stopping import SpeechStoppingCriteria, StreamTrimmer, find_stop
 import ai.model_parameters as model_parameters
+import ai.serving_parameters as serving_parameters
+
+# Наименьший размер статического KV-кэша; больше он растёт степенями двойки,
+# чтобы скомпилированные графы декодирования переиспользовались между запросами
+STATIC_CACHE_MIN_LENGTH = 512
+
+
+class _CallbackStreamer(TextStreamer):
+
+    """
+    Стример, передающий готовые фрагменты текста в функцию обратного вызова.
+
+    Текст проходит через StreamTrimmer: клиент не получает примечания и
+    стоп-строки, которые обрезаются в итоговом тексте речи.
+    """
+
+    def __init__(self, tokenizer, on_text: Callable[[str], None]):
+        super().__init__(tokenizer, skip_prompt=True, skip_special_tokens=True)
+        self.trimmer = StreamTrimmer(on_text)
+
+    def on_finalized_text(self, text: str, stream_end: bool = False):
+        self.trimmer.add(text, end=stream_end)
+
+
+class SpeechText(str):
+
+    """
+    Текст речи вместе со статистикой его генерации.
+
+    Ведёт себя как обычная строка, поэтому проходит через очередь генерации
+    и пакетные задания без изменений; статистика используется в метаданных ответа API.
+
+    Attributes:
+        prompt_tokens (int): Количество токенов промпта (в структурном режиме - всех проходов).
+        completion_tokens (int): Количество сгенерированных токенов.
+        generation_seconds (float): Длительность вызова модели, в котором сгенерирована речь.
+        settings_version (int): Версия параметров генерации на момент генерации.
+        stop_reason (str): Причина окончания: "eos" (модель завершила ответ), "length"
+            (исчерпан лимит токенов), "stop_string" или "completion" (досрочная остановка).
+        tokens_saved (int): Токены лимита, которые не пришлось декодировать благодаря
+            досрочной остановке.
+        score (Optional[float]): Оценка варианта при ранжировании (см. ai/ranking.py).
+        candidates (List[SpeechText]): Все варианты при генерации нескольких вариантов
+            (request.n > 1), первый - сама речь; иначе пустой список.
+    """
+
+    def __new__(
+        cls,
+        text: str,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        generation_seconds: float = 0.0,
+        stop_reason: str = "eos",
+        tokens_saved: int = 0
+    ):
+        speech = super().__new__(cls, text)
+        speech.prompt_tokens = prompt_tokens
+        speech.completion_tokens = completion_tokens
+        speech.generation_seconds = generation_seconds
+        speech.stop_reason = stop_reason
+        speech.tokens_saved = tokens_saved
+        speech.score = None
+        speech.candidates = []
+        speech.settings_version = model_parameters.settings_version
+        return speech
+
+
+@dataclass
+class WarmupStep:
+    """Одна прогревочная генерация: стиль, размер батча, длина промпта и длительность."""
+    style: str
+    batch_size: int
+    prompt_tokens: int
+    seconds: float
+
+
+@dataclass
+class TokenBudget:
+
+    """
+    Бюджет токенов запроса до генерации.
+
+    Attributes:
+        base_tokens (int): Системный промпт, разметка чата, параметры речи и задание.
+        key_points_tokens (int): Ключевые моменты.
+        custom_instructions_tokens (int): Дополнительные требования.
+        prompt_tokens (int): Весь промпт самого длинного прохода генерации.
+        planned_output_tokens (int): Лимит новых токенов этого прохода.
+        max_prompt_tokens (int): Длина промпта, после которой токенизатор обрезает его конец.
+        context_tokens (int): Контекстное окно модели (промпт + ответ).
+        predicted_seconds (Optional[float]): Ожидаемая длительность декодирования по
+            скорости предыдущих генераций; None, пока генераций не было.
+    """
+
+    base_tokens: int
+    key_points_tokens: int
+    custom_instructions_tokens: int
+    prompt_tokens: int
+    planned_output_tokens: int
+    max_prompt_tokens: int
+    context_tokens: int
+    predicted_seconds: Optional[float] = None
+
+    @property
+    def fits(self) -> bool:
+        """Промпт не будет обрезан, и ответ помещается в контекст после него."""
+        return (
+            self.prompt_tokens <= self.max_prompt_tokens
+            and self.prompt_tokens + self.planned_output_tokens <= self.context_tokens
+        )
 
 
 class SpeechGenerator:
@@ -21,10 +144,28 @@ class SpeechGenerator:
     Attributes:
         SYSTEM_PROMPT (str): Системный промпт, определяющий роль модели.
         USER_PROMPT (str): Базовый пользовательский промпт для генерации речи.
+        OUTLINE_PROMPT (str): Промпт для составления плана речи в структурном режиме.
+        SECTION_PROMPTS (Dict[str, str]): Промпты разделов речи в структурном режиме,
+            в порядке их следования в итоговом тексте.
+        model_name (str): Идентификатор модели на Hugging Face или путь к ней.
         model (AutoModelForCausalLM): Загруженная языковая модель.
         tokenizer (AutoTokenizer): Токенизатор для обработки текста.
+        budget_tokenizer (AutoTokenizer): Отдельный экземпляр токенизатора для подсчёта
+            токенов (count_tokens). Быстрый токенизатор хранит состояние паддинга
+            и обрезки, поэтому подсчёт бюджета из потоков эндпоинтов не должен
+            пользоваться экземпляром, которым в это время кодируется батч генерации.
         device (str): Устройство для вычислений ('cuda' или 'cpu').
         model_loaded (bool): Флаг загрузки модели.
+        load_peak_rss_bytes (int): Пиковая RSS процесса во время загрузки модели.
+        load_rss_bytes (int): RSS процесса после загрузки модели.
+        offloaded_modules (List[str]): Модули модели, выгруженные на диск в режиме low_memory.
+        seconds_per_token (Optional[float]): Скользящая оценка длительности шага декодирования.
+        stop_token_ids (List[int]): Токены, кроме EOS, которыми заканчивается ответ
+            (serving_parameters.stop_tokens, найденные в словаре токенизатора).
+        adapters (Optional[AdapterManager]): LoRA-адаптеры стилей (ai/lora.py);
+            создаётся при первом запросе стиля с адаптером.
+        memory (MemoryAccountant): Журнал памяти генераций generate_speech и
+            generate_batch (при serving_parameters.memory_accounting).
     """
 
     SYSTEM_PROMPT = '''Ты - профессиональный спичрайтер и оратор.
@@ -32,19 +173,52 @@ class SpeechGenerator:
     Речь должна быть естественной, убедительной и подходящей для устного выступления.'''
     USER_PROMPT = '''Пожалуйста, напиши полноценную речь с вступлением, основной частью и заключением.
     Речь должна быть готова для непосредственного произнесения.'''
+    OUTLINE_PROMPT = '''Пожалуйста, составь краткий план речи: по одной строке
+    для вступления, основной части и заключения. Не пиши саму речь.'''
+    SECTION_PROMPTS = {
+        "вступление": '''Напиши только вступление этой речи по плану выше.
+    Не пиши основную часть и заключение.''',
+        "основная часть": '''Напиши только основную часть этой речи по плану выше,
+    без приветствия и без заключения.''',
+        "заключение": '''Напиши только заключение этой речи по плану выше,
+    без повторного приветствия и вступления.'''
+    }
 
-    def __init__(self):
+    DEFAULT_MODEL_NAME = 'microsoft/Phi-3-mini-4k-instruct'
+    # Вес нового замера в скользящей оценке скорости декодирования
+    DECODE_SPEED_SMOOTHING = 0.2
+    COMPILE_CACHE_FILE = 'cache_artifacts.bin'
+    WARMUP_STYLES = {"нейтральный": "Нейтральный стиль выступления"}
+    WARMUP_FILLER = "Приведи пример из практики и подробно его разбери. "
+
+    def __init__(self, model_name: str = DEFAULT_MODEL_NAME):
 
         """
         Инициализирует генератор речей.
 
         Определяет устройство для вычислений и устанавливает флаг загрузки модели в False.
+
+        Args:
+            model_name (str): Идентификатор модели на Hugging Face или путь к ней.
+                По умолчанию Phi-3-mini-4k-instruct.
         """
 
+        self.model_name = model_name
         self.model = None
         self.tokenizer = None
+        self.budget_tokenizer = None
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         self.model_loaded = False
+        self.load_peak_rss_bytes = 0
+        self.load_rss_bytes = 0
+        self.offloaded_modules = []
+        self.seconds_per_token = None
+        self.stop_token_ids = []
+        self.adapters = None
+        self.memory = MemoryAccountant(serving_parameters.memory_history_size, serving_parameters.memory_count_tensors)
+        self._static_cache = None
+        self._static_cache_length = 0
+        self._compile_cache_saved = False
 
     def load_model(self):
 
@@ -52,7 +226,16 @@ class SpeechGenerator:
         Загружает модель Phi-3 mini и токенизатор с Hugging Face.
 
         Загружает предобученную модель и токенизатор, настраивает pad_token
-        и определяет конфигурацию модели для генерации.
+        и определяет конфигурацию модели для генерации. Тип весов, реализация
+        внимания и число потоков torch берутся из параметров обслуживания
+        (model_dtype, attn_implementation, torch_threads). Если включена компиляция
+        шага декодирования, подгружает сохранённый кэш скомпилированных графов.
+
+        В режиме low_memory веса читаются из отображённых в память safetensors
+        по одному тензору, а в оперативной памяти размещается не больше
+        load_memory_budget_gb весов; остальные слои декодера выгружаются на диск
+        и подгружаются при прямом проходе. Пиковая и итоговая RSS сохраняются
+        в load_peak_rss_bytes и load_rss_bytes.
 
         Raises:
             Exception: Если произошла ошибка при загрузке модели.
@@ -60,33 +243,88 @@ class SpeechGenerator:
 
         try:
             self.tokenizer = AutoTokenizer.from_pretrained(
-                'microsoft/Phi-3-mini-4k-instruct',
+                self.model_name,
                 trust_remote_code=True
             )
             if self.tokenizer.pad_token is None:
                 self.tokenizer.pad_token = self.tokenizer.eos_token
+            # Для батчевой генерации декодер-only модели промпты выравниваются по правому краю
+            self.tokenizer.padding_side = "left"
+            self.budget_tokenizer = copy.deepcopy(self.tokenizer)
+            self.stop_token_ids = self._find_stop_token_ids()
 
-            self.model = AutoModelForCausalLM.from_pretrained(
-                'microsoft/Phi-3-mini-4k-instruct',
-                dtype=torch.float16,
-                device_map="auto",
-                trust_remote_code=False,
-                attn_implementation="eager"
+            if serving_parameters.torch_threads:
+                torch.set_num_threads(serving_parameters.torch_threads)
+            with RSSSampler() as sampler:
+                self.model = AutoModelForCausalLM.from_pretrained(
+                    self.model_name,
+                    dtype=getattr(torch, serving_parameters.model_dtype),
+                    device_map="auto",
+                    trust_remote_code=False,
+                    attn_implementation=serving_parameters.attn_implementation,
+                    **self._low_memory_kwargs()
+                )
+            gc.collect()
+            self.load_peak_rss_bytes = sampler.peak_bytes
+            self.load_rss_bytes = rss_bytes()
+            self.offloaded_modules = [
+                name for name, device in (getattr(self.model, "hf_device_map", None) or {}).items() if device == "disk"
+            ]
+            print(
+                f"RSS при загрузке модели: пик {self.load_peak_rss_bytes / 1024 ** 2:.0f} МБ, "
+                f"после загрузки {self.load_rss_bytes / 1024 ** 2:.0f} МБ, "
+                f"модулей на диске: {len(self.offloaded_modules)}"
             )
+            if serving_parameters.compile_decode:
+                self._load_compile_cache()
             self.model_loaded = True
 
         except Exception as e:
             print(f"Ошибка при загрузке модели: {e}")
             raise
 
-    def generate_prompt(self, request: SpeechRequest, available_styles: Dict[str, str]) -> str:
+    def _low_memory_kwargs(self) -> dict:
+
+        """
+        Параметры from_pretrained для загрузки в пределах бюджета памяти.
+
+        Returns:
+            dict: Пустой словарь вне режима low_memory, иначе max_memory
+                (бюджет оперативной памяти и свободная память GPU) и каталог
+                для выгрузки слоёв на диск.
+        """
+
+        if not serving_parameters.low_memory:
+            return {}
+        max_memory = {"cpu": int(serving_parameters.load_memory_budget_gb * 1024 ** 3)}
+        if torch.cuda.is_available():
+            for index in range(torch.cuda.device_count()):
+                max_memory[index] = torch.cuda.mem_get_info(index)[0]
+        return {
+            "low_cpu_mem_usage": True,
+            "use_safetensors": True,
+            "max_memory": max_memory,
+            "offload_folder": serving_parameters.offload_folder
+        }
+
+    def generate_prompt(
+        self,
+        request: SpeechRequest,
+        available_styles: Dict[str, str],
+        instruction: Optional[str] = None
+    ) -> str:
 
         """
         Генерирует форматированный промпт для модели на основе запроса.
 
+        Для стиля с LoRA-адаптером (serving_parameters.style_adapters) вместо
+        описания стиля в промпт попадает только его название.
+
         Args:
             request (SpeechRequest): Объект запроса с параметрами речи.
             available_styles (Dict[str, str]): Словарь доступных стилей выступления.
+            instruction (Optional[str]): Задание в конце сообщения пользователя.
+                По умолчанию USER_PROMPT - написать речь целиком.
 
         Returns:
             str: Отформатированный промпт в виде строки.
@@ -97,7 +335,8 @@ class SpeechGenerator:
 
         if request.style not in available_styles:
             raise ValueError(f"Стиль '{request.style}' не найден. Доступные стили: {', '.join(available_styles.keys())}")
-        style_description = available_styles[request.style]
+        # Стиль с LoRA-адаптером задан весами, в промпте достаточно его названия
+        style_description = request.style if self.style_adapter(request.style) else available_styles[request.style]
 
         user_message = f"""
 Тема речи: {request.topic}
@@ -111,11 +350,16 @@ class SpeechGenerator:
             user_message += f"Ключевые моменты для раскрытия:\n{points_text}\n\n"
         if request.custom_instructions:
             user_message += f"Дополнительные требования:\n{request.custom_instructions}\n\n"
-        user_message += self.USER_PROMPT
+        user_message += instruction or self.USER_PROMPT
         chat_format = f"<|system|>\n{self.SYSTEM_PROMPT}<|end|>\n<|user|>\n{user_message}<|end|>\n<|assistant|>\n"
         return chat_format
 
-    def generate_speech(self, request: SpeechRequest, available_styles: Dict[str, str]) -> str:
+    def generate_speech(
+        self,
+        request: SpeechRequest,
+        available_styles: Dict[str, str],
+        on_text: Optional[Callable[[str], None]] = None
+    ) -> str:
 
         """
         Генерирует речь на основе запроса с использованием загруженной модели.
@@ -123,6 +367,9 @@ class SpeechGenerator:
         Args:
             request (SpeechRequest): Объект запроса с параметрами речи.
             available_styles (Dict[str, str]): Словарь доступных стилей выступления.
+            on_text (Optional[Callable[[str], None]]): Функция, получающая фрагменты
+                текста по мере декодирования. В структурном режиме разделы
+                генерируются параллельно, поэтому речь передаётся одним фрагментом.
 
         Returns:
             str: Сгенерированный текст речи.
@@ -132,15 +379,459 @@ class SpeechGenerator:
             Exception: Если произошла ошибка при генерации текста.
         """
 
+        with self._measure_memory(request.topic):
+            if request.n > 1:
+                if on_text is not None:
+                    raise ValueError("Потоковая генерация возвращает одну речь, n > 1 не поддерживается")
+                return self.generate_candidates(request, available_styles)
+
+            if on_text is None or request.structured:
+                speech = self.generate_batch([request], available_styles)[0]
+                if on_text is not None:
+                    on_text(speech)
+                return speech
+
+            if not self.model_loaded:
+                raise RuntimeError("Модель не загружена. Подождите.")
+            self._seed(request)
+            prompt = self.generate_prompt(request, available_styles)
+            return self._generate_texts(
+                [prompt],
+                self._max_new_tokens(request),
+                streamer=_CallbackStreamer(self.tokenizer, on_text),
+                do_sample=request.do_sample,
+                adapters=[self.style_adapter(request.style)]
+            )[0]
+
+    def generate_batch(self, requests: List[SpeechRequest], available_styles: Dict[str, str]) -> List[str]:
+
+        """
+        Генерирует несколько речей одним вызовом модели.
+
+        Промпты токенизируются вместе с выравниванием паддингом слева, поэтому
+        все последовательности декодируются параллельно за один проход generate.
+        Запросы с разными собственными параметрами генерации (max_new_tokens,
+        do_sample) генерируются отдельными вызовами. Запросы в структурном режиме (structured=True) генерируются отдельным
+        батчем по разделам, см. _generate_structured; запросы нескольких
+        вариантов (n > 1) - каждый своим вызовом, см. generate_candidates.
+
+        Args:
+            requests (List[SpeechRequest]): Запросы с параметрами речей.
+            available_styles (Dict[str, str]): Словарь доступных стилей выступления.
+
+        Returns:
+            List[str]: Тексты речей в том же порядке, что и запросы.
+
+        Raises:
+            RuntimeError: Если модель не была загружена перед вызовом.
+            ValueError: Если стиль одного из запросов не найден.
+            Exception: Если произошла ошибка при генерации текста.
+        """
+
         if not self.model_loaded:
             raise RuntimeError("Модель не загружена. Подождите.")
 
+        with self._measure_memory(self._memory_label(requests), len(requests)):
+            self._seed(*requests)
+            responses = [None] * len(requests)
+            plain = [index for index, request in enumerate(requests) if not request.structured and request.n == 1]
+            structured = [index for index, request in enumerate(requests) if request.structured]
+            multiple = [index for index, request in enumerate(requests) if not request.structured and request.n != 1]
+
+            for (max_new_tokens, do_sample), group in self._settings_groups(requests, plain).items():
+                prompts = [self.generate_prompt(requests[index], available_styles) for index in group]
+                adapters = [self.style_adapter(requests[index].style) for index in group]
+                texts = self._generate_texts(prompts, max_new_tokens, do_sample=do_sample, adapters=adapters)
+                for index, response in zip(group, texts):
+                    responses[index] = response
+            for (max_new_tokens, do_sample), group in self._settings_groups(requests, structured).items():
+                speeches = self._generate_structured(
+                    [requests[index] for index in group], available_styles, max_new_tokens, do_sample
+                )
+                for index, speech in zip(group, speeches):
+                    responses[index] = speech
+            for index in multiple:
+                responses[index] = self.generate_candidates(requests[index], available_styles)
+
+            return responses
+
+    @staticmethod
+    def _max_new_tokens(request: SpeechRequest) -> int:
+        """Лимит новых токенов запроса: собственный, но не больше общего max_new_tokens."""
+        if request.max_new_tokens is None:
+            return model_parameters.max_new_tokens
+        return max(1, min(request.max_new_tokens, model_parameters.max_new_tokens))
+
+    def _settings_groups(
+        self, requests: List[SpeechRequest], indices: List[int]
+    ) -> Dict[Tuple[int, Optional[bool]], List[int]]:
+        """Группирует запросы по собственным параметрам генерации для общих вызовов модели."""
+        groups = {}
+        for index in indices:
+            settings = (self._max_new_tokens(requests[index]), requests[index].do_sample)
+            groups.setdefault(settings, []).append(index)
+        return groups
+
+    def _measure_memory(self, label: str, requests: int = 1):
+        # Вложенный вызов (generate_speech -> generate_batch) учитывается внешним
+        if not serving_parameters.memory_accounting:
+            return nullcontext()
+        return self.memory.measure(label, requests)
+
+    @staticmethod
+    def _memory_label(requests: List[SpeechRequest]) -> str:
+        if len(requests) == 1:
+            return requests[0].topic
+        return f"батч из {len(requests)} запросов"
+
+    def style_adapter(self, style: str) -> Optional[str]:
+
+        """
+        Возвращает LoRA-адаптер стиля для этой модели.
+
+        Args:
+            style (str): Название стиля.
+
+        Returns:
+            Optional[str]: Каталог адаптера из serving_parameters.style_adapters или None,
+                если у стиля нет адаптера либо он недоступен или обучен для другой модели.
+        """
+
+        path = serving_parameters.style_adapters.get(style)
+        if path is None or self.model is None:
+            return None
+        if self.adapters is None:
+            self.adapters = AdapterManager(self.model, self.model_name, serving_parameters.lora_max_adapters)
+        return path if self.adapters.compatible(path) else None
+
+    def _activate_adapters(self, adapters: Optional[List[Optional[str]]]):
+        # Строки батча повторяют промпты, при нескольких вариантах адаптер у них один
+        if not any(adapters or ()):
+            return nullcontext()
+        return self.adapters.activate(adapters)
+
+    def generate_candidates(self, request: SpeechRequest, available_styles: Dict[str, str]) -> SpeechText:
+
+        """
+        Генерирует request.n вариантов речи с одним проходом по промпту.
+
+        Промпт (кроме последнего токена) прогоняется через модель один раз, его
+        KV-кэш размножается на n строк, и все варианты семплируются одним вызовом
+        generate. Семплирование включается независимо от do_sample, иначе
+        варианты совпали бы. При request.rank варианты упорядочиваются по оценке
+        ai/ranking.py, лучший - первым.
+
+        Args:
+            request (SpeechRequest): Запрос с параметрами речи и количеством вариантов n.
+            available_styles (Dict[str, str]): Словарь доступных стилей выступления.
+
+        Returns:
+            SpeechText: Первый вариант; все варианты - в его атрибуте candidates.
+
+        Raises:
+            RuntimeError: Если модель не была загружена перед вызовом.
+            ValueError: Если n вне диапазона 1..max_candidates, запрос в структурном
+                режиме или стиль не найден.
+        """
+
+        if not self.model_loaded:
+            raise RuntimeError("Модель не загружена. Подождите.")
+        if not 1 <= request.n <= serving_parameters.max_candidates:
+            raise ValueError(f"Количество вариантов n должно быть от 1 до {serving_parameters.max_candidates}")
+        if request.structured:
+            raise ValueError("Несколько вариантов не поддерживаются в структурном режиме")
+
+        self._seed(request)
         prompt = self.generate_prompt(request, available_styles)
+        candidates = self._generate_texts(
+            [prompt], self._max_new_tokens(request), num_candidates=request.n, adapters=[self.style_adapter(request.style)]
+        )
+        if request.rank:
+            for candidate in candidates:
+                candidate.score = score_speech(candidate, request)
+            candidates.sort(key=lambda candidate: candidate.score, reverse=True)
+
+        best = candidates[0]
+        best.candidates = candidates
+        return best
+
+    def _generate_structured(
+        self,
+        requests: List[SpeechRequest],
+        available_styles: Dict[str, str],
+        max_new_tokens: Optional[int] = None,
+        do_sample: Optional[bool] = None
+    ) -> List[SpeechText]:
+
+        """
+        Генерирует речи в структурном режиме: сначала план, затем все разделы параллельно.
+
+        Первый проход коротким батчем составляет планы всех речей. Во втором проходе
+        каждый раздел каждой речи становится отдельной строкой одного батча: строки
+        одной речи отличаются только заданием в конце промпта, а лимит новых токенов
+        делится между разделами. Поэтому длительность декодирования определяется
+        самым длинным разделом, а не всей речью.
+
+        Args:
+            requests (List[SpeechRequest]): Запросы в структурном режиме.
+            available_styles (Dict[str, str]): Словарь доступных стилей выступления.
+            max_new_tokens (Optional[int]): Лимит новых токенов речи, делится между
+                разделами. По умолчанию берётся из параметров генерации.
+            do_sample (Optional[bool]): Семплирование вместо параметра генерации do_sample.
+
+        Returns:
+            List[SpeechText]: Речи, склеенные из разделов в порядке SECTION_PROMPTS,
+                со статистикой обоих проходов.
+        """
+
+        outline_prompts = [
+            self.generate_prompt(request, available_styles, self.OUTLINE_PROMPT)
+            for request in requests
+        ]
+        adapters = [self.style_adapter(request.style) for request in requests]
+        outlines = self._generate_texts(
+            outline_prompts, serving_parameters.outline_max_new_tokens, do_sample=do_sample, adapters=adapters
+        )
+
+        section_prompts = [
+            self.generate_prompt(request, available_styles, f"План речи:\n{outline}\n\n{section_prompt}")
+            for request, outline in zip(requests, outlines)
+            for section_prompt in self.SECTION_PROMPTS.values()
+        ]
+        section_tokens = max(1, (max_new_tokens or model_parameters.max_new_tokens) // len(self.SECTION_PROMPTS))
+        section_adapters = [adapter for adapter in adapters for _ in self.SECTION_PROMPTS]
+        sections = self._generate_texts(section_prompts, section_tokens, do_sample=do_sample, adapters=section_adapters)
+
+        sections_count = len(self.SECTION_PROMPTS)
+        speeches = []
+        for outline, start in zip(outlines, range(0, len(sections), sections_count)):
+            parts = sections[start:start + sections_count]
+            speeches.append(SpeechText(
+                "\n\n".join(parts),
+                prompt_tokens=outline.prompt_tokens + sum(part.prompt_tokens for part in parts),
+                completion_tokens=outline.completion_tokens + sum(part.completion_tokens for part in parts),
+                generation_seconds=outline.generation_seconds + parts[0].generation_seconds,
+                stop_reason=parts[-1].stop_reason,
+                tokens_saved=outline.tokens_saved + sum(part.tokens_saved for part in parts)
+            ))
+        return speeches
+
+    def warm_up(self, available_styles: Dict[str, str]) -> List[WarmupStep]:
+
+        """
+        Прогревает модель синтетическими генерациями перед приёмом запросов.
+
+        Первые генерации после загрузки заметно медленнее установившихся: ядра
+        инициализируются лениво, аллокатор постепенно наращивает пулы памяти,
+        а при compile_decode компилируется шаг декодирования. Прогрев выполняет
+        короткие генерации (warmup_max_new_tokens) для каждой длины промпта из
+        warmup_prompt_tokens и каждого размера батча из warmup_batch_sizes.
+        Формы тензоров зависят от длины промпта и размера батча, а не от стиля,
+        поэтому все генерации используют один представительный стиль
+        (warmup_style): время прогрева не растёт с размером каталога стилей.
+
+        Args:
+            available_styles (Dict[str, str]): Стили, из которых выбирается стиль прогрева.
+                Если стилей нет, используется WARMUP_STYLES.
+
+        Returns:
+            List[WarmupStep]: Длительность каждой прогревочной генерации.
+
+        Raises:
+            RuntimeError: Если модель не была загружена перед вызовом.
+        """
+
+        if not self.model_loaded:
+            raise RuntimeError("Модель не загружена. Подождите.")
+
+        styles = self.warmup_style(available_styles)
+        [style] = styles
+        steps = []
+        for prompt_tokens in serving_parameters.warmup_prompt_tokens:
+            prompt = self._warmup_prompt(style, styles, prompt_tokens)
+            for batch_size in serving_parameters.warmup_batch_sizes:
+                started = time.perf_counter()
+                speeches = self._generate_texts([prompt] * batch_size, serving_parameters.warmup_max_new_tokens)
+                steps.append(WarmupStep(
+                    style=style,
+                    batch_size=batch_size,
+                    prompt_tokens=speeches[0].prompt_tokens,
+                    seconds=time.perf_counter() - started
+                ))
+                print(
+                    f"Прогрев: стиль '{style}', батч {batch_size}, "
+                    f"промпт {steps[-1].prompt_tokens} токенов - {steps[-1].seconds:.2f} с"
+                )
+        return steps
+
+    @classmethod
+    def warmup_style(cls, available_styles: Dict[str, str]) -> Dict[str, str]:
+
+        """
+        Выбирает один стиль для прогрева.
+
+        Берётся первый стиль без LoRA-адаптера: прогрев не должен загружать
+        адаптеры. Если таких стилей нет, используется WARMUP_STYLES.
+
+        Args:
+            available_styles (Dict[str, str]): Словарь доступных стилей выступления.
+
+        Returns:
+            Dict[str, str]: Словарь из одного стиля.
+        """
+
+        for style, description in available_styles.items():
+            if style not in serving_parameters.style_adapters:
+                return {style: description}
+        return dict(cls.WARMUP_STYLES)
+
+    def _warmup_prompt(self, style: str, available_styles: Dict[str, str], prompt_tokens: int) -> str:
+        # Промпт дополняется инструкциями-заполнителями до нужной длины, но оставляет место для ответа
+        target = min(prompt_tokens, model_parameters.max_length - serving_parameters.warmup_max_new_tokens)
+        request = SpeechRequest(topic="Итоги года", duration_minutes=5, style=style)
+        base_tokens = self.count_tokens(self.generate_prompt(request, available_styles))
+        filler_tokens = max(1, self.count_tokens(self.WARMUP_FILLER))
+        request.custom_instructions = self.WARMUP_FILLER * max(0, (target - base_tokens) // filler_tokens)
+        return self.generate_prompt(request, available_styles)
+
+    def token_budget(self, request: SpeechRequest, available_styles: Dict[str, str]) -> TokenBudget:
+
+        """
+        Считает токены промпта запроса и планируемого ответа без генерации.
+
+        Промпт, длиннее max_length, токенизатор обрезает вместе с концом сообщения
+        и маркером ответа модели, а ответ, не помещающийся в контекст после промпта,
+        не может быть сгенерирован полностью. Такие запросы лучше отклонять до
+        постановки в очередь. В структурном режиме оценивается проход разделов:
+        его промпт включает план речи.
+
+        Args:
+            request (SpeechRequest): Запрос с параметрами речи.
+            available_styles (Dict[str, str]): Словарь доступных стилей выступления.
+
+        Returns:
+            TokenBudget: Разбивка промпта по частям и лимиты контекста.
+
+        Raises:
+            RuntimeError: Если модель не была загружена перед вызовом.
+            ValueError: Если стиль запроса не найден.
+        """
+
+        if not self.model_loaded:
+            raise RuntimeError("Модель не загружена. Подождите.")
+
+        instruction = None
+        extra_tokens = 0
+        planned_output_tokens = self._max_new_tokens(request)
+        if request.structured:
+            longest_section = max(self.SECTION_PROMPTS.values(), key=len)
+            instruction = f"План речи:\n\n\n{longest_section}"
+            extra_tokens = serving_parameters.outline_max_new_tokens
+            planned_output_tokens = max(1, planned_output_tokens // len(self.SECTION_PROMPTS))
+
+        bare = request.model_copy(update={"key_points": None, "custom_instructions": None})
+        base_tokens = self.count_tokens(self.generate_prompt(bare, available_styles, instruction)) + extra_tokens
+        without_instructions = request.model_copy(update={"custom_instructions": None})
+        with_key_points = self.count_tokens(self.generate_prompt(without_instructions, available_styles, instruction))
+        prompt_tokens = self.count_tokens(self.generate_prompt(request, available_styles, instruction)) + extra_tokens
+
+        predicted_seconds = None
+        if self.seconds_per_token is not None:
+            predicted_seconds = round(planned_output_tokens * self.seconds_per_token, 2)
+
+        return TokenBudget(
+            base_tokens=base_tokens,
+            key_points_tokens=with_key_points + extra_tokens - base_tokens,
+            custom_instructions_tokens=prompt_tokens - with_key_points - extra_tokens,
+            prompt_tokens=prompt_tokens,
+            planned_output_tokens=planned_output_tokens,
+            max_prompt_tokens=model_parameters.max_length,
+            context_tokens=self._context_tokens(),
+            predicted_seconds=predicted_seconds
+        )
+
+    def _context_tokens(self) -> int:
+        # Контекстное окно из конфигурации модели; без него - общий лимит max_length
+        try:
+            return int(self.model.config.max_position_embeddings)
+        except (AttributeError, TypeError, ValueError):
+            return model_parameters.max_length
+
+    def _record_decode_speed(self, generation_seconds: float, tokens: int):
+        if tokens <= 0:
+            return
+        seconds_per_token = generation_seconds / tokens
+        if self.seconds_per_token is None:
+            self.seconds_per_token = seconds_per_token
+        else:
+            self.seconds_per_token += self.DECODE_SPEED_SMOOTHING * (seconds_per_token - self.seconds_per_token)
+
+    def count_tokens(self, text: str) -> int:
+
+        """
+        Считает токены текста без генерации.
+
+        Использует budget_tokenizer, поэтому безопасен для вызова из других
+        потоков во время генерации.
+
+        Args:
+            text (str): Текст (например, готовый промпт).
+
+        Returns:
+            int: Количество токенов.
+        """
+
+        return len(self.budget_tokenizer(text, add_special_tokens=False)["input_ids"])
+
+    @staticmethod
+    def _seed(*requests: SpeechRequest):
+
+        """
+        Фиксирует генератор случайных чисел по seed запроса, если он задан.
+
+        Очередь генерации не объединяет запросы с seed в батчи с другими,
+        поэтому seed однозначно определяет результат семплирования.
+        """
+
+        for request in requests:
+            if request.seed is not None:
+                torch.manual_seed(request.seed)
+                return
+
+    def _generate_texts(
+        self,
+        prompts: List[str],
+        max_new_tokens: Optional[int] = None,
+        streamer: Optional[TextStreamer] = None,
+        num_candidates: int = 1,
+        do_sample: Optional[bool] = None,
+        adapters: Optional[List[Optional[str]]] = None
+    ) -> List[SpeechText]:
+
+        """
+        Выполняет один батчевый вызов модели для готовых промптов.
+
+        Args:
+            prompts (List[str]): Промпты в формате чата Phi-3.
+            max_new_tokens (Optional[int]): Лимит новых токенов. По умолчанию
+                берётся из параметров генерации.
+            streamer (Optional[TextStreamer]): Стример токенов, только для одного промпта.
+            num_candidates (int): Количество вариантов ответа, только для одного промпта;
+                проход по промпту выполняется один раз для всех вариантов.
+            do_sample (Optional[bool]): Семплирование вместо параметра генерации do_sample.
+            adapters (Optional[List[Optional[str]]]): LoRA-адаптер каждого промпта
+                (см. style_adapter); None - все промпты генерируются базовой моделью.
+
+        Returns:
+            List[SpeechText]: Очищенные ответы модели в порядке промптов (или вариантов)
+                со статистикой токенов; длительность генерации у всех ответов батча общая.
+        """
 
         try:
-            print('Начало конфигурации')
+            print(f'Начало конфигурации, запросов в батче: {len(prompts)}')
+            started = time.perf_counter()
             inputs = self.tokenizer(
-                prompt,
+                prompts,
                 return_tensors="pt",
                 padding=True,
                 truncation=True,
@@ -149,36 +840,306 @@ class SpeechGenerator:
 
             print('Сконфигурировал tokenizer')
 
-            with torch.no_grad():
-                outputs = self.model.generate(
-                    **inputs,
-                    max_new_tokens=model_parameters.max_new_tokens,  # Максимальная длина ответа
-                    temperature=model_parameters.temperature,
-                    do_sample=model_parameters.do_sample,
-                    top_p=model_parameters.top_p,
-                    top_k=model_parameters.top_k,
-                    pad_token_id=self.tokenizer.eos_token_id,
-                    repetition_penalty=model_parameters.repetition_penalty,
-                    eos_token_id=self.tokenizer.eos_token_id
+            generation_kwargs = self._generation_kwargs()
+            if max_new_tokens is not None:
+                generation_kwargs["max_new_tokens"] = max_new_tokens
+            if do_sample is not None:
+                generation_kwargs["do_sample"] = do_sample
+            if streamer is not None:
+                generation_kwargs["streamer"] = streamer
+            # Адаптеры стилей действуют и на общий проход по промпту нескольких вариантов
+            with self._activate_adapters(adapters):
+                if num_candidates > 1:
+                    generation_kwargs.update(self._shared_prefill_kwargs(inputs, num_candidates))
+                    inputs = {name: tensor.repeat(num_candidates, 1) for name, tensor in inputs.items()}
+
+                # Все промпты выровнены до одной длины, ответ начинается сразу после неё
+                prompt_length = inputs["input_ids"].shape[1]
+                static_cache_used = (
+                    serving_parameters.static_cache
+                    and len(prompts) == 1
+                    and num_candidates == 1
+                    and prompt_length < self._context_tokens()
+                    # Шаг декодирования с адаптерами не компилируется в один граф
+                    and not any(adapters or ())
+                    and not serving_parameters.kv_cache_format
                 )
+                if static_cache_used:
+                    generation_kwargs.update(self._static_cache_kwargs(prompt_length, generation_kwargs["max_new_tokens"]))
+                elif serving_parameters.kv_cache_format and "past_key_values" not in generation_kwargs:
+                    generation_kwargs["past_key_values"] = self._new_cache()
+                stopping_criteria = None
+                if serving_parameters.stop_strings or serving_parameters.completion_phrases:
+                    stopping_criteria = SpeechStoppingCriteria(
+                        self.tokenizer, prompt_length, inputs["input_ids"].shape[0], self._eos_token_ids()
+                    )
+                    generation_kwargs["stopping_criteria"] = StoppingCriteriaList([stopping_criteria])
+
+                with torch.no_grad():
+                    outputs = self.model.generate(**inputs, **generation_kwargs)
+
+            if static_cache_used and serving_parameters.compile_decode and not self._compile_cache_saved:
+                self.save_compile_cache()
+            if serving_parameters.kv_cache_format:
+                kv_cache_bytes = cache_nbytes(generation_kwargs["past_key_values"])
+                print(f'KV-кэш {serving_parameters.kv_cache_format}: {kv_cache_bytes / 1024 ** 2:.1f} МБ '
+                      f'на {len(outputs)} посл.')
 
             print('Получил ответ от модели')
 
-            generated_text = self.tokenizer.decode(
-                outputs[0],
-                skip_special_tokens=True
-            )
+            generation_seconds = time.perf_counter() - started
+            responses = [
+                self._speech_text(
+                    output[prompt_length:],
+                    int(attention_mask.sum()),
+                    stopping_criteria.stops[row] if stopping_criteria is not None else None,
+                    generation_kwargs["max_new_tokens"],
+                    generation_seconds
+                )
+                for row, (output, attention_mask) in enumerate(zip(outputs, inputs["attention_mask"]))
+            ]
+            tokens_saved = sum(response.tokens_saved for response in responses)
+            if tokens_saved:
+                print(f'Досрочная остановка, не декодировано токенов: {tokens_saved}')
+            # Строки батча декодируются параллельно, шагов столько, сколько токенов у самой длинной
+            self._record_decode_speed(generation_seconds, max(response.completion_tokens for response in responses))
 
             print('Десериализация ответа')
 
-            if "<|assistant|>\n" in generated_text:
-                response = generated_text.split("<|assistant|>\n")[-1]
-                response = response.replace("<|end|>", "").strip()
-            else:
-                response = generated_text[len(prompt):].strip()
-
-            return response
+            return responses
 
         except Exception as e:
             print(f"Ошибка при генерации речи: {e}")
             raise
+
+    def _shared_prefill_kwargs(self, inputs, num_candidates: int) -> dict:
+
+        """
+        Выполняет общий проход по промпту для нескольких вариантов ответа.
+
+        Промпт без последнего токена прогоняется через модель один раз, и его
+        KV-кэш повторяется num_candidates раз. generate получает промпт целиком
+        и вычисляет только последний токен, поэтому варианты различаются с первого
+        сгенерированного токена.
+
+        Args:
+            inputs: Токенизированный промпт (одна строка).
+            num_candidates (int): Количество вариантов.
+
+        Returns:
+            dict: Дополнительные аргументы model.generate.
+        """
+
+        cache = self._new_cache()
+        with torch.no_grad():
+            self.model(
+                input_ids=inputs["input_ids"][:, :-1],
+                attention_mask=inputs["attention_mask"][:, :-1],
+                past_key_values=cache,
+                use_cache=True
+            )
+        cache.batch_repeat_interleave(num_candidates)
+        return {"past_key_values": cache, "do_sample": True}
+
+    def _new_cache(self):
+        # Пустой KV-кэш для generate: квантованный при kv_cache_format, иначе DynamicCache
+        if not serving_parameters.kv_cache_format:
+            return DynamicCache()
+        return new_cache(self.model.config, serving_parameters.kv_cache_format, serving_parameters.kv_cache_residual_tokens)
+
+    def _speech_text(
+        self,
+        output: torch.Tensor,
+        prompt_tokens: int,
+        stop: Optional[Tuple[int, str]],
+        max_new_tokens: int,
+        generation_seconds: float
+    ) -> SpeechText:
+
+        """
+        Собирает текст речи и статистику одной строки батча.
+
+        Args:
+            output (torch.Tensor): Токены ответа строки (без промпта).
+            prompt_tokens (int): Длина промпта строки без паддинга.
+            stop (Optional[Tuple[int, str]]): Число токенов и причина досрочной остановки
+                строки, если она была.
+            max_new_tokens (int): Лимит новых токенов вызова.
+            generation_seconds (float): Длительность вызова модели.
+
+        Returns:
+            SpeechText: Речь, обрезанная по стоп-строке или по концу заключения.
+        """
+
+        tokens = output.tolist()
+        text = self.tokenizer.decode(output, skip_special_tokens=True)
+        cut = find_stop(text)
+        if cut is not None:
+            text = text[:cut[0]]
+
+        if stop is not None:
+            completion_tokens, stop_reason = stop
+        else:
+            completion_tokens = self._completion_tokens(tokens)
+            eos_token_ids = set(self._eos_token_ids())
+            stop_reason = "eos" if eos_token_ids.intersection(tokens) else "length"
+
+        return SpeechText(
+            self._extract_speech(text),
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            generation_seconds=generation_seconds,
+            stop_reason=stop_reason,
+            tokens_saved=max_new_tokens - completion_tokens if stop is not None else 0
+        )
+
+    def _completion_tokens(self, tokens: List[int]) -> int:
+        # После EOS строка батча дополняется паддингом (pad_token_id = eos_token_id), он не считается
+        eos_token_ids = set(self._eos_token_ids())
+        for position, token in enumerate(tokens):
+            if token in eos_token_ids:
+                return position + 1
+        return len(tokens)
+
+    def _eos_token_ids(self) -> List[int]:
+        return [self.tokenizer.eos_token_id] + self.stop_token_ids
+
+    def _find_stop_token_ids(self) -> List[int]:
+
+        """
+        Находит в словаре токенизатора токены serving_parameters.stop_tokens.
+
+        У Phi-3 токен EOS - <|endoftext|>, а ход ассистента заканчивается <|end|>;
+        без него модель продолжает писать после конца ответа.
+
+        Returns:
+            List[int]: Идентификаторы найденных токенов, кроме EOS.
+        """
+
+        vocab = self.tokenizer.get_vocab()
+        return [
+            vocab[token] for token in serving_parameters.stop_tokens
+            if token in vocab and vocab[token] != self.tokenizer.eos_token_id
+        ]
+
+    def _generation_kwargs(self) -> dict:
+
+        """
+        Собирает аргументы model.generate из текущих параметров генерации.
+
+        Returns:
+            dict: Именованные аргументы для model.generate.
+        """
+
+        return {
+            "max_new_tokens": model_parameters.max_new_tokens,  # Максимальная длина ответа
+            "temperature": model_parameters.temperature,
+            "do_sample": model_parameters.do_sample,
+            "top_p": model_parameters.top_p,
+            "top_k": model_parameters.top_k,
+            "pad_token_id": self.tokenizer.eos_token_id,
+            "repetition_penalty": model_parameters.repetition_penalty,
+            "eos_token_id": self._eos_token_ids()
+        }
+
+    def _static_cache_kwargs(self, prompt_length: int, max_new_tokens: int) -> dict:
+
+        """
+        Подготавливает статический KV-кэш для генерации одной последовательности.
+
+        Кэш вмещает промпт и max_new_tokens новых токенов: его размер
+        округляется вверх до степени двойки (не меньше STATIC_CACHE_MIN_LENGTH)
+        и ограничивается контекстным окном модели, поэтому ответ не короче,
+        чем с динамическим кэшем. Кэш выделяется заново только при смене
+        размера, между запросами он обнуляется, и декодирование не
+        перевыделяет память на каждом шаге. Формы тензоров постоянны для
+        каждого размера, что позволяет выполнять шаг декодирования
+        скомпилированным через torch.compile.
+
+        Args:
+            prompt_length (int): Длина промпта в токенах.
+            max_new_tokens (int): Запрошенный лимит новых токенов.
+
+        Returns:
+            dict: Дополнительные аргументы model.generate.
+        """
+
+        needed = prompt_length + max_new_tokens
+        cache_length = min(self._context_tokens(), max(STATIC_CACHE_MIN_LENGTH, 1 << (needed - 1).bit_length()))
+        if self._static_cache is None or self._static_cache_length != cache_length:
+            self._static_cache = StaticCache(config=self.model.config, max_cache_len=cache_length)
+            self._static_cache_length = cache_length
+        else:
+            self._static_cache.reset()
+
+        kwargs = {
+            "past_key_values": self._static_cache,
+            # Промпт и ответ должны поместиться в заранее выделенный кэш
+            "max_new_tokens": min(max_new_tokens, cache_length - prompt_length),
+            "disable_compile": not serving_parameters.compile_decode
+        }
+        if serving_parameters.compile_decode:
+            compile_config = CompileConfig(
+                fullgraph=True,
+                mode="reduce-overhead" if self.device == "cuda" else "default"
+            )
+            # По умолчанию transformers компилирует декодирование только на GPU
+            compile_config._compile_all_devices = True
+            kwargs["compile_config"] = compile_config
+        return kwargs
+
+    def _load_compile_cache(self):
+
+        """
+        Подключает кэш скомпилированных графов, переживающий перезапуски.
+
+        Кэш inductor направляется в serving_parameters.compile_cache_dir, а
+        сохранённые ранее артефакты компиляции загружаются до первой генерации.
+        """
+
+        os.makedirs(serving_parameters.compile_cache_dir, exist_ok=True)
+        os.environ.setdefault(
+            "TORCHINDUCTOR_CACHE_DIR",
+            os.path.join(serving_parameters.compile_cache_dir, "inductor")
+        )
+        artifacts_path = os.path.join(serving_parameters.compile_cache_dir, self.COMPILE_CACHE_FILE)
+        if os.path.exists(artifacts_path):
+            with open(artifacts_path, 'rb') as f:
+                torch.compiler.load_cache_artifacts(f.read())
+            print('Загружен кэш скомпилированных графов')
+
+    def save_compile_cache(self):
+
+        """
+        Сохраняет артефакты torch.compile для следующих запусков.
+
+        Вызывается автоматически после первой скомпилированной генерации.
+        Файл записывается атомарно, чтобы падение не оставило битый кэш.
+        """
+
+        artifacts = torch.compiler.save_cache_artifacts()
+        self._compile_cache_saved = True
+        if artifacts is None:
+            return
+        os.makedirs(serving_parameters.compile_cache_dir, exist_ok=True)
+        artifacts_path = os.path.join(serving_parameters.compile_cache_dir, self.COMPILE_CACHE_FILE)
+        with open(artifacts_path + '.tmp', 'wb') as f:
+            f.write(artifacts[0])
+        os.replace(artifacts_path + '.tmp', artifacts_path)
+
+    @staticmethod
+    def _extract_speech(generated_text: str) -> str:
+
+        """
+        Очищает декодированный ответ модели от служебной разметки чата.
+
+        Args:
+            generated_text (str): Декодированный текст ответа.
+
+        Returns:
+            str: Текст речи без служебных маркеров.
+        """
+
+        if "<|assistant|>\n" in generated_text:
+            generated_text = generated_text.split("<|assistant|>\n")[-1]
+        return generated_text.replace("<|end|>", "").strip()
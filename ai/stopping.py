@@ -0,0 +1,228 @@
+"""
+Модуль досрочной остановки генерации по тексту.
+
+Phi-3 нередко продолжает писать после заключения речи: добавляет примечания
+для автора или начинает вторую речь. Эти токены декодируются и оплачиваются
+временем, хотя в ответ не попадают. Генерация строки батча останавливается:
+- на стоп-строке (serving_parameters.stop_strings);
+- после завершённого заключения: фразы из serving_parameters.completion_phrases,
+  конца предложения после неё и конца абзаца. Без конца абзаца та же фраза
+  встречается в обычной речи («Спасибо за внимание к нашему проекту. ...»).
+
+Проверка выполняется на каждом шаге декодирования по уже декодированному
+тексту, поэтому текст восстанавливается инкрементально: на шаге декодируется
+только окно из нескольких последних токенов, а не весь ответ заново.
+
+model.generate передаёт новые токены стримеру раньше, чем проверяет критерии
+остановки, поэтому потоковая выдача задерживает хвост текста (StreamTrimmer)
+и отбрасывает его, если в нём сработала остановка.
+"""
+
+import re
+from typing import Callable, List, Optional, Tuple
+
+import torch
+from transformers import StoppingCriteria
+
+import ai.serving_parameters as serving_parameters
+
+STOP_STRING = "stop_string"
+COMPLETION = "completion"
+# Сколько символов до нового текста просматривается при поиске завершения:
+# фраза заключения и продолжение предложения до его конца
+COMPLETION_LOOKBACK_CHARS = 256
+
+
+def find_stop(text: str, start: int = 0) -> Optional[Tuple[int, str]]:
+
+    """
+    Ищет в тексте место досрочной остановки.
+
+    Args:
+        text (str): Декодированный текст ответа.
+        start (int): Позиция, с которой искать; текст до неё уже проверен.
+
+    Returns:
+        Optional[Tuple[int, str]]: Позиция, по которой обрезается текст, и причина
+            (STOP_STRING или COMPLETION); None, если остановка не нужна.
+    """
+
+    stops = []
+    for stop_string in serving_parameters.stop_strings:
+        position = text.find(stop_string, start)
+        if position != -1:
+            stops.append((position, STOP_STRING))
+
+    if serving_parameters.completion_phrases:
+        pattern = _completion_pattern(tuple(serving_parameters.completion_phrases))
+        match = pattern.search(text, start)
+        if match is not None:
+            stops.append((match.end(), COMPLETION))
+
+    return min(stops) if stops else None
+
+
+_compiled_patterns = {}
+
+
+def _completion_pattern(phrases: Tuple[str, ...]) -> "re.Pattern":
+    # Фраза заключения, остаток предложения, знаки его конца и конец абзаца
+    if phrases not in _compiled_patterns:
+        alternatives = "|".join(re.escape(phrase) for phrase in phrases)
+        _compiled_patterns[phrases] = re.compile(rf"(?:{alternatives})[^.!?…\n]*[.!?…]+(?=[ \t]*\n)", re.IGNORECASE)
+    return _compiled_patterns[phrases]
+
+
+def _lookback_chars() -> int:
+    # Сколько уже проверенного текста просматривается заново: стоп-строка или
+    # заключение могли начаться до нового фрагмента
+    return max([len(stop_string) for stop_string in serving_parameters.stop_strings] + [COMPLETION_LOOKBACK_CHARS])
+
+
+class StreamTrimmer:
+
+    """
+    Потоковая выдача текста без хвоста после досрочной остановки.
+
+    Последние символы текста (столько, сколько в самой длинной стоп-строке)
+    задерживаются: по ним ещё может сработать остановка. Когда она срабатывает,
+    выдаётся текст до места обрезки, а всё после него отбрасывается.
+
+    Attributes:
+        text (str): Весь полученный текст.
+        stopped (bool): Сработала ли досрочная остановка.
+    """
+
+    def __init__(self, on_text: Callable[[str], None]):
+        self.on_text = on_text
+        self.text = ""
+        self.stopped = False
+        self._sent = 0
+        self._holdback = max([len(stop_string) for stop_string in serving_parameters.stop_strings], default=0)
+        self._lookback = _lookback_chars()
+
+    def add(self, text: str, end: bool = False):
+
+        """
+        Добавляет фрагмент текста и выдаёт то, что уже не может быть обрезано.
+
+        Args:
+            text (str): Новый фрагмент текста.
+            end (bool): Последний фрагмент: задержанный хвост выдаётся целиком.
+        """
+
+        if self.stopped:
+            return
+        checked = len(self.text)
+        self.text += text
+        stop = find_stop(self.text, max(0, checked - self._lookback))
+        if stop is not None:
+            self.stopped = True
+            self._send(stop[0])
+        else:
+            self._send(len(self.text) if end else len(self.text) - self._holdback)
+
+    def _send(self, until: int):
+        if until > self._sent:
+            self.on_text(self.text[self._sent:until])
+            self._sent = until
+
+
+class IncrementalDetokenizer:
+
+    """
+    Инкрементальное восстановление текста по токенам одной последовательности.
+
+    Декодируются только токены от prefix_offset: токены, уже выданные текстом
+    на предыдущем шаге (для правильной обработки пробелов sentencepiece), и новые.
+    Если новые токены обрываются посреди символа UTF-8, текст не выдаётся,
+    пока символ не будет дописан следующими токенами.
+
+    Attributes:
+        text (str): Весь восстановленный текст.
+    """
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.tokens = []
+        self.text = ""
+        self._prefix_offset = 0
+        self._read_offset = 0
+
+    def add(self, tokens: List[int]) -> str:
+
+        """
+        Добавляет новые токены и возвращает появившийся текст.
+
+        Args:
+            tokens (List[int]): Токены, сгенерированные после предыдущего вызова.
+
+        Returns:
+            str: Новый текст (пустой, если символ ещё не дописан).
+        """
+
+        self.tokens.extend(tokens)
+        prefix_text = self._decode(self.tokens[self._prefix_offset:self._read_offset])
+        new_text = self._decode(self.tokens[self._prefix_offset:])
+        if len(new_text) <= len(prefix_text) or new_text.endswith("\ufffd"):
+            return ""
+
+        delta = new_text[len(prefix_text):]
+        self._prefix_offset = self._read_offset
+        self._read_offset = len(self.tokens)
+        self.text += delta
+        return delta
+
+    def _decode(self, tokens: List[int]) -> str:
+        return self.tokenizer.decode(tokens, skip_special_tokens=True) if tokens else ""
+
+
+class SpeechStoppingCriteria(StoppingCriteria):
+
+    """
+    Критерий остановки model.generate по стоп-строкам и завершению заключения.
+
+    Каждая строка батча проверяется отдельно; остановленная строка дополняется
+    паддингом, пока не завершатся остальные, а весь вызов заканчивается, когда
+    остановлены все строки.
+
+    Attributes:
+        stops (List[Optional[Tuple[int, str]]]): Для каждой строки - число
+            сгенерированных токенов и причина, если строка остановлена этим критерием.
+    """
+
+    def __init__(self, tokenizer, prompt_length: int, batch_size: int, eos_token_ids: List[int]):
+
+        """
+        Args:
+            tokenizer: Токенизатор модели.
+            prompt_length (int): Длина промпта в токенах (с паддингом), ответ начинается после неё.
+            batch_size (int): Количество строк батча.
+            eos_token_ids (List[int]): Токены конца ответа; строка с ними уже завершена моделью.
+        """
+
+        self.prompt_length = prompt_length
+        self.eos_token_ids = set(eos_token_ids)
+        self.detokenizers = [IncrementalDetokenizer(tokenizer) for _ in range(batch_size)]
+        self.stops: List[Optional[Tuple[int, str]]] = [None] * batch_size
+        self._finished = [False] * batch_size
+        self._lookback = _lookback_chars()
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        for row, detokenizer in enumerate(self.detokenizers):
+            if self._finished[row]:
+                continue
+            new_tokens = input_ids[row, self.prompt_length + len(detokenizer.tokens):].tolist()
+            if self.eos_token_ids.intersection(new_tokens):
+                self._finished[row] = True
+                continue
+
+            checked = len(detokenizer.text)
+            if not detokenizer.add(new_tokens):
+                continue
+            stop = find_stop(detokenizer.text, max(0, checked - self._lookback))
+            if stop is not None:
+                self._finished[row] = True
+                self.stops[row] = (len(detokenizer.tokens), stop[1])
+
+        return torch.tensor(self._finished, dtype=torch.bool, device=input_ids.device)
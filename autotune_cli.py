@@ -0,0 +1,327 @@
+"""
+Подбор параметров обслуживания под узел, на котором запускается сервис.
+
+Загружает модель локально и перебирает число потоков torch, размер батча,
+окно батчинга, тип весов и реализацию внимания. Каждая конфигурация
+обслуживает одну и ту же синтетическую смесь запросов SpeechRequest через
+очередь генерации, как в приложении; измеряются пропускная способность
+и задержки (p50, p95, p99). Из конфигураций, не уступающих другим сразу по
+пропускной способности и p95 (фронт Парето), выбирается лучшая, и она
+записывается в профиль (ai/serving_profile.py), который приложение применяет
+при старте.
+
+Пример запуска:
+    python autotune_cli.py --threads 4,8 --batch-sizes 1,4,8 --windows 0,20 --dtypes bfloat16,float32 --attn eager,sdpa
+    python autotune_cli.py --max-p95-ms 30000 --output serving_profile.json
+"""
+
+import argparse
+import itertools
+import random
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional
+
+import torch
+
+from ai.scheduler import GenerationScheduler
+import ai.model_parameters as model_parameters
+import ai.serving_parameters as serving_parameters
+from ai.serving_profile import save_profile
+from ai.speech_generator import SpeechGenerator
+from replay_cli import percentile
+from schemas.model import SpeechRequest
+from utils import load_styles
+
+TOPICS = [
+    "Открытие конференции по цифровой трансформации",
+    "Юбилей компании",
+    "Итоги года и планы развития",
+    "Свадебный тост",
+    "Выпускной вечер",
+    "Запуск нового продукта",
+    "Благодарность команде проекта",
+    "Отчёт перед инвесторами"
+]
+KEY_POINTS = ["Результаты", "Команда", "Клиенты", "Инновации", "Планы", "Благодарности", "Трудности", "Ценности"]
+FALLBACK_STYLES = {"formal": "Формальный стиль выступления"}
+
+
+@dataclass
+class Measurement:
+    """Замер одной конфигурации на синтетической смеси запросов."""
+    parameters: Dict[str, object]
+    requests: int
+    errors: int
+    seconds: float
+    throughput_rps: float
+    tokens_per_second: float
+    latency_p50_ms: Optional[float]
+    latency_p95_ms: Optional[float]
+    latency_p99_ms: Optional[float]
+
+
+def synthetic_requests(count: int, styles: List[str], seed: int = 0) -> List[SpeechRequest]:
+
+    """
+    Синтетическая смесь запросов: короткие тосты и длинные доклады, с ключевыми
+    моментами и требованиями и без них.
+
+    Args:
+        count (int): Количество запросов.
+        styles (List[str]): Стили, из которых выбираются стили запросов.
+        seed (int): Зерно, одинаковая смесь для всех конфигураций.
+
+    Returns:
+        List[SpeechRequest]: Запросы смеси.
+    """
+
+    rng = random.Random(seed)
+    requests = []
+    for _ in range(count):
+        requests.append(SpeechRequest(
+            topic=rng.choice(TOPICS),
+            duration_minutes=rng.choice([1, 2, 3, 5, 10, 15]),
+            style=rng.choice(styles),
+            key_points=rng.sample(KEY_POINTS, rng.randint(0, 5)) or None,
+            custom_instructions=rng.choice([None, None, "Упомянуть вклад каждого отдела. " * rng.randint(1, 20)])
+        ))
+    return requests
+
+
+def measure(
+    generator,
+    requests: List[SpeechRequest],
+    available_styles: Dict[str, str],
+    parameters: Dict[str, object],
+    rate: float = 0.0,
+    seed: int = 0
+) -> Measurement:
+
+    """
+    Обслуживает смесь запросов через очередь генерации и измеряет конфигурацию.
+
+    Запросы поступают потоком Пуассона с интенсивностью rate (0 - все сразу),
+    поэтому окно батчинга влияет на результат так же, как под реальной нагрузкой.
+
+    Args:
+        generator: Загруженный генератор речей.
+        requests (List[SpeechRequest]): Смесь запросов.
+        available_styles (Dict[str, str]): Стили выступлений.
+        parameters (Dict[str, object]): Проверяемая конфигурация (для отчёта).
+        rate (float): Запросов в секунду.
+        seed (int): Зерно интервалов между поступлениями.
+
+    Returns:
+        Measurement: Пропускная способность и задержки конфигурации.
+    """
+
+    rng = random.Random(seed)
+    scheduler = GenerationScheduler(styles_provider=lambda: available_styles, model_provider=lambda _: generator)
+    started = time.perf_counter()
+    submitted, finished = [], {}
+    for index, request in enumerate(requests):
+        future = scheduler.submit(None, request)
+        submitted.append((time.perf_counter(), future))
+        future.add_done_callback(lambda _, index=index: finished.setdefault(index, time.perf_counter()))
+        if rate > 0:
+            time.sleep(rng.expovariate(rate))
+
+    latencies_ms, tokens, errors = [], 0, 0
+    for index, (submitted_at, future) in enumerate(submitted):
+        try:
+            speech = future.result()
+        except Exception:
+            errors += 1
+            continue
+        latencies_ms.append((finished[index] - submitted_at) * 1000)
+        tokens += getattr(speech, "completion_tokens", 0)
+    seconds = max(finished.values(), default=started) - started
+
+    return Measurement(
+        parameters=dict(parameters),
+        requests=len(requests),
+        errors=errors,
+        seconds=round(seconds, 3),
+        throughput_rps=round((len(requests) - errors) / seconds, 4) if seconds else 0.0,
+        tokens_per_second=round(tokens / seconds, 2) if seconds else 0.0,
+        latency_p50_ms=_round(percentile(latencies_ms, 0.50)),
+        latency_p95_ms=_round(percentile(latencies_ms, 0.95)),
+        latency_p99_ms=_round(percentile(latencies_ms, 0.99))
+    )
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 1) if value is not None else None
+
+
+def pareto_front(measurements: List[Measurement]) -> List[Measurement]:
+
+    """
+    Конфигурации без ошибок, которые не уступают ни одной другой сразу по
+    пропускной способности и p95 задержки.
+
+    Args:
+        measurements (List[Measurement]): Замеры всех конфигураций.
+
+    Returns:
+        List[Measurement]: Фронт Парето по убыванию пропускной способности.
+    """
+
+    valid = [item for item in measurements if not item.errors and item.latency_p95_ms is not None]
+
+    def dominated(item: Measurement) -> bool:
+        return any(
+            other.throughput_rps >= item.throughput_rps and other.latency_p95_ms <= item.latency_p95_ms
+            and (other.throughput_rps > item.throughput_rps or other.latency_p95_ms < item.latency_p95_ms)
+            for other in valid
+        )
+
+    return sorted((item for item in valid if not dominated(item)), key=lambda item: -item.throughput_rps)
+
+
+def choose(front: List[Measurement], max_p95_ms: Optional[float] = None) -> Optional[Measurement]:
+
+    """
+    Выбирает конфигурацию с фронта Парето.
+
+    С ограничением max_p95_ms - самую производительную из укладывающихся в него;
+    без ограничения - лучший компромисс: максимум суммы пропускной способности
+    и обратной p95, каждая нормирована на лучшее значение фронта.
+
+    Args:
+        front (List[Measurement]): Фронт Парето.
+        max_p95_ms (Optional[float]): Допустимая p95 задержки в миллисекундах.
+
+    Returns:
+        Optional[Measurement]: Выбранная конфигурация или None, если выбрать не из чего.
+    """
+
+    if max_p95_ms is not None:
+        fitting = [item for item in front if item.latency_p95_ms <= max_p95_ms]
+        return max(fitting, key=lambda item: item.throughput_rps) if fitting else None
+    if not front:
+        return None
+    best_throughput = max(item.throughput_rps for item in front) or 1.0
+    best_latency = min(item.latency_p95_ms for item in front) or 1.0
+    return max(front, key=lambda item: item.throughput_rps / best_throughput + best_latency / max(item.latency_p95_ms, 0.1))
+
+
+def sweep(
+    load: Callable[[], object],
+    grid: Dict[str, List[object]],
+    requests: List[SpeechRequest],
+    available_styles: Dict[str, str],
+    rate: float = 0.0
+) -> List[Measurement]:
+
+    """
+    Перебирает конфигурации сетки параметров.
+
+    Модель перезагружается только при смене типа весов или реализации внимания;
+    число потоков, размер батча и окно меняются на загруженной модели.
+    Конфигурация, на которой модель не загрузилась (например, bfloat16 без
+    поддержки устройством), пропускается.
+
+    Args:
+        load (Callable[[], object]): Загружает генератор по текущим параметрам обслуживания.
+        grid (Dict[str, List[object]]): Значения каждого параметра TUNABLE.
+        requests (List[SpeechRequest]): Смесь запросов.
+        available_styles (Dict[str, str]): Стили выступлений.
+        rate (float): Интенсивность поступления запросов в секунду (0 - все сразу).
+
+    Returns:
+        List[Measurement]: Замеры успешно проверенных конфигураций.
+    """
+
+    measurements = []
+    for dtype, attn in itertools.product(grid["model_dtype"], grid["attn_implementation"]):
+        serving_parameters.model_dtype = dtype
+        serving_parameters.attn_implementation = attn
+        try:
+            generator = load()
+        except Exception as e:
+            print(f"Пропуск {dtype}/{attn}: модель не загрузилась ({e})")
+            continue
+
+        for threads, batch_size, window in itertools.product(
+            grid["torch_threads"], grid["batch_size"], grid["batch_window_ms"]
+        ):
+            if threads:
+                torch.set_num_threads(threads)
+            serving_parameters.torch_threads = threads
+            serving_parameters.batch_size = batch_size
+            serving_parameters.batch_window_ms = window
+            parameters = {
+                "torch_threads": threads, "batch_size": batch_size, "batch_window_ms": window,
+                "model_dtype": dtype, "attn_implementation": attn
+            }
+            measurement = measure(generator, requests, available_styles, parameters, rate)
+            measurements.append(measurement)
+            print(
+                f"{parameters}: {measurement.throughput_rps} запр/с, {measurement.tokens_per_second} ток/с, "
+                f"p95 {measurement.latency_p95_ms} мс, ошибок {measurement.errors}"
+            )
+        del generator
+    return measurements
+
+
+def _values(text: str, cast: Callable[[str], object]) -> List[object]:
+    return [cast(value.strip()) for value in text.split(",") if value.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Подбор параметров обслуживания под узел")
+    parser.add_argument(
+        "--model",
+        default=serving_parameters.models[serving_parameters.default_model],
+        help="Модель на Hugging Face или путь к ней (по умолчанию - модель по умолчанию из реестра)"
+    )
+    parser.add_argument("--threads", default=str(torch.get_num_threads()), help="Числа потоков torch через запятую")
+    parser.add_argument("--batch-sizes", default="1,4,8", help="Размеры батча через запятую")
+    parser.add_argument("--windows", default="0,20,50", help="Окна батчинга в миллисекундах через запятую")
+    parser.add_argument("--dtypes", default="float16,bfloat16,float32", help="Типы весов через запятую")
+    parser.add_argument("--attn", default="eager,sdpa", help="Реализации внимания через запятую")
+    parser.add_argument("--requests", type=int, default=16, help="Запросов в синтетической смеси")
+    parser.add_argument("--rate", type=float, default=0.0, help="Запросов в секунду (0 - все сразу)")
+    parser.add_argument("--max-new-tokens", type=int, default=64, help="Лимит новых токенов одной генерации")
+    parser.add_argument("--max-p95-ms", type=float, default=None, help="Допустимая p95 задержки в миллисекундах")
+    parser.add_argument("--output", default=serving_parameters.profile_path, help="Файл профиля")
+    args = parser.parse_args()
+
+    grid = {
+        "torch_threads": _values(args.threads, int),
+        "batch_size": _values(args.batch_sizes, int),
+        "batch_window_ms": _values(args.windows, int),
+        "model_dtype": _values(args.dtypes, str),
+        "attn_implementation": _values(args.attn, str)
+    }
+    # Жадное декодирование и одинаковый лимит делают конфигурации сравнимыми
+    model_parameters.do_sample = False
+    model_parameters.max_new_tokens = args.max_new_tokens
+    available_styles = load_styles() or FALLBACK_STYLES
+    requests = synthetic_requests(args.requests, list(available_styles))
+
+    def load():
+        generator = SpeechGenerator(args.model)
+        generator.load_model()
+        # Первые генерации после загрузки медленнее, в замеры они не попадают
+        measure(generator, requests[:2], available_styles, {})
+        return generator
+
+    measurements = sweep(load, grid, requests, available_styles, args.rate)
+    front = pareto_front(measurements)
+    best = choose(front, args.max_p95_ms)
+    if best is None:
+        print("Ни одна конфигурация не подошла, профиль не записан")
+        return
+
+    print("Фронт Парето:")
+    for item in front:
+        print(f"  {item.parameters}: {item.throughput_rps} запр/с, p95 {item.latency_p95_ms} мс")
+    save_profile(args.output, args.model, best.parameters, [asdict(item) for item in measurements])
+    print(f"Профиль записан в {args.output}: {best.parameters}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Офлайн-генерация речей из JSONL-файла без запуска API.
+
+Загружает модель один раз и обрабатывает все запросы входного файла батчами
+максимального размера. Результаты дописываются в выходной JSONL по мере готовности,
+поэтому после падения повторный запуск с теми же файлами продолжит работу
+с первого необработанного запроса. Запросы, завершившиеся ошибкой, при
+повторном запуске генерируются заново.
+
+Пример запуска:
+    python batch_cli.py requests.jsonl results.jsonl --batch-size 16
+"""
+
+import argparse
+import json
+import os
+from typing import List, Set
+
+from ai.scheduler import run_batch
+import ai.serving_parameters as serving_parameters
+from ai.speech_generator import SpeechGenerator
+from schemas.model import SpeechRequest
+from utils import load_styles, parse_speech_requests
+
+
+def load_processed_indexes(output_path: str) -> Set[int]:
+
+    """
+    Читает номера запросов, речи которых уже записаны в выходной файл.
+
+    Последняя строка файла может быть оборвана падением процесса - такие
+    строки пропускаются, и соответствующий запрос будет сгенерирован заново.
+    Строки с ошибкой тоже не считаются обработанными: запрос повторяется.
+
+    Args:
+        output_path (str): Путь к выходному JSONL-файлу.
+
+    Returns:
+        Set[int]: Номера уже обработанных запросов.
+    """
+
+    processed = set()
+    if not os.path.exists(output_path):
+        return processed
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+                if "error" not in result:
+                    processed.add(result["index"])
+            except (json.JSONDecodeError, KeyError, TypeError):
+                continue
+    return processed
+
+
+def make_batches(pending: List[int], requests: List[SpeechRequest], batch_size: int) -> List[List[int]]:
+
+    """
+    Разбивает номера запросов на батчи.
+
+    Запросы с seed и с несколькими вариантами генерируются по одному, как и
+    в очереди генерации: seed фиксирует генератор случайных чисел на весь
+    батч, поэтому результат воспроизводим, только если запрос в батче один.
+
+    Args:
+        pending (List[int]): Номера необработанных запросов в порядке генерации.
+        requests (List[SpeechRequest]): Все запросы входного файла.
+        batch_size (int): Максимальное количество запросов в одном батче.
+
+    Returns:
+        List[List[int]]: Номера запросов каждого батча.
+    """
+
+    batches, batch = [], []
+    for index in pending:
+        if requests[index].seed is not None or requests[index].n > 1:
+            batches.append([index])
+            continue
+        batch.append(index)
+        if len(batch) == batch_size:
+            batches.append(batch)
+            batch = []
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетная генерация речей из JSONL-файла")
+    parser.add_argument("input", help="JSONL-файл с запросами SpeechRequest")
+    parser.add_argument("output", help="JSONL-файл для результатов (дописывается при возобновлении)")
+    parser.add_argument("--batch-size", type=int, default=16, help="Количество запросов в одном батче")
+    parser.add_argument(
+        "--model",
+        default=serving_parameters.models[serving_parameters.default_model],
+        help="Модель на Hugging Face или путь к ней (по умолчанию - модель по умолчанию из реестра)"
+    )
+    args = parser.parse_args()
+
+    with open(args.input, 'r', encoding='utf-8') as f:
+        requests = parse_speech_requests(f)
+
+    processed = load_processed_indexes(args.output)
+    pending = [index for index in range(len(requests)) if index not in processed]
+    print(f'Запросов: {len(requests)}, уже обработано: {len(processed)}, осталось: {len(pending)}')
+    if not pending:
+        return
+
+    generator = SpeechGenerator(args.model)
+    generator.load_model()
+    available_styles = load_styles()
+
+    # Запросы с близкой длиной промпта попадают в один батч - меньше паддинга
+    def prompt_length(index: int) -> int:
+        try:
+            return len(generator.generate_prompt(requests[index], available_styles))
+        except ValueError:
+            return 0
+
+    pending.sort(key=prompt_length)
+
+    with open(args.output, 'a', encoding='utf-8') as out:
+        # Оборванная при падении строка не должна склеиться с первой новой
+        if out.tell() > 0:
+            with open(args.output, 'rb') as tail:
+                tail.seek(-1, os.SEEK_END)
+                if tail.read(1) != b"\n":
+                    out.write("\n")
+        done = 0
+        for batch in make_batches(pending, requests, args.batch_size):
+            results = run_batch(generator, [requests[index] for index in batch], available_styles)
+            for index, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    line = {"index": index, "error": str(result)}
+                else:
+                    line = {"index": index, "speech": result}
+                out.write(json.dumps(line, ensure_ascii=False) + "\n")
+            out.flush()
+            os.fsync(out.fileno())
+            done += len(batch)
+            print(f'Обработано {done} из {len(pending)}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Бенчмарк квантованного KV-кэша: память на последовательность, одновременность и качество.
+
+Для каждого формата KV-кэша (исходная точность, int8, int4) измеряет:
+- объём кэша одной последовательности после промпта заданной длины и нескольких
+  шагов декодирования;
+- сколько таких последовательностей помещается в бюджет памяти --memory-gb
+  (с учётом слоя кэша, разворачиваемого в исходную точность на шаге декодирования);
+- качество на фиксированных промптах относительно кэша в исходной точности:
+  совпадение жадно сгенерированных токенов, позицию первого расхождения и
+  совпадение следующего токена при подаче эталонного продолжения (teacher forcing),
+  не зависящее от расхождения продолжений.
+
+Пример запуска:
+    python benchmarks/bench_kv_cache.py --contexts 1024 2048 4000 --memory-gb 8
+    python benchmarks/bench_kv_cache.py --model ./model_cache/tiny-llama --tokens 64
+"""
+
+import argparse
+import os
+import sys
+
+import torch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ai.serving_parameters as serving_parameters  # noqa: E402
+from ai.quantized_cache import KV_CACHE_FORMATS, cache_nbytes, new_cache  # noqa: E402
+from ai.speech_generator import SpeechGenerator  # noqa: E402
+from schemas.model import SpeechRequest  # noqa: E402
+
+FORMATS = [""] + list(KV_CACHE_FORMATS)
+
+STYLES = {"formal": "Формальный стиль выступления", "inspirational": "Вдохновляющий стиль"}
+
+PROMPTS = [
+    SpeechRequest(topic="Итоги года и планы развития компании", duration_minutes=5, style="formal",
+                  key_points=["Результаты", "Команда", "Планы"]),
+    SpeechRequest(topic="Выпускной вечер в университете", duration_minutes=3, style="inspirational"),
+    SpeechRequest(topic="Открытие конференции по искусственному интеллекту", duration_minutes=10, style="formal",
+                  custom_instructions="Упомянуть этические аспекты"),
+]
+
+
+def format_name(kv_format: str) -> str:
+    return kv_format or serving_parameters.model_dtype
+
+
+def sequence_bytes(model, kv_format: str, context: int, decode_steps: int = 4) -> int:
+    """Объём кэша одной последовательности: промпт длиной context и decode_steps шагов."""
+    cache = new_cache(model.config, kv_format, serving_parameters.kv_cache_residual_tokens)
+    input_ids = torch.randint(0, model.config.vocab_size, (1, context), generator=torch.Generator().manual_seed(0))
+    logits = model(input_ids=input_ids, past_key_values=cache, use_cache=True).logits
+    for _ in range(decode_steps):
+        logits = model(input_ids=logits[:, -1:].argmax(-1), past_key_values=cache, use_cache=True).logits
+    return cache_nbytes(cache)
+
+
+def greedy(model, inputs: dict, kv_format: str, tokens: int) -> torch.Tensor:
+    """Жадно сгенерированные токены (без промпта) с кэшем заданного формата."""
+    cache = new_cache(model.config, kv_format, serving_parameters.kv_cache_residual_tokens)
+    outputs = model.generate(
+        **inputs, past_key_values=cache, max_new_tokens=tokens, min_new_tokens=tokens, do_sample=False
+    )
+    return outputs[0, inputs["input_ids"].shape[1]:]
+
+
+def teacher_forced_agreement(model, inputs: dict, kv_format: str, reference: torch.Tensor) -> float:
+    """Доля шагов, на которых следующий токен совпадает с эталоном при подаче эталонного продолжения."""
+    cache = new_cache(model.config, kv_format, serving_parameters.kv_cache_residual_tokens)
+    logits = model(**inputs, past_key_values=cache, use_cache=True).logits
+    matches = 0
+    for token in reference:
+        matches += int(logits[0, -1].argmax() == token)
+        logits = model(input_ids=token.view(1, 1), past_key_values=cache, use_cache=True).logits
+    return matches / len(reference)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк квантованного KV-кэша")
+    parser.add_argument("--model", default=SpeechGenerator.DEFAULT_MODEL_NAME, help="Модель или путь к ней")
+    parser.add_argument("--contexts", type=int, nargs="+", default=[1024, 2048, 4000], help="Длины последовательностей")
+    parser.add_argument("--memory-gb", type=float, default=8, help="Бюджет памяти на KV-кэши, ГБ")
+    parser.add_argument("--tokens", type=int, default=128, help="Токенов в проверке качества")
+    args = parser.parse_args()
+
+    generator = SpeechGenerator(args.model)
+    generator.load_model()
+    model = generator.model
+    layers = model.config.get_text_config(decoder=True).num_hidden_layers
+    budget = args.memory_gb * 1024 ** 3
+
+    sizes = {kv_format: [sequence_bytes(model, kv_format, context) for context in args.contexts] for kv_format in FORMATS}
+    print(f"Память KV-кэша на последовательность, МБ (остаток без квантования: "
+          f"{serving_parameters.kv_cache_residual_tokens} токенов)")
+    print(f"{'формат':<10}" + "".join(f"{context:>10}" for context in args.contexts))
+    for kv_format in FORMATS:
+        print(f"{format_name(kv_format):<10}" + "".join(f"{size / 1024 ** 2:>10.1f}" for size in sizes[kv_format]))
+
+    print(f"\nОдновременных последовательностей в {args.memory_gb:g} ГБ")
+    print(f"{'формат':<10}" + "".join(f"{context:>10}" for context in args.contexts))
+    for kv_format in FORMATS:
+        row = []
+        for size, full_size in zip(sizes[kv_format], sizes[""]):
+            # На шаге декодирования один слой кэша каждой последовательности развёрнут в исходную точность
+            transient = full_size / layers if kv_format else 0
+            row.append(int(budget // (size + transient)))
+        print(f"{format_name(kv_format):<10}" + "".join(f"{count:>10}" for count in row))
+
+    print(f"\nКачество относительно {format_name('')} на {len(PROMPTS)} промптах, {args.tokens} токенов")
+    print(f"{'формат':<10}{'совпадение':>12}{'расхождение':>14}{'teacher forcing':>18}")
+    references = []
+    for request in PROMPTS:
+        inputs = generator.tokenizer([generator.generate_prompt(request, STYLES)], return_tensors="pt").to(generator.device)
+        references.append((inputs, greedy(model, inputs, "", args.tokens)))
+    for kv_format in KV_CACHE_FORMATS:
+        matched, divergence, forced = [], [], []
+        for inputs, reference in references:
+            tokens = greedy(model, inputs, kv_format, args.tokens)
+            equal = (tokens == reference).tolist()
+            matched.append(sum(equal) / len(equal))
+            divergence.append(equal.index(False) if False in equal else len(equal))
+            forced.append(teacher_forced_agreement(model, inputs, kv_format, reference))
+        print(
+            f"{kv_format:<10}{sum(matched) / len(matched):>12.1%}{min(divergence):>14}"
+            f"{sum(forced) / len(forced):>18.1%}"
+        )
+
+
+if __name__ == "__main__":
+    torch.set_grad_enabled(False)
+    main()
@@ -0,0 +1,92 @@
+"""
+Бенчмарк сериализации и сжатия ответа с длинной речью.
+
+Сравнивает сериализацию SpeechResponse:
+- jsonable_encoder + json: путь FastAPI по умолчанию для JSONResponse;
+- pydantic-core: FastJSONResponse, сериализация в байты на стороне Rust;
+- orjson: для сравнения, если пакет установлен.
+
+Затем для каждой доступной кодировки сжатия (gzip, brotli, zstd) измеряет
+размер тела ответа на проводе и процессорное время сжатия одного ответа.
+Речь синтетическая (повторяющийся абзац), поэтому степень сжатия выше, чем
+у настоящих речей; соотношение времени между кодировками сохраняется.
+
+Пример запуска:
+    python benchmarks/bench_response_encoding.py --kilobytes 16 --runs 200
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from fastapi.encoders import jsonable_encoder
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http_encoding import COMPRESSORS, FastJSONResponse  # noqa: E402
+from schemas.model import GenerationMetadata, SpeechResponse  # noqa: E402
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+PARAGRAPH = (
+    "Дорогие коллеги! Сегодня мы подводим итоги года, который стал для нашей команды "
+    "временем смелых решений и настоящих открытий. Мы запустили три новых продукта, "
+    "вдвое увеличили число клиентов и, что важнее всего, сохранили атмосферу, "
+    "в которой каждый может предложить идею и увидеть её воплощённой.\n\n"
+)
+
+
+def build_response(kilobytes: int) -> SpeechResponse:
+    """Собирает ответ с речью заданного размера в UTF-8."""
+    repeats = max(1, kilobytes * 1024 // len(PARAGRAPH.encode("utf-8")))
+    return SpeechResponse(
+        speech=PARAGRAPH * repeats,
+        metadata=GenerationMetadata(
+            model="phi-3-mini", prompt_tokens=180, completion_tokens=2048,
+            generation_ms=41250.0, total_ms=41302.7, settings_version=3
+        )
+    )
+
+
+def measure_us(function, runs: int) -> float:
+    """Среднее процессорное время одного вызова в микросекундах."""
+    started = time.process_time()
+    for _ in range(runs):
+        function()
+    return (time.process_time() - started) / runs * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк сериализации и сжатия ответа с речью")
+    parser.add_argument("--kilobytes", type=int, default=16, help="Размер речи в килобайтах UTF-8")
+    parser.add_argument("--runs", type=int, default=200, help="Количество повторений каждого замера")
+    args = parser.parse_args()
+
+    response = build_response(args.kilobytes)
+    serializers = {
+        "jsonable_encoder+json": lambda: json.dumps(jsonable_encoder(response), ensure_ascii=False).encode("utf-8"),
+        "pydantic-core": lambda: FastJSONResponse(response).body,
+    }
+    if orjson is not None:
+        serializers["orjson"] = lambda: orjson.dumps(response.model_dump())
+
+    print(f"{'сериализация':<24}{'байт':>10}{'мкс CPU':>12}")
+    for name, serialize in serializers.items():
+        print(f"{name:<24}{len(serialize()):>10}{measure_us(serialize, args.runs):>12.1f}")
+
+    body = FastJSONResponse(response).body
+    print()
+    print(f"{'сжатие':<24}{'байт':>10}{'доля':>8}{'мкс CPU':>12}")
+    print(f"{'identity':<24}{len(body):>10}{1:>8.2f}{0:>12.1f}")
+    for name, compress in COMPRESSORS.items():
+        size = len(compress(body))
+        print(f"{name:<24}{size:>10}{size / len(body):>8.2f}{measure_us(lambda: compress(body), args.runs):>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Бенчмарк статического KV-кэша и скомпилированного шага декодирования.
+
+Сравнивает три режима генерации одной речи (батч из одного запроса):
+- dynamic: KV-кэш растёт на каждом шаге, ядра запускаются в eager-режиме;
+- static: KV-кэш под промпт и max_new_tokens (округлённые до степени двойки) выделяется заранее и переиспользуется;
+- static+compile: статический кэш и шаг декодирования под torch.compile.
+
+Для каждого режима измеряется задержка на сгенерированный токен и количество
+выделений памяти тензорным аллокатором за одну генерацию (по профилировщику torch).
+
+Пример запуска:
+    python benchmarks/bench_static_cache.py --tokens 128 --runs 5
+    python benchmarks/bench_static_cache.py --model ./model_cache/tiny-llama
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import torch
+from torch.profiler import ProfilerActivity, profile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ai.model_parameters as model_parameters  # noqa: E402
+import ai.serving_parameters as serving_parameters  # noqa: E402
+from ai.speech_generator import SpeechGenerator  # noqa: E402
+from schemas.model import SpeechRequest  # noqa: E402
+
+MODES = {
+    "dynamic": (False, False),
+    "static": (True, False),
+    "static+compile": (True, True),
+}
+
+STYLES = {"formal": "Формальный стиль выступления"}
+
+REQUEST = SpeechRequest(
+    topic="Итоги года и планы развития компании",
+    duration_minutes=5,
+    style="formal",
+    key_points=["Результаты", "Команда", "Планы"]
+)
+
+
+def count_allocations(generator: SpeechGenerator) -> int:
+    """Считает выделения памяти тензорами за одну генерацию."""
+    with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+        generator.generate_speech(REQUEST, STYLES)
+    return sum(1 for event in prof.events() if event.name == "[memory]" and event.cpu_memory_usage > 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк статического KV-кэша и torch.compile")
+    parser.add_argument("--model", default=SpeechGenerator.DEFAULT_MODEL_NAME, help="Модель или путь к ней")
+    parser.add_argument("--tokens", type=int, default=128, help="Количество генерируемых токенов")
+    parser.add_argument("--runs", type=int, default=3, help="Количество замеров на режим")
+    args = parser.parse_args()
+
+    # Жадное декодирование и фиксированная длина ответа делают режимы сравнимыми
+    model_parameters.do_sample = False
+    model_parameters.max_new_tokens = args.tokens
+
+    generator = SpeechGenerator(args.model)
+    generator.load_model()
+
+    generated_tokens = []
+    original_generate = generator.model.generate
+
+    def generate(**kwargs):
+        kwargs["min_new_tokens"] = kwargs["max_new_tokens"]
+        outputs = original_generate(**kwargs)
+        generated_tokens.append(outputs.shape[1] - kwargs["input_ids"].shape[1])
+        return outputs
+
+    generator.model.generate = generate
+
+    print(f"{'режим':<16}{'мс/токен':>12}{'stdev':>10}{'выделений':>12}")
+    for mode, (static_cache, compile_decode) in MODES.items():
+        serving_parameters.static_cache = static_cache
+        serving_parameters.compile_decode = compile_decode
+
+        # Прогревочный запуск: компиляция и первичное выделение кэша не входят в замер
+        generator.generate_speech(REQUEST, STYLES)
+
+        latencies = []
+        for _ in range(args.runs):
+            generated_tokens.clear()
+            start = time.perf_counter()
+            generator.generate_speech(REQUEST, STYLES)
+            latencies.append((time.perf_counter() - start) * 1000 / generated_tokens[-1])
+
+        allocations = count_allocations(generator)
+        stdev = statistics.stdev(latencies) if len(latencies) > 1 else 0.0
+        print(f"{mode:<16}{statistics.mean(latencies):>12.2f}{stdev:>10.2f}{allocations:>12}")
+
+
+if __name__ == "__main__":
+    torch.set_grad_enabled(False)
+    main()
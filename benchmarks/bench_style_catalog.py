@@ -0,0 +1,96 @@
+"""
+Бенчмарк каталога стилей на разных размерах.
+
+Для каталогов из 1k, 10k и 100k стилей измеряет задержку операций:
+- первая страница и страница глубоко в каталоге (по курсору);
+- поиск по префиксу, по редкой и по частой подстроке имени;
+- добавление одного стиля (включая перезапись файла);
+- снимок каталога для генерации;
+- полный список стилей одним ответом (GET /styles без параметров).
+
+Чтения через индекс должны оставаться плоскими по размеру каталога;
+добавление стиля растёт с размером, потому что файл стилей перезаписывается
+целиком.
+
+Пример запуска:
+    python benchmarks/bench_style_catalog.py --sizes 1000 10000 100000 --runs 50
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils  # noqa: E402
+from schemas.styles import SpeechStyle  # noqa: E402
+from style_catalog import StyleCatalog, encode_cursor  # noqa: E402
+
+ADJECTIVES = ["Научный", "деловой", "Торжественный", "дружеский", "Мотивационный", "юмористический", "Строгий"]
+AUDIENCES = ["для конференции", "для команды", "для студентов", "для инвесторов", "для выпускников"]
+
+
+def build_styles(size: int) -> dict:
+    """Собирает каталог с именами вида «Научный для команды 00042»."""
+    return {
+        f"{ADJECTIVES[index % len(ADJECTIVES)]} {AUDIENCES[index % len(AUDIENCES)]} {index:06d}":
+            f"Описание стиля {index}: тон, структура и лексика выступления."
+        for index in range(size)
+    }
+
+
+def measure_ms(function, runs: int) -> float:
+    """Среднее время одного вызова в миллисекундах."""
+    started = time.perf_counter()
+    for _ in range(runs):
+        function()
+    return (time.perf_counter() - started) / runs * 1e3
+
+
+def bench(size: int, runs: int) -> dict:
+    """Замеры операций каталога заданного размера."""
+    styles = build_styles(size)
+    utils.save_styles(styles)
+    catalog = StyleCatalog()
+    catalog.snapshot()
+    deep = encode_cursor(sorted(styles, key=lambda name: (name.casefold(), name))[size * 9 // 10])
+    # Первый поиск по подстроке строит триграммный индекс
+    started = time.perf_counter()
+    catalog.page(50, contains="000")
+    index_ms = (time.perf_counter() - started) * 1e3
+    added = iter(range(size, size + runs))
+
+    return {
+        "первая страница": measure_ms(lambda: catalog.page(50), runs),
+        "страница по курсору": measure_ms(lambda: catalog.page(50, cursor=deep), runs),
+        "префикс": measure_ms(lambda: catalog.page(50, prefix="торжественный для студ"), runs),
+        "редкая подстрока": measure_ms(lambda: catalog.page(50, contains=f"{size // 2:06d}"), runs),
+        "частая подстрока": measure_ms(lambda: catalog.page(50, contains="для команды"), runs),
+        "построение триграмм": index_ms,
+        "добавление стиля": measure_ms(
+            lambda: catalog.add_styles([SpeechStyle(name=f"Новый {next(added)}", description="Новый стиль")]), runs
+        ),
+        "снимок каталога": measure_ms(catalog.snapshot, runs),
+        "полный список": measure_ms(catalog.serialized, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк каталога стилей")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="Размеры каталога")
+    parser.add_argument("--runs", type=int, default=50, help="Количество повторений каждого замера")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        utils.STYLES_FILE = os.path.join(directory, "speech_styles.json")
+        results = {size: bench(size, args.runs) for size in args.sizes}
+
+    print(f"{'операция, мс':<24}" + "".join(f"{size:>12}" for size in args.sizes))
+    for operation in results[args.sizes[0]]:
+        print(f"{operation:<24}" + "".join(f"{results[size][operation]:>12.3f}" for size in args.sizes))
+
+
+if __name__ == "__main__":
+    main()
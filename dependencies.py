@@ -1,69 +1,320 @@
 """
-Модуль управления зависимостью SpeechGenerator для FastAPI приложения.
+Модуль управления зависимостями FastAPI приложения.
 
 Этот модуль реализует паттерн Dependency Injection для инициализации и предоставления
-единого экземпляра генератора речей во всем приложении. Используется глобальная
-переменная для хранения инициализированного экземпляра SpeechGenerator.
+общих объектов во всем приложении. Модели генерации хранятся в едином реестре
+моделей ModelRegistry, который загружает их лениво и выгружает по бюджету памяти.
+Используются глобальные переменные для хранения единственных экземпляров.
+
+Здесь же создаются общая очередь генерации, реестр пакетных заданий,
+реестр объединяемых одновременных генераций, версионируемый каталог стилей,
+состояние готовности экземпляра, квоты токенов по API-ключам, уровни
+деградации при перегрузке и кэш ответов для них, а также плавная остановка
+экземпляра. Каждая модель после загрузки прогревается.
 """
 
+import threading
+from typing import Optional
+
+from ai.degradation import DegradationPolicy
+from ai.jobs import JobManager
+from ai.model_registry import ModelRegistry
+from ai.response_cache import ResponseCache
+from ai.scheduler import GenerationScheduler
+from ai.sidecar import SidecarGenerator
+from ai.singleflight import SingleFlight
 from ai.speech_generator import SpeechGenerator
+import ai.serving_parameters as serving_parameters
+from drain import DrainController
+from quotas import QuotaManager, create_quota_manager
+from readiness import Readiness
+from style_catalog import StyleCatalog
 
-# Глобальная переменная для хранения единственного экземпляра SpeechGenerator
+# Глобальная переменная для хранения единственного реестра моделей
 # Используется для реализации паттерна Singleton
-_speech_generator = None
+_model_registry = None
+
+# Общая очередь генерации и реестр пакетных заданий создаются при первом обращении
+_generation_scheduler = None
+_job_manager = None
+_singleflight = SingleFlight()
+_style_catalog = StyleCatalog()
+_readiness = Readiness()
+_quota_manager = None
+_degradation_policy = None
+_response_cache = None
+_drain_controller = DrainController(
+    readiness=_readiness,
+    scheduler_provider=lambda: _generation_scheduler,
+    job_manager_provider=lambda: _job_manager,
+    release=lambda: close_speech_generators()
+)
+
+
+def _load_generator(model_id: str) -> SpeechGenerator:
+
+    """
+    Загружает модель реестра и прогревает её по стилям каталога.
 
+    При serving_parameters.sidecar модель загружается в отдельном процессе генерации.
 
-async def get_speech_generator() -> SpeechGenerator:
+    Args:
+        model_id (str): Идентификатор модели на Hugging Face или путь к ней.
 
+    Returns:
+        SpeechGenerator: Загруженный и прогретый генератор.
     """
-    Dependency provider для внедрения SpeechGenerator в эндпоинты FastAPI.
 
-    Эта функция используется как зависимость (dependency) в FastAPI маршрутах
-    для предоставления доступа к инициализированному генератору речей.
+    if serving_parameters.sidecar:
+        generator = SidecarGenerator(model_id)
+    else:
+        generator = SpeechGenerator(model_id)
+        generator.load_model()
+    if serving_parameters.warmup:
+        # В процесс генерации (sidecar) передаётся один стиль, а не весь каталог
+        styles = SpeechGenerator.warmup_style(get_style_catalog().snapshot())
+        _readiness.record_warmup(model_id, generator.warm_up(styles))
+    return generator
+
+
+def get_model_registry() -> ModelRegistry:
+
+    """
+    Dependency provider для внедрения реестра моделей в эндпоинты FastAPI.
+
+    Реестр создаётся при первом обращении по конфигурации из
+    ai.serving_parameters; модели загружаются при первом использовании.
 
     Returns:
-        SpeechGenerator: Инициализированный экземпляр генератора речей.
+        ModelRegistry: Единственный экземпляр реестра моделей.
 
     Raises:
-        RuntimeError: Если генератор не был инициализирован перед использованием.
+        ValueError: Если конфигурация моделей некорректна.
 
     Пример использования в FastAPI:
         @app.post("/generate")
         async def generate_speech(
-            generator: SpeechGenerator = Depends(get_speech_generator)
+            registry: ModelRegistry = Depends(get_model_registry)
         ):
             ...
     """
 
-    if _speech_generator is None:
-        raise RuntimeError("SpeechGenerator не инициализирован")
-    return _speech_generator
+    global _model_registry
+    if _model_registry is None:
+        _model_registry = ModelRegistry(
+            models=serving_parameters.models,
+            default_model=serving_parameters.default_model,
+            routes=serving_parameters.model_routes,
+            memory_budget_bytes=int(serving_parameters.model_memory_budget_gb * 1024 ** 3),
+            loader=_load_generator
+        )
+    return _model_registry
 
 
-def init_speech_generator():
+def init_speech_generator() -> threading.Thread:
 
     """
-    Инициализирует SpeechGenerator при старте приложения.
+    Запускает загрузку и прогрев модели по умолчанию в фоновом потоке.
 
-    Эта функция должна быть вызвана при запуске приложения для загрузки
-    модели и создания экземпляра SpeechGenerator. Загруженный экземпляр
-    сохраняется в глобальной переменной для последующего использования.
+    Загрузка длится минуты, поэтому не задерживает старт приложения: HTTP
+    уже обслуживается, /api/health/live отвечает, а /api/health/ready
+    отвечает 503, пока модель не загружена и не прогрета. Запросы на
+    генерацию, пришедшие во время загрузки, ждут её в реестре моделей.
+    Остальные модели реестра загружаются и прогреваются лениво, при первом
+    запросе к ним.
 
-    Процесс инициализации:
-        1. Создает экземпляр SpeechGenerator
-        2. Загружает модель и токенизатор
-        3. Сохраняет экземпляр в глобальной переменной
+    Returns:
+        threading.Thread: Поток загрузки.
 
     Side Effects:
-        - Изменяет глобальную переменную _speech_generator
+        - Создаёт реестр моделей, если он ещё не создан
+        - По окончании загрузки отмечает экземпляр готовым принимать запросы,
+          при ошибке - не загрузившимся
         - Выводит сообщения о процессе загрузки в консоль
-
-    Raises:
-        Exception: Если произошла ошибка при загрузке модели.
     """
 
+    thread = threading.Thread(target=_load_default_model, name="model-loader", daemon=True)
+    thread.start()
+    return thread
+
+
+def _load_default_model():
     print('Начало загрузки модели...')
-    global _speech_generator
-    _speech_generator = SpeechGenerator()
-    _speech_generator.load_model()
+    registry = get_model_registry()
+    try:
+        registry.get(registry.default_model)
+    except Exception as e:
+        print(f'Ошибка загрузки модели: {e}')
+        _readiness.mark_failed(str(e))
+        return
+    _readiness.mark_ready()
     print('Модель загружена')
+
+
+def close_speech_generators():
+
+    """
+    Выгружает модели реестра при остановке приложения.
+
+    Процессы генерации (serving_parameters.sidecar) останавливаются вместе
+    с приложением, а не перезапускаются.
+    """
+
+    if _model_registry is not None:
+        _model_registry.close()
+
+
+def get_generation_scheduler() -> GenerationScheduler:
+
+    """
+    Dependency provider общей очереди генерации.
+
+    Очередь создаётся при первом обращении, её рабочий поток стартует
+    вместе с первым запросом на генерацию. Запросы ставятся в очередь с именем
+    модели, генератор берётся из реестра моделей при выполнении батча.
+
+    Returns:
+        GenerationScheduler: Единственный экземпляр очереди генерации.
+    """
+
+    global _generation_scheduler
+    if _generation_scheduler is None:
+        _generation_scheduler = GenerationScheduler(
+            styles_provider=lambda: get_style_catalog().snapshot(),
+            model_provider=lambda name: get_model_registry().get(name)
+        )
+    return _generation_scheduler
+
+
+def get_job_manager() -> JobManager:
+
+    """
+    Dependency provider реестра пакетных заданий.
+
+    Returns:
+        JobManager: Единственный экземпляр реестра заданий, работающий
+            поверх общей очереди генерации.
+    """
+
+    global _job_manager
+    if _job_manager is None:
+        _job_manager = JobManager(get_generation_scheduler())
+    return _job_manager
+
+
+def get_singleflight() -> SingleFlight:
+
+    """
+    Dependency provider реестра объединяемых одновременных генераций.
+
+    Returns:
+        SingleFlight: Единственный экземпляр реестра.
+    """
+
+    return _singleflight
+
+
+def get_style_catalog() -> StyleCatalog:
+
+    """
+    Dependency provider каталога стилей выступлений.
+
+    Returns:
+        StyleCatalog: Единственный экземпляр каталога стилей.
+    """
+
+    return _style_catalog
+
+
+def get_readiness() -> Readiness:
+
+    """
+    Dependency provider состояния готовности экземпляра.
+
+    Returns:
+        Readiness: Единственный экземпляр состояния готовности.
+    """
+
+    return _readiness
+
+
+def get_quota_manager() -> Optional[QuotaManager]:
+
+    """
+    Dependency provider квот токенов по API-ключам.
+
+    Квоты создаются при первом обращении по конфигурации из ai.serving_parameters.
+
+    Returns:
+        Optional[QuotaManager]: Единственный экземпляр квот или None, если квоты
+            выключены (quota_enabled).
+    """
+
+    global _quota_manager
+    if not serving_parameters.quota_enabled:
+        return None
+    if _quota_manager is None:
+        _quota_manager = create_quota_manager()
+    return _quota_manager
+
+
+def close_quota_manager():
+    """Закрывает хранилище квот при остановке приложения."""
+    global _quota_manager
+    if _quota_manager is not None:
+        _quota_manager.close()
+        _quota_manager = None
+
+
+def get_degradation_policy() -> DegradationPolicy:
+
+    """
+    Dependency provider уровней деградации при перегрузке.
+
+    Политика создаётся при первом обращении по degradation_tiers из
+    ai.serving_parameters; без уровней запросы обслуживаются без деградации.
+
+    Returns:
+        DegradationPolicy: Единственный экземпляр политики деградации.
+
+    Raises:
+        ValueError: Если описание уровня некорректно.
+    """
+
+    global _degradation_policy
+    if _degradation_policy is None:
+        _degradation_policy = DegradationPolicy.from_config(serving_parameters.degradation_tiers)
+    return _degradation_policy
+
+
+def get_response_cache() -> ResponseCache:
+
+    """
+    Dependency provider кэша ответов для уровней деградации.
+
+    Returns:
+        ResponseCache: Единственный экземпляр кэша ответов.
+    """
+
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache(
+            size=serving_parameters.response_cache_size,
+            min_similarity=serving_parameters.response_cache_min_similarity
+        )
+    return _response_cache
+
+
+def get_drain_controller() -> DrainController:
+
+    """
+    Dependency provider плавной остановки экземпляра.
+
+    Остановка ждёт только уже созданные очередь генерации и реестр заданий:
+    если запросов не было, модели выгружаются сразу.
+
+    Returns:
+        DrainController: Единственный экземпляр остановки.
+    """
+
+    return _drain_controller
@@ -0,0 +1,224 @@
+"""
+Модуль плавной остановки экземпляра (drain).
+
+При выкатке новой версии экземпляр получает SIGTERM. Если сразу завершить
+процесс, многоминутные генерации обрываются, клиенты повторяют их на другом
+узле, и вычисления тратятся дважды. Вместо этого остановка проходит этапы:
+1. экземпляр перестаёт принимать запросы на генерацию (503 с Retry-After),
+   а /api/health/ready отвечает 503 со статусом "draining", чтобы балансировщик
+   убрал его из ротации;
+2. при drain_handoff ещё не начатые запросы пакетных заданий дописываются
+   в JSONL-файл drain_handoff_path (его принимают POST /api/jobs другого
+   экземпляра и batch_cli.py);
+3. принятые запросы дорабатываются, но не дольше drain_grace_period_s; запросы,
+   так и не дождавшиеся генерации, завершаются ошибкой InstanceDraining (503);
+4. модели выгружаются, статус готовности становится "drained".
+
+Остановку запускает SIGTERM (если сервер, например uvicorn, установил свой
+обработчик - он вызывается после остановки и завершает процесс) или
+POST /api/admin/drain (процесс остаётся жить до остановки оркестратором).
+Уже идущий батч генерации не прерывается: после истечения периода ожидания
+модели выгружаются, а память батча освобождается с его окончанием.
+"""
+
+import signal
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+import ai.serving_parameters as serving_parameters
+from ai.memory import rss_bytes
+from readiness import Readiness
+
+
+class InstanceDraining(Exception):
+    """Запрос не был выполнен, потому что экземпляр останавливается; его можно повторить на другом экземпляре."""
+
+
+@dataclass
+class DrainState:
+
+    """
+    Состояние остановки экземпляра.
+
+    Attributes:
+        state (str): "serving", "draining" или "drained".
+        reason (Optional[str]): Причина остановки: "SIGTERM" или "admin".
+        started_at (Optional[float]): Время начала остановки (Unix time, секунды).
+        finished_at (Optional[float]): Время окончания остановки.
+        grace_period_s (float): Сколько секунд дорабатываются принятые запросы.
+        in_flight (int): Принятые и ещё не выполненные запросы.
+        handed_off (int): Запросы пакетных заданий, переданные в drain_handoff_path.
+        abandoned (int): Запросы, не дождавшиеся генерации за период ожидания.
+        released_bytes (int): Насколько уменьшилась RSS процесса после выгрузки моделей.
+    """
+
+    state: str = "serving"
+    reason: Optional[str] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    grace_period_s: float = 0.0
+    in_flight: int = 0
+    handed_off: int = 0
+    abandoned: int = 0
+    released_bytes: int = 0
+
+
+class DrainController:
+
+    """
+    Плавная остановка экземпляра: один раз за время жизни процесса.
+
+    Attributes:
+        readiness (Readiness): Состояние готовности экземпляра.
+    """
+
+    def __init__(
+        self,
+        readiness: Readiness,
+        scheduler_provider: Callable[[], object],
+        job_manager_provider: Callable[[], object],
+        release: Callable[[], None]
+    ):
+
+        """
+        Args:
+            readiness (Readiness): Состояние готовности экземпляра.
+            scheduler_provider (Callable[[], object]): Возвращает очередь генерации
+                или None, если она ещё не создавалась.
+            job_manager_provider (Callable[[], object]): Возвращает реестр пакетных
+                заданий или None.
+            release (Callable[[], None]): Выгружает модели.
+        """
+
+        self.readiness = readiness
+        self._scheduler_provider = scheduler_provider
+        self._job_manager_provider = job_manager_provider
+        self._release = release
+        self._status = DrainState()
+        self._on_drained: List[Callable[[], None]] = []
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self, reason: str, on_drained: Optional[Callable[[], None]] = None) -> bool:
+
+        """
+        Запускает остановку в фоновом потоке.
+
+        Args:
+            reason (str): Причина остановки для состояния и журнала.
+            on_drained (Optional[Callable[[], None]]): Вызывается после выгрузки моделей.
+
+        Returns:
+            bool: True, если остановка запущена этим вызовом; False, если она уже идёт
+                или завершена (on_drained всё равно будет вызван).
+        """
+
+        with self._lock:
+            started = self._status.state == "serving"
+            if started:
+                self._status.state = "draining"
+                self._status.reason = reason
+                self._status.started_at = time.time()
+                self._status.grace_period_s = serving_parameters.drain_grace_period_s
+                self.readiness.start_draining()
+            if on_drained is not None:
+                if self._done.is_set():
+                    threading.Thread(target=on_drained, daemon=True).start()
+                else:
+                    self._on_drained.append(on_drained)
+        if started:
+            print(f"Остановка экземпляра ({reason}): новые запросы не принимаются")
+            threading.Thread(target=self._run, name="drain", daemon=True).start()
+        return started
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Ждёт окончания остановки; False по таймауту."""
+        return self._done.wait(timeout)
+
+    def status(self) -> DrainState:
+        """Возвращает копию состояния остановки с текущим количеством запросов в работе."""
+        scheduler = self._scheduler_provider()
+        with self._lock:
+            status = DrainState(**vars(self._status))
+        status.in_flight = scheduler.in_flight if scheduler is not None else 0
+        return status
+
+    def _run(self):
+        grace_period_s = self._status.grace_period_s
+        scheduler = self._scheduler_provider()
+        job_manager = self._job_manager_provider()
+
+        handed_off = 0
+        if serving_parameters.drain_handoff and job_manager is not None:
+            handed_off = job_manager.handoff(serving_parameters.drain_handoff_path)
+            if handed_off:
+                print(f"Передано запросов пакетных заданий: {handed_off} -> {serving_parameters.drain_handoff_path}")
+
+        abandoned = 0
+        if scheduler is not None and not scheduler.wait_idle(grace_period_s):
+            withdrawn = scheduler.withdraw()
+            for _, _, future in withdrawn:
+                future.set_exception(InstanceDraining("Экземпляр останавливается, повторите запрос"))
+            abandoned = len(withdrawn)
+            print(
+                f"Период ожидания {grace_period_s} с истёк: отклонено ожидающих запросов {abandoned}, "
+                f"в генерации {scheduler.in_flight}"
+            )
+
+        rss_before = rss_bytes()
+        self._release()
+        released_bytes = max(0, rss_before - rss_bytes())
+        self.readiness.mark_drained()
+
+        with self._lock:
+            status = self._status
+            status.state = "drained"
+            status.finished_at = time.time()
+            status.handed_off = handed_off
+            status.abandoned = abandoned
+            status.released_bytes = released_bytes
+            callbacks, self._on_drained = self._on_drained, []
+            self._done.set()
+        print(f"Остановка завершена за {status.finished_at - status.started_at:.1f} с, "
+              f"освобождено {released_bytes / 1024 ** 2:.0f} МБ")
+        for callback in callbacks:
+            callback()
+
+
+def install_sigterm_handler(controller: DrainController) -> bool:
+
+    """
+    Запускает остановку по SIGTERM перед обработчиком сервера.
+
+    Обработчик сервера (uvicorn завершает по нему процесс) вызывается после
+    остановки, в том числе начатой через POST /api/admin/drain; повторный
+    SIGTERM передаётся ему сразу.
+    Вызывается из главного потока при старте приложения.
+
+    Args:
+        controller (DrainController): Остановка экземпляра.
+
+    Returns:
+        bool: True, если обработчик установлен; False, если сервер не установил
+            свой обработчик SIGTERM или вызов не из главного потока.
+    """
+
+    if threading.current_thread() is not threading.main_thread():
+        return False
+    previous = signal.getsignal(signal.SIGTERM)
+    if not callable(previous):
+        return False
+
+    received = []
+
+    def handle(signum, frame):
+        if received:
+            previous(signum, frame)
+            return
+        received.append(signum)
+        controller.start("SIGTERM", on_drained=lambda: previous(signum, frame))
+
+    signal.signal(signal.SIGTERM, handle)
+    return True
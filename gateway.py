@@ -0,0 +1,213 @@
+"""
+Модуль шлюза перед несколькими экземплярами сервиса генерации речей.
+
+Шлюз не загружает модели: он принимает запросы на генерацию, выбирает экземпляр
+из gateway_backends (см. load_balancer) и передаёт ответ экземпляра клиенту
+байт в байт — потоковая генерация отдаётся по мере поступления фрагментов,
+сжатый ответ не распаковывается. Экземпляры, не прошедшие проверку
+/api/health/ready, исключаются из балансировки до следующей успешной проверки.
+
+Запуск:
+    uvicorn main:app --port 8001
+    uvicorn main:app --port 8002
+    uvicorn gateway:app --port 8000
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+import httpx
+import uvicorn
+
+from load_balancer import Backend, BackendPool, estimate_request_tokens
+from schemas.model import SpeechRequest
+import ai.serving_parameters as serving_parameters
+
+# Заголовки запроса клиента, которые не передаются экземпляру
+_HOP_BY_HOP_HEADERS = {"host", "content-length", "connection", "keep-alive", "transfer-encoding", "upgrade"}
+# Заголовки ответа экземпляра, которые передаются клиенту
+_RESPONSE_HEADERS = ("content-type", "content-encoding", "vary", "cache-control", "retry-after")
+
+pool = BackendPool(
+    serving_parameters.gateway_backends,
+    affinity_slack_tokens=serving_parameters.gateway_affinity_slack_tokens
+)
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Возвращает общий HTTP-клиент шлюза, создавая его при первом обращении."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(serving_parameters.gateway_timeout_s, connect=5.0),
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=64)
+        )
+    return _client
+
+
+async def check_backends():
+
+    """
+    Проверяет готовность всех экземпляров пула через /api/health/ready.
+
+    Экземпляр исправен, если ответил кодом 200. Экземпляр, который загружает
+    или прогревает модель, отвечает 503 и не получает запросов.
+    """
+
+    client = get_client()
+
+    async def check(backend: Backend):
+        try:
+            response = await client.get(
+                f"{backend.url}/api/health/ready", timeout=serving_parameters.gateway_health_interval_s
+            )
+            pool.mark(backend, response.status_code == 200)
+        except httpx.HTTPError:
+            pool.mark(backend, False)
+
+    await asyncio.gather(*(check(backend) for backend in pool.backends))
+
+
+async def _health_loop():
+    while True:
+        await check_backends()
+        await asyncio.sleep(serving_parameters.gateway_health_interval_s)
+
+
+async def _proxy(path: str, speech_request: SpeechRequest, request: Request) -> StreamingResponse:
+
+    """
+    Передаёт запрос на генерацию выбранному экземпляру и отдаёт его ответ потоком.
+
+    Если экземпляр не принимает соединение, он помечается неисправным и запрос
+    отправляется следующему. После установки соединения запрос не повторяется:
+    генерация на экземпляре уже могла начаться.
+
+    Args:
+        path (str): Путь эндпоинта экземпляра.
+        speech_request (SpeechRequest): Проверенный запрос (для стиля и оценки токенов).
+        request (Request): Исходный HTTP-запрос клиента.
+
+    Returns:
+        StreamingResponse: Ответ экземпляра с его кодом состояния и заголовками.
+
+    Raises:
+        HTTPException: 503, если исправных экземпляров нет; 502, если экземпляр
+            оборвал соединение до ответа.
+    """
+
+    body = await request.body()
+    headers = {name: value for name, value in request.headers.items() if name not in _HOP_BY_HOP_HEADERS}
+    # Без этого httpx запросил бы сжатие от своего имени, и клиент получил бы кодировку, которую не просил
+    headers.setdefault("accept-encoding", "identity")
+    tokens = estimate_request_tokens(speech_request)
+    client = get_client()
+    tried = []
+
+    while True:
+        backend = pool.choose(speech_request.style, exclude=tried)
+        if backend is None:
+            raise HTTPException(status_code=503, detail="Нет готовых экземпляров сервиса генерации")
+
+        pool.acquire(backend, speech_request.style, tokens)
+        upstream_request = client.build_request("POST", f"{backend.url}{path}", content=body, headers=headers)
+        try:
+            upstream = await client.send(upstream_request, stream=True)
+            break
+        except (httpx.ConnectError, httpx.ConnectTimeout):
+            pool.release(backend, tokens)
+            pool.mark(backend, False)
+            tried.append(backend.url)
+        except httpx.HTTPError as e:
+            pool.release(backend, tokens)
+            raise HTTPException(status_code=502, detail=f"Экземпляр {backend.url} не ответил: {e}")
+
+    async def passthrough():
+        try:
+            async for chunk in upstream.aiter_raw():
+                yield chunk
+        finally:
+            await upstream.aclose()
+            pool.release(backend, tokens)
+
+    response_headers = {name: upstream.headers[name] for name in _RESPONSE_HEADERS if name in upstream.headers}
+    response_headers["X-Backend"] = backend.url
+    return StreamingResponse(passthrough(), status_code=upstream.status_code, headers=response_headers)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Жизненный цикл шлюза: периодическая проверка экземпляров и закрытие HTTP-клиента.
+
+    Args:
+        app (FastAPI): Экземпляр FastAPI приложения шлюза.
+
+    Yields:
+        None: Контроль возвращается FastAPI для работы приложения.
+    """
+    health_task = asyncio.create_task(_health_loop())
+    yield
+    health_task.cancel()
+    await get_client().aclose()
+
+
+app = FastAPI(
+    title="Speech Generation Gateway",
+    description="Шлюз, распределяющий генерацию речей между экземплярами сервиса",
+    lifespan=lifespan
+)
+
+
+@app.post("/api/model/generate_speech")
+async def generate_speech(speech_request: SpeechRequest, request: Request) -> StreamingResponse:
+    """Генерирует речь на наименее загруженном экземпляре (см. /api/model/generate_speech сервиса)."""
+    return await _proxy("/api/model/generate_speech", speech_request, request)
+
+
+@app.post("/api/model/generate_speech_stream")
+async def generate_speech_stream(speech_request: SpeechRequest, request: Request) -> StreamingResponse:
+    """Потоковая генерация на наименее загруженном экземпляре; фрагменты передаются без буферизации."""
+    return await _proxy("/api/model/generate_speech_stream", speech_request, request)
+
+
+@app.get("/api/gateway/backends")
+async def get_backends() -> list:
+
+    """
+    Возвращает состояние экземпляров пула.
+
+    Returns:
+        list: Для каждого экземпляра - URL, исправность, токены и запросы в работе,
+            количество отправленных запросов и ошибок, недавние стили.
+    """
+
+    return [
+        {
+            "url": backend.url,
+            "healthy": backend.healthy,
+            "outstanding_tokens": backend.outstanding_tokens,
+            "outstanding_requests": backend.outstanding_requests,
+            "served": backend.served,
+            "failures": backend.failures,
+            "recent_styles": list(backend.recent_styles)
+        }
+        for backend in pool.backends
+    ]
+
+
+@app.get("/api/health/ready")
+async def ready() -> dict:
+    """Шлюз готов, если готов хотя бы один экземпляр; иначе 503."""
+    healthy = len(pool.healthy_backends)
+    if healthy == 0:
+        raise HTTPException(status_code=503, detail="Нет готовых экземпляров сервиса генерации")
+    return {"status": "ready", "healthy_backends": healthy, "backends": len(pool.backends)}
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="0.0.0.0", port=8000)
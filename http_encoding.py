@@ -0,0 +1,163 @@
+"""
+Модуль кодирования HTTP-ответов: быстрая сериализация JSON и сжатие.
+
+FastJSONResponse сериализует ответы сериализатором pydantic-core (написан на Rust)
+сразу в байты UTF-8, минуя jsonable_encoder и стандартный модуль json.
+
+CompressionMiddleware сжимает ответы gzip, brotli или zstd в зависимости от
+заголовка Accept-Encoding клиента. Сжимаются только ответы не меньше порога
+compression_min_size с текстовым или JSON-содержимым. Потоковые ответы
+(генерация речи потоком, результаты пакетных заданий) передаются без сжатия,
+чтобы фрагменты доходили до клиента без задержки на буферизацию.
+
+Brotli и zstd необязательны: если пакеты brotli / zstandard не установлены,
+соответствующие кодировки просто не предлагаются.
+"""
+
+import gzip
+from typing import Any, Callable, Dict, Optional
+
+import pydantic_core
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+
+import ai.serving_parameters as serving_parameters
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class FastJSONResponse(JSONResponse):
+
+    """JSON-ответ, сериализуемый pydantic-core без экранирования не-ASCII символов."""
+
+    def render(self, content: Any) -> bytes:
+        return pydantic_core.to_json(content)
+
+
+def _compress_gzip(body: bytes) -> bytes:
+    return gzip.compress(body, compresslevel=serving_parameters.compression_levels["gzip"], mtime=0)
+
+
+def _compress_brotli(body: bytes) -> bytes:
+    return brotli.compress(body, quality=serving_parameters.compression_levels["br"])
+
+
+def _compress_zstd(body: bytes) -> bytes:
+    return zstandard.ZstdCompressor(level=serving_parameters.compression_levels["zstd"]).compress(body)
+
+
+# Доступные кодировки сжатия: имя в Accept-Encoding -> функция сжатия
+COMPRESSORS: Dict[str, Callable[[bytes], bytes]] = {"gzip": _compress_gzip}
+if brotli is not None:
+    COMPRESSORS["br"] = _compress_brotli
+if zstandard is not None:
+    COMPRESSORS["zstd"] = _compress_zstd
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+
+    """
+    Выбирает кодировку сжатия по заголовку Accept-Encoding.
+
+    Из кодировок с наибольшим весом q выбирается первая в порядке предпочтения
+    serving_parameters.compression_encodings. Кодировки с q=0 и недоступные
+    на сервере не выбираются.
+
+    Args:
+        accept_encoding (str): Значение заголовка Accept-Encoding.
+
+    Returns:
+        Optional[str]: Имя кодировки или None, если ответ нужно отдать без сжатия.
+
+    Example:
+        >>> choose_encoding("gzip, deflate")
+        'gzip'
+        >>> choose_encoding("gzip;q=0")
+    """
+
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name] = weight
+
+    best, best_weight = None, 0.0
+    for name in serving_parameters.compression_encodings:
+        if name not in COMPRESSORS:
+            continue
+        weight = weights.get(name, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = name, weight
+    return best
+
+
+def _compressible(headers: MutableHeaders) -> bool:
+    content_type = headers.get("content-type", "")
+    return content_type.startswith("text/") or "json" in content_type
+
+
+class CompressionMiddleware:
+
+    """
+    ASGI-middleware сжатия ответов по Accept-Encoding.
+
+    Ответ, переданный одним сообщением, сжимается целиком, если он не меньше
+    порога и ещё не сжат. Ответы из нескольких сообщений (потоковые) не сжимаются.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        start_message = None
+
+        async def send_compressed(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            start, start_message = start_message, None
+            headers = MutableHeaders(raw=start["headers"])
+            body = message.get("body", b"")
+            if _compressible(headers):
+                headers.add_vary_header("Accept-Encoding")
+                if (
+                    encoding is not None
+                    and not message.get("more_body", False)
+                    and "content-encoding" not in headers
+                    and len(body) >= serving_parameters.compression_min_size
+                ):
+                    body = COMPRESSORS[encoding](body)
+                    headers["Content-Encoding"] = encoding
+                    headers["Content-Length"] = str(len(body))
+                    message = {**message, "body": body}
+            await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
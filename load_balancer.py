@@ -0,0 +1,149 @@
+"""
+Модуль балансировки запросов генерации между экземплярами сервиса.
+
+Каждый запрос оценивается в токенах (промпт и планируемая речь), и шлюз
+отправляет его на исправный экземпляр с наименьшим количеством токенов в работе
+(least outstanding tokens). Так длинный доклад и короткий тост нагружают
+экземпляры пропорционально реальной работе, а не одинаково.
+
+Экземпляр, недавно генерировавший речи того же стиля, получает преимущество:
+промпты одного стиля совпадают в начале, поэтому повторное обращение к тому же
+экземпляру лучше использует его кэши. Преимущество ограничено
+gateway_affinity_slack_tokens, чтобы сродство не перегружало один экземпляр.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional
+
+from schemas.model import SpeechRequest
+import ai.serving_parameters as serving_parameters
+
+
+def estimate_request_tokens(request: SpeechRequest) -> int:
+
+    """
+    Грубо оценивает работу по запросу в токенах без токенизатора.
+
+    Args:
+        request (SpeechRequest): Запрос с параметрами речи.
+
+    Returns:
+        int: Оценка токенов промпта (около трёх символов на токен) и речи
+            (gateway_tokens_per_minute на минуту выступления на каждый вариант).
+    """
+
+    prompt_chars = len(request.topic) + len(request.custom_instructions or "")
+    prompt_chars += sum(len(point) for point in request.key_points or [])
+    output_tokens = request.duration_minutes * serving_parameters.gateway_tokens_per_minute
+    return prompt_chars // 3 + output_tokens * max(1, request.n)
+
+
+@dataclass
+class Backend:
+
+    """
+    Экземпляр сервиса генерации за шлюзом.
+
+    Attributes:
+        url (str): Базовый URL экземпляра, например http://10.0.0.5:8000.
+        healthy (bool): Результат последней проверки готовности.
+        outstanding_tokens (int): Оценка токенов запросов, выполняющихся сейчас.
+        outstanding_requests (int): Количество запросов, выполняющихся сейчас.
+        served (int): Количество запросов, отправленных на экземпляр.
+        failures (int): Количество неудачных обращений и проверок.
+        recent_styles (OrderedDict): Стили последних запросов, от давних к недавним.
+    """
+
+    url: str
+    healthy: bool = True
+    outstanding_tokens: int = 0
+    outstanding_requests: int = 0
+    served: int = 0
+    failures: int = 0
+    recent_styles: "OrderedDict[str, None]" = field(default_factory=OrderedDict)
+
+
+class BackendPool:
+
+    """
+    Пул экземпляров сервиса с балансировкой по токенам в работе.
+
+    Шлюз выполняется в одном цикле событий, поэтому состояние пула
+    изменяется без блокировок.
+    """
+
+    def __init__(self, urls: Iterable[str], affinity_slack_tokens: int = 0, styles_per_backend: int = 64):
+
+        """
+        Инициализирует пул. До первой проверки готовности экземпляры считаются исправными.
+
+        Args:
+            urls (Iterable[str]): Базовые URL экземпляров.
+            affinity_slack_tokens (int): На сколько токенов в работе экземпляр, недавно
+                обслуживавший стиль запроса, может быть загружен больше наименее
+                загруженного и всё равно получить запрос.
+            styles_per_backend (int): Сколько последних стилей помнить для каждого экземпляра.
+        """
+
+        self.backends = [Backend(url=url.rstrip("/")) for url in urls]
+        self.affinity_slack_tokens = affinity_slack_tokens
+        self.styles_per_backend = styles_per_backend
+
+    def choose(self, style: str, exclude: Iterable[str] = ()) -> Optional[Backend]:
+
+        """
+        Выбирает экземпляр для запроса.
+
+        Args:
+            style (str): Стиль запроса.
+            exclude (Iterable[str]): URL экземпляров, которые уже не ответили на этот запрос.
+
+        Returns:
+            Optional[Backend]: Экземпляр или None, если исправных экземпляров нет.
+        """
+
+        excluded = set(exclude)
+        candidates = [backend for backend in self.backends if backend.healthy and backend.url not in excluded]
+        if not candidates:
+            return None
+
+        least_loaded = min(candidates, key=lambda backend: backend.outstanding_tokens)
+        warm = [
+            backend for backend in candidates
+            if style in backend.recent_styles
+            and backend.outstanding_tokens <= least_loaded.outstanding_tokens + self.affinity_slack_tokens
+        ]
+        if warm:
+            return min(warm, key=lambda backend: backend.outstanding_tokens)
+        return least_loaded
+
+    def acquire(self, backend: Backend, style: str, tokens: int):
+        """Учитывает запрос, отправленный на экземпляр."""
+        backend.outstanding_tokens += tokens
+        backend.outstanding_requests += 1
+        backend.served += 1
+        backend.recent_styles.pop(style, None)
+        backend.recent_styles[style] = None
+        while len(backend.recent_styles) > self.styles_per_backend:
+            backend.recent_styles.popitem(last=False)
+
+    def release(self, backend: Backend, tokens: int):
+        """Снимает учёт завершённого запроса."""
+        backend.outstanding_tokens -= tokens
+        backend.outstanding_requests -= 1
+
+    def mark(self, backend: Backend, healthy: bool):
+        """Обновляет исправность экземпляра по результату проверки или обращения."""
+        if not healthy:
+            backend.failures += 1
+            if backend.healthy:
+                print(f"Экземпляр {backend.url} недоступен, запросы на него не направляются")
+        elif not backend.healthy:
+            print(f"Экземпляр {backend.url} снова готов")
+        backend.healthy = healthy
+
+    @property
+    def healthy_backends(self) -> List[Backend]:
+        """Исправные экземпляры пула."""
+        return [backend for backend in self.backends if backend.healthy]
@@ -9,9 +9,17 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 import uvicorn
 
-from dependencies import init_speech_generator
+import ai.serving_parameters as serving_parameters
+from ai.serving_profile import load_profile
+from dependencies import close_quota_manager, close_speech_generators, get_drain_controller, init_speech_generator
+from drain import install_sigterm_handler
+from http_encoding import CompressionMiddleware, FastJSONResponse
+from routers.admin_api import router as admin_router
+from routers.health_api import router as health_router
+from routers.jobs_api import router as jobs_router
 from routers.model_api import router as model_router
 from routers.styles_api import router as style_router
+from traffic_capture import CaptureMiddleware, close_recorder
 
 
 @asynccontextmanager
@@ -29,24 +37,45 @@ async def lifespan(app: FastAPI):
         None: Контроль возвращается FastAPI для работы приложения.
 
     Side Effects:
-        - Инициализирует генератор речей при старте приложения
-        - Высвобождает ресурсы при завершении (если будут добавлены)
+        - Применяет профиль параметров узла (autotune_cli.py), если он есть
+        - Запускает в фоне загрузку и прогрев модели по умолчанию: приложение сразу
+          принимает соединения, а экземпляр готов к запросам после прогрева
+        - Перехватывает SIGTERM для плавной остановки (drain.py): принятые генерации
+          дорабатываются до завершения процесса
+        - Дописывает и закрывает файл записи трафика при завершении
+        - Выгружает модели и останавливает процессы генерации при завершении
+        - Закрывает хранилище квот токенов при завершении
     """
     # Инициализация при старте приложения
+    load_profile()
     init_speech_generator()
+    if serving_parameters.drain_on_sigterm:
+        install_sigterm_handler(get_drain_controller())
     yield
-    # Здесь можно добавить код для очистки при завершении
+    close_recorder()
+    close_speech_generators()
+    close_quota_manager()
 
 # Создание основного экземпляра FastAPI приложения
 app = FastAPI(
     title="Speech Generation API",
     description="API для генерации речей для выступлений",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
+# Сжатие ответов gzip / brotli / zstd по заголовку Accept-Encoding
+app.add_middleware(CompressionMiddleware)
+# Запись запросов генерации для воспроизведения (включается capture_enabled);
+# добавлена последней, поэтому задержка включает сжатие ответа
+app.add_middleware(CaptureMiddleware)
+
 # Подключение роутеров API с префиксами
 app.include_router(model_router, prefix="/api/model")
 app.include_router(style_router, prefix="/api/styles")
+app.include_router(jobs_router, prefix="/api/jobs")
+app.include_router(health_router, prefix="/api/health")
+app.include_router(admin_router, prefix="/api/admin")
 
 
 if __name__ == "__main__":
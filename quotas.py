@@ -0,0 +1,308 @@
+"""
+Модуль квот токенов по API-ключам.
+
+Каждому ключу (заголовок X-API-Key) соответствует «ведро» токенов: оно
+наполняется со скоростью quota_tokens_per_minute до ёмкости quota_burst_tokens
+(ai/serving_parameters.py). Токены - это токены промпта плюс сгенерированные
+токены. При приёме запроса с ведра списывается оценка бюджета (промпт и
+планируемый ответ на каждый вариант), по завершении генерации списание
+сверяется с фактическим расходом: неиспользованное возвращается, перерасход
+досписывается. Запрос, завершившийся ошибкой, не расходует квоту.
+
+Отдельное ведро есть только у ключей из quota_keys; запросы без ключа и с
+неизвестным ключом делят общее ведро ANONYMOUS_KEY, иначе случайный заголовок
+давал бы полную квоту и новое ведро в хранилище на каждый запрос.
+
+Состояние вёдер хранится локально в памяти процесса (quota_backend = "memory")
+или в файле SQLite (quota_backend = "sqlite"), общем для нескольких
+процессов-обработчиков одного узла.
+"""
+
+import math
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+import ai.serving_parameters as serving_parameters
+
+# Общее ведро запросов без заголовка X-API-Key или с ключом, которого нет в quota_keys
+ANONYMOUS_KEY = "anonymous"
+
+
+@dataclass
+class QuotaCharge:
+
+    """
+    Списание с квоты ключа за один запрос.
+
+    Attributes:
+        key (str): API-ключ.
+        tokens (int): Сколько токенов списано за запрос на текущий момент.
+        limit_tokens (int): Ёмкость ведра ключа.
+        remaining_tokens (int): Остаток ведра после списания.
+        reset_seconds (float): Через сколько секунд ведро наполнится полностью.
+    """
+
+    key: str
+    tokens: int
+    limit_tokens: int
+    remaining_tokens: int
+    reset_seconds: float
+
+    def headers(self) -> Dict[str, str]:
+        """Заголовки ответа с остатком квоты."""
+        return {
+            "x-ratelimit-limit-tokens": str(self.limit_tokens),
+            "x-ratelimit-remaining-tokens": str(self.remaining_tokens),
+            "x-ratelimit-reset-tokens": f"{self.reset_seconds:.0f}s"
+        }
+
+
+class QuotaExceeded(Exception):
+
+    """
+    Квоты ключа не хватает на запрос.
+
+    Attributes:
+        charge (QuotaCharge): Состояние ведра ключа (tokens - оценка отклонённого запроса).
+        retry_after (int): Через сколько секунд в ведре наберётся достаточно токенов.
+    """
+
+    def __init__(self, charge: QuotaCharge, retry_after: int):
+        super().__init__(
+            f"Квота токенов исчерпана: запрос оценён в {charge.tokens} токенов, "
+            f"доступно {charge.remaining_tokens}"
+        )
+        self.charge = charge
+        self.retry_after = retry_after
+
+
+def _refill(level: float, updated_at: float, now: float, rate: float, capacity: int) -> float:
+    return min(capacity, level + max(0.0, now - updated_at) * rate)
+
+
+class MemoryQuotaBackend:
+
+    """Вёдра токенов в памяти процесса: у каждого обработчика свои квоты."""
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: str, tokens: int, required: int, rate: float, capacity: int, now: float) -> Tuple[bool, float]:
+
+        """
+        Списывает токены, если в ведре есть хотя бы required токенов.
+
+        Args:
+            key (str): API-ключ.
+            tokens (int): Сколько списать.
+            required (int): Сколько должно быть в ведре для списания.
+            rate (float): Скорость наполнения ведра, токенов в секунду.
+            capacity (int): Ёмкость ведра; новое ведро полное.
+            now (float): Текущее время, секунды.
+
+        Returns:
+            Tuple[bool, float]: Списаны ли токены и уровень ведра после операции.
+        """
+
+        with self._lock:
+            level, updated_at = self._buckets.get(key, (capacity, now))
+            level = _refill(level, updated_at, now, rate, capacity)
+            taken = level >= required
+            if taken:
+                level -= tokens
+            self._buckets[key] = (level, now)
+            return taken, level
+
+    def adjust(self, key: str, delta: int, rate: float, capacity: int, now: float) -> float:
+
+        """
+        Возвращает (delta > 0) или досписывает (delta < 0) токены ведра.
+
+        Returns:
+            float: Уровень ведра после операции; при досписании может стать отрицательным.
+        """
+
+        with self._lock:
+            level, updated_at = self._buckets.get(key, (capacity, now))
+            level = min(capacity, _refill(level, updated_at, now, rate, capacity) + delta)
+            self._buckets[key] = (level, now)
+            return level
+
+    def close(self):
+        pass
+
+
+class SQLiteQuotaBackend:
+
+    """
+    Вёдра токенов в файле SQLite, общие для процессов-обработчиков узла.
+
+    Каждая операция выполняется в транзакции BEGIN IMMEDIATE, поэтому
+    одновременные списания из разных процессов не теряются.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._lock = threading.Lock()
+
+    def _update(self, key: str, capacity: int, now: float, change: Callable[[float], Tuple[bool, float]]):
+        with self._lock:
+            connection = self._connection
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+                level, updated_at = row if row is not None else (capacity, now)
+                result, level = change(level, updated_at)
+                connection.execute(
+                    "INSERT INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                    (key, level, now)
+                )
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            return result, level
+
+    def take(self, key: str, tokens: int, required: int, rate: float, capacity: int, now: float) -> Tuple[bool, float]:
+        """Списывает токены, если в ведре есть хотя бы required токенов (см. MemoryQuotaBackend.take)."""
+        def change(level, updated_at):
+            level = _refill(level, updated_at, now, rate, capacity)
+            taken = level >= required
+            return taken, level - tokens if taken else level
+
+        return self._update(key, capacity, now, change)
+
+    def adjust(self, key: str, delta: int, rate: float, capacity: int, now: float) -> float:
+        """Возвращает или досписывает токены ведра (см. MemoryQuotaBackend.adjust)."""
+        def change(level, updated_at):
+            level = min(capacity, _refill(level, updated_at, now, rate, capacity) + delta)
+            return None, level
+
+        return self._update(key, capacity, now, change)[1]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class QuotaManager:
+
+    """
+    Квоты токенов по API-ключам поверх хранилища вёдер.
+
+    Запрос принимается, если в ведре есть его оценка; оценка больше ёмкости
+    ведра принимается при полном ведре, иначе такой запрос не прошёл бы никогда.
+    Ключи, которых нет в keys, списываются с общего ведра ANONYMOUS_KEY.
+
+    Attributes:
+        backend: Хранилище вёдер (MemoryQuotaBackend или SQLiteQuotaBackend).
+        tokens_per_minute (int): Скорость наполнения ведра по умолчанию.
+        burst_tokens (int): Ёмкость ведра по умолчанию.
+        keys (Dict[str, Tuple[int, int]]): Отдельные квоты ключей: ключ -> (токенов в минуту, ёмкость).
+    """
+
+    def __init__(
+        self,
+        backend,
+        tokens_per_minute: int,
+        burst_tokens: int,
+        keys: Optional[Dict[str, Tuple[int, int]]] = None,
+        clock: Callable[[], float] = time.time
+    ):
+        self.backend = backend
+        self.tokens_per_minute = tokens_per_minute
+        self.burst_tokens = burst_tokens
+        self.keys = dict(keys or {})
+        self._clock = clock
+
+    def _limits(self, key: str) -> Tuple[float, int]:
+        tokens_per_minute, capacity = self.keys.get(key, (self.tokens_per_minute, self.burst_tokens))
+        return tokens_per_minute / 60, capacity
+
+    def _charge(self, key: str, tokens: int, level: float, rate: float, capacity: int) -> QuotaCharge:
+        return QuotaCharge(
+            key=key,
+            tokens=tokens,
+            limit_tokens=capacity,
+            remaining_tokens=max(0, math.floor(level)),
+            reset_seconds=max(0.0, capacity - level) / rate
+        )
+
+    def admit(self, key: Optional[str], estimated_tokens: int) -> QuotaCharge:
+
+        """
+        Списывает с квоты ключа оценку запроса.
+
+        Args:
+            key (Optional[str]): API-ключ; без ключа или с ключом не из keys используется
+                общее ведро ANONYMOUS_KEY.
+            estimated_tokens (int): Оценка токенов запроса.
+
+        Returns:
+            QuotaCharge: Списание, которое сверяется с фактическим расходом в settle.
+
+        Raises:
+            QuotaExceeded: Если в ведре недостаточно токенов.
+        """
+
+        key = key if key in self.keys else ANONYMOUS_KEY
+        rate, capacity = self._limits(key)
+        required = min(estimated_tokens, capacity)
+        taken, level = self.backend.take(key, estimated_tokens, required, rate, capacity, self._clock())
+        if not taken:
+            retry_after = math.ceil((required - level) / rate)
+            raise QuotaExceeded(self._charge(key, estimated_tokens, level, rate, capacity), retry_after)
+        return self._charge(key, estimated_tokens, level, rate, capacity)
+
+    def settle(self, charge: QuotaCharge, used_tokens: int) -> QuotaCharge:
+
+        """
+        Сверяет списание с фактическим расходом запроса.
+
+        Args:
+            charge (QuotaCharge): Списание из admit.
+            used_tokens (int): Фактический расход токенов (0 - запрос завершился ошибкой).
+
+        Returns:
+            QuotaCharge: Списание с фактическим расходом и остатком ведра после сверки.
+        """
+
+        rate, capacity = self._limits(charge.key)
+        level = self.backend.adjust(charge.key, charge.tokens - used_tokens, rate, capacity, self._clock())
+        return self._charge(charge.key, used_tokens, level, rate, capacity)
+
+    def close(self):
+        self.backend.close()
+
+
+def create_quota_manager() -> QuotaManager:
+
+    """
+    Создаёт квоты по конфигурации из ai.serving_parameters.
+
+    Raises:
+        ValueError: Если указано неизвестное хранилище квот.
+    """
+
+    if serving_parameters.quota_backend == "memory":
+        backend = MemoryQuotaBackend()
+    elif serving_parameters.quota_backend == "sqlite":
+        backend = SQLiteQuotaBackend(serving_parameters.quota_sqlite_path)
+    else:
+        raise ValueError(f"Неизвестное хранилище квот: '{serving_parameters.quota_backend}'")
+    return QuotaManager(
+        backend,
+        tokens_per_minute=serving_parameters.quota_tokens_per_minute,
+        burst_tokens=serving_parameters.quota_burst_tokens,
+        keys=serving_parameters.quota_keys
+    )
@@ -0,0 +1,81 @@
+"""
+Модуль состояния готовности экземпляра сервиса.
+
+Экземпляр готов принимать запросы только после загрузки и прогрева модели
+по умолчанию; они идут в фоновом потоке после старта приложения, а если
+загрузка не удалась, экземпляр так и остаётся неготовым. Балансировщик или оркестратор опрашивает готовность через
+/api/health/ready и не направляет запросы на неготовый экземпляр.
+
+При остановке (drain.py) экземпляр снова становится неготовым: сначала
+"draining" - новые запросы на генерацию отклоняются, принятые дорабатываются, -
+затем "drained", когда модели выгружены.
+"""
+
+import threading
+from typing import Dict, List, Optional
+
+from ai.speech_generator import WarmupStep
+
+
+class Readiness:
+
+    """
+    Состояние готовности и отчёты прогрева загруженных моделей.
+
+    Attributes:
+        status (str): "starting" до загрузки и прогрева модели по умолчанию, затем "ready"
+            или "failed", если загрузить модель не удалось; при остановке - "draining" и "drained".
+        error (Optional[str]): Ошибка загрузки модели по умолчанию.
+        warmup_reports (Dict[str, List[WarmupStep]]): Прогревочные генерации
+            по идентификатору модели.
+    """
+
+    def __init__(self):
+        self.status = "starting"
+        self.error: Optional[str] = None
+        self.warmup_reports: Dict[str, List[WarmupStep]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        """Готов ли экземпляр принимать запросы."""
+        return self.status == "ready"
+
+    @property
+    def accepting(self) -> bool:
+        """Принимает ли экземпляр новые запросы на генерацию (не остановлен и не останавливается)."""
+        return self.status not in ("draining", "drained")
+
+    def mark_ready(self):
+        """Отмечает экземпляр готовым принимать запросы."""
+        if self.accepting:
+            self.status = "ready"
+
+    def mark_failed(self, error: str):
+        """Отмечает, что модель по умолчанию не загрузилась: экземпляр остаётся неготовым."""
+        self.error = error
+        if self.accepting:
+            self.status = "failed"
+
+    def start_draining(self):
+        """Отмечает экземпляр останавливающимся: новые запросы на генерацию не принимаются."""
+        self.status = "draining"
+
+    def mark_drained(self):
+        """Отмечает экземпляр остановленным: принятые запросы обработаны, модели выгружены."""
+        self.status = "drained"
+
+    def record_warmup(self, model_id: str, steps: List[WarmupStep]):
+
+        """
+        Сохраняет отчёт прогрева модели и выводит его итог.
+
+        Args:
+            model_id (str): Идентификатор прогретой модели.
+            steps (List[WarmupStep]): Прогревочные генерации модели.
+        """
+
+        with self._lock:
+            self.warmup_reports[model_id] = list(steps)
+        total = sum(step.seconds for step in steps)
+        print(f"Прогрев модели '{model_id}' завершён: {len(steps)} генераций за {total:.1f} с")
@@ -0,0 +1,232 @@
+"""
+Воспроизведение записанного трафика генерации на экземпляре сервиса.
+
+Читает файлы записи traffic_capture.py (или обычный JSONL с запросами) и
+отправляет запросы на целевой экземпляр с исходными интервалами между
+поступлениями, ускоренными или замедленными в --speed раз. По окончании
+сравнивает задержки и пропускную способность воспроизведения с записанными.
+
+Пример запуска:
+    python replay_cli.py captures/requests.jsonl.1 captures/requests.jsonl --target http://127.0.0.1:8000 --speed 2
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import httpx
+
+from schemas.model import SpeechRequest
+from traffic_capture import CAPTURED_PATHS
+
+
+@dataclass
+class CapturedRequest:
+    """Записанный запрос: тело, эндпоинт, время поступления и наблюдавшиеся задержка и код ответа."""
+    request: SpeechRequest
+    endpoint: str
+    captured_at: Optional[float] = None
+    latency_ms: Optional[float] = None
+    status: Optional[int] = None
+
+
+@dataclass
+class ReplayResult:
+    """Результат воспроизведения одного запроса."""
+    sent_at: float
+    latency_ms: float
+    status: Optional[int]
+    error: Optional[str] = None
+
+
+def load_capture(paths: List[str]) -> List[CapturedRequest]:
+
+    """
+    Читает записанные запросы из одного или нескольких файлов.
+
+    Запросы упорядочиваются по времени поступления, поэтому ротированные
+    файлы можно передавать в любом порядке. Строки без captured_at (обычный
+    JSONL с запросами) считаются поступившими одновременно.
+
+    Args:
+        paths (List[str]): Пути к файлам JSONL.
+
+    Returns:
+        List[CapturedRequest]: Запросы в порядке поступления.
+
+    Raises:
+        ValueError: Если строка не является корректным запросом.
+    """
+
+    captured = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                    request = SpeechRequest.model_validate(entry)
+                except ValueError as e:
+                    raise ValueError(f"{path}, строка {line_number}: некорректный запрос: {e}") from e
+                captured.append(CapturedRequest(
+                    request=request,
+                    endpoint=entry.get("endpoint", CAPTURED_PATHS[0]),
+                    captured_at=entry.get("captured_at"),
+                    latency_ms=entry.get("latency_ms"),
+                    status=entry.get("status")
+                ))
+    captured.sort(key=lambda item: item.captured_at or 0.0)
+    return captured
+
+
+async def replay(
+    captured: List[CapturedRequest],
+    client: httpx.AsyncClient,
+    speed: float = 1.0
+) -> List[ReplayResult]:
+
+    """
+    Отправляет записанные запросы, сохраняя интервалы между поступлениями.
+
+    Args:
+        captured (List[CapturedRequest]): Запросы в порядке поступления.
+        client (httpx.AsyncClient): Клиент с base_url целевого экземпляра.
+        speed (float): Во сколько раз ускорить поступление запросов;
+            0 - отправить все запросы сразу.
+
+    Returns:
+        List[ReplayResult]: Результаты в порядке запросов.
+    """
+
+    first_arrival = (captured[0].captured_at or 0.0) if captured else 0.0
+    started = time.perf_counter()
+
+    async def send(item: CapturedRequest) -> ReplayResult:
+        if speed > 0:
+            delay = ((item.captured_at or first_arrival) - first_arrival) / speed
+            await asyncio.sleep(max(0.0, started + delay - time.perf_counter()))
+        sent_at = time.perf_counter()
+        try:
+            response = await client.post(
+                item.endpoint,
+                content=item.request.model_dump_json(exclude_none=True),
+                headers={"Content-Type": "application/json"}
+            )
+            return ReplayResult(sent_at - started, (time.perf_counter() - sent_at) * 1000, response.status_code)
+        except httpx.HTTPError as e:
+            return ReplayResult(sent_at - started, (time.perf_counter() - sent_at) * 1000, None, str(e) or type(e).__name__)
+
+    return await asyncio.gather(*(send(item) for item in captured))
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    """Перцентиль по ближайшему рангу; None для пустого списка."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def summarize(starts: List[float], latencies_ms: List[float], errors: int) -> Dict[str, Optional[float]]:
+
+    """
+    Сводка прогона: задержки и пропускная способность.
+
+    Args:
+        starts (List[float]): Моменты поступления успешных запросов в секундах.
+        latencies_ms (List[float]): Задержки успешных запросов в миллисекундах.
+        errors (int): Количество запросов с ошибкой или кодом ответа не 2xx.
+
+    Returns:
+        Dict[str, Optional[float]]: Количество запросов и ошибок, пропускная способность
+            (запросов в секунду от первого поступления до последнего ответа) и перцентили задержки.
+    """
+
+    span = None
+    if starts and latencies_ms and len(starts) == len(latencies_ms):
+        span = max(start + latency / 1000 for start, latency in zip(starts, latencies_ms)) - min(starts)
+    return {
+        "requests": len(starts) + errors,
+        "errors": errors,
+        "throughput_rps": len(latencies_ms) / span if span else None,
+        "latency_mean_ms": sum(latencies_ms) / len(latencies_ms) if latencies_ms else None,
+        "latency_p50_ms": percentile(latencies_ms, 0.50),
+        "latency_p95_ms": percentile(latencies_ms, 0.95),
+        "latency_p99_ms": percentile(latencies_ms, 0.99),
+    }
+
+
+def compare(captured: List[CapturedRequest], results: List[ReplayResult]) -> Dict[str, Dict[str, Optional[float]]]:
+
+    """
+    Сравнивает воспроизведение с записанным прогоном.
+
+    Args:
+        captured (List[CapturedRequest]): Записанные запросы.
+        results (List[ReplayResult]): Результаты воспроизведения тех же запросов.
+
+    Returns:
+        Dict[str, Dict[str, Optional[float]]]: Сводки "recorded" и "replay" (см. summarize).
+            Для записанного прогона без задержек метрики задержки равны None.
+    """
+
+    recorded = [item for item in captured if item.latency_ms is not None]
+    recorded_ok = [item for item in recorded if item.status is not None and item.status < 400]
+    replay_ok = [result for result in results if result.status is not None and result.status < 400]
+    return {
+        "recorded": summarize(
+            [item.captured_at or 0.0 for item in recorded_ok],
+            [item.latency_ms for item in recorded_ok],
+            len(recorded) - len(recorded_ok)
+        ),
+        "replay": summarize(
+            [result.sent_at for result in replay_ok],
+            [result.latency_ms for result in replay_ok],
+            len(results) - len(replay_ok)
+        ),
+    }
+
+
+def print_report(report: Dict[str, Dict[str, Optional[float]]]):
+    """Печатает сводки записанного прогона и воспроизведения рядом."""
+    print(f"{'метрика':<20}{'запись':>14}{'повтор':>14}")
+    for metric in report["replay"]:
+        values = [report[run][metric] for run in ("recorded", "replay")]
+        cells = ["-" if value is None else f"{value:.2f}" if isinstance(value, float) else str(value) for value in values]
+        print(f"{metric:<20}{cells[0]:>14}{cells[1]:>14}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение записанного трафика генерации")
+    parser.add_argument("captures", nargs="+", help="Файлы записи JSONL (ротированные - в любом порядке)")
+    parser.add_argument("--target", default="http://127.0.0.1:8000", help="Базовый URL экземпляра или шлюза")
+    parser.add_argument(
+        "--speed", type=float, default=1.0,
+        help="Ускорение поступления запросов: 1 - исходные интервалы, 2 - вдвое чаще, 0 - все сразу"
+    )
+    parser.add_argument("--limit", type=int, default=None, help="Воспроизвести только первые N запросов")
+    parser.add_argument("--timeout", type=float, default=600, help="Таймаут одного запроса в секундах")
+    args = parser.parse_args()
+
+    captured = load_capture(args.captures)[:args.limit]
+    if not captured:
+        print('Нет запросов для воспроизведения')
+        return
+    arrivals = [item.captured_at for item in captured if item.captured_at is not None]
+    duration = (max(arrivals) - min(arrivals)) / args.speed if arrivals and args.speed > 0 else 0.0
+    print(f'Запросов: {len(captured)}, поступления растянуты на {duration:.1f} с')
+
+    async def run() -> List[ReplayResult]:
+        async with httpx.AsyncClient(base_url=args.target, timeout=args.timeout) as client:
+            return await replay(captured, client, args.speed)
+
+    results = asyncio.run(run())
+    print_report(compare(captured, results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Модуль административных API-роутов экземпляра сервиса.
+
+- /drain - плавная остановка экземпляра (drain.py) и её состояние
+- /memory - память генераций загруженных моделей и признаки утечки
+- /memory/tensors - включение и выключение подсчёта живых тензоров генераций
+- /memory/allocations - крупнейшие места выделения памяти Python (tracemalloc)
+
+Административные эндпоинты требуют заголовок X-Admin-Token, совпадающий
+с admin_token (ai/serving_parameters.py); без настроенного токена они
+доступны только с локального адреса.
+"""
+
+import secrets
+import tracemalloc
+from dataclasses import asdict
+from typing import Annotated, Literal, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+
+import ai.serving_parameters as serving_parameters
+from ai.memory import allocation_sites, rss_bytes
+from ai.model_registry import ModelRegistry
+from dependencies import get_drain_controller, get_model_registry
+from drain import DrainController
+from schemas.admin import AllocationReport, AllocationSite, DrainStatus, GenerationMemory, MemoryReport, ModelMemory
+
+# Адреса, с которых административные эндпоинты доступны без токена
+LOCAL_HOSTS = ("127.0.0.1", "::1", "localhost")
+
+
+def require_admin(request: Request, admin_token: Annotated[Optional[str], Header(alias="X-Admin-Token")] = None):
+    """Пропускает только администратора: по токену или, если токен не настроен, с локального адреса."""
+    if serving_parameters.admin_token:
+        if admin_token is None or not secrets.compare_digest(admin_token, serving_parameters.admin_token):
+            raise HTTPException(status_code=403, detail="Неверный X-Admin-Token")
+    elif request.client is None or request.client.host not in LOCAL_HOSTS:
+        raise HTTPException(status_code=403, detail="Административные эндпоинты доступны только локально")
+
+
+# Роутер для административных эндпоинтов
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+@router.post("/drain", response_model=DrainStatus, status_code=202)
+async def drain(
+    drain_controller: Annotated[DrainController, Depends(get_drain_controller)]
+) -> DrainStatus:
+    """
+    Запускает плавную остановку экземпляра.
+
+    Экземпляр перестаёт принимать запросы на генерацию и становится неготовым,
+    принятые запросы дорабатываются в течение drain_grace_period_s, после чего
+    модели выгружаются. Процесс продолжает работать до остановки оркестратором;
+    повторный вызов возвращает состояние уже идущей остановки.
+
+    Args:
+        drain_controller (DrainController): Плавная остановка экземпляра.
+
+    Returns:
+        DrainStatus: Состояние остановки.
+
+    Raises:
+        HTTPException 403: Нет прав администратора.
+
+    Example:
+        Запрос:
+        POST /api/admin/drain
+
+        Ответ (202):
+        {"state": "draining", "reason": "admin", "started_at": 1767000000.1, "finished_at": null,
+         "grace_period_s": 300, "in_flight": 3, "handed_off": 0, "abandoned": 0, "released_bytes": 0}
+    """
+
+    drain_controller.start("admin")
+    return DrainStatus(**asdict(drain_controller.status()))
+
+
+@router.get("/drain", response_model=DrainStatus)
+async def drain_status(
+    drain_controller: Annotated[DrainController, Depends(get_drain_controller)]
+) -> DrainStatus:
+    """
+    Возвращает состояние плавной остановки экземпляра.
+
+    Args:
+        drain_controller (DrainController): Плавная остановка экземпляра.
+
+    Returns:
+        DrainStatus: Этап остановки, запросы в работе, переданные и отклонённые
+            запросы и освобождённая память.
+    """
+
+    return DrainStatus(**asdict(drain_controller.status()))
+
+
+@router.get("/memory", response_model=MemoryReport)
+async def memory(
+    registry: Annotated[ModelRegistry, Depends(get_model_registry)],
+    limit: Annotated[int, Query(ge=0, le=1000)] = 50
+) -> MemoryReport:
+    """
+    Возвращает память последних генераций загруженных моделей.
+
+    Для каждой генерации записаны пиковая RSS, RSS, удержанная после неё,
+    и объём живых тензоров, если их подсчёт включён (/memory/tensors). Наклоны
+    считаются по всему журналу модели: если RSS или тензоры растут от
+    генерации к генерации, память удерживается между запросами.
+
+    Args:
+        registry (ModelRegistry): Реестр моделей.
+        limit (int): Сколько последних генераций каждой модели вернуть.
+
+    Returns:
+        MemoryReport: RSS процесса и журналы памяти моделей.
+
+    Example:
+        Ответ:
+        {"rss_bytes": 8120000000, "models": [{"model": "phi-3-mini", "rss_trend_bytes": 1520.4,
+         "tensor_trend_bytes": 0.0, "generations": [{"label": "Итоги года", "requests": 1, ...,
+         "peak_rss_bytes": 8460000000, "retained_rss_bytes": 4096, "retained_tensor_bytes": 0}]}]}
+    """
+
+    models = []
+    for name, generator in registry.loaded_generators().items():
+        accountant = getattr(generator, "memory", None)
+        if accountant is None:
+            continue
+        records = accountant.records
+        rss_trend, tensor_trend = accountant.trend()
+        models.append(ModelMemory(
+            model=name,
+            rss_trend_bytes=round(rss_trend, 1),
+            tensor_trend_bytes=round(tensor_trend, 1) if tensor_trend is not None else None,
+            count_tensors=accountant.count_tensors,
+            generations=[GenerationMemory(**asdict(record)) for record in records[len(records) - limit:]]
+        ))
+    return MemoryReport(rss_bytes=rss_bytes(), models=models)
+
+
+def _count_tensors(registry: ModelRegistry, enabled: bool):
+    """Включает или выключает подсчёт живых тензоров у загруженных и загружаемых позже моделей."""
+    serving_parameters.memory_count_tensors = enabled
+    for generator in registry.loaded_generators().values():
+        accountant = getattr(generator, "memory", None)
+        if accountant is not None:
+            accountant.count_tensors = enabled
+
+
+@router.post("/memory/tensors", status_code=204)
+async def start_tensor_counting(registry: Annotated[ModelRegistry, Depends(get_model_registry)]) -> None:
+    """
+    Включает подсчёт живых тензоров до и после каждой генерации.
+
+    Подсчёт обходит все объекты сборщика мусора дважды за генерацию (до сотен
+    миллисекунд), поэтому по умолчанию выключен (serving_parameters.memory_count_tensors)
+    и включается на время поиска утечки; наклон тензоров появляется в /memory.
+
+    Args:
+        registry (ModelRegistry): Реестр моделей.
+    """
+
+    _count_tensors(registry, True)
+
+
+@router.delete("/memory/tensors", status_code=204)
+async def stop_tensor_counting(registry: Annotated[ModelRegistry, Depends(get_model_registry)]) -> None:
+    """Выключает подсчёт живых тензоров генераций."""
+    _count_tensors(registry, False)
+
+
+@router.get("/memory/allocations", response_model=AllocationReport)
+async def memory_allocations(
+    limit: Annotated[int, Query(ge=1, le=500)] = 20,
+    group_by: Literal["lineno", "filename", "traceback"] = "lineno",
+    frames: Annotated[int, Query(ge=1, le=64)] = 10
+) -> AllocationReport:
+    """
+    Возвращает крупнейшие места выделения памяти Python по tracemalloc.
+
+    Первый вызов включает трассировку и возвращает пустой список: выделения
+    видны только после включения. Трассировка замедляет выделение памяти,
+    поэтому после поиска утечки её стоит выключить (DELETE). Память тензоров
+    torch в tracemalloc не видна, её показывает /memory.
+
+    Args:
+        limit (int): Сколько мест вернуть.
+        group_by (str): Группировка: по строке, по файлу или по стеку вызовов.
+        frames (int): Глубина стека выделений; действует при включении трассировки.
+
+    Returns:
+        AllocationReport: Места выделения по убыванию объёма.
+    """
+
+    started, statistics, traced_bytes, peak_traced_bytes = allocation_sites(limit, group_by, frames)
+    sites = []
+    for statistic in statistics:
+        frame = statistic.traceback[-1] if group_by == "traceback" else statistic.traceback[0]
+        sites.append(AllocationSite(
+            location=frame.filename if group_by == "filename" else f"{frame.filename}:{frame.lineno}",
+            size_bytes=statistic.size,
+            count=statistic.count,
+            traceback=statistic.traceback.format() if group_by == "traceback" else []
+        ))
+    return AllocationReport(
+        tracing_started=started, traced_bytes=traced_bytes, peak_traced_bytes=peak_traced_bytes, sites=sites
+    )
+
+
+@router.delete("/memory/allocations", status_code=204)
+async def stop_memory_allocations() -> None:
+    """Выключает трассировку выделений памяти и освобождает её данные."""
+    tracemalloc.stop()
@@ -0,0 +1,84 @@
+"""
+Модуль API-роутов проверки состояния сервиса.
+
+- /live - процесс запущен и отвечает на запросы
+- /ready - модель по умолчанию загружена и прогрета, можно направлять запросы;
+  вместе с готовностью возвращаются длительности прогрева моделей
+"""
+
+from dataclasses import asdict
+from typing import Annotated
+from fastapi import APIRouter, Depends, Response
+
+from dependencies import get_readiness
+from readiness import Readiness
+from schemas.health import HealthStatus, WarmupReport
+
+# Роутер для эндпоинтов проверки состояния
+router = APIRouter()
+
+
+@router.get("/live")
+async def live() -> dict:
+    """
+    Проверка живости процесса.
+
+    Returns:
+        dict: {"status": "ok"}, пока процесс обрабатывает HTTP-запросы.
+    """
+
+    return {"status": "ok"}
+
+
+@router.get("/ready", response_model=HealthStatus)
+async def ready(
+    response: Response,
+    readiness: Annotated[Readiness, Depends(get_readiness)]
+) -> HealthStatus:
+    """
+    Проверка готовности экземпляра принимать запросы на генерацию.
+
+    Пока модель по умолчанию загружается и прогревается (в фоне после старта
+    приложения) или если её не удалось загрузить, возвращается код 503, чтобы
+    балансировщик не направлял на экземпляр первые, самые медленные запросы.
+
+    Args:
+        response (Response): HTTP-ответ для установки кода состояния.
+        readiness (Readiness): Состояние готовности экземпляра.
+
+    Returns:
+        HealthStatus: Статус готовности и отчёты о прогреве моделей.
+
+    Example:
+        Запрос:
+        GET /api/health/ready
+
+        Ответ:
+        {
+            "status": "ready",
+            "ready": true,
+            "warmup": [
+                {
+                    "model_id": "microsoft/Phi-3-mini-4k-instruct",
+                    "total_seconds": 6.8,
+                    "steps": [{"style": "formal", "batch_size": 1, "prompt_tokens": 131, "seconds": 1.9}]
+                }
+            ]
+        }
+    """
+
+    if not readiness.ready:
+        response.status_code = 503
+    return HealthStatus(
+        status=readiness.status,
+        ready=readiness.ready,
+        warmup=[
+            WarmupReport(
+                model_id=model_id,
+                total_seconds=round(sum(step.seconds for step in steps), 3),
+                steps=[asdict(step) for step in steps]
+            )
+            for model_id, steps in readiness.warmup_reports.items()
+        ],
+        error=readiness.error
+    )
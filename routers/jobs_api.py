@@ -0,0 +1,213 @@
+"""
+Модуль API-роутов пакетных заданий на генерацию речей.
+
+Позволяет загрузить JSONL-файл с запросами SpeechRequest одним заданием,
+отслеживать прогресс его выполнения и получать результаты потоком JSONL.
+Задание расходует квоту токенов ключа так же, как отдельные запросы генерации.
+"""
+
+import asyncio
+import json
+from typing import Annotated, List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+
+from ai.jobs import JobManager, BatchJob
+from ai.model_registry import ModelRegistry
+from dependencies import get_job_manager, get_model_registry, get_quota_manager
+from quotas import QuotaCharge, QuotaManager
+from routers.model_api import _admit_quota, _token_budget, _token_estimate, _used_tokens, ensure_accepting
+from schemas.jobs import JobStatus
+from utils import parse_speech_requests
+
+# Роутер для эндпоинтов пакетных заданий
+router = APIRouter()
+
+# Интервал опроса задания при потоковой выдаче результатов, в секундах
+RESULTS_POLL_INTERVAL = 0.2
+
+
+def _job_status(job: BatchJob) -> JobStatus:
+    return JobStatus(
+        job_id=job.job_id,
+        status=job.status,
+        total=job.total,
+        completed=job.completed,
+        failed=job.failed
+    )
+
+
+def _get_job(job_manager: JobManager, job_id: str) -> BatchJob:
+    job = job_manager.get(job_id)
+    if job is None and job_manager.expired(job_id):
+        raise HTTPException(status_code=410, detail=f"Задание '{job_id}' завершено и удалено по сроку хранения")
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Задание '{job_id}' не найдено")
+    return job
+
+
+def _settle_job(quota: QuotaManager, charge: QuotaCharge, estimates: List[int]):
+    """Сверяет списание задания с фактическим расходом; без статистики речи остаётся оценка запроса."""
+    def settle(job: BatchJob):
+        used = 0
+        for speech, estimate in zip(job.speeches, estimates):
+            if speech is not None:
+                tokens = _used_tokens(speech)
+                used += estimate if tokens is None else tokens
+        quota.settle(charge, used)
+
+    return settle
+
+
+@router.post("", response_model=JobStatus)
+async def submit_job(
+    request: Request,
+    response: Response,
+    registry: Annotated[ModelRegistry, Depends(get_model_registry)],
+    job_manager: Annotated[JobManager, Depends(get_job_manager)],
+    quota: Annotated[Optional[QuotaManager], Depends(get_quota_manager)],
+    api_key: Annotated[Optional[str], Header(alias="X-API-Key")] = None
+) -> JobStatus:
+    """
+    Создаёт пакетное задание из JSONL с запросами на генерацию речей.
+
+    Тело запроса - JSONL, каждая строка которого является объектом SpeechRequest.
+    Все запросы ставятся в общую очередь генерации и обрабатываются батчами;
+    модель для каждого запроса выбирается реестром моделей. Бюджет токенов
+    каждого запроса проверяется при приёме, как в /api/model/generate_speech:
+    задание с запросом, который не помещается в контекст модели, отклоняется
+    целиком, а не завершается ошибкой в очереди. При включённых квотах
+    с квоты ключа при приёме списывается сумма оценок всех запросов задания
+    (если её не хватает - код 429), а после завершения задания списание
+    сверяется с фактическим расходом; запросы с ошибкой квоту не расходуют.
+
+    Args:
+        request (Request): HTTP-запрос с JSONL в теле.
+        registry (ModelRegistry): Реестр моделей.
+        job_manager (JobManager): Реестр пакетных заданий.
+        quota (Optional[QuotaManager]): Квоты токенов по API-ключам (None - квоты выключены).
+        api_key (Optional[str]): API-ключ из заголовка X-API-Key.
+
+    Returns:
+        JobStatus: Состояние созданного задания, включая его идентификатор;
+            заголовки ответа содержат остаток квоты после списания оценки.
+
+    Raises:
+        HTTPException:
+            - 422: Строка JSONL не является корректным SpeechRequest
+            - 400: Задание не содержит ни одного запроса или запрашивает неизвестную модель
+            - 413: Запрос задания не помещается в контекст модели
+            - 429: Квоты ключа не хватает на оценку задания
+            - 503: Экземпляр останавливается
+
+    Example:
+        Запрос:
+        POST /api/jobs
+        {"topic": "Открытие конференции", "duration_minutes": 3, "style": "formal"}
+        {"topic": "Выпускной вечер", "duration_minutes": 5, "style": "casual"}
+
+        Ответ:
+        {"job_id": "3f2a...", "status": "queued", "total": 2, "completed": 0, "failed": 0}
+    """
+
+    ensure_accepting()
+    body = (await request.body()).decode("utf-8")
+    try:
+        speech_requests = parse_speech_requests(body.splitlines())
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if not speech_requests:
+        raise HTTPException(status_code=400, detail="Задание не содержит запросов")
+
+    try:
+        models = [registry.resolve(speech_request) for speech_request in speech_requests]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    estimates = []
+    for index, (speech_request, model_name) in enumerate(zip(speech_requests, models)):
+        budget = await _token_budget(speech_request, registry, model_name)
+        estimates.append(budget.prompt_tokens + budget.planned_output_tokens * speech_request.n)
+        if not budget.fits:
+            raise HTTPException(status_code=413, detail={
+                "message": f"Запрос {index} не помещается в контекст модели: сократите ключевые моменты "
+                           "или дополнительные требования либо уменьшите max_new_tokens",
+                "index": index,
+                "budget": _token_estimate(model_name, budget, job_manager.scheduler).model_dump()
+            })
+
+    on_finished = None
+    if quota is not None:
+        charge = await _admit_quota(quota, api_key, sum(estimates))
+        response.headers.update(charge.headers())
+        on_finished = _settle_job(quota, charge, estimates)
+
+    job = job_manager.submit(speech_requests, models, on_finished)
+    return _job_status(job)
+
+
+@router.get("/{job_id}", response_model=JobStatus)
+async def get_job(
+    job_id: str,
+    job_manager: Annotated[JobManager, Depends(get_job_manager)]
+) -> JobStatus:
+    """
+    Возвращает прогресс выполнения пакетного задания.
+
+    Args:
+        job_id (str): Идентификатор задания.
+        job_manager (JobManager): Реестр пакетных заданий.
+
+    Returns:
+        JobStatus: Текущее состояние задания.
+
+    Raises:
+        HTTPException:
+            - 404: Задание не найдено
+            - 410: Задание завершено и удалено по сроку хранения
+    """
+
+    return _job_status(_get_job(job_manager, job_id))
+
+
+@router.get("/{job_id}/results")
+async def get_job_results(
+    job_id: str,
+    job_manager: Annotated[JobManager, Depends(get_job_manager)]
+) -> StreamingResponse:
+    """
+    Отдаёт результаты пакетного задания потоком JSONL.
+
+    Результаты выдаются в порядке готовности; поток завершается, когда
+    обработаны все запросы задания. Каждая строка содержит номер запроса
+    в исходном JSONL и текст речи либо описание ошибки:
+        {"index": 0, "speech": "..."}
+        {"index": 1, "error": "..."}
+
+    Args:
+        job_id (str): Идентификатор задания.
+        job_manager (JobManager): Реестр пакетных заданий.
+
+    Returns:
+        StreamingResponse: Поток строк JSONL с результатами.
+
+    Raises:
+        HTTPException:
+            - 404: Задание не найдено
+            - 410: Задание завершено и удалено по сроку хранения
+    """
+
+    job = _get_job(job_manager, job_id)
+
+    async def stream_results():
+        sent = 0
+        while True:
+            done = job.done
+            for line in job.results[sent:]:
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+                sent += 1
+            if done and sent >= len(job.results):
+                break
+            await asyncio.sleep(RESULTS_POLL_INTERVAL)
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
@@ -2,36 +2,284 @@
 Модуль API-роутов для генерации речей и управления параметрами модели.
 
 Этот модуль предоставляет REST API эндпоинты для взаимодействия с генератором речей:
-- генерация текста речей на основе запросов
+- генерация текста речей на основе запросов (целиком или потоком) с учётом квот токенов
+- оценка запроса (токены промпта и ответа, ожидаемая длительность) без генерации
 - настройка параметров языковой модели
+- состояние реестра моделей
+- состояние очереди генерации и точность предсказания длины ответа
+- уровни деградации при перегрузке и переходы между ними
+
+Во время плавной остановки экземпляра (drain.py) запросы на генерацию
+отклоняются с кодом 503, чтобы клиент повторил их на другом экземпляре.
 """
 
-from typing import Annotated
-from fastapi import APIRouter, Depends
+import time
+from concurrent.futures import Future
+from dataclasses import asdict, dataclass
+from typing import Annotated, AsyncIterator, Dict, List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
-from ai.speech_generator import SpeechGenerator
+from ai.degradation import NORMAL_TIER
+from ai.model_registry import ModelRegistry
+from ai.scheduler import GenerationScheduler
+from ai.sidecar import SidecarCrashed
+from ai.singleflight import Flight, SingleFlight, coalescing_key
+from ai.speech_generator import TokenBudget
 import ai.model_parameters
-from dependencies import get_speech_generator
+import ai.serving_parameters
+from dependencies import (
+    get_degradation_policy, get_generation_scheduler, get_model_registry, get_quota_manager, get_readiness,
+    get_response_cache, get_singleflight, get_style_catalog
+)
+from drain import InstanceDraining
+from http_encoding import FastJSONResponse
+from quotas import QuotaCharge, QuotaExceeded, QuotaManager
 from schemas.model import (
-    SpeechRequest, SpeechResponse, ModelSettings
+    DegradationStatus, GenerationMetadata, SchedulerStatus, SpeechCandidate, SpeechRequest, SpeechResponse,
+    ModelSettings, RegisteredModel, TokenEstimate
 )
-from utils import load_styles
 
 # Роутер для эндпоинтов генерации речи
 router = APIRouter()
 
 
+def ensure_accepting():
+    """Отклоняет запрос на генерацию, если экземпляр останавливается."""
+    if not get_readiness().accepting:
+        raise HTTPException(
+            status_code=503,
+            detail="Экземпляр останавливается, повторите запрос на другом экземпляре",
+            headers={"Retry-After": "1"}
+        )
+
+
+def _resolve_model(request: SpeechRequest, registry: ModelRegistry) -> str:
+    try:
+        return registry.resolve(request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def _token_budget(request: SpeechRequest, registry: ModelRegistry, model_name: str) -> TokenBudget:
+    """Считает бюджет токенов запроса; токенизация и загрузка модели выполняются вне цикла событий."""
+    def count():
+        generator = registry.get(model_name)
+        return generator.token_budget(request, get_style_catalog().snapshot())
+
+    try:
+        return await run_in_threadpool(count)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _token_estimate(model_name: str, budget: TokenBudget, scheduler: GenerationScheduler) -> TokenEstimate:
+    return TokenEstimate(
+        model=model_name,
+        prompt_tokens=budget.prompt_tokens,
+        planned_output_tokens=budget.planned_output_tokens,
+        max_prompt_tokens=budget.max_prompt_tokens,
+        context_tokens=budget.context_tokens,
+        breakdown={
+            "base": budget.base_tokens,
+            "key_points": budget.key_points_tokens,
+            "custom_instructions": budget.custom_instructions_tokens
+        },
+        fits=budget.fits,
+        predicted_seconds=budget.predicted_seconds,
+        queue_depth=scheduler.queue_depth
+    )
+
+
+@dataclass
+class _Generation:
+    """Запрос, принятый в генерацию: модель, полёт, списание квоты и уровень деградации."""
+    model_name: str
+    request: SpeechRequest
+    flight: Flight
+    charge: Optional[QuotaCharge]
+    tier: str = NORMAL_TIER
+    cached: bool = False
+
+    def headers(self) -> Dict[str, str]:
+        """Заголовки ответа: уровень деградации и остаток квоты."""
+        headers = {"x-degradation-tier": self.tier}
+        if self.charge is not None:
+            headers.update(self.charge.headers())
+        return headers
+
+
+async def _start_generation(
+    request: SpeechRequest,
+    registry: ModelRegistry,
+    scheduler: GenerationScheduler,
+    singleflight: SingleFlight,
+    quota: Optional[QuotaManager] = None,
+    api_key: Optional[str] = None,
+    stream: bool = False
+) -> _Generation:
+    """
+    Проверяет бюджет токенов запроса и ставит его в очередь генерации
+    или присоединяет к такой же выполняющейся генерации.
+
+    Под нагрузкой запрос сначала удешевляется уровнем деградации
+    (ai/degradation.py); уровень с use_cache отдаёт речь близкого запроса
+    из кэша ответов без генерации и без расхода квоты.
+    Запрос, промпт которого был бы обрезан или ответ которого не помещается
+    в контекст модели, отклоняется с кодом 413 и разбивкой бюджета токенов.
+    При включённых квотах с квоты ключа списывается оценка запроса (промпт
+    и планируемый ответ на каждый вариант); если её не хватает, запрос
+    отклоняется с кодом 429.
+    """
+    ensure_accepting()
+    _check_candidates(request, stream)
+    degradation = get_degradation_policy()
+    tier = degradation.select(scheduler.queue_depth, scheduler.predicted_wait_seconds) if degradation.tiers else None
+    tier_name = NORMAL_TIER
+    if tier is not None:
+        request = tier.apply(request)
+        tier_name = tier.name
+    model_name = _resolve_model(request, registry)
+
+    if tier is not None and tier.use_cache:
+        speech = get_response_cache().find(model_name, request)
+        if speech is not None:
+            degradation.record_cache_hit()
+            charge = await _admit_quota(quota, api_key, 0) if quota is not None else None
+            cached = Future()
+            cached.set_result(speech)
+            flight = singleflight.run(None, lambda on_text: cached, stream=stream)
+            return _Generation(model_name, request, flight, charge, tier_name, cached=True)
+
+    budget = await _token_budget(request, registry, model_name)
+    if not budget.fits:
+        raise HTTPException(status_code=413, detail={
+            "message": "Запрос не помещается в контекст модели: сократите ключевые моменты "
+                       "или дополнительные требования либо уменьшите max_new_tokens",
+            "budget": _token_estimate(model_name, budget, scheduler).model_dump()
+        })
+    charge = None
+    if quota is not None:
+        charge = await _admit_quota(quota, api_key, budget.prompt_tokens + budget.planned_output_tokens * request.n)
+
+    style_description = get_style_catalog().snapshot().get(request.style)
+    key = coalescing_key(request, style_description, registry.models[model_name])
+    flight = singleflight.run(
+        key,
+        lambda on_text: scheduler.submit(model_name, request, on_text),
+        stream=stream
+    )
+    return _Generation(model_name, request, flight, charge, tier_name)
+
+
+async def _admit_quota(quota: QuotaManager, api_key: Optional[str], estimated_tokens: int) -> QuotaCharge:
+    """Списывает оценку запроса с квоты ключа вне цикла событий: SQLite ждёт блокировку до 10 секунд."""
+    try:
+        return await run_in_threadpool(quota.admit, api_key, estimated_tokens)
+    except QuotaExceeded as e:
+        raise HTTPException(
+            status_code=429,
+            detail={"message": str(e), "estimated_tokens": estimated_tokens},
+            headers={"Retry-After": str(e.retry_after), **e.charge.headers()}
+        )
+
+
+def _used_tokens(speech: Optional[str]) -> Optional[int]:
+    """Фактический расход токенов: промпт (общий для вариантов) и ответы всех вариантов."""
+    if speech is None or not hasattr(speech, "prompt_tokens"):
+        return None
+    candidates = getattr(speech, "candidates", None) or [speech]
+    return speech.prompt_tokens + sum(candidate.completion_tokens for candidate in candidates)
+
+
+async def _finish_generation(quota: Optional[QuotaManager], generation: _Generation):
+    """
+    Сверяет списание с квоты с фактическим расходом генерации и запоминает речь в кэше ответов.
+
+    Генерация с ошибкой и ответ из кэша не расходуют квоту; если расход
+    неизвестен (генератор без статистики или клиент отключился до окончания
+    потока), остаётся оценка. Сверка, как и списание, выполняется вне цикла событий.
+    """
+    flight = generation.flight
+    if flight.done and flight.error is None and not generation.cached and get_degradation_policy().uses_cache:
+        get_response_cache().put(generation.model_name, generation.request, flight.result)
+
+    charge = generation.charge
+    if charge is None:
+        return
+    if flight.error is not None or generation.cached:
+        generation.charge = await run_in_threadpool(quota.settle, charge, 0)
+        return
+    used = _used_tokens(flight.result) if flight.done else None
+    generation.charge = await run_in_threadpool(quota.settle, charge, charge.tokens if used is None else used)
+
+
+def _check_candidates(request: SpeechRequest, stream: bool):
+    """Проверяет количество вариантов до постановки запроса в очередь."""
+    if not 1 <= request.n <= ai.serving_parameters.max_candidates:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Количество вариантов n должно быть от 1 до {ai.serving_parameters.max_candidates}"
+        )
+    if request.n > 1 and (stream or request.structured):
+        raise HTTPException(
+            status_code=400,
+            detail="Несколько вариантов не поддерживаются в потоковом и структурном режимах"
+        )
+
+
+def _speech_candidates(speech: str) -> Optional[List[SpeechCandidate]]:
+    """Варианты речи для ответа, если их генерировалось несколько."""
+    candidates = getattr(speech, "candidates", None)
+    if not candidates:
+        return None
+    return [
+        SpeechCandidate(
+            speech=candidate,
+            completion_tokens=getattr(candidate, "completion_tokens", 0),
+            score=getattr(candidate, "score", None)
+        )
+        for candidate in candidates
+    ]
+
+
+def _generation_metadata(speech: str, generation: _Generation, started: float) -> GenerationMetadata:
+    """Собирает метаданные ответа; генераторы без статистики дают нулевые счётчики."""
+    return GenerationMetadata(
+        model=generation.model_name,
+        prompt_tokens=getattr(speech, "prompt_tokens", 0),
+        completion_tokens=getattr(speech, "completion_tokens", 0),
+        generation_ms=round(getattr(speech, "generation_seconds", 0.0) * 1000, 1),
+        total_ms=round((time.perf_counter() - started) * 1000, 1),
+        settings_version=getattr(speech, "settings_version", ai.model_parameters.settings_version),
+        stop_reason=getattr(speech, "stop_reason", None),
+        tokens_saved=getattr(speech, "tokens_saved", 0),
+        tier=generation.tier,
+        cached=generation.cached
+    )
+
+
 @router.post("/generate_speech", response_model=SpeechResponse)
 async def generate_speech(
     request: SpeechRequest,
-    speech_generator: Annotated[SpeechGenerator, Depends(get_speech_generator)]
-) -> SpeechResponse:
+    registry: Annotated[ModelRegistry, Depends(get_model_registry)],
+    scheduler: Annotated[GenerationScheduler, Depends(get_generation_scheduler)],
+    singleflight: Annotated[SingleFlight, Depends(get_singleflight)],
+    quota: Annotated[Optional[QuotaManager], Depends(get_quota_manager)],
+    api_key: Annotated[Optional[str], Header(alias="X-API-Key")] = None
+) -> FastJSONResponse:
 
     """
     Генерирует текст речи на основе переданных параметров запроса.
 
     Этот эндпоинт принимает тему, стиль, длительность и другие параметры речи,
-    и возвращает сгенерированный текст готовый для произнесения.
+    и возвращает сгенерированный текст готовый для произнесения. Запрос проходит
+    через общую очередь генерации и может быть объединён в батч с другими запросами.
+    Одинаковые одновременные запросы с детерминированным результатом (жадное
+    декодирование или общий seed) обслуживаются одной генерацией. При перегрузке
+    запрос обслуживается на уровне деградации (degradation_tiers): жадным
+    декодированием, с меньшим лимитом токенов, меньшей моделью или из кэша ответов.
 
     Args:
         request (SpeechRequest): Объект запроса с параметрами речи, включая:
@@ -41,21 +289,141 @@ async def generate_speech(
             - language: Язык речи
             - key_points: Список ключевых моментов (опционально)
             - custom_instructions: Дополнительные инструкции (опционально)
-        speech_generator (SpeechGenerator): Инстанс генератора речей,
-            внедряемый через dependency injection.
+            - model: Модель из реестра (опционально, иначе выбор по длительности)
+            - n: Количество вариантов речи с общим проходом по промпту (опционально)
+            - rank: Упорядочить варианты по локальной оценке (опционально)
+            - max_new_tokens, do_sample: Собственные параметры генерации запроса (опционально)
+        registry (ModelRegistry): Реестр моделей, внедряемый через dependency injection.
+        scheduler (GenerationScheduler): Общая очередь генерации.
+        singleflight (SingleFlight): Реестр выполняющихся объединяемых генераций.
+        quota (Optional[QuotaManager]): Квоты токенов по API-ключам (None - квоты выключены).
+        api_key (Optional[str]): API-ключ из заголовка X-API-Key.
 
     Returns:
-        SpeechResponse: Объект ответа, содержащий сгенерированный текст речи.
+        FastJSONResponse: Ответ SpeechResponse с текстом речи и метаданными генерации
+            (количество токенов, длительности, версия параметров генерации);
+            при n > 1 - с вариантами речи в candidates. Уровень деградации - в
+            metadata.tier и заголовке x-degradation-tier. При включённых квотах
+            заголовки x-ratelimit-*-tokens содержат ёмкость квоты ключа, остаток
+            после сверки с фактическим расходом и время до полного восстановления.
 
     Raises:
         HTTPException: Возможные ошибки:
-            - 400: Некорректный запрос
+            - 400: Некорректный запрос, неизвестная модель или стиль, n вне допустимого
+                   диапазона или n > 1 в структурном режиме
+            - 413: Промпт был бы обрезан или ответ не помещается в контекст модели;
+                   в detail.budget - разбивка бюджета токенов
             - 422: Ошибка валидации параметров
+            - 429: Квоты токенов ключа не хватает на запрос; Retry-After - через сколько
+                   секунд её хватит
             - 500: Ошибка генерации модели
+            - 503: Процесс генерации завершился аварийно, и запрос не удалось повторить,
+                   или экземпляр останавливается
     """
 
     print('Начало генерации речи')
-    return SpeechResponse(speech=speech_generator.generate_speech(request, load_styles()))
+    started = time.perf_counter()
+    generation = await _start_generation(request, registry, scheduler, singleflight, quota, api_key)
+    try:
+        speech = await generation.flight.wait()
+    except (SidecarCrashed, InstanceDraining) as e:
+        # Процесс генерации перезапускается или экземпляр останавливается, запрос можно повторить
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    finally:
+        await _finish_generation(quota, generation)
+    response = SpeechResponse(
+        speech=speech,
+        metadata=_generation_metadata(speech, generation, started),
+        candidates=_speech_candidates(speech)
+    )
+    # Ответ сериализуется сразу в байты, длинный текст речи не проходит через jsonable_encoder
+    return FastJSONResponse(response, headers=generation.headers())
+
+
+@router.post("/generate_speech_stream")
+async def generate_speech_stream(
+    request: SpeechRequest,
+    registry: Annotated[ModelRegistry, Depends(get_model_registry)],
+    scheduler: Annotated[GenerationScheduler, Depends(get_generation_scheduler)],
+    singleflight: Annotated[SingleFlight, Depends(get_singleflight)],
+    quota: Annotated[Optional[QuotaManager], Depends(get_quota_manager)],
+    api_key: Annotated[Optional[str], Header(alias="X-API-Key")] = None
+) -> StreamingResponse:
+    """
+    Генерирует текст речи и отдаёт его потоком по мере декодирования.
+
+    Принимает те же параметры, что и /generate_speech. Клиент, присоединившийся
+    к уже выполняющейся такой же генерации, получает поток с самого начала.
+    Отключение клиента не прерывает генерацию для остальных ожидающих.
+    Квота ключа списывается при приёме запроса и сверяется с фактическим
+    расходом после окончания потока; заголовки ответа содержат остаток после
+    списания оценки и уровень деградации (x-degradation-tier).
+
+    Args:
+        request (SpeechRequest): Объект запроса с параметрами речи.
+        registry (ModelRegistry): Реестр моделей.
+        scheduler (GenerationScheduler): Общая очередь генерации.
+        singleflight (SingleFlight): Реестр выполняющихся объединяемых генераций.
+        quota (Optional[QuotaManager]): Квоты токенов по API-ключам (None - квоты выключены).
+        api_key (Optional[str]): API-ключ из заголовка X-API-Key.
+
+    Returns:
+        StreamingResponse: Поток фрагментов текста речи (text/plain).
+    """
+
+    print('Начало потоковой генерации речи')
+    generation = await _start_generation(request, registry, scheduler, singleflight, quota, api_key, stream=True)
+
+    async def chunks() -> AsyncIterator[str]:
+        try:
+            async for chunk in generation.flight.stream():
+                yield chunk
+        finally:
+            await _finish_generation(quota, generation)
+
+    return StreamingResponse(chunks(), media_type="text/plain; charset=utf-8", headers=generation.headers())
+
+
+@router.post("/estimate", response_model=TokenEstimate)
+async def estimate(
+    request: SpeechRequest,
+    registry: Annotated[ModelRegistry, Depends(get_model_registry)],
+    scheduler: Annotated[GenerationScheduler, Depends(get_generation_scheduler)]
+) -> TokenEstimate:
+    """
+    Оценивает запрос на генерацию речи без генерации.
+
+    Считает токены промпта по частям, планируемый ответ и ожидаемую длительность
+    генерации, а также проверяет, помещается ли запрос в контекст модели.
+
+    Args:
+        request (SpeechRequest): Объект запроса с параметрами речи.
+        registry (ModelRegistry): Реестр моделей.
+        scheduler (GenerationScheduler): Общая очередь генерации.
+
+    Returns:
+        TokenEstimate: Бюджет токенов запроса и ожидаемая длительность генерации.
+
+    Raises:
+        HTTPException 400: Неизвестная модель или стиль.
+
+    Example:
+        Запрос:
+        POST /api/model/estimate
+        {"topic": "Открытие конференции", "duration_minutes": 3, "style": "formal"}
+
+        Ответ:
+        {
+            "model": "phi-3-mini", "prompt_tokens": 212, "planned_output_tokens": 2048,
+            "max_prompt_tokens": 2048, "context_tokens": 4096,
+            "breakdown": {"base": 212, "key_points": 0, "custom_instructions": 0},
+            "fits": true, "predicted_seconds": 40.9, "queue_depth": 2
+        }
+    """
+
+    model_name = _resolve_model(request, registry)
+    budget = await _token_budget(request, registry, model_name)
+    return _token_estimate(model_name, budget, scheduler)
 
 
 @router.post("/set_model_settings")
@@ -92,3 +460,72 @@ async def set_model_settings(settings: ModelSettings) -> None:
     ai.model_parameters.temperature = settings.temperature
     ai.model_parameters.top_k = settings.top_k
     ai.model_parameters.top_p = settings.top_p
+    ai.model_parameters.settings_version += 1
+
+
+@router.get("/registry", response_model=List[RegisteredModel])
+async def get_registry(
+    registry: Annotated[ModelRegistry, Depends(get_model_registry)]
+) -> List[RegisteredModel]:
+    """
+    Возвращает состояние реестра моделей и счётчики использования каждой модели.
+
+    Args:
+        registry (ModelRegistry): Реестр моделей.
+
+    Returns:
+        List[RegisteredModel]: Сконфигурированные модели с признаком загрузки,
+            объёмом памяти и счётчиками загрузок, попаданий и выгрузок.
+    """
+
+    loaded = set(registry.loaded_models())
+    return [
+        RegisteredModel(name=name, model_id=registry.models[name], loaded=name in loaded, **vars(stats))
+        for name, stats in registry.stats().items()
+    ]
+
+
+@router.get("/scheduler", response_model=SchedulerStatus)
+async def get_scheduler(
+    scheduler: Annotated[GenerationScheduler, Depends(get_generation_scheduler)]
+) -> SchedulerStatus:
+    """
+    Возвращает состояние очереди генерации и точность предсказания длины ответа.
+
+    Очередь упорядочивает запросы по предсказанной длине ответа; ошибка
+    предсказаний показывает, насколько этот порядок близок к идеальному.
+
+    Args:
+        scheduler (GenerationScheduler): Общая очередь генерации.
+
+    Returns:
+        SchedulerStatus: Порядок очереди, её глубина и ошибки предсказателя длины.
+    """
+
+    return SchedulerStatus(
+        policy=ai.serving_parameters.scheduling_policy,
+        queue_depth=scheduler.queue_depth,
+        **asdict(scheduler.predictor.stats())
+    )
+
+
+@router.get("/degradation", response_model=DegradationStatus)
+async def get_degradation(
+    scheduler: Annotated[GenerationScheduler, Depends(get_generation_scheduler)]
+) -> DegradationStatus:
+    """
+    Возвращает текущий уровень деградации и метрики переходов между уровнями.
+
+    Args:
+        scheduler (GenerationScheduler): Общая очередь генерации.
+
+    Returns:
+        DegradationStatus: Текущий уровень, нагрузка очереди, количество запросов
+            на каждом уровне, переходы между уровнями и попадания в кэш ответов.
+    """
+
+    return DegradationStatus(
+        queue_depth=scheduler.queue_depth,
+        predicted_wait_seconds=round(scheduler.predicted_wait_seconds, 1),
+        **asdict(get_degradation_policy().stats())
+    )
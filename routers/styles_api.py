@@ -3,19 +3,62 @@
 
 Предоставляет API для работы со стилями речей: добавление, получение и обновление
 стилей, которые могут использоваться при генерации речей.
+
+Каталог стилей версионируется: список стилей отдаётся с ETag, поддерживает
+условный GET (If-None-Match -> 304) и получение только изменений с версии клиента.
+
+Большие каталоги читаются постранично с курсором и с поиском по префиксу
+и подстроке имени, а переносятся между экземплярами выгрузкой и загрузкой JSONL
+(GET /styles/export, POST /styles/import).
+
+Методы каталога читают и перезаписывают файл стилей (до сотен тысяч стилей),
+поэтому вызываются вне цикла событий и не задерживают потоковые ответы.
 """
 
-from fastapi import APIRouter, HTTPException
-from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+from typing import Annotated, List, Literal, Optional
 
+import ai.serving_parameters as serving_parameters
+from dependencies import get_style_catalog
+from http_encoding import FastJSONResponse
 from schemas.styles import SpeechStyle
-from utils import load_styles, save_styles
+from style_catalog import StyleCatalog
 
 router = APIRouter()
 
 
+def _version_headers(version: int) -> dict:
+    # no-cache: клиент может хранить ответ, но обязан перепроверять его по ETag
+    return {"ETag": f'"{version}"', "X-Styles-Version": str(version), "Cache-Control": "no-cache"}
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate == etag:
+            return True
+    return False
+
+
+def _parse_style_line(line: bytes, line_number: int) -> Optional[SpeechStyle]:
+    if not line.strip():
+        return None
+    try:
+        return SpeechStyle.model_validate_json(line)
+    except ValidationError as e:
+        raise HTTPException(status_code=400, detail=f"Строка {line_number}: {e.errors(include_url=False)}")
+
+
 @router.post("")
-async def set_styles(styles_list: List[SpeechStyle]):
+async def set_styles(
+    styles_list: List[SpeechStyle],
+    catalog: Annotated[StyleCatalog, Depends(get_style_catalog)]
+):
     """
        Добавляет новые стили выступлений в систему.
 
@@ -28,6 +71,7 @@ async def set_styles(styles_list: List[SpeechStyle]):
                Каждый стиль содержит:
                - name (str): Уникальное имя стиля
                - description (str): Описание стиля
+           catalog (StyleCatalog): Каталог стилей.
 
        Returns:
            dict: Сообщение об успешном добавлении и данные добавленных стилей.
@@ -66,51 +110,116 @@ async def set_styles(styles_list: List[SpeechStyle]):
                ]
            }
        """
-    styles = load_styles()
-    added_styles = []
-    for style in styles_list:
-        if style.name in styles:
-            raise HTTPException(status_code=400, detail=f"Стиль с именем '{style.name}' уже существует")
-        styles[style.name] = style.description
-        added_styles.append(style.dict())
-    save_styles(styles)
-    return {"message": "Стили добавлены", "styles": added_styles}
+    try:
+        await run_in_threadpool(catalog.add_styles, styles_list)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": "Стили добавлены", "styles": [style.model_dump() for style in styles_list]}
 
 
 @router.get("")
-async def get_styles():
+async def get_styles(
+    catalog: Annotated[StyleCatalog, Depends(get_style_catalog)],
+    since: Optional[int] = None,
+    limit: Annotated[Optional[int], Query(ge=1)] = None,
+    cursor: Optional[str] = None,
+    prefix: Optional[str] = None,
+    q: Optional[str] = None,
+    if_none_match: Annotated[Optional[str], Header()] = None
+) -> Response:
     """
     Получает все доступные стили выступлений из системы.
 
     Возвращает словарь со всеми стилями, где ключ - имя стиля,
-    значение - описание стиля.
+    значение - описание стиля. Ответ сериализуется один раз на версию каталога
+    и отдаётся с заголовками ETag и X-Styles-Version. Если переданный
+    If-None-Match совпадает с текущим ETag, возвращается 304 без тела.
+
+    С параметром since возвращаются только стили, добавленные или изменённые
+    после указанной версии, и имена удалённых стилей. Если история изменений
+    с этой версии неизвестна (например, сервер перезапускался), возвращаются
+    все стили с признаком full=true, и клиент должен заменить свой список целиком.
+
+    С любым из параметров limit, cursor, prefix и q стили отдаются страницей
+    в порядке имён без учёта регистра. Следующая страница запрашивается с
+    курсором next_cursor; на последней странице он равен null.
+
+    Args:
+        catalog (StyleCatalog): Каталог стилей.
+        since (Optional[int]): Версия каталога, известная клиенту.
+        limit (Optional[int]): Количество стилей на странице (по умолчанию styles_page_size,
+            не больше styles_page_max).
+        cursor (Optional[str]): Курсор следующей страницы из предыдущего ответа.
+        prefix (Optional[str]): Префикс имени стиля без учёта регистра.
+        q (Optional[str]): Подстрока имени стиля без учёта регистра.
+        if_none_match (Optional[str]): ETag закэшированного клиентом ответа.
 
     Returns:
-        dict: Словарь со всеми стилями в формате:
+        Response: Словарь со всеми стилями в формате:
             {
-                "имя_стиля_1": "описание_стиля_1",
-                "имя_стиля_2": "описание_стиля_2",
-                ...
+                "styles": {
+                    "имя_стиля_1": "описание_стиля_1",
+                    ...
+                }
             }
+            либо изменения с версии since в формате:
+            {
+                "version": 1767000000123,
+                "full": false,
+                "styles": {"имя_стиля": "новое_описание"},
+                "removed": ["имя_удалённого_стиля"]
+            }
+            либо страницу стилей в формате:
+            {
+                "version": 1767000000123,
+                "styles": [{"name": "научный", "description": "Научный стиль речи"}],
+                "next_cursor": "0L3QsNGD0YfQvdGL0Lk"
+            }
+
+    Raises:
+        HTTPException 400: Если курсор страницы повреждён.
 
     Example:
         Запрос:
         GET /styles
 
-        Ответ:
+        Ответ (ETag: "1767000000123"):
         {
-            "научный": "Научный стиль речи",
-            "художественный": "Художественный стиль",
-            "официальный": "Официально-деловой стиль"
+            "styles": {
+                "научный": "Научный стиль речи",
+                "художественный": "Художественный стиль"
+            }
         }
+
+        Повторный запрос с If-None-Match: "1767000000123" -> 304 Not Modified
+
+        Поиск: GET /styles?q=науч&limit=20
     """
 
-    styles = load_styles()
-    return {"styles": styles}
+    if limit is not None or cursor is not None or prefix is not None or q is not None:
+        limit = min(limit or serving_parameters.styles_page_size, serving_parameters.styles_page_max)
+        try:
+            page = await run_in_threadpool(catalog.page, limit, cursor=cursor, prefix=prefix, contains=q)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return FastJSONResponse(page, headers=_version_headers(page["version"]))
+
+    if since is not None:
+        changes = await run_in_threadpool(catalog.changes_since, since)
+        return FastJSONResponse(changes, headers=_version_headers(changes["version"]))
+
+    version, body = await run_in_threadpool(catalog.serialized)
+    headers = _version_headers(version)
+    if if_none_match is not None and _etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 @router.put("")
-async def update_styles(style: SpeechStyle):
+async def update_styles(
+    style: SpeechStyle,
+    catalog: Annotated[StyleCatalog, Depends(get_style_catalog)]
+):
     """
     Обновляет описание существующего стиля выступления.
 
@@ -121,6 +230,7 @@ async def update_styles(style: SpeechStyle):
         style (SpeechStyle): Объект стиля для обновления, содержащий:
             - name (str): Имя существующего стиля для обновления
             - description (str): Новое описание стиля
+        catalog (StyleCatalog): Каталог стилей.
 
     Returns:
         dict: Сообщение об успешном обновлении и данные обновленного стиля.
@@ -150,9 +260,81 @@ async def update_styles(style: SpeechStyle):
             }
         }
     """
-    styles = load_styles()
-    if style.name not in styles:
+    try:
+        await run_in_threadpool(catalog.update_style, style)
+    except KeyError:
         raise HTTPException(status_code=404, detail=f"Стиль с именем '{style.name}' не найден")
-    styles[style.name] = style.description
-    save_styles(styles)
-    return {"message": "Стиль обновлен", "style": style.dict()}
+    return {"message": "Стиль обновлен", "style": style.model_dump()}
+
+
+@router.get("/export")
+async def export_styles(catalog: Annotated[StyleCatalog, Depends(get_style_catalog)]) -> StreamingResponse:
+    """
+    Выгружает все стили в формате JSONL.
+
+    Каждая строка - объект {"name": ..., "description": ...}; стили идут в порядке
+    имён без учёта регистра. Выгрузка отдаётся потоком и соответствует версии
+    каталога из заголовка X-Styles-Version.
+
+    Args:
+        catalog (StyleCatalog): Каталог стилей.
+
+    Returns:
+        StreamingResponse: Поток строк JSONL (application/x-ndjson).
+    """
+    version, chunks = await run_in_threadpool(catalog.export)
+    return StreamingResponse(chunks, media_type="application/x-ndjson", headers=_version_headers(version))
+
+
+@router.post("/import")
+async def import_styles(
+    request: Request,
+    catalog: Annotated[StyleCatalog, Depends(get_style_catalog)],
+    on_conflict: Literal["error", "skip", "replace"] = "error"
+):
+    """
+    Загружает стили из тела запроса в формате JSONL.
+
+    Строки разбираются по мере чтения тела; весь импорт применяется одним
+    сохранением каталога - либо целиком, либо, при ошибке, не применяется вовсе.
+
+    Args:
+        request (Request): Запрос с телом JSONL, по стилю {"name": ..., "description": ...} в строке.
+        catalog (StyleCatalog): Каталог стилей.
+        on_conflict (str): Что делать со стилем, который уже есть в каталоге:
+            "error" - отклонить импорт, "skip" - оставить существующий,
+            "replace" - заменить описание.
+
+    Returns:
+        dict: Количество добавленных, обновлённых и пропущенных стилей и новая версия каталога.
+            Пример:
+            {"added": 9998, "updated": 0, "skipped": 2, "version": 1767000000123}
+
+    Raises:
+        HTTPException 400: Если строка не является стилем или, при on_conflict=error,
+            стиль уже существует.
+
+    Example:
+        Запрос:
+        POST /styles/import?on_conflict=skip
+        {"name": "научный", "description": "Научный стиль речи"}
+        {"name": "художественный", "description": "Художественный стиль"}
+    """
+    styles = []
+    line_number = 0
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_number += 1
+            styles.append(_parse_style_line(line, line_number))
+    if buffer:
+        styles.append(_parse_style_line(buffer, line_number + 1))
+
+    try:
+        return await run_in_threadpool(
+            catalog.import_styles, [style for style in styles if style is not None], on_conflict
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,131 @@
+from typing import List, Optional
+from pydantic import BaseModel
+
+
+class DrainStatus(BaseModel):
+    """
+    Состояние плавной остановки экземпляра.
+
+    Attributes:
+        state: "serving" до остановки, "draining" пока принятые запросы дорабатываются,
+            "drained" после выгрузки моделей.
+        reason: Причина остановки: "SIGTERM" или "admin".
+        started_at: Время начала остановки (Unix time, секунды).
+        finished_at: Время окончания остановки.
+        grace_period_s: Сколько секунд дорабатываются принятые запросы.
+        in_flight: Принятые и ещё не выполненные запросы.
+        handed_off: Запросы пакетных заданий, переданные в drain_handoff_path.
+        abandoned: Запросы, не дождавшиеся генерации за период ожидания.
+        released_bytes: Насколько уменьшилась RSS процесса после выгрузки моделей.
+
+    Examples:
+        >>> DrainStatus(state="serving", grace_period_s=0, in_flight=0, handed_off=0, abandoned=0,
+        ...             released_bytes=0).state
+        'serving'
+    """
+    state: str
+    reason: Optional[str] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    grace_period_s: float
+    in_flight: int
+    handed_off: int
+    abandoned: int
+    released_bytes: int
+
+
+class GenerationMemory(BaseModel):
+    """
+    Память одной генерации (ai/memory.py, MemoryRecord).
+
+    Attributes:
+        label: Тема речи или размер батча.
+        requests: Запросов в вызове генерации.
+        finished_at: Время окончания (Unix time, секунды).
+        seconds: Длительность генерации.
+        rss_before_bytes: RSS процесса перед генерацией.
+        peak_rss_bytes: Пиковая RSS во время генерации.
+        rss_after_bytes: RSS после генерации.
+        retained_rss_bytes: Насколько RSS после генерации больше, чем до неё.
+        tensor_bytes: Живые тензоры после генерации; null без подсчёта тензоров.
+        retained_tensor_bytes: Насколько живых тензоров стало больше.
+    """
+    label: str
+    requests: int
+    finished_at: float
+    seconds: float
+    rss_before_bytes: int
+    peak_rss_bytes: int
+    rss_after_bytes: int
+    retained_rss_bytes: int
+    tensor_bytes: Optional[int] = None
+    retained_tensor_bytes: Optional[int] = None
+
+
+class ModelMemory(BaseModel):
+    """
+    Журнал памяти генераций одной модели.
+
+    Attributes:
+        model: Имя модели в реестре.
+        rss_trend_bytes: Наклон RSS после генерации по журналу, байт на генерацию;
+            устойчиво положительный наклон - признак утечки.
+        tensor_trend_bytes: Наклон объёма живых тензоров, байт на генерацию.
+        count_tensors: Считаются ли живые тензоры в новых генерациях.
+        generations: Последние генерации, от старых к новым.
+    """
+    model: str
+    rss_trend_bytes: float
+    tensor_trend_bytes: Optional[float] = None
+    count_tensors: bool = False
+    generations: List[GenerationMemory]
+
+
+class MemoryReport(BaseModel):
+    """
+    Память процесса и генераций загруженных моделей.
+
+    Attributes:
+        rss_bytes: Текущая RSS процесса.
+        models: Журналы памяти загруженных моделей (модели в отдельном процессе
+            генерации журнала в процессе API не имеют и не перечисляются).
+    """
+    rss_bytes: int
+    models: List[ModelMemory]
+
+
+class AllocationSite(BaseModel):
+    """
+    Место выделения памяти Python по tracemalloc.
+
+    Attributes:
+        location: Файл и строка (или только файл при группировке по файлам).
+        size_bytes: Объём живых выделений этого места.
+        count: Количество живых выделений.
+        traceback: Стек выделения от внешнего вызова к месту выделения
+            (при группировке по стеку).
+    """
+    location: str
+    size_bytes: int
+    count: int
+    traceback: List[str] = []
+
+
+class AllocationReport(BaseModel):
+    """
+    Крупнейшие места выделения памяти Python.
+
+    Attributes:
+        tracing_started: Трассировка включена этим запросом; выделения видны со следующего.
+        traced_bytes: Объём памяти, отслеживаемой tracemalloc.
+        peak_traced_bytes: Пиковый объём отслеживаемой памяти с момента включения.
+        sites: Места выделения по убыванию объёма.
+
+    Examples:
+        >>> AllocationReport(tracing_started=True, traced_bytes=0, peak_traced_bytes=0, sites=[]).sites
+        []
+    """
+    tracing_started: bool
+    traced_bytes: int
+    peak_traced_bytes: int
+    sites: List[AllocationSite]
@@ -0,0 +1,59 @@
+from typing import List, Optional
+from pydantic import BaseModel
+
+
+class WarmupStepReport(BaseModel):
+    """
+    Одна прогревочная генерация.
+
+    Attributes:
+        style: Стиль выступления, использованный в промпте.
+        batch_size: Количество промптов в батче.
+        prompt_tokens: Длина промпта в токенах.
+        seconds: Длительность генерации в секундах.
+    """
+    style: str
+    batch_size: int
+    prompt_tokens: int
+    seconds: float
+
+
+class WarmupReport(BaseModel):
+    """
+    Отчёт о прогреве одной модели после загрузки.
+
+    Attributes:
+        model_id: Идентификатор модели на Hugging Face или путь к ней.
+        total_seconds: Суммарная длительность прогрева в секундах.
+        steps: Прогревочные генерации: стиль, размер батча, длина промпта
+               в токенах и длительность в секундах.
+
+    Examples:
+        >>> report = WarmupReport(model_id="microsoft/Phi-3-mini-4k-instruct", total_seconds=4.2, steps=[])
+        >>> report.total_seconds
+        4.2
+    """
+    model_id: str
+    total_seconds: float
+    steps: List[WarmupStepReport]
+
+
+class HealthStatus(BaseModel):
+    """
+    Состояние готовности экземпляра сервиса.
+
+    Attributes:
+        status: "starting" во время загрузки и прогрева модели, "ready" после них,
+            "failed", если модель не загрузилась, "draining" и "drained" при остановке экземпляра.
+        ready: Готов ли экземпляр принимать запросы на генерацию.
+        warmup: Отчёты о прогреве загруженных моделей.
+        error: Ошибка загрузки модели по умолчанию (при status "failed").
+
+    Examples:
+        >>> HealthStatus(status="ready", ready=True, warmup=[]).ready
+        True
+    """
+    status: str
+    ready: bool
+    warmup: List[WarmupReport]
+    error: Optional[str] = None
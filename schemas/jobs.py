@@ -0,0 +1,24 @@
+from pydantic import BaseModel
+
+
+class JobStatus(BaseModel):
+    """
+    Модель состояния пакетного задания на генерацию речей.
+
+    Attributes:
+        job_id: Уникальный идентификатор задания.
+        status: Статус задания: "queued", "running" или "completed".
+        total: Общее количество запросов в задании.
+        completed: Количество успешно сгенерированных речей.
+        failed: Количество запросов, завершившихся ошибкой.
+
+    Examples:
+        >>> status = JobStatus(job_id="3f2a", status="running", total=100, completed=40, failed=1)
+        >>> status.total - status.completed - status.failed
+        59
+    """
+    job_id: str
+    status: str
+    total: int
+    completed: int
+    failed: int
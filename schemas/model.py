@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 
 class SpeechRequest(BaseModel):
@@ -20,6 +20,26 @@ class SpeechRequest(BaseModel):
                   По умолчанию: "ru" (русский).
         custom_instructions: Дополнительные пожелания или требования к содержанию речи.
                              Может быть None, если не требуется.
+        structured: Структурный режим генерации. Модель сначала составляет план,
+                    затем вступление, основная часть и заключение генерируются
+                    параллельно и склеиваются. Сокращает задержку длинных речей.
+                    По умолчанию: False.
+        seed: Зерно генератора случайных чисел для семплирования. Одинаковые
+              запросы с одним seed, пришедшие одновременно, обслуживаются
+              одной генерацией. По умолчанию: None.
+        model: Имя модели из реестра моделей. Если не указано, модель выбирается
+               по длительности речи или используется модель по умолчанию.
+               По умолчанию: None.
+        n: Количество вариантов речи. Варианты семплируются одним вызовом модели
+           после общего прохода по промпту и возвращаются в поле candidates ответа.
+           Не поддерживается в структурном и потоковом режимах. По умолчанию: 1.
+        rank: Упорядочить варианты по соответствию длительности, покрытию ключевых
+              моментов и отсутствию повторов; первым идёт лучший. По умолчанию: False.
+        max_new_tokens: Собственный лимит новых токенов запроса; не больше общего
+                        параметра генерации max_new_tokens. По умолчанию: None.
+        do_sample: Собственный режим декодирования запроса (False - жадное) вместо
+                   общего параметра генерации do_sample. Уровни деградации при
+                   перегрузке задают оба поля сами. По умолчанию: None.
 
     Examples:
         >>> request = SpeechRequest(
@@ -38,6 +58,102 @@ class SpeechRequest(BaseModel):
     key_points: Optional[List[str]] = None
     language: str = "ru"
     custom_instructions: Optional[str] = None
+    structured: bool = False
+    seed: Optional[int] = None
+    model: Optional[str] = None
+    n: int = 1
+    rank: bool = False
+    max_new_tokens: Optional[int] = None
+    do_sample: Optional[bool] = None
+
+
+class GenerationMetadata(BaseModel):
+    """
+    Метаданные генерации речи.
+
+    Attributes:
+        model: Имя модели в реестре, сгенерировавшей речь.
+        prompt_tokens: Количество токенов промпта (в структурном режиме - всех проходов).
+        completion_tokens: Количество сгенерированных токенов.
+        generation_ms: Длительность вызова модели в миллисекундах. При генерации
+                       батчем - длительность всего батча.
+        total_ms: Время обработки запроса сервером в миллисекундах, включая ожидание в очереди.
+        settings_version: Версия параметров генерации, с которыми сгенерирована речь.
+                          Увеличивается при каждом вызове /set_model_settings.
+        stop_reason: Причина окончания генерации: "eos", "length", "stop_string"
+                     или "completion" (остановка после завершённого заключения).
+        tokens_saved: Токены лимита, не декодированные благодаря досрочной остановке.
+        tier: Уровень деградации, с которым обслужен запрос ("normal" - без деградации).
+        cached: Речь взята из кэша ответов для близкого запроса, а не сгенерирована.
+
+    Examples:
+        >>> metadata = GenerationMetadata(model="phi-3-mini", prompt_tokens=120, completion_tokens=640,
+        ...                               generation_ms=9100.0, total_ms=9130.5, settings_version=2)
+        >>> metadata.completion_tokens
+        640
+    """
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+    generation_ms: float
+    total_ms: float
+    settings_version: int
+    stop_reason: Optional[str] = None
+    tokens_saved: int = 0
+    tier: str = "normal"
+    cached: bool = False
+
+
+class TokenEstimate(BaseModel):
+    """
+    Оценка запроса на генерацию речи без генерации.
+
+    Attributes:
+        model: Имя модели в реестре, которая будет генерировать речь.
+        prompt_tokens: Длина промпта в токенах (в структурном режиме - прохода разделов,
+                       включая план речи).
+        planned_output_tokens: Лимит новых токенов генерации.
+        max_prompt_tokens: Максимальная длина промпта (max_length); более длинный
+                           промпт токенизатор обрезает.
+        context_tokens: Контекстное окно модели для промпта и ответа вместе.
+        breakdown: Токены промпта по частям: base (системный промпт, параметры речи
+                   и задание), key_points, custom_instructions.
+        fits: Помещается ли запрос в лимиты; иначе генерация отклоняется с кодом 413.
+        predicted_seconds: Ожидаемая длительность генерации по скорости предыдущих
+                           генераций модели, без учёта очереди (None, пока генераций не было).
+        queue_depth: Количество запросов, ожидающих генерации в очереди.
+
+    Examples:
+        >>> estimate = TokenEstimate(model="phi-3-mini", prompt_tokens=310, planned_output_tokens=2048,
+        ...                          max_prompt_tokens=2048, context_tokens=4096,
+        ...                          breakdown={"base": 250, "key_points": 40, "custom_instructions": 20},
+        ...                          fits=True, predicted_seconds=41.0, queue_depth=0)
+        >>> estimate.fits
+        True
+    """
+    model: str
+    prompt_tokens: int
+    planned_output_tokens: int
+    max_prompt_tokens: int
+    context_tokens: int
+    breakdown: Dict[str, int]
+    fits: bool
+    predicted_seconds: Optional[float] = None
+    queue_depth: int = 0
+
+
+class SpeechCandidate(BaseModel):
+    """
+    Вариант речи при генерации нескольких вариантов (n > 1).
+
+    Attributes:
+        speech: Текст варианта.
+        completion_tokens: Количество сгенерированных токенов варианта.
+        score: Оценка варианта от 0 до 1, если запрошено ранжирование (rank=True).
+    """
+    speech: str
+    completion_tokens: int = 0
+    score: Optional[float] = None
 
 
 class SpeechResponse(BaseModel):
@@ -50,6 +166,10 @@ class SpeechResponse(BaseModel):
     Attributes:
         speech: Текст сгенерированной речи. Включает в себя вступление,
                 основную часть и заключение, отформатированные для устного выступления.
+        metadata: Метаданные генерации: количество токенов, длительности и версия
+                  параметров генерации (опционально).
+        candidates: Все варианты речи при n > 1, speech совпадает с первым из них
+                    (опционально).
 
     Examples:
         >>> response = SpeechResponse(
@@ -59,6 +179,8 @@ class SpeechResponse(BaseModel):
         True
     """
     speech: str
+    metadata: Optional[GenerationMetadata] = None
+    candidates: Optional[List[SpeechCandidate]] = None
 
 
 class ModelSettings(BaseModel):
@@ -108,3 +230,98 @@ class ModelSettings(BaseModel):
     max_new_tokens: int = 2048
     repetition_penalty: float = 1.1
     do_sample: bool = True
+
+
+class RegisteredModel(BaseModel):
+    """
+    Состояние модели в реестре моделей и счётчики её использования.
+
+    Attributes:
+        name: Имя модели в реестре.
+        model_id: Идентификатор модели на Hugging Face или путь к ней.
+        loaded: Загружена ли модель в память сейчас.
+        memory_bytes: Объём весов модели по последней загрузке, в байтах.
+        loads: Количество загрузок модели.
+        hits: Количество обращений к уже загруженной модели.
+        evictions: Количество выгрузок модели по бюджету памяти.
+        last_load_seconds: Длительность последней загрузки в секундах.
+        load_peak_rss_bytes: Пиковая RSS процесса во время последней загрузки, в байтах.
+        load_rss_bytes: RSS процесса сразу после последней загрузки, в байтах.
+        offloaded_modules: Количество модулей модели, выгруженных на диск в режиме low_memory.
+
+    Examples:
+        >>> info = RegisteredModel(name="phi-3-mini", model_id="microsoft/Phi-3-mini-4k-instruct",
+        ...                        loaded=True, memory_bytes=7_600_000_000, loads=1, hits=42,
+        ...                        evictions=0, last_load_seconds=35.2)
+        >>> info.hits
+        42
+    """
+    name: str
+    model_id: str
+    loaded: bool
+    memory_bytes: int
+    loads: int
+    hits: int
+    evictions: int
+    last_load_seconds: float
+    load_peak_rss_bytes: int = 0
+    load_rss_bytes: int = 0
+    offloaded_modules: int = 0
+
+
+class SchedulerStatus(BaseModel):
+    """
+    Состояние очереди генерации и точность предсказания длины ответа.
+
+    Attributes:
+        policy: Порядок очереди: "sjf" (сначала короткие ответы) или "fifo".
+        queue_depth: Количество запросов, ожидающих генерации.
+        observations: Количество завершённых запросов, на которых учился предсказатель длины.
+        keys: Количество различных сочетаний признаков (стиль, длительность, язык, ключевые моменты).
+        mean_absolute_error: Средняя абсолютная ошибка предсказания длины ответа, в токенах.
+        mean_absolute_percentage_error: Средняя абсолютная ошибка относительно фактической длины, в процентах.
+        recent_absolute_error: Сглаженная абсолютная ошибка последних предсказаний, в токенах.
+
+    Examples:
+        >>> status = SchedulerStatus(policy="sjf", queue_depth=3, observations=120, keys=14,
+        ...                          mean_absolute_error=96.4, mean_absolute_percentage_error=11.8,
+        ...                          recent_absolute_error=71.2)
+        >>> status.policy
+        'sjf'
+    """
+    policy: str
+    queue_depth: int
+    observations: int
+    keys: int
+    mean_absolute_error: float
+    mean_absolute_percentage_error: float
+    recent_absolute_error: float
+
+
+class DegradationStatus(BaseModel):
+    """
+    Текущий уровень деградации и метрики переходов между уровнями.
+
+    Attributes:
+        tier: Уровень, выбранный для последнего запроса ("normal" - без деградации).
+        since: Время перехода на текущий уровень (Unix time, секунды).
+        queue_depth: Количество запросов, ожидающих генерации.
+        predicted_wait_seconds: Ожидаемое время ожидания нового запроса в очереди.
+        requests: Количество запросов, обслуженных на каждом уровне.
+        transitions: Количество переходов между уровнями: "из->в" -> количество.
+        cache_hits: Количество ответов из кэша ответов.
+
+    Examples:
+        >>> status = DegradationStatus(tier="greedy", since=1760870400.0, queue_depth=9,
+        ...                            predicted_wait_seconds=48.5, requests={"normal": 120, "greedy": 14},
+        ...                            transitions={"normal->greedy": 2, "greedy->normal": 1}, cache_hits=0)
+        >>> status.transitions["normal->greedy"]
+        2
+    """
+    tier: str
+    since: float
+    queue_depth: int
+    predicted_wait_seconds: float
+    requests: Dict[str, int]
+    transitions: Dict[str, int]
+    cache_hits: int
@@ -0,0 +1,483 @@
+"""
+Модуль версионируемого каталога стилей выступлений.
+
+Каталог держит стили в памяти и сверяет их с файлом `speech_styles.json` по его
+сигнатуре (время изменения, размер, inode), поэтому повторное чтение и разбор файла
+происходят только после его изменения - в том числе другим процессом.
+
+Каждое изменение каталога увеличивает его версию. Версия служит ETag для
+условного GET, по ней кэшируется сериализованный ответ со всеми стилями, а
+по версиям отдельных стилей строится дельта изменений с указанной версии.
+
+Для каталогов из десятков тысяч стилей имена индексируются (StyleIndex):
+постраничный вывод с курсором и поиск по префиксу и подстроке без учёта
+регистра не перебирают весь каталог. Собственные изменения каталога
+применяются к памяти и индексу только для изменённых стилей.
+"""
+
+import base64
+import binascii
+import bisect
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import pydantic_core
+
+import utils
+from schemas.styles import SpeechStyle
+
+
+def _now_version() -> int:
+    # Версии основаны на времени в миллисекундах, поэтому растут и между перезапусками
+    return int(time.time() * 1000)
+
+
+def encode_cursor(name: str) -> str:
+    """Непрозрачный курсор страницы: последнее имя предыдущей страницы."""
+    return base64.urlsafe_b64encode(name.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> str:
+
+    """
+    Восстанавливает имя стиля из курсора страницы.
+
+    Raises:
+        ValueError: Если курсор повреждён.
+    """
+
+    try:
+        return base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+    except (binascii.Error, UnicodeDecodeError):
+        raise ValueError(f"Некорректный курсор страницы: '{cursor}'")
+
+
+class _TrigramIndex:
+
+    """
+    Триграммы имён стилей (без учёта регистра) для поиска по подстроке.
+
+    Списки вхождений хранят номера имён в компактных массивах. Удалённые
+    имена остаются в списках до перестроения индекса и отсеиваются при проверке.
+    """
+
+    def __init__(self, names: Iterable[str]):
+        self.names: List[Optional[str]] = []
+        self.folded: List[str] = []
+        self.stale = 0
+        self._ids: Dict[str, int] = {}
+        self._postings: Dict[str, array] = {}
+        for name in names:
+            self.add(name)
+
+    @staticmethod
+    def trigrams(folded: str) -> set:
+        return {folded[start:start + 3] for start in range(len(folded) - 2)}
+
+    def add(self, name: str):
+        folded = name.casefold()
+        position = len(self.names)
+        self._ids[name] = position
+        self.names.append(name)
+        self.folded.append(folded)
+        for trigram in self.trigrams(folded):
+            postings = self._postings.get(trigram)
+            if postings is None:
+                postings = self._postings[trigram] = array("I")
+            postings.append(position)
+
+    def remove(self, name: str):
+        self.names[self._ids.pop(name)] = None
+        self.stale += 1
+
+    def smallest_postings(self, query: str) -> array:
+        """Самый короткий список вхождений триграмм запроса; все совпадения входят в него."""
+        postings = [self._postings.get(trigram) for trigram in self.trigrams(query)]
+        if any(item is None for item in postings):
+            return array("I")
+        return min(postings, key=len)
+
+
+class StyleIndex:
+
+    """
+    Индекс имён стилей для постраничного вывода и поиска без учёта регистра.
+
+    Имена хранятся отсортированными по casefold: страница после курсора и поиск
+    по префиксу - двоичный поиск и проход по соседним именам, O(log N + limit).
+    Поиск по подстроке от трёх символов использует триграммный индекс, который
+    строится при первом таком поиске: совпадения проверяются только среди имён
+    с самой редкой триграммой запроса, а если их слишком много - проходом по
+    отсортированным именам, где совпадения тогда обычно встречаются часто.
+    """
+
+    def __init__(self, names: Iterable[str] = ()):
+        self._keys: List[Tuple[str, str]] = sorted((name.casefold(), name) for name in names)
+        self._trigrams: Optional[_TrigramIndex] = None
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def names(self) -> List[str]:
+        """Все имена в порядке страниц."""
+        return [name for _, name in self._keys]
+
+    def add(self, name: str):
+        bisect.insort(self._keys, (name.casefold(), name))
+        if self._trigrams is not None:
+            self._trigrams.add(name)
+
+    def remove(self, name: str):
+        position = bisect.bisect_left(self._keys, (name.casefold(), name))
+        del self._keys[position]
+        if self._trigrams is not None:
+            self._trigrams.remove(name)
+            # После массовых удалений индекс дешевле перестроить при следующем поиске
+            if self._trigrams.stale > len(self._keys):
+                self._trigrams = None
+
+    def page(
+        self,
+        limit: int,
+        after: Optional[str] = None,
+        prefix: Optional[str] = None,
+        contains: Optional[str] = None
+    ) -> Tuple[List[str], bool]:
+
+        """
+        Возвращает страницу имён.
+
+        Args:
+            limit (int): Максимальное количество имён на странице.
+            after (Optional[str]): Последнее имя предыдущей страницы.
+            prefix (Optional[str]): Префикс имени без учёта регистра.
+            contains (Optional[str]): Подстрока имени без учёта регистра.
+
+        Returns:
+            Tuple[List[str], bool]: Имена страницы и признак того, что есть следующая страница.
+        """
+
+        prefix = prefix.casefold() if prefix else ""
+        contains = contains.casefold() if contains else ""
+        after_key = (after.casefold(), after) if after is not None else None
+
+        if len(contains) >= 3:
+            if self._trigrams is None:
+                self._trigrams = _TrigramIndex(name for _, name in self._keys)
+            trigrams = self._trigrams
+            postings = trigrams.smallest_postings(contains)
+            # Редкая подстрока: проверяются и сортируются только кандидаты из индекса
+            if len(postings) ** 2 <= limit * len(self._keys):
+                matches = sorted(
+                    (trigrams.folded[position], trigrams.names[position]) for position in postings
+                    if trigrams.names[position] is not None
+                    and contains in trigrams.folded[position]
+                    and trigrams.folded[position].startswith(prefix)
+                    and (after_key is None or (trigrams.folded[position], trigrams.names[position]) > after_key)
+                )
+                return [name for _, name in matches[:limit]], len(matches) > limit
+
+        start = bisect.bisect_right(self._keys, after_key) if after_key is not None else 0
+        if prefix:
+            start = max(start, bisect.bisect_left(self._keys, (prefix,)))
+        names = []
+        keys = self._keys
+        for position in range(start, len(keys)):
+            folded, name = keys[position]
+            if not folded.startswith(prefix):
+                break
+            if contains in folded:
+                if len(names) == limit:
+                    return names, True
+                names.append(name)
+        return names, False
+
+
+class StyleCatalog:
+
+    """
+    Каталог стилей с монотонно растущей версией.
+
+    Attributes:
+        version (int): Текущая версия каталога.
+        base_version (int): Версия, с которой каталог знает историю изменений.
+            Дельта с более ранней версии отдаётся полным списком стилей.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.base_version = 0
+        self._styles: Dict[str, str] = {}
+        self._style_versions: Dict[str, int] = {}
+        self._removed: Dict[str, int] = {}
+        self._signature = object()
+        self._serialized: Optional[Tuple[int, bytes]] = None
+        self._index = StyleIndex()
+        self._lock = threading.RLock()
+
+    def snapshot(self) -> Dict[str, str]:
+
+        """
+        Возвращает актуальный словарь стилей.
+
+        Словарь общий для всех вызывающих в пределах одной версии и не должен
+        изменяться; для изменений используются add_styles и update_style.
+
+        Returns:
+            Dict[str, str]: Словарь стилей, где ключ - название, значение - описание.
+        """
+
+        with self._lock:
+            self._refresh()
+            return self._styles
+
+    def serialized(self) -> Tuple[int, bytes]:
+
+        """
+        Возвращает JSON-ответ со всеми стилями, сериализованный один раз на версию.
+
+        Returns:
+            Tuple[int, bytes]: Версия каталога и тело ответа {"styles": {...}}.
+        """
+
+        with self._lock:
+            self._refresh()
+            if self._serialized is None or self._serialized[0] != self.version:
+                body = pydantic_core.to_json({"styles": self._styles})
+                self._serialized = (self.version, body)
+            return self._serialized
+
+    def changes_since(self, since: int) -> dict:
+
+        """
+        Возвращает изменения каталога после указанной версии.
+
+        Args:
+            since (int): Версия каталога, известная клиенту.
+
+        Returns:
+            dict: {"version": текущая версия, "full": признак полного списка,
+                "styles": добавленные и изменённые стили, "removed": удалённые стили}.
+                Если история изменений с версии since неизвестна (например, после
+                перезапуска), отдаются все стили и full=True.
+        """
+
+        with self._lock:
+            self._refresh()
+            if since < self.base_version:
+                return {"version": self.version, "full": True, "styles": dict(self._styles), "removed": []}
+            return {
+                "version": self.version,
+                "full": False,
+                "styles": {
+                    name: description for name, description in self._styles.items()
+                    if self._style_versions[name] > since
+                },
+                "removed": [name for name, version in self._removed.items() if version > since]
+            }
+
+    def page(
+        self,
+        limit: int,
+        cursor: Optional[str] = None,
+        prefix: Optional[str] = None,
+        contains: Optional[str] = None
+    ) -> dict:
+
+        """
+        Возвращает страницу стилей в порядке имён без учёта регистра.
+
+        Курсор указывает на последнее имя предыдущей страницы, поэтому
+        добавление и удаление стилей между запросами страниц не приводит
+        к пропускам и повторам.
+
+        Args:
+            limit (int): Максимальное количество стилей на странице.
+            cursor (Optional[str]): Курсор next_cursor предыдущей страницы.
+            prefix (Optional[str]): Префикс имени без учёта регистра.
+            contains (Optional[str]): Подстрока имени без учёта регистра.
+
+        Returns:
+            dict: {"version": версия каталога, "styles": [{"name": ..., "description": ...}],
+                "next_cursor": курсор следующей страницы или None}.
+
+        Raises:
+            ValueError: Если курсор повреждён.
+        """
+
+        after = decode_cursor(cursor) if cursor else None
+        with self._lock:
+            self._refresh()
+            names, more = self._index.page(limit, after, prefix, contains)
+            return {
+                "version": self.version,
+                "styles": [{"name": name, "description": self._styles[name]} for name in names],
+                "next_cursor": encode_cursor(names[-1]) if more else None
+            }
+
+    def export(self, chunk_size: int = 1000) -> Tuple[int, Iterator[bytes]]:
+
+        """
+        Выгружает все стили строками JSONL в порядке имён.
+
+        Выгружается версия каталога на момент вызова; изменения во время
+        выгрузки в неё не попадают.
+
+        Args:
+            chunk_size (int): Количество строк в одном фрагменте.
+
+        Returns:
+            Tuple[int, Iterator[bytes]]: Версия каталога и фрагменты
+                из строк {"name": ..., "description": ...}.
+        """
+
+        with self._lock:
+            self._refresh()
+            version, styles, names = self.version, self._styles, self._index.names()
+
+        def chunks():
+            for start in range(0, len(names), chunk_size):
+                yield b"".join(
+                    pydantic_core.to_json({"name": name, "description": styles[name]}) + b"\n"
+                    for name in names[start:start + chunk_size]
+                )
+
+        return version, chunks()
+
+    def add_styles(self, styles: List[SpeechStyle]):
+
+        """
+        Добавляет новые стили и сохраняет каталог в файл.
+
+        Args:
+            styles (List[SpeechStyle]): Стили для добавления.
+
+        Raises:
+            ValueError: Если стиль с таким именем уже существует или повторяется
+                в списке. В этом случае ни один стиль из списка не добавляется.
+        """
+
+        with self._lock:
+            self._refresh()
+            added = {}
+            for style in styles:
+                if style.name in self._styles or style.name in added:
+                    raise ValueError(f"Стиль с именем '{style.name}' уже существует")
+                added[style.name] = style.description
+            updated = dict(self._styles)
+            updated.update(added)
+            self._save(updated, list(added))
+
+    def import_styles(self, styles: Iterable[SpeechStyle], on_conflict: str = "error") -> dict:
+
+        """
+        Импортирует стили одним сохранением каталога.
+
+        Args:
+            styles (Iterable[SpeechStyle]): Импортируемые стили.
+            on_conflict (str): Что делать со стилем, который уже есть в каталоге:
+                "error" - отклонить весь импорт, "skip" - оставить существующий,
+                "replace" - заменить описание.
+
+        Returns:
+            dict: {"added": ..., "updated": ..., "skipped": ..., "version": ...}.
+
+        Raises:
+            ValueError: Если стиль уже существует при on_conflict="error"
+                или указан неизвестный on_conflict. Каталог не изменяется.
+        """
+
+        if on_conflict not in ("error", "skip", "replace"):
+            raise ValueError(f"Неизвестный режим on_conflict: '{on_conflict}'")
+
+        with self._lock:
+            self._refresh()
+            incoming = {}
+            added = updated = skipped = 0
+            for style in styles:
+                existing = self._styles.get(style.name)
+                if existing is None:
+                    added += style.name not in incoming
+                elif on_conflict == "error":
+                    raise ValueError(f"Стиль с именем '{style.name}' уже существует")
+                elif on_conflict == "skip" or existing == style.description:
+                    skipped += 1
+                    continue
+                else:
+                    updated += style.name not in incoming
+                incoming[style.name] = style.description
+            if incoming:
+                merged = dict(self._styles)
+                merged.update(incoming)
+                self._save(merged, list(incoming))
+            return {"added": added, "updated": updated, "skipped": skipped, "version": self.version}
+
+    def update_style(self, style: SpeechStyle):
+
+        """
+        Обновляет описание существующего стиля и сохраняет каталог в файл.
+
+        Args:
+            style (SpeechStyle): Стиль с новым описанием.
+
+        Raises:
+            KeyError: Если стиль с таким именем не найден.
+        """
+
+        with self._lock:
+            self._refresh()
+            if style.name not in self._styles:
+                raise KeyError(style.name)
+            updated = dict(self._styles)
+            updated[style.name] = style.description
+            self._save(updated, [style.name])
+
+    def _save(self, styles: Dict[str, str], changed: List[str]):
+        utils.save_styles(styles)
+        self._apply(styles, changed, [])
+        self._signature = utils.styles_file_signature()
+
+    def _refresh(self):
+        signature = utils.styles_file_signature()
+        if signature != self._signature:
+            self._apply(utils.load_styles())
+            self._signature = signature
+
+    def _apply(self, styles: Dict[str, str], changed: Optional[List[str]] = None, removed: Optional[List[str]] = None):
+
+        """
+        Заменяет содержимое каталога, увеличивая версию при изменениях.
+
+        Args:
+            styles (Dict[str, str]): Новое содержимое каталога.
+            changed (Optional[List[str]]): Добавленные и изменённые стили, если они известны;
+                иначе изменения находятся сравнением со всем каталогом.
+            removed (Optional[List[str]]): Удалённые стили, если они известны.
+        """
+
+        if self.version == 0:
+            self.version = self.base_version = _now_version()
+            self._styles = dict(styles)
+            self._style_versions = {name: self.version for name in styles}
+            self._index = StyleIndex(styles)
+            return
+
+        if changed is None:
+            changed = [name for name, description in styles.items() if self._styles.get(name) != description]
+            removed = [name for name in self._styles if name not in styles]
+        if not changed and not removed:
+            return
+
+        self.version = max(self.version + 1, _now_version())
+        for name in changed:
+            if name not in self._styles:
+                self._index.add(name)
+            self._style_versions[name] = self.version
+            self._removed.pop(name, None)
+        for name in removed:
+            self._index.remove(name)
+            self._style_versions.pop(name, None)
+            self._removed[name] = self.version
+        self._styles = styles
@@ -7,6 +7,8 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from schemas.model import SpeechRequest
 from schemas.model import ModelSettings
+from ai.model_registry import ModelRegistry
+from ai.speech_generator import TokenBudget
 
 
 from ai.model_parameters import (
@@ -19,6 +21,9 @@ from ai.model_parameters import (
     repetition_penalty
 )
 
+# Фикстуры микробенчмарков: benchmark_session, benchmark
+pytest_plugins = ["test_benchmarks.benchmarking"]
+
 
 @pytest.fixture
 def sample_speech_request():
@@ -43,14 +48,23 @@ def sample_available_styles():
     }
 
 
+def registry_with(generator):
+    """Реестр моделей из одной модели по умолчанию, «загружающий» переданный генератор"""
+    return ModelRegistry(models={"default": "test-model"}, default_model="default", loader=lambda model_id: generator)
+
+
 @pytest.fixture
 def mock_speech_generator():
     """Фикстура для мокинга SpeechGenerator"""
     mock_instance = Mock()
     mock_instance.model_loaded = True
     mock_instance.generate_speech.return_value = "Это сгенерированная тестовая речь."
+    mock_instance.token_budget.return_value = TokenBudget(
+        base_tokens=200, key_points_tokens=30, custom_instructions_tokens=20, prompt_tokens=250,
+        planned_output_tokens=2048, max_prompt_tokens=2048, context_tokens=4096
+    )
 
-    with patch('dependencies._speech_generator', mock_instance):
+    with patch('dependencies._model_registry', registry_with(mock_instance)):
         yield mock_instance
 
 
@@ -98,3 +112,30 @@ def model_parameters_module():
     """Фикстура возвращает сам модуль с параметрами"""
     from ai import model_parameters
     return model_parameters
+
+
+def pytest_addoption(parser):
+    """Параметры запуска микробенчмарков (tests/test_benchmarks) и теста утечек памяти (tests/test_soak)"""
+    group = parser.getgroup("benchmarks", "микробенчмарки горячих путей")
+    group.addoption(
+        "--benchmark", action="store_true",
+        help="Запустить микробенчмарки и упасть, если путь медленнее базовой линии больше чем на допуск"
+    )
+    group.addoption(
+        "--benchmark-update", action="store_true",
+        help="Запустить микробенчмарки и перезаписать базовую линию tests/test_benchmarks/baseline.json"
+    )
+    group.addoption(
+        "--benchmark-tolerance", type=float, default=0.3,
+        help="Допустимое замедление относительно базовой линии (0.3 - на 30%%)"
+    )
+    group = parser.getgroup("soak", "длительный тест утечек памяти")
+    group.addoption(
+        "--soak", action="store_true",
+        help="Запустить много генераций на маленькой модели и упасть, если удержанная память растёт"
+    )
+    group.addoption("--soak-generations", type=int, default=300, help="Количество генераций в тесте утечек")
+    group.addoption(
+        "--soak-max-growth-mb", type=float, default=16,
+        help="Допустимый рост RSS после прогрева по наклону тренда, МБ"
+    )
@@ -0,0 +1,87 @@
+"""
+Генератор-заглушка для процесса генерации в тестах ai/sidecar.py.
+
+Ведёт себя по теме запроса: "crash" - процесс завершается аварийно,
+"crash slowly" - завершается через полсекунды (за это время в очередь
+процесса успевают встать другие вызовы), "crash after chunk" - после первого
+фрагмента потока, "hang" - генерация зависает, "slow" - долгая исправная
+генерация: фрагменты потока приходят каждые полсекунды.
+"""
+
+import os
+import time
+from dataclasses import dataclass
+
+import ai.model_parameters as model_parameters
+
+
+class FakeSpeech(str):
+    """Текст речи со статистикой генерации, как SpeechText, но без импорта torch"""
+
+
+@dataclass
+class FakeBudget:
+    base_tokens: int
+    key_points_tokens: int
+    custom_instructions_tokens: int
+    prompt_tokens: int
+    planned_output_tokens: int
+    max_prompt_tokens: int
+    context_tokens: int
+
+
+@dataclass
+class FakeWarmupStep:
+    style: str
+    batch_size: int
+    prompt_tokens: int
+    seconds: float
+
+
+class FakeGenerator:
+    """Генератор без модели: речь - описание стиля, тема и дополнительные требования"""
+
+    def __init__(self, model_id):
+        self.model_id = model_id
+
+    def load_model(self):
+        if self.model_id == "broken":
+            raise RuntimeError("Модель не найдена")
+
+    def generate_speech(self, request, available_styles, on_text=None):
+        if request.topic == "crash":
+            os._exit(1)
+        if request.topic == "crash slowly":
+            time.sleep(0.5)
+            os._exit(1)
+        if request.topic == "hang":
+            time.sleep(3600)
+        if request.style not in available_styles:
+            raise ValueError(f"Стиль '{request.style}' не найден")
+
+        chunks = [available_styles[request.style], ": ", request.topic, request.custom_instructions or ""]
+        if on_text is not None:
+            for chunk in chunks:
+                if request.topic == "slow":
+                    time.sleep(0.5)
+                on_text(chunk)
+                if request.topic == "crash after chunk":
+                    os._exit(1)
+        speech = FakeSpeech("".join(chunks))
+        speech.prompt_tokens, speech.completion_tokens = 3, len(chunks)
+        speech.settings_version = model_parameters.settings_version
+        speech.score = model_parameters.temperature
+        return speech
+
+    def generate_batch(self, requests, available_styles):
+        return [self.generate_speech(request, available_styles) for request in requests]
+
+    def token_budget(self, request, available_styles):
+        return FakeBudget(
+            base_tokens=10, key_points_tokens=0, custom_instructions_tokens=len(request.custom_instructions or ""),
+            prompt_tokens=10, planned_output_tokens=model_parameters.max_new_tokens,
+            max_prompt_tokens=model_parameters.max_length, context_tokens=4096
+        )
+
+    def warm_up(self, available_styles):
+        return [FakeWarmupStep(style=style, batch_size=1, prompt_tokens=10, seconds=0.0) for style in available_styles]
@@ -0,0 +1,51 @@
+import pytest
+
+from ai.degradation import DegradationPolicy
+from ai.response_cache import ResponseCache
+
+
+class TestDegradation:
+    """Тесты уровней деградации и кэша ответов"""
+
+    def test_most_severe_triggered_tier_and_transitions(self, sample_speech_request):
+        """Проверяет выбор самого тяжёлого сработавшего уровня, удешевление запроса и учёт переходов"""
+
+        policy = DegradationPolicy.from_config([
+            {"name": "greedy", "queue_depth": 4, "do_sample": False},
+            {"name": "short", "queue_depth": 8, "predicted_wait_s": 60, "do_sample": False, "max_new_tokens": 512,
+             "model": "small"}
+        ])
+
+        assert policy.select(queue_depth=2, predicted_wait_s=0) is None
+        assert policy.select(queue_depth=5, predicted_wait_s=0).name == "greedy"
+        tier = policy.select(queue_depth=1, predicted_wait_s=90)
+        assert policy.select(queue_depth=0, predicted_wait_s=0) is None
+
+        degraded = tier.apply(sample_speech_request.model_copy(update={"max_new_tokens": 300}))
+        assert (degraded.do_sample, degraded.max_new_tokens, degraded.model) == (False, 300, "small")
+        stats = policy.stats()
+        assert stats.tier == "normal"
+        assert stats.requests == {"normal": 2, "greedy": 1, "short": 1}
+        assert stats.transitions == {"normal->greedy": 1, "greedy->short": 1, "short->normal": 1}
+
+    def test_tier_requires_threshold(self):
+        """Проверяет, что уровень без порога отклоняется"""
+
+        with pytest.raises(ValueError):
+            DegradationPolicy.from_config([{"name": "greedy", "do_sample": False}])
+
+    def test_response_cache_serves_close_requests(self, sample_speech_request):
+        """Проверяет попадание в кэш для близкого запроса и промах для другой длительности или темы"""
+
+        cache = ResponseCache(size=2, min_similarity=0.6)
+        cache.put("default", sample_speech_request, "Речь о технологиях")
+
+        close = sample_speech_request.model_copy(update={"custom_instructions": "Сделать акцент на этику"})
+        assert cache.find("default", close) == "Речь о технологиях"
+        assert cache.find("default", close.model_copy(update={"duration_minutes": 15})) is None
+        assert cache.find("default", close.model_copy(update={"topic": "Юбилей", "key_points": None})) is None
+        assert cache.find("other", close) is None
+
+        cache.put("default", close.model_copy(update={"topic": "Первый"}), "1")
+        cache.put("default", close.model_copy(update={"topic": "Второй"}), "2")
+        assert cache.find("default", sample_speech_request) is None
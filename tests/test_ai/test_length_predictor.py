@@ -0,0 +1,35 @@
+from ai.length_predictor import LengthPredictor
+import ai.serving_parameters
+
+
+class TestLengthPredictor:
+    """Тесты онлайн-предсказателя длины ответа"""
+
+    def test_prior_then_learned_estimates(self, sample_speech_request, monkeypatch):
+        """Проверяет априорную оценку, обучение по признакам и переход к оценке по языку"""
+
+        monkeypatch.setattr(ai.serving_parameters, "length_prior_tokens_per_minute", 300)
+        predictor = LengthPredictor(smoothing=0.5)
+        assert predictor.predict(sample_speech_request) == 1500
+
+        predictor.observe(sample_speech_request, 1000)
+        predictor.observe(sample_speech_request, 1200)
+
+        assert predictor.predict(sample_speech_request) == 1100
+        # Незнакомое сочетание признаков оценивается по токенам на минуту речи на этом языке
+        other = sample_speech_request.model_copy(update={"style": "casual", "duration_minutes": 2})
+        assert predictor.predict(other) == 440
+
+    def test_reports_error_of_prior_predictions(self, sample_speech_request):
+        """Проверяет, что ошибка считается по предсказаниям до обучения на запросе"""
+
+        predictor = LengthPredictor(smoothing=1.0)
+        predictor.observe(sample_speech_request, 1000)
+        predictor.observe(sample_speech_request, 1500)
+
+        stats = predictor.stats()
+        assert (stats.observations, stats.keys) == (2, 1)
+        # Ошибки: |1750 - 1000| и |1000 - 1500|
+        assert stats.mean_absolute_error == 625.0
+        assert stats.mean_absolute_percentage_error == 54.2
+        assert stats.recent_absolute_error == 500.0
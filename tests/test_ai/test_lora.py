@@ -0,0 +1,153 @@
+import json
+from contextlib import nullcontext
+from unittest.mock import Mock, patch
+
+import pytest
+import torch
+from safetensors.torch import save_file
+from transformers import LlamaConfig, LlamaForCausalLM
+
+from ai.lora import AdapterManager, load_adapter
+from ai.speech_generator import SpeechGenerator
+import ai.serving_parameters as serving_parameters
+
+TARGET_MODULES = ["self_attn.q_proj", "self_attn.v_proj", "mlp.down_proj"]
+
+
+def save_adapter(path, model, seed, rank=4, alpha=8, base_model="tiny-llama"):
+    """Сохраняет случайный LoRA-адаптер в формате PEFT для всех слоёв TARGET_MODULES"""
+    generator = torch.Generator().manual_seed(seed)
+    tensors = {}
+    for layer in range(model.config.num_hidden_layers):
+        for target in TARGET_MODULES:
+            name = f"model.layers.{layer}.{target}"
+            linear = model.get_submodule(name)
+            prefix = f"base_model.model.{name}"
+            tensors[f"{prefix}.lora_A.weight"] = torch.randn(rank, linear.in_features, generator=generator) * 0.1
+            tensors[f"{prefix}.lora_B.weight"] = torch.randn(linear.out_features, rank, generator=generator) * 0.1
+    path.mkdir()
+    save_file(tensors, str(path / "adapter_model.safetensors"))
+    config = {"peft_type": "LORA", "r": rank, "lora_alpha": alpha, "base_model_name_or_path": base_model}
+    (path / "adapter_config.json").write_text(json.dumps(config), encoding="utf-8")
+    return str(path)
+
+
+def merged(model, adapter_path):
+    """Копия модели с адаптером, влитым в веса: эталон для применения по строкам"""
+    reference = LlamaForCausalLM(model.config)
+    reference.load_state_dict(model.state_dict())
+    adapter = load_adapter(adapter_path)
+    with torch.no_grad():
+        for name, (a, b) in adapter.modules.items():
+            reference.get_submodule(name).weight += b @ a * adapter.scaling
+    return reference.eval()
+
+
+class TestLoRA:
+    """Тесты LoRA-адаптеров стилей с применением по строкам батча"""
+
+    @pytest.fixture
+    def tiny_model(self):
+        """Фикстура: маленькая модель со случайными весами"""
+        torch.manual_seed(0)
+        config = LlamaConfig(
+            vocab_size=128, hidden_size=64, intermediate_size=128, num_hidden_layers=2,
+            num_attention_heads=4, num_key_value_heads=4
+        )
+        return LlamaForCausalLM(config).eval()
+
+    def test_mixed_batch_matches_merged_weights(self, tiny_model, tmp_path):
+        """Тест: в одном батче каждая строка получает свой адаптер, строка без адаптера - базовую модель"""
+
+        first = save_adapter(tmp_path / "first", tiny_model, seed=1)
+        second = save_adapter(tmp_path / "second", tiny_model, seed=2)
+        input_ids = torch.randint(0, 128, (4, 6), generator=torch.Generator().manual_seed(3))
+        with torch.no_grad():
+            expected = [
+                merged(tiny_model, first)(input_ids[:1]).logits,
+                tiny_model(input_ids[1:2]).logits,
+                merged(tiny_model, second)(input_ids[2:3]).logits,
+                merged(tiny_model, first)(input_ids[3:]).logits,
+            ]
+
+            manager = AdapterManager(tiny_model, "tiny-llama", capacity=2)
+            with manager.activate([first, None, second, first]):
+                logits = tiny_model(input_ids).logits
+            # Вне activate адаптеры не действуют, но остаются загруженными
+            base_logits = tiny_model(input_ids).logits
+
+        for row, row_expected in enumerate(expected):
+            torch.testing.assert_close(logits[row:row + 1], row_expected, atol=1e-5, rtol=1e-4)
+        assert not torch.allclose(logits[0], logits[3]) and not torch.allclose(logits[0], base_logits[0])
+        # Хуки не меняют состав модулей и state_dict модели
+        assert list(tiny_model.state_dict()) == list(merged(tiny_model, first).state_dict())
+        assert manager.loaded == [first, second]
+
+    def test_uniform_adapter_applies_to_any_batch_size(self, tiny_model, tmp_path):
+        """Тест: один адаптер на все строки применяется ко всему батчу, в том числе размноженному"""
+
+        adapter = save_adapter(tmp_path / "adapter", tiny_model, seed=1, alpha=4)
+        input_ids = torch.randint(0, 128, (3, 5), generator=torch.Generator().manual_seed(4))
+        manager = AdapterManager(tiny_model, "tiny-llama", capacity=1)
+        with torch.no_grad(), manager.activate([adapter]):
+            logits = tiny_model(input_ids).logits
+
+        torch.testing.assert_close(logits, merged(tiny_model, adapter)(input_ids).logits, atol=1e-5, rtol=1e-4)
+
+    def test_lru_evicts_least_recently_used(self, tiny_model, tmp_path):
+        """Тест: при переполнении выгружается давно не использованный адаптер, но не адаптер текущего батча"""
+
+        paths = [save_adapter(tmp_path / f"adapter{index}", tiny_model, seed=index) for index in range(3)]
+        manager = AdapterManager(tiny_model, "tiny-llama", capacity=2)
+
+        for batch in ([paths[0]], [paths[1]], [paths[0]], [paths[2]]):
+            with manager.activate(batch):
+                pass
+
+        assert manager.loaded == [paths[0], paths[2]]
+        assert (manager.loads, manager.hits, manager.evictions) == (3, 1, 1)
+        assert all(paths[1] not in layer.adapters for layer in manager._layers.values())
+        assert manager.nbytes == 2 * load_adapter(paths[0]).nbytes
+        with pytest.raises(ValueError, match="lora_max_adapters"):
+            with manager.activate(paths):
+                pass
+
+    def test_adapter_for_other_model_is_not_used(self, tiny_model, tmp_path):
+        """Тест: адаптер другой базовой модели и недоступный адаптер не применяются"""
+
+        other = save_adapter(tmp_path / "other", tiny_model, seed=1, base_model="other-model")
+        manager = AdapterManager(tiny_model, "tiny-llama", capacity=2)
+
+        assert not manager.compatible(other)
+        assert not manager.compatible(str(tmp_path / "missing"))
+
+    def test_generator_batches_styles_with_adapters(
+        self, tmp_path, monkeypatch, sample_speech_request, sample_available_styles
+    ):
+        """Тест: стиль с адаптером описывается в промпте названием, а адаптеры передаются по строкам одного батча"""
+
+        adapter = tmp_path / "formal"
+        adapter.mkdir()
+        (adapter / "adapter_config.json").write_text(json.dumps({"r": 4}), encoding="utf-8")
+        monkeypatch.setattr(serving_parameters, "style_adapters", {"formal": str(adapter)})
+
+        generator = SpeechGenerator()
+        generator.model_loaded = True
+        generator.tokenizer = Mock(return_value=Mock(to=Mock(return_value={
+            "input_ids": torch.tensor([[1, 2, 3]] * 2), "attention_mask": torch.tensor([[1, 1, 1]] * 2)
+        })))
+        generator.tokenizer.eos_token_id = 0
+        generator.tokenizer.decode.return_value = "Речь"
+        generator.model = Mock()
+        generator.model.generate.return_value = torch.tensor([[1, 2, 3, 4]] * 2)
+
+        prompt = generator.generate_prompt(sample_speech_request, sample_available_styles)
+        assert "Стиль выступления: formal" in prompt
+        assert sample_available_styles["formal"] not in prompt
+
+        casual = sample_speech_request.model_copy(update={"style": "casual"})
+        with patch.object(AdapterManager, "activate", return_value=nullcontext()) as activate:
+            generator.generate_batch([sample_speech_request, casual], sample_available_styles)
+
+        activate.assert_called_once_with([str(adapter), None])
+        generator.model.generate.assert_called_once()
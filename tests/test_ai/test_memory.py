@@ -0,0 +1,92 @@
+import time
+
+import pytest
+from unittest.mock import Mock, patch
+
+import torch
+from transformers import LlamaConfig, LlamaForCausalLM
+
+from ai.memory import MemoryAccountant, RSSSampler, linear_trend, live_tensor_bytes, rss_bytes
+from ai.speech_generator import SpeechGenerator
+import ai.serving_parameters as serving_parameters
+
+
+class TestMemory:
+    """Тесты измерения памяти и загрузки модели в режиме low_memory"""
+
+    @pytest.fixture
+    def tiny_model_dir(self, tmp_path):
+        """Фикстура сохраняет маленькую модель в safetensors и возвращает путь и размер весов"""
+        config = LlamaConfig(
+            vocab_size=256, hidden_size=128, intermediate_size=256, num_hidden_layers=8,
+            num_attention_heads=4, num_key_value_heads=4
+        )
+        model = LlamaForCausalLM(config).to(torch.float16)
+        model.save_pretrained(tmp_path / "model")
+        return str(tmp_path / "model"), model.get_memory_footprint()
+
+    def test_rss_sampler_sees_peak(self):
+        """Тест: сэмплер фиксирует пик RSS от временного выделения памяти внутри блока"""
+
+        before = rss_bytes()
+        with RSSSampler(interval=0.001) as sampler:
+            data = bytearray(64 * 1024 ** 2)
+            data[::4096] = b"x" * len(data[::4096])
+            time.sleep(0.05)
+            del data
+
+        assert sampler.peak_bytes - before >= 32 * 1024 ** 2
+
+    def test_low_memory_load_honors_budget(self, tiny_model_dir, tmp_path, monkeypatch):
+        """Тест: в оперативной памяти не больше бюджета весов, остальные слои выгружены на диск"""
+
+        model_dir, model_bytes = tiny_model_dir
+        budget_bytes = model_bytes // 2
+        monkeypatch.setattr(serving_parameters, "low_memory", True)
+        monkeypatch.setattr(serving_parameters, "load_memory_budget_gb", budget_bytes / 1024 ** 3)
+        monkeypatch.setattr(serving_parameters, "offload_folder", str(tmp_path / "offload"))
+
+        generator = SpeechGenerator(model_dir)
+        generator.device = "cpu"
+        with patch("ai.speech_generator.AutoTokenizer.from_pretrained", return_value=Mock(get_vocab=Mock(return_value={}))):
+            generator.load_model()
+
+        resident_bytes = sum(
+            parameter.numel() * parameter.element_size()
+            for parameter in generator.model.parameters()
+            if parameter.device.type != "meta"
+        )
+        assert 0 < resident_bytes <= budget_bytes
+        assert any(name.startswith("model.layers.") for name in generator.offloaded_modules)
+        assert generator.load_peak_rss_bytes >= generator.load_rss_bytes > 0
+
+        output = generator.model.generate(torch.tensor([[1, 2, 3]]), max_new_tokens=2, do_sample=False)
+        assert output.shape == (1, 5)
+
+    def test_live_tensor_bytes_counts_shared_storage_once(self):
+        """Тест: подсчёт живых тензоров видит новый тензор, а его представления не удваивают объём"""
+
+        before = live_tensor_bytes()
+        tensor = torch.zeros(1024, 1024)
+        views = [tensor[:512], tensor.view(-1)]
+        assert live_tensor_bytes() - before == tensor.nbytes
+        del tensor, views
+        assert live_tensor_bytes() == before
+
+    def test_accountant_records_retained_tensors_and_trend(self):
+        """Тест: журнал памяти записывает удержанные тензоры, вложенные замеры не дублируются"""
+
+        accountant = MemoryAccountant(history_size=3)
+        leaked = []
+        for step in range(4):
+            with accountant.measure(f"запрос {step}"):
+                with accountant.measure("вложенный"):
+                    leaked.append(torch.ones(256, 1024))
+                    torch.ones(1024, 1024).sum()
+
+        records = accountant.records
+        assert [record.label for record in records] == ["запрос 1", "запрос 2", "запрос 3"]
+        assert all(record.retained_tensor_bytes == 1024 ** 2 for record in records)
+        assert all(record.peak_rss_bytes >= record.rss_before_bytes for record in records)
+        assert accountant.trend()[1] == 1024 ** 2
+        assert linear_trend([5, 5, 5]) == 0 and linear_trend([1]) == 0
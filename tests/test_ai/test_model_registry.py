@@ -0,0 +1,137 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from unittest.mock import Mock
+
+from ai.model_registry import ModelRegistry
+
+GB = 1024 ** 3
+
+
+def fake_loader(sizes):
+    """Загрузчик, возвращающий мок генератора с заданным объёмом памяти модели"""
+    loaded = []
+
+    def load(model_id):
+        generator = Mock()
+        generator.model_id = model_id
+        generator.model.get_memory_footprint.return_value = sizes[model_id]
+        loaded.append(model_id)
+        return generator
+
+    return load, loaded
+
+
+class TestModelRegistry:
+    """Тесты для реестра моделей"""
+
+    @pytest.fixture
+    def registry(self):
+        load, loaded = fake_loader({"small-id": 2 * GB, "large-id": 8 * GB, "medium-id": 4 * GB})
+        registry = ModelRegistry(
+            models={"small": "small-id", "large": "large-id", "medium": "medium-id"},
+            default_model="large",
+            routes=[(3, "small"), (10, "medium")],
+            memory_budget_bytes=12 * GB,
+            loader=load
+        )
+        registry.loaded_ids = loaded
+        return registry
+
+    def test_models_are_loaded_lazily(self, registry):
+        """Тест: модель загружается при первом обращении и переиспользуется"""
+
+        assert registry.loaded_models() == []
+        first = registry.get("small")
+        second = registry.get("small")
+
+        assert first is second
+        assert registry.loaded_ids == ["small-id"]
+        stats = registry.stats()["small"]
+        assert stats.loads == 1
+        assert stats.hits == 1
+        assert stats.memory_bytes == 2 * GB
+
+    def test_least_recently_used_model_is_evicted(self, registry):
+        """Тест: при превышении бюджета выгружается давно не использованная модель"""
+
+        registry.get("small")
+        registry.get("large")
+        registry.get("small")
+        registry.get("medium")
+
+        assert registry.loaded_models() == ["small", "medium"]
+        assert registry.stats()["large"].evictions == 1
+
+    def test_known_size_evicts_before_loading(self, registry):
+        """Тест: размер с прошлой загрузки освобождает память до повторной загрузки"""
+
+        registry.get("large")
+        registry.get("medium")
+        registry.get("small")
+        registry.get("large")
+
+        assert "large" in registry.loaded_models()
+        assert sum(registry.stats()[name].memory_bytes for name in registry.loaded_models()) <= 12 * GB
+
+    def test_routing_by_duration(self, registry, sample_speech_request):
+        """Тест: модель выбирается по длительности, явный выбор имеет приоритет"""
+
+        assert registry.resolve(sample_speech_request.model_copy(update={"duration_minutes": 2})) == "small"
+        assert registry.resolve(sample_speech_request.model_copy(update={"duration_minutes": 7})) == "medium"
+        assert registry.resolve(sample_speech_request.model_copy(update={"duration_minutes": 30})) == "large"
+        assert registry.resolve(sample_speech_request.model_copy(update={"duration_minutes": 2, "model": "large"})) == "large"
+
+    def test_unknown_model(self, registry, sample_speech_request):
+        """Тест ошибки при запросе несконфигурированной модели"""
+
+        with pytest.raises(ValueError, match="Модель 'ghost' не найдена"):
+            registry.resolve(sample_speech_request.model_copy(update={"model": "ghost"}))
+
+    def test_invalid_configuration(self):
+        """Тест ошибки при маршруте на несконфигурированную модель"""
+
+        with pytest.raises(ValueError):
+            ModelRegistry(models={"a": "a-id"}, default_model="a", routes=[(5, "b")])
+
+    def test_loading_does_not_block_loaded_models(self):
+        """Тест: пока модель загружается, загруженные модели и счётчики доступны, а загрузка одна на всех"""
+
+        release = threading.Event()
+        load, loaded = fake_loader({"small-id": GB, "large-id": GB})
+
+        def slow_load(model_id):
+            if model_id == "large-id":
+                assert release.wait(5)
+            return load(model_id)
+
+        registry = ModelRegistry(models={"small": "small-id", "large": "large-id"}, default_model="small", loader=slow_load)
+        small = registry.get("small")
+        with ThreadPoolExecutor(2) as pool:
+            waiting = [pool.submit(registry.get, "large") for _ in range(2)]
+            assert registry.get("small") is small
+            assert registry.loaded_models() == ["small"]
+            assert registry.stats()["large"].loads == 0
+            release.set()
+            first, second = [future.result(5) for future in waiting]
+
+        assert first is second
+        assert loaded == ["small-id", "large-id"]
+
+    def test_failed_load_is_reported_and_retried(self):
+        """Тест: ошибка загрузки достаётся вызвавшему, а следующий вызов загружает модель заново"""
+
+        attempts = []
+
+        def failing_load(model_id):
+            attempts.append(model_id)
+            if len(attempts) == 1:
+                raise RuntimeError("нет памяти")
+            return Mock()
+
+        registry = ModelRegistry(models={"a": "a-id"}, default_model="a", loader=failing_load)
+        with pytest.raises(RuntimeError, match="нет памяти"):
+            registry.get("a")
+        assert registry.get("a") is not None
+        assert attempts == ["a-id", "a-id"]
@@ -0,0 +1,146 @@
+from unittest.mock import Mock
+
+import pytest
+import torch
+from transformers import DynamicCache, LlamaConfig, LlamaForCausalLM
+
+from ai.quantized_cache import QuantizedKVCache, cache_nbytes, dequantize, new_cache, quantize
+from ai.speech_generator import SpeechGenerator
+import ai.serving_parameters as serving_parameters
+
+
+def relative_error(actual: torch.Tensor, expected: torch.Tensor) -> float:
+    return ((actual - expected).float().norm() / expected.float().norm()).item()
+
+
+class TestQuantizedCache:
+    """Тесты квантованного KV-кэша"""
+
+    @pytest.fixture
+    def tiny_model(self):
+        """Фикстура: маленькая модель со случайными весами"""
+        torch.manual_seed(0)
+        config = LlamaConfig(
+            vocab_size=128, hidden_size=128, intermediate_size=256, num_hidden_layers=2,
+            num_attention_heads=4, num_key_value_heads=4
+        )
+        return LlamaForCausalLM(config).eval()
+
+    @pytest.mark.parametrize("nbits, max_error", [(8, 0.01), (4, 0.15)])
+    def test_quantize_round_trip(self, nbits, max_error):
+        """Тест: ошибка восстановления ключей по каналам и значений по токенам, упаковка int4"""
+
+        states = torch.randn(2, 4, 64, 15, dtype=torch.float16)
+        for dim in (-2, -1):
+            quantized = quantize(states, nbits, dim)
+            restored = dequantize(quantized)
+            assert restored.shape == states.shape and restored.dtype == torch.float16
+            assert relative_error(restored, states) < max_error
+        # В int4 два значения в байте, нечётная ось дополняется
+        assert quantized.data.shape[-1] == (15 if nbits == 8 else 8)
+
+    @pytest.mark.parametrize("kv_format, max_ratio, max_error", [("int8", 0.4, 0.02), ("int4", 0.3, 0.2)])
+    def test_cache_is_smaller_and_close_to_full_precision(self, tiny_model, kv_format, max_ratio, max_error):
+        """Тест: кэш меньше обычного, а логиты шагов декодирования близки к кэшу в исходной точности"""
+
+        input_ids = torch.randint(0, 128, (2, 100), generator=torch.Generator().manual_seed(1))
+        continuation = torch.randint(0, 128, (2, 20), generator=torch.Generator().manual_seed(2))
+        caches = {"": DynamicCache(), kv_format: new_cache(tiny_model.config, kv_format, residual_length=16)}
+        logits = {}
+        with torch.no_grad():
+            for name, cache in caches.items():
+                tiny_model(input_ids=input_ids, past_key_values=cache, use_cache=True)
+                logits[name] = torch.cat([
+                    tiny_model(input_ids=continuation[:, step:step + 1], past_key_values=cache, use_cache=True).logits
+                    for step in range(continuation.shape[1])
+                ], dim=1)
+
+        assert isinstance(caches[kv_format], QuantizedKVCache)
+        assert caches[kv_format].get_seq_length() == 120
+        assert cache_nbytes(caches[kv_format]) < max_ratio * cache_nbytes(caches[""])
+        assert relative_error(logits[kv_format], logits[""]) < max_error
+
+    def test_generate_with_shared_prefill(self, tiny_model):
+        """Тест: квантованный кэш промпта размножается на несколько вариантов и дописывается в generate"""
+
+        input_ids = torch.randint(0, 128, (1, 40), generator=torch.Generator().manual_seed(3))
+        cache = new_cache(tiny_model.config, "int4", residual_length=16)
+        with torch.no_grad():
+            tiny_model(input_ids=input_ids[:, :-1], past_key_values=cache, use_cache=True)
+            cache.batch_repeat_interleave(3)
+            outputs = tiny_model.generate(
+                input_ids=input_ids.repeat(3, 1), attention_mask=torch.ones(3, 40, dtype=torch.long),
+                past_key_values=cache, max_new_tokens=8, do_sample=False, pad_token_id=0
+            )
+
+        assert outputs.shape == (3, 48)
+        assert cache.get_seq_length() == 47
+        assert all(block_keys.data.shape[0] == 3 for layer in cache.layers for block_keys, _ in layer.blocks)
+
+    @pytest.mark.parametrize("tokens_to_remove, blocks, residual", [(-1, 3, 1), (-18, 2, 0), (-10, 2, 8), (-60, 0, 0)])
+    def test_crop_keeps_prefix(self, tiny_model, tokens_to_remove, blocks, residual):
+        """Тест: обрезка отбрасывает целые блоки, разрезанный блок становится хвостом, кэш дописывается дальше"""
+
+        input_ids = torch.randint(0, 128, (1, 50), generator=torch.Generator().manual_seed(4))
+        cache = new_cache(tiny_model.config, "int8", residual_length=16)
+        with torch.no_grad():
+            tiny_model(input_ids=input_ids, past_key_values=cache, use_cache=True)
+        layer = cache.layers[0]
+        keys = torch.cat([dequantize(block_keys) for block_keys, _ in layer.blocks] + [layer.keys], dim=-2)
+
+        cache.crop(tokens_to_remove)
+
+        length = max(0, 50 + tokens_to_remove)
+        assert cache.get_seq_length() == length
+        assert (len(layer.blocks), layer.keys.shape[-2]) == (blocks, residual)
+        cropped = torch.cat([dequantize(block_keys) for block_keys, _ in layer.blocks] + [layer.keys], dim=-2)
+        assert torch.equal(cropped, keys[..., :length, :])
+        with torch.no_grad():
+            tiny_model(input_ids=input_ids[:, :20], past_key_values=cache, use_cache=True)
+        assert cache.get_seq_length() == length + 20
+
+    def test_crop_after_unaligned_prompt_and_decoding(self, tiny_model):
+        """Тест: после промпта не кратного residual_length и шагов декодирования обрезка сохраняет длину и позиции"""
+
+        input_ids = torch.randint(0, 128, (1, 90), generator=torch.Generator().manual_seed(5))
+        cache = new_cache(tiny_model.config, "int8", residual_length=16)
+        with torch.no_grad():
+            tiny_model(input_ids=input_ids[:, :50], past_key_values=cache, use_cache=True)
+            for step in range(50, 90):
+                tiny_model(input_ids=input_ids[:, step:step + 1], past_key_values=cache, use_cache=True)
+        layer = cache.layers[0]
+        assert all(block_keys.data.shape[-2] == 16 for block_keys, _ in layer.blocks)
+        keys = torch.cat([dequantize(block_keys) for block_keys, _ in layer.blocks] + [layer.keys], dim=-2)
+
+        cache.crop(-20)
+
+        assert cache.get_seq_length() == 70
+        cropped = torch.cat([dequantize(block_keys) for block_keys, _ in layer.blocks] + [layer.keys], dim=-2)
+        assert torch.equal(cropped, keys[..., :70, :])
+        with torch.no_grad():
+            tiny_model(input_ids=input_ids[:, 70:71], past_key_values=cache, use_cache=True)
+        restored = torch.cat([dequantize(block_keys) for block_keys, _ in layer.blocks] + [layer.keys], dim=-2)
+        assert cache.get_seq_length() == restored.shape[-2] == 71
+
+    def test_generator_uses_quantized_cache(self, monkeypatch, tiny_model, sample_speech_request, sample_available_styles):
+        """Тест: при kv_cache_format генерация получает квантованный кэш вместо статического"""
+
+        monkeypatch.setattr(serving_parameters, "kv_cache_format", "int8")
+        monkeypatch.setattr(serving_parameters, "static_cache", True)
+        generator = SpeechGenerator()
+        generator.model_loaded = True
+        generator.tokenizer = Mock(return_value=Mock(to=Mock(return_value={
+            "input_ids": torch.tensor([[1, 2, 3]]), "attention_mask": torch.tensor([[1, 1, 1]])
+        })))
+        generator.tokenizer.eos_token_id = 0
+        generator.tokenizer.decode.return_value = "Речь"
+        generator.model = Mock(config=tiny_model.config)
+        generator.model.generate.return_value = torch.tensor([[1, 2, 3, 4]])
+
+        generator.generate_speech(sample_speech_request, sample_available_styles)
+
+        cache = generator.model.generate.call_args.kwargs["past_key_values"]
+        assert isinstance(cache, QuantizedKVCache)
+        assert generator._static_cache is None
+        with pytest.raises(ValueError, match="int8, int4"):
+            new_cache(tiny_model.config, "int2", residual_length=16)
@@ -0,0 +1,102 @@
+import threading
+import time
+from unittest.mock import Mock
+
+import pytest
+
+from ai.scheduler import GenerationScheduler, run_batch
+import ai.serving_parameters
+
+
+class TestGenerationScheduler:
+    """Тесты для очереди генерации"""
+
+    def test_concurrent_requests_are_batched(self, sample_speech_request, monkeypatch):
+        """Тест объединения одновременных запросов к одной модели в один батч"""
+
+        monkeypatch.setattr(ai.serving_parameters, "batch_window_ms", 200)
+        monkeypatch.setattr(ai.serving_parameters, "batch_size", 4)
+        generator = Mock()
+        generator.generate_batch.side_effect = lambda requests, styles: [request.topic for request in requests]
+        scheduler = GenerationScheduler(styles_provider=dict)
+
+        futures = [
+            scheduler.submit(generator, sample_speech_request.model_copy(update={"topic": str(i)}))
+            for i in range(4)
+        ]
+
+        assert [future.result(timeout=5) for future in futures] == ["0", "1", "2", "3"]
+        generator.generate_batch.assert_called_once()
+        assert scheduler.queue_depth == 0
+
+    def test_batch_size_is_respected(self, sample_speech_request, monkeypatch):
+        """Тест ограничения размера батча"""
+
+        monkeypatch.setattr(ai.serving_parameters, "batch_window_ms", 0)
+        monkeypatch.setattr(ai.serving_parameters, "batch_size", 2)
+        release = threading.Event()
+        generator = Mock()
+
+        def generate_batch(requests, styles):
+            release.wait(5)
+            return ["ok"] * len(requests)
+
+        generator.generate_batch.side_effect = generate_batch
+        generator.generate_speech.side_effect = lambda request, styles: generate_batch([request], styles)[0]
+        scheduler = GenerationScheduler(styles_provider=dict)
+
+        futures = [scheduler.submit(generator, sample_speech_request) for _ in range(5)]
+        release.set()
+
+        assert all(future.result(timeout=5) == "ok" for future in futures)
+        for call in generator.generate_batch.call_args_list:
+            assert len(call.args[0]) <= 2
+
+    @pytest.mark.parametrize("aging, expected", [(0, ["1", "15"]), (10 ** 6, ["15", "1"])])
+    def test_shortest_job_first_with_aging(self, sample_speech_request, monkeypatch, aging, expected):
+        """Тест выбора короткой речи раньше длинной и старения, не дающего длинной голодать"""
+
+        monkeypatch.setattr(ai.serving_parameters, "batch_window_ms", 0)
+        monkeypatch.setattr(ai.serving_parameters, "batch_size", 1)
+        monkeypatch.setattr(ai.serving_parameters, "sjf_aging_tokens_per_second", aging)
+        started, release = threading.Event(), threading.Event()
+        order = []
+
+        def generate_speech(request, styles):
+            started.set()
+            release.wait(5)
+            order.append(str(request.duration_minutes))
+            return "ok"
+
+        generator = Mock()
+        generator.generate_speech.side_effect = generate_speech
+        scheduler = GenerationScheduler(styles_provider=dict)
+
+        futures = [scheduler.submit(generator, sample_speech_request)]
+        started.wait(5)
+        futures.append(scheduler.submit(generator, sample_speech_request.model_copy(update={"duration_minutes": 15})))
+        time.sleep(0.05)
+        futures.append(scheduler.submit(generator, sample_speech_request.model_copy(update={"duration_minutes": 1})))
+        release.set()
+
+        assert all(future.result(timeout=5) == "ok" for future in futures)
+        assert order[1:] == expected
+
+    def test_run_batch_isolates_failures(self, sample_speech_request):
+        """Тест изоляции ошибки одного запроса при падении батча"""
+
+        generator = Mock()
+        generator.generate_batch.side_effect = ValueError("Стиль не найден")
+        bad_request = sample_speech_request.model_copy(update={"style": "unknown"})
+
+        def generate_speech(request, styles):
+            if request.style == "unknown":
+                raise ValueError("Стиль не найден")
+            return "ok"
+
+        generator.generate_speech.side_effect = generate_speech
+
+        results = run_batch(generator, [sample_speech_request, bad_request], {})
+
+        assert results[0] == "ok"
+        assert isinstance(results[1], ValueError)
@@ -0,0 +1,79 @@
+import json
+import time
+from unittest.mock import Mock
+
+import pytest
+
+import ai.serving_parameters as serving_parameters
+from ai.serving_profile import load_profile, save_profile
+from autotune_cli import Measurement, choose, measure, pareto_front, synthetic_requests
+
+
+def measurement(throughput, p95, errors=0):
+    """Замер с заданными пропускной способностью и p95"""
+    return Measurement(
+        parameters={"batch_size": throughput}, requests=10, errors=errors, seconds=1.0,
+        throughput_rps=throughput, tokens_per_second=0.0, latency_p50_ms=p95 / 2,
+        latency_p95_ms=p95, latency_p99_ms=p95
+    )
+
+
+class TestServingProfile:
+    """Тесты профиля параметров обслуживания и его подбора"""
+
+    def test_profile_round_trip(self, tmp_path, monkeypatch):
+        """Проверяет, что профиль применяет только настраиваемые параметры."""
+        monkeypatch.setattr(serving_parameters, "batch_size", 8)
+        monkeypatch.setattr(serving_parameters, "model_dtype", "float16")
+        monkeypatch.setattr(serving_parameters, "static_cache", False)
+        path = str(tmp_path / "profile.json")
+
+        assert load_profile(path) == {}
+        save_profile(path, "tiny", {"batch_size": 4, "model_dtype": "bfloat16", "static_cache": True}, [])
+        assert json.loads(open(path, encoding="utf-8").read())["model"] == "tiny"
+
+        assert load_profile(path) == {"batch_size": 4, "model_dtype": "bfloat16"}
+        assert (serving_parameters.batch_size, serving_parameters.model_dtype) == (4, "bfloat16")
+        assert serving_parameters.static_cache is False
+
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("{")
+        with pytest.raises(ValueError):
+            load_profile(path)
+
+    def test_pareto_front_and_choice(self):
+        """Проверяет фронт Парето по пропускной способности и p95 и выбор конфигурации."""
+        fast_slow = measurement(30, 900)
+        balanced = measurement(25, 300)
+        low_latency = measurement(10, 200)
+        dominated = measurement(20, 400)
+        failed = measurement(50, 100, errors=1)
+
+        front = pareto_front([fast_slow, balanced, low_latency, dominated, failed])
+
+        assert front == [fast_slow, balanced, low_latency]
+        assert choose(front) is balanced
+        assert choose(front, max_p95_ms=250) is low_latency
+        assert choose(front, max_p95_ms=100) is None
+
+    def test_measure_batches_through_scheduler(self, monkeypatch):
+        """Проверяет, что замер проходит через очередь генерации с заданным размером батча."""
+        monkeypatch.setattr(serving_parameters, "batch_size", 4)
+        monkeypatch.setattr(serving_parameters, "batch_window_ms", 50)
+        generator = Mock()
+
+        def generate_batch(requests, styles):
+            time.sleep(0.01)
+            return ["речь"] * len(requests)
+
+        generator.generate_batch.side_effect = generate_batch
+        generator.generate_speech.side_effect = lambda request, styles: generate_batch([request], styles)[0]
+        requests = synthetic_requests(8, ["formal"])
+
+        result = measure(generator, requests, {"formal": "Формальный"}, {"batch_size": 4})
+
+        assert requests == synthetic_requests(8, ["formal"])
+        assert (result.requests, result.errors) == (8, 0)
+        assert generator.generate_batch.call_count == 2
+        assert result.throughput_rps > 0
+        assert result.latency_p50_ms <= result.latency_p95_ms <= result.latency_p99_ms
@@ -0,0 +1,135 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import ai.model_parameters as model_parameters
+import ai.serving_parameters as serving_parameters
+from ai.sidecar import ShmRing, SidecarCrashed, SidecarGenerator
+from schemas.model import SpeechRequest
+
+FAKE_FACTORY = "sidecar_fakes:FakeGenerator"
+STYLES = {"formal": "Формальный стиль", "casual": "Неформальный стиль"}
+
+
+@pytest.fixture
+def sidecar():
+    """Фикстура: процесс генерации с генератором-заглушкой"""
+    generator = SidecarGenerator("fake", factory=FAKE_FACTORY)
+    yield generator
+    generator.close()
+
+
+class TestShmRing:
+    """Тесты кольцевого буфера в общей памяти"""
+
+    def test_wraps_around_and_reports_full(self):
+        """Проверяет перенос записи через конец буфера и отказ при нехватке места."""
+        writer = ShmRing(capacity=16)
+        reader = ShmRing(writer.name)
+        try:
+            first = writer.write(b"0123456789")
+            assert reader.read(*first) == b"0123456789"
+            second = writer.write(b"abcdefghij")
+            assert second == (10, 10)
+            assert writer.write(b"klmnopq") is None
+            assert reader.read(*second) == b"abcdefghij"
+            assert writer.write(b"x" * 16) == (20, 16)
+        finally:
+            reader.close()
+            writer.close()
+
+
+class TestSidecarGenerator:
+    """Тесты генерации в отдельном процессе"""
+
+    def test_generation_streaming_and_errors(self, sidecar, monkeypatch):
+        """Проверяет генерацию, поток, передачу через буфер, параметры генерации и ошибки запроса."""
+        monkeypatch.setattr(model_parameters, "temperature", 0.3)
+        long_instructions = "Подробнее о каждом отделе. " * 1000
+        request = SpeechRequest(topic="Итоги года", duration_minutes=3, style="formal",
+                                custom_instructions=long_instructions)
+
+        speech = sidecar.generate_speech(request, STYLES)
+        assert speech == "Формальный стиль: Итоги года" + long_instructions
+        assert (speech.prompt_tokens, speech.completion_tokens, speech.score) == (3, 4, 0.3)
+
+        chunks = []
+        streamed = sidecar.generate_speech(request.model_copy(update={"custom_instructions": None}), STYLES,
+                                           on_text=chunks.append)
+        assert chunks == ["Формальный стиль", ": ", "Итоги года", ""]
+        assert streamed == "".join(chunks)
+
+        batch = sidecar.generate_batch([request, request.model_copy(update={"style": "casual"})], STYLES)
+        assert [speech.split(":")[0] for speech in batch] == ["Формальный стиль", "Неформальный стиль"]
+        assert sidecar.token_budget(request, STYLES).custom_instructions_tokens == len(long_instructions)
+        assert [step.style for step in sidecar.warm_up(STYLES)] == ["formal", "casual"]
+        with pytest.raises(ValueError):
+            sidecar.generate_speech(request.model_copy(update={"style": "ghost"}), STYLES)
+        assert sidecar.restarts == 0
+
+    def test_crash_fails_started_calls_and_requeues_queued(self, sidecar):
+        """Проверяет перезапуск после падения: начатый вызов завершается ошибкой, ещё не начатый - повторяется."""
+        request = SpeechRequest(topic="crash slowly", duration_minutes=3, style="formal")
+
+        with ThreadPoolExecutor(2) as pool:
+            crashing = pool.submit(sidecar.generate_speech, request, STYLES)
+            time.sleep(0.2)
+            queued = pool.submit(sidecar.generate_speech, request.model_copy(update={"topic": "в очереди"}), STYLES)
+            with pytest.raises(SidecarCrashed):
+                crashing.result(10)
+            assert queued.result(10) == "Формальный стиль: в очереди"
+        assert sidecar.restarts == 1
+
+        chunks = []
+        with pytest.raises(SidecarCrashed):
+            sidecar.generate_speech(request.model_copy(update={"topic": "crash after chunk"}), STYLES,
+                                    on_text=chunks.append)
+        assert chunks == ["Формальный стиль"]
+
+        # Процесс перезапущен без ожидания следующего запроса
+        after = request.model_copy(update={"topic": "после падения"})
+        assert sidecar.generate_speech(after, STYLES) == "Формальный стиль: после падения"
+        assert sidecar.restarts == 2
+        assert sidecar.model_loaded
+
+    def test_hung_call_times_out_and_restarts(self, sidecar, monkeypatch):
+        """Проверяет, что бюджет считается во время генерации, а зависший вызов завершается по таймауту."""
+        monkeypatch.setattr(serving_parameters, "sidecar_call_timeout_s", 1.0)
+        request = SpeechRequest(topic="hang", duration_minutes=3, style="formal")
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(1) as pool:
+            hung = pool.submit(sidecar.generate_speech, request, STYLES)
+            time.sleep(0.2)
+            # Бюджет с действующими параметрами не ждёт за генерацией
+            assert sidecar.token_budget(request, STYLES).planned_output_tokens == model_parameters.max_new_tokens
+            with pytest.raises(SidecarCrashed):
+                hung.result(10)
+        assert time.monotonic() - started < 10
+
+        after = request.model_copy(update={"topic": "после зависания"})
+        assert sidecar.generate_speech(after, STYLES) == "Формальный стиль: после зависания"
+        assert sidecar.restarts == 1
+
+    def test_queued_calls_wait_behind_long_generation(self, sidecar, monkeypatch):
+        """Проверяет, что вызовы в очереди за долгой исправной генерацией не считаются зависшими."""
+        monkeypatch.setattr(serving_parameters, "sidecar_call_timeout_s", 1.0)
+        request = SpeechRequest(topic="slow", duration_minutes=3, style="formal")
+
+        with ThreadPoolExecutor(3) as pool:
+            slow = pool.submit(sidecar.generate_speech, request, STYLES, on_text=lambda text: None)
+            time.sleep(0.2)
+            queued = pool.submit(sidecar.generate_speech, request.model_copy(update={"topic": "в очереди"}), STYLES)
+            # Бюджет с изменёнными параметрами выполняется в очереди, за генерацией
+            monkeypatch.setattr(model_parameters, "max_new_tokens", 77)
+            budget = pool.submit(sidecar.token_budget, request, STYLES)
+            assert slow.result(10) == "Формальный стиль: slow"
+            assert queued.result(10) == "Формальный стиль: в очереди"
+            assert budget.result(10).planned_output_tokens == 77
+        assert sidecar.restarts == 0
+
+    def test_failed_model_load_is_reported(self):
+        """Проверяет, что ошибка загрузки модели в процессе генерации видна при запуске."""
+        with pytest.raises(RuntimeError, match="Модель не найдена"):
+            SidecarGenerator("broken", factory=FAKE_FACTORY)
@@ -0,0 +1,117 @@
+import asyncio
+from concurrent.futures import Future
+
+import ai.model_parameters
+from ai.singleflight import SingleFlight, coalescing_key
+
+
+class TestCoalescingKey:
+    """Тесты для ключа объединения запросов"""
+
+    def test_sampling_without_seed_is_not_coalesced(self, sample_speech_request, monkeypatch):
+        """Тест: случайная генерация без seed не объединяется"""
+        monkeypatch.setattr(ai.model_parameters, "do_sample", True)
+        assert coalescing_key(sample_speech_request, "стиль", "model") is None
+
+    def test_same_inputs_give_same_key(self, sample_speech_request, monkeypatch):
+        """Тест: одинаковые запрос, стиль и настройки дают одинаковый ключ"""
+        monkeypatch.setattr(ai.model_parameters, "do_sample", False)
+        key = coalescing_key(sample_speech_request, "стиль", "model")
+        assert key == coalescing_key(sample_speech_request.model_copy(), "стиль", "model")
+        assert key != coalescing_key(sample_speech_request, "другой стиль", "model")
+
+    def test_settings_change_key(self, sample_speech_request, monkeypatch):
+        """Тест: изменение параметров генерации даёт новый ключ"""
+        sample_speech_request.seed = 42
+        key = coalescing_key(sample_speech_request, "стиль", "model")
+        monkeypatch.setattr(ai.model_parameters, "temperature", 0.2)
+        assert coalescing_key(sample_speech_request, "стиль", "model") != key
+
+
+class TestSingleFlight:
+    """Тесты для объединения одновременных генераций"""
+
+    def test_waiters_share_one_generation(self):
+        """Тест: ожидающие с одним ключом получают результат одной генерации"""
+
+        async def scenario():
+            singleflight = SingleFlight()
+            submitted = []
+
+            def submit(on_text):
+                future = Future()
+                submitted.append(future)
+                return future
+
+            first = singleflight.run("key", submit)
+            second = singleflight.run("key", submit)
+            waiters = asyncio.gather(first.wait(), second.wait())
+            await asyncio.sleep(0)
+            submitted[0].set_result("речь")
+            results = await waiters
+            return submitted, results, singleflight.in_flight
+
+        submitted, results, in_flight = asyncio.run(scenario())
+        assert len(submitted) == 1
+        assert results == ["речь", "речь"]
+        assert in_flight == 0
+
+    def test_disconnected_waiter_does_not_cancel_others(self):
+        """Тест: отключение одного клиента не отменяет генерацию для остальных"""
+
+        async def scenario():
+            singleflight = SingleFlight()
+            future = Future()
+            leaving = asyncio.ensure_future(singleflight.run("key", lambda on_text: future).wait())
+            staying = asyncio.ensure_future(singleflight.run("key", lambda on_text: future).wait())
+            await asyncio.sleep(0)
+            leaving.cancel()
+            await asyncio.sleep(0)
+            cancelled = future.cancelled()
+            future.set_result("речь")
+            return cancelled, await staying
+
+        cancelled, result = asyncio.run(scenario())
+        assert cancelled is False
+        assert result == "речь"
+
+    def test_last_waiter_leaving_cancels_queued_generation(self):
+        """Тест: если ждать больше некому, запрос снимается из очереди"""
+
+        async def scenario():
+            future = Future()
+            waiter = asyncio.ensure_future(SingleFlight().run("key", lambda on_text: future).wait())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.sleep(0)
+            return future.cancelled()
+
+        assert asyncio.run(scenario()) is True
+
+    def test_late_stream_subscriber_gets_all_chunks(self):
+        """Тест: присоединившийся позже клиент получает поток с начала"""
+
+        async def scenario():
+            singleflight = SingleFlight()
+            future = Future()
+            callbacks = []
+
+            def submit(on_text):
+                callbacks.append(on_text)
+                return future
+
+            first = singleflight.run("key", submit, stream=True)
+            callbacks[0]("Добрый ")
+            await asyncio.sleep(0)
+            second = singleflight.run("key", submit, stream=True)
+
+            async def collect(flight):
+                return "".join([chunk async for chunk in flight.stream()])
+
+            readers = asyncio.gather(collect(first), collect(second))
+            await asyncio.sleep(0)
+            callbacks[0]("день!")
+            future.set_result("Добрый день!")
+            return await readers
+
+        assert asyncio.run(scenario()) == ["Добрый день!", "Добрый день!"]
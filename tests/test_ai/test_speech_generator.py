@@ -1,8 +1,15 @@
+import sys
+import threading
+
 import pytest
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
 import torch
+from tokenizers import Tokenizer, models, pre_tokenizers
+from transformers import PreTrainedTokenizerFast
 from ai.speech_generator import SpeechGenerator
+import ai.model_parameters as model_parameters
+import ai.serving_parameters as serving_parameters
 
 
 class TestSpeechGenerator:
@@ -14,16 +21,19 @@ class TestSpeechGenerator:
         generator = SpeechGenerator()
         generator.model_loaded = True
 
-        input_data = {
-            'input_ids': torch.tensor([[1, 2, 3]]),
-            'attention_mask': torch.tensor([[1, 1, 1]])
-        }
-
-        mock_inputs = Mock()
-        mock_inputs.to.return_value = input_data
+        def tokenize(prompts, **kwargs):
+            # Как настоящий токенизатор: по строке входа на каждый промпт
+            input_data = {
+                'input_ids': torch.tensor([[1, 2, 3]] * len(prompts)),
+                'attention_mask': torch.tensor([[1, 1, 1]] * len(prompts))
+            }
+            mock_inputs = Mock()
+            mock_inputs.to.return_value = input_data
+            return mock_inputs
 
         generator.tokenizer = Mock()
-        generator.tokenizer.return_value = mock_inputs
+        generator.tokenizer.side_effect = tokenize
+        generator.tokenizer.eos_token_id = 0
         generator.tokenizer.decode.return_value = "<|assistant|>\nТестовая сгенерированная речь<|end|>"
 
         generator.model = Mock()
@@ -76,3 +86,283 @@ class TestSpeechGenerator:
 
         with pytest.raises(Exception):
             speech_generator.generate_speech(sample_speech_request, sample_available_styles)
+
+    def test_generate_batch_decodes_only_new_tokens(self, speech_generator, sample_speech_request, sample_available_styles):
+        """Тест батчевой генерации: каждый ответ декодируется без токенов промпта"""
+
+        speech_generator.model.generate.return_value = torch.tensor([[1, 2, 3, 4, 5], [1, 2, 3, 6, 7]])
+        speech_generator.tokenizer.decode.side_effect = lambda tokens, **kwargs: f"речь {tokens.tolist()}<|end|>"
+
+        result = speech_generator.generate_batch([sample_speech_request, sample_speech_request], sample_available_styles)
+
+        assert result == ["речь [4, 5]", "речь [6, 7]"]
+        assert [(speech.prompt_tokens, speech.completion_tokens) for speech in result] == [(3, 2), (3, 2)]
+        prompts = speech_generator.tokenizer.call_args.args[0]
+        assert len(prompts) == 2
+        speech_generator.model.generate.assert_called_once()
+
+    def test_generate_batch_groups_request_overrides(self, speech_generator, sample_speech_request, sample_available_styles):
+        """Тест собственных параметров генерации: запросы с разными параметрами генерируются отдельными вызовами"""
+
+        degraded = sample_speech_request.model_copy(update={"max_new_tokens": 256, "do_sample": False})
+
+        speech_generator.generate_batch([sample_speech_request, degraded, sample_speech_request], sample_available_styles)
+
+        calls = [call.kwargs for call in speech_generator.model.generate.call_args_list]
+        assert [(len(call["input_ids"]), call["max_new_tokens"], call["do_sample"]) for call in calls] == [
+            (2, model_parameters.max_new_tokens, model_parameters.do_sample), (1, 256, False)
+        ]
+
+    def test_generate_structured_sections_in_one_batch(self, speech_generator, sample_speech_request, sample_available_styles):
+        """Тест структурного режима: план, затем все разделы одним батчем"""
+
+        sample_speech_request.structured = True
+        speech_generator.model.generate.side_effect = [
+            torch.tensor([[1, 2, 3, 9]]),
+            torch.tensor([[1, 2, 3, 4], [1, 2, 3, 5], [1, 2, 3, 6]])
+        ]
+        texts = {9: "1. Приветствие", 4: "Вступление", 5: "Основная часть", 6: "Заключение"}
+        speech_generator.tokenizer.decode.side_effect = lambda tokens, **kwargs: texts[tokens.tolist()[0]]
+
+        result = speech_generator.generate_speech(sample_speech_request, sample_available_styles)
+
+        assert result == "Вступление\n\nОсновная часть\n\nЗаключение"
+        assert result.prompt_tokens == 3 * (1 + len(SpeechGenerator.SECTION_PROMPTS))
+        assert result.completion_tokens == 1 + len(SpeechGenerator.SECTION_PROMPTS)
+        assert speech_generator.model.generate.call_count == 2
+        section_prompts = speech_generator.tokenizer.call_args.args[0]
+        assert len(section_prompts) == len(SpeechGenerator.SECTION_PROMPTS)
+        assert all("1. Приветствие" in prompt for prompt in section_prompts)
+        section_call = speech_generator.model.generate.call_args_list[1]
+        assert section_call.kwargs["max_new_tokens"] == model_parameters.max_new_tokens // 3
+
+    def test_completion_tokens_exclude_padding_after_eos(
+        self, speech_generator, sample_speech_request, sample_available_styles, monkeypatch
+    ):
+        """Тест: паддинг после EOS не входит в число сгенерированных токенов"""
+
+        monkeypatch.setattr(model_parameters, "settings_version", 7)
+        speech_generator.model.generate.return_value = torch.tensor([[1, 2, 3, 4, 5, 7], [1, 2, 3, 6, 0, 0]])
+        speech_generator.tokenizer.decode.return_value = "речь"
+
+        result = speech_generator.generate_batch([sample_speech_request, sample_speech_request], sample_available_styles)
+
+        assert [speech.completion_tokens for speech in result] == [3, 2]
+        assert result[1].settings_version == 7
+        assert result[0].generation_seconds >= 0
+
+    def test_stop_tokens_strings_and_tokens_saved(
+        self, speech_generator, sample_speech_request, sample_available_styles, monkeypatch
+    ):
+        """Тест: <|end|> завершает ответ, текст обрезается по стоп-строке, сэкономленные токены считаются"""
+
+        monkeypatch.setattr(serving_parameters, "stop_strings", ["\n\nПримечание:"])
+        speech_generator.tokenizer.get_vocab.return_value = {"<|end|>": 9, "<|endoftext|>": 0}
+        speech_generator.stop_token_ids = speech_generator._find_stop_token_ids()
+        speech_generator.model.generate.return_value = torch.tensor([[1, 2, 3, 4, 9, 0], [1, 2, 3, 4, 5, 6]])
+        speech_generator.tokenizer.decode.return_value = "Речь.\n\nПримечание: для автора"
+
+        result = speech_generator.generate_batch([sample_speech_request, sample_speech_request], sample_available_styles)
+
+        kwargs = speech_generator.model.generate.call_args.kwargs
+        assert kwargs["eos_token_id"] == [0, 9]
+        criteria = kwargs["stopping_criteria"][0]
+        assert [speech.completion_tokens for speech in result] == [2, 3]
+        assert [speech.stop_reason for speech in result] == ["eos", "length"]
+        assert result[0] == "Речь."
+
+        # Вторую строку критерий остановил на втором токене
+        criteria.stops[1] = (2, "stop_string")
+        speech = speech_generator._speech_text(torch.tensor([5, 6, 0]), 3, criteria.stops[1], 100, 1.0)
+        assert (speech.completion_tokens, speech.stop_reason, speech.tokens_saved) == (2, "stop_string", 98)
+
+    def test_static_cache_used_for_single_sequence(
+        self, speech_generator, sample_speech_request, sample_available_styles, monkeypatch
+    ):
+        """Тест статического KV-кэша: выделяется один раз и ограничивает длину ответа"""
+
+        monkeypatch.setattr(serving_parameters, "static_cache", True)
+        monkeypatch.setattr(model_parameters, "max_length", 1000)
+
+        with patch('ai.speech_generator.StaticCache') as static_cache:
+            speech_generator.generate_speech(sample_speech_request, sample_available_styles)
+            speech_generator.generate_speech(sample_speech_request, sample_available_styles)
+
+        static_cache.assert_called_once()
+        static_cache.return_value.reset.assert_called_once()
+        kwargs = speech_generator.model.generate.call_args.kwargs
+        assert kwargs["past_key_values"] is static_cache.return_value
+        assert kwargs["max_new_tokens"] == 1000 - 3
+        assert kwargs["disable_compile"] is True
+
+    def test_static_cache_fits_max_new_tokens_in_buckets(
+        self, speech_generator, sample_speech_request, sample_available_styles, monkeypatch
+    ):
+        """Тест статического KV-кэша: размер - промпт и max_new_tokens, округлённые до степени двойки"""
+
+        monkeypatch.setattr(serving_parameters, "static_cache", True)
+        monkeypatch.setattr(model_parameters, "max_length", 2048)
+        monkeypatch.setattr(model_parameters, "max_new_tokens", 2048)
+        speech_generator.model.config.max_position_embeddings = 8192
+
+        with patch('ai.speech_generator.StaticCache') as static_cache:
+            speech_generator.generate_speech(sample_speech_request, sample_available_styles)
+            speech_generator.generate_speech(sample_speech_request, sample_available_styles)
+
+        static_cache.assert_called_once()
+        assert static_cache.call_args.kwargs["max_cache_len"] == 4096
+        assert speech_generator.model.generate.call_args.kwargs["max_new_tokens"] == 2048
+
+    def test_static_cache_not_used_for_batches(
+        self, speech_generator, sample_speech_request, sample_available_styles, monkeypatch
+    ):
+        """Тест: батчи из нескольких запросов генерируются с динамическим кэшем"""
+
+        monkeypatch.setattr(serving_parameters, "static_cache", True)
+        speech_generator.model.generate.return_value = torch.tensor([[1, 2, 3, 4], [1, 2, 3, 5]])
+
+        speech_generator.generate_batch([sample_speech_request, sample_speech_request], sample_available_styles)
+
+        assert "past_key_values" not in speech_generator.model.generate.call_args.kwargs
+
+    def test_candidates_share_one_prefill_and_are_ranked(
+        self, speech_generator, sample_speech_request, sample_available_styles
+    ):
+        """Тест нескольких вариантов: один проход по промпту, кэш размножается, варианты ранжируются"""
+
+        sample_speech_request.n = 3
+        sample_speech_request.rank = True
+        sample_speech_request.key_points = ["Инновации"]
+        speech_generator.model.generate.return_value = torch.tensor([[1, 2, 3, 4, 0], [1, 2, 3, 5, 6], [1, 2, 3, 7, 0]])
+        texts = {4: "Привет", 5: "Инновации и рост", 7: "Инновации"}
+        speech_generator.tokenizer.decode.side_effect = lambda tokens, **kwargs: texts[tokens.tolist()[0]]
+
+        with patch('ai.speech_generator.DynamicCache') as dynamic_cache:
+            result = speech_generator.generate_speech(sample_speech_request, sample_available_styles)
+
+        prefill = speech_generator.model.call_args.kwargs
+        assert prefill["input_ids"].tolist() == [[1, 2]]
+        assert prefill["past_key_values"] is dynamic_cache.return_value
+        dynamic_cache.return_value.batch_repeat_interleave.assert_called_once_with(3)
+        speech_generator.model.generate.assert_called_once()
+        kwargs = speech_generator.model.generate.call_args.kwargs
+        assert kwargs["input_ids"].tolist() == [[1, 2, 3]] * 3
+        assert kwargs["past_key_values"] is dynamic_cache.return_value
+        assert kwargs["do_sample"] is True
+
+        # Лучший вариант покрывает ключевой момент и ближе всех к длительности
+        assert [str(candidate) for candidate in result.candidates] == ["Инновации и рост", "Инновации", "Привет"]
+        assert result is result.candidates[0]
+        assert [candidate.completion_tokens for candidate in result.candidates] == [2, 2, 2]
+        scores = [candidate.score for candidate in result.candidates]
+        assert scores == sorted(scores, reverse=True)
+
+    def test_candidates_limit_and_streaming(self, speech_generator, sample_speech_request, sample_available_styles):
+        """Тест: количество вариантов ограничено, потоковая генерация нескольких вариантов не поддерживается"""
+
+        sample_speech_request.n = serving_parameters.max_candidates + 1
+        with pytest.raises(ValueError):
+            speech_generator.generate_speech(sample_speech_request, sample_available_styles)
+
+        sample_speech_request.n = 2
+        with pytest.raises(ValueError):
+            speech_generator.generate_speech(sample_speech_request, sample_available_styles, on_text=print)
+
+    def test_warm_up_covers_lengths_and_batches_with_one_style(
+        self, speech_generator, sample_available_styles, monkeypatch
+    ):
+        """Тест прогрева: генерация на каждую длину промпта и размер батча одним стилем без адаптера"""
+
+        monkeypatch.setattr(serving_parameters, "warmup_prompt_tokens", [64, 512])
+        monkeypatch.setattr(serving_parameters, "warmup_batch_sizes", [1, 4])
+        monkeypatch.setattr(serving_parameters, "warmup_max_new_tokens", 8)
+        first_style = next(iter(sample_available_styles))
+        monkeypatch.setattr(serving_parameters, "style_adapters", {first_style: "adapters/first"})
+        monkeypatch.setattr(speech_generator, "count_tokens", lambda text: len(text.split()))
+        speech_generator.model.generate.side_effect = lambda **kwargs: torch.tensor(
+            [[1, 2, 3, 4]] * kwargs["input_ids"].shape[0]
+        )
+
+        steps = speech_generator.warm_up(sample_available_styles)
+
+        assert len(steps) == 2 * 2
+        [style] = {step.style for step in steps}
+        assert style in sample_available_styles and style != first_style
+        assert [step.batch_size for step in steps] == [1, 4, 1, 4]
+        prompts = [call.args[0] for call in speech_generator.tokenizer.call_args_list if isinstance(call.args[0], list)]
+        assert len(prompts[-1]) == 4
+        assert len(prompts[2][0].split()) > len(prompts[0][0].split())
+        assert all(call.kwargs["max_new_tokens"] == 8 for call in speech_generator.model.generate.call_args_list)
+
+    def test_token_budget_breakdown_and_limits(
+        self, speech_generator, sample_speech_request, sample_available_styles, monkeypatch
+    ):
+        """Тест бюджета токенов: разбивка промпта по частям и проверка лимитов"""
+
+        monkeypatch.setattr(model_parameters, "max_length", 2048)
+        monkeypatch.setattr(model_parameters, "max_new_tokens", 512)
+        monkeypatch.setattr(speech_generator, "count_tokens", lambda text: len(text.split()))
+        speech_generator.model.config.max_position_embeddings = 4096
+
+        budget = speech_generator.token_budget(sample_speech_request, sample_available_styles)
+
+        full_prompt = speech_generator.generate_prompt(sample_speech_request, sample_available_styles)
+        assert budget.prompt_tokens == len(full_prompt.split())
+        assert budget.base_tokens + budget.key_points_tokens + budget.custom_instructions_tokens == budget.prompt_tokens
+        assert budget.custom_instructions_tokens >= len(sample_speech_request.custom_instructions.split())
+        assert budget.planned_output_tokens == 512
+        assert budget.context_tokens == 4096
+        assert budget.fits
+        assert budget.predicted_seconds is None
+
+        sample_speech_request.custom_instructions = "слово " * 3000
+        assert not speech_generator.token_budget(sample_speech_request, sample_available_styles).fits
+
+    def test_token_budget_predicts_from_decode_speed(
+        self, speech_generator, sample_speech_request, sample_available_styles, monkeypatch
+    ):
+        """Тест: ожидаемая длительность считается по скорости предыдущей генерации"""
+
+        monkeypatch.setattr(model_parameters, "max_new_tokens", 100)
+        monkeypatch.setattr(speech_generator, "count_tokens", lambda text: len(text.split()))
+        speech_generator._record_decode_speed(generation_seconds=2.0, tokens=40)
+
+        budget = speech_generator.token_budget(sample_speech_request, sample_available_styles)
+
+        assert budget.predicted_seconds == 5.0
+
+    def test_count_tokens_does_not_race_batch_encoding(self):
+        """Тест: подсчёт токенов из другого потока не сбрасывает паддинг кодируемого батча"""
+
+        vocab = {"<unk>": 0, "<pad>": 1, **{char: index + 2 for index, char in enumerate("абвгд ")}}
+        backend = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+        backend.pre_tokenizer = pre_tokenizers.Split("", "isolated")
+        tokenizer = PreTrainedTokenizerFast(tokenizer_object=backend, unk_token="<unk>", pad_token="<pad>")
+        generator = SpeechGenerator()
+        generator.device = "cpu"
+        with patch("ai.speech_generator.AutoTokenizer.from_pretrained", return_value=tokenizer), \
+                patch("ai.speech_generator.AutoModelForCausalLM.from_pretrained", return_value=Mock(hf_device_map={})):
+            generator.load_model()
+        assert generator.budget_tokenizer is not generator.tokenizer
+
+        # Частое переключение потоков делает гонку за состояние паддинга воспроизводимой
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        stop = threading.Event()
+        counters = [
+            threading.Thread(target=lambda: [generator.count_tokens("где " * 20) for _ in iter(stop.is_set, True)])
+            for _ in range(2)
+        ]
+        for counter in counters:
+            counter.start()
+        try:
+            for _ in range(1000):
+                inputs = generator.tokenizer(
+                    ["а", "бвг " * 10], return_tensors="pt", padding=True, truncation=True, max_length=16
+                )
+                assert inputs["input_ids"].shape[0] == 2
+        finally:
+            stop.set()
+            for counter in counters:
+                counter.join()
+            sys.setswitchinterval(switch_interval)
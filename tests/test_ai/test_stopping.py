@@ -0,0 +1,97 @@
+import pytest
+import torch
+
+from ai.stopping import (
+    COMPLETION, STOP_STRING, IncrementalDetokenizer, SpeechStoppingCriteria, StreamTrimmer, find_stop
+)
+import ai.serving_parameters as serving_parameters
+
+EOS = 0
+
+
+class ByteTokenizer:
+    """Токенизатор «один токен - один байт UTF-8»: кириллический символ делится на два токена"""
+
+    def decode(self, tokens, skip_special_tokens=True):
+        return bytes(token for token in tokens if token != EOS).decode("utf-8", errors="replace")
+
+    @staticmethod
+    def encode(text):
+        return list(text.encode("utf-8"))
+
+
+@pytest.fixture(autouse=True)
+def stop_settings(monkeypatch):
+    """Фикстура фиксирует стоп-строки и фразы заключения"""
+    monkeypatch.setattr(serving_parameters, "stop_strings", ["\n\nПримечание:"])
+    monkeypatch.setattr(serving_parameters, "completion_phrases", ["Спасибо за внимание"])
+
+
+class TestStopping:
+    """Тесты досрочной остановки генерации"""
+
+    def test_incremental_detokenizer_matches_full_decode(self):
+        """Тест: текст по одному токену совпадает с декодированием целиком, половины символов не выдаются"""
+
+        tokenizer = ByteTokenizer()
+        text = "Добрый день, коллеги! Today we talk."
+        detokenizer = IncrementalDetokenizer(tokenizer)
+
+        deltas = [detokenizer.add([token]) for token in tokenizer.encode(text)]
+
+        assert "".join(deltas) == detokenizer.text == text
+        assert all("�" not in delta for delta in deltas)
+        assert deltas[0] == ""
+
+    def test_find_stop(self):
+        """Тест: остановка на стоп-строке и после предложения с фразой заключения в конце абзаца"""
+
+        speech = "Итак, вперёд! Спасибо за внимание и удачи всем!"
+        assert find_stop(speech + "\nРечь 2: ...") == (len(speech), COMPLETION)
+        assert find_stop(speech + " \n") == (len(speech), COMPLETION)
+        assert find_stop(speech) is None
+        assert find_stop("Спасибо за внимание и") is None
+        assert find_stop("Спасибо за внимание к деталям. Продолжим.\n") is None
+        assert find_stop("Речь.\n\nПримечание: для автора") == (len("Речь."), STOP_STRING)
+        assert find_stop("Обычный текст речи.") is None
+
+    def test_criteria_stops_rows_independently(self):
+        """Тест: строки батча останавливаются по своему тексту, строка с EOS не учитывается"""
+
+        tokenizer = ByteTokenizer()
+        prompt = [7, 7]
+        rows = [
+            tokenizer.encode("Вперёд! Спасибо за внимание!\nДополнение"),
+            tokenizer.encode("Речь без конца и края. " * 5),
+            tokenizer.encode("Конец.") + [EOS] * 40,
+        ]
+        length = max(len(row) for row in rows)
+        rows = [row + [EOS] * (length - len(row)) for row in rows]
+        criteria = SpeechStoppingCriteria(tokenizer, len(prompt), len(rows), [EOS])
+
+        finished_steps = []
+        for step in range(1, length + 1):
+            finished_steps.append(criteria(torch.tensor([prompt + row[:step] for row in rows]), None).tolist())
+
+        stop_tokens = len(tokenizer.encode("Вперёд! Спасибо за внимание!\n"))
+        assert criteria.stops[0] == (stop_tokens, COMPLETION)
+        assert [finished[0] for finished in finished_steps].index(True) + 1 == stop_tokens
+        assert criteria.stops[1] is None and criteria.stops[2] is None
+        assert finished_steps[-1] == [True, False, True]
+
+    @pytest.mark.parametrize("text, expected", [
+        ("Речь готова. Спасибо за внимание!\n\nПримечание: речь можно сократить", "Речь готова. Спасибо за внимание!"),
+        ("Речь готова.\n\nПримечание: речь можно сократить", "Речь готова."),
+        ("Речь без остановки.\n\nДо встречи", "Речь без остановки.\n\nДо встречи"),
+    ])
+    def test_stream_trimmer_withholds_text_after_stop(self, text, expected):
+        """Тест: в потоке нет текста после места обрезки, без остановки поток выдаётся целиком"""
+
+        chunks = []
+        trimmer = StreamTrimmer(chunks.append)
+        words = text.split(" ")
+        for position, word in enumerate(words):
+            trimmer.add(word + (" " if position < len(words) - 1 else ""), end=position == len(words) - 1)
+
+        assert "".join(chunks) == expected
+        assert trimmer.stopped == (expected != text)
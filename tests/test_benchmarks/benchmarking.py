@@ -0,0 +1,181 @@
+"""
+Инфраструктура микробенчмарков: замер, калибровка и сравнение с базовой линией.
+
+Модуль подключается к тестам через pytest_plugins в tests/conftest.py,
+там же объявлены параметры запуска (--benchmark, --benchmark-update, --benchmark-tolerance).
+
+Время вызова - минимум из нескольких повторов (минимум меньше всего зависит
+от фоновой нагрузки). Чтобы базовая линия, записанная на одной машине, была
+пригодна на другой, время пути делится на время калибровочной нагрузки.
+Нагрузок две: на чистом Python ("python") и на нативном коде - pydantic-core
+и re ("native"); соотношение их скоростей на разных машинах разное, поэтому
+путь нормируется той, на которой проводит основное время.
+
+Повторы калибровки и пути чередуются, поэтому обе величины измеряются в одном
+и том же окне времени, и замедление всей машины (другая работа, частота
+процессора) сокращается в их отношении. К допуску добавляется абсолютный порог
+шума NOISE_FLOOR_SECONDS: разница в несколько микросекунд на разных машинах -
+не замедление. Замер, превысивший допуск, повторяется до MEASURE_ATTEMPTS раз
+и сравнивается лучший из них; путь, медленный во всех попытках, роняет тест.
+"""
+
+import json
+import platform
+import re
+import time
+from pathlib import Path
+from typing import Tuple
+
+import pydantic_core
+import pytest
+
+BASELINE_FILE = Path(__file__).parent / "baseline.json"
+REPEATS = 7
+# Минимальная длительность одного повтора, по ней подбирается число вызовов
+REPEAT_SECONDS = 0.02
+# Абсолютный порог шума: замедление меньше него не считается регрессией
+NOISE_FLOOR_SECONDS = 10e-6
+# Сколько раз замеряется путь, превысивший допуск, прежде чем тест упадёт
+MEASURE_ATTEMPTS = 3
+
+
+def _calls_per_repeat(function) -> int:
+    """Число вызовов, которые длятся не меньше REPEAT_SECONDS."""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            function()
+        if time.perf_counter() - started >= REPEAT_SECONDS:
+            return number
+        number *= 2
+
+
+def _repeat(function, number: int) -> float:
+    started = time.perf_counter()
+    for _ in range(number):
+        function()
+    return (time.perf_counter() - started) / number
+
+
+def time_per_call(function) -> float:
+    """Минимальное по повторам время одного вызова функции в секундах."""
+    number = _calls_per_repeat(function)
+    return min(_repeat(function, number) for _ in range(REPEATS))
+
+
+def interleaved_times(function, calibration) -> Tuple[float, float]:
+
+    """
+    Время вызова функции и калибровочной нагрузки, измеренные вперемежку.
+
+    Повтор калибровки и повтор функции идут друг за другом, поэтому минимумы
+    обеих величин берутся из одного окна времени.
+
+    Returns:
+        Tuple[float, float]: Минимальное время вызова функции и калибровки в секундах.
+    """
+
+    function_number = _calls_per_repeat(function)
+    calibration_number = _calls_per_repeat(calibration)
+    function_seconds = calibration_seconds = float("inf")
+    for _ in range(REPEATS):
+        calibration_seconds = min(calibration_seconds, _repeat(calibration, calibration_number))
+        function_seconds = min(function_seconds, _repeat(function, function_number))
+    return function_seconds, calibration_seconds
+
+
+CALIBRATION_DATA = {f"стиль {index}": "описание " * (index % 7) for index in range(300)}
+CALIBRATION_JSON = pydantic_core.to_json(CALIBRATION_DATA)
+CALIBRATION_TEXT = "\n".join(f"- {key}: {value}" for key, value in CALIBRATION_DATA.items())
+
+
+def python_calibration_workload():
+    """Эталонная нагрузка на Python: строки, словари и JSON, как в проверяемых путях."""
+    json.loads(json.dumps(CALIBRATION_DATA, ensure_ascii=False))
+    "\n".join(f"- {key}: {value}" for key, value in CALIBRATION_DATA.items())
+
+
+def native_calibration_workload():
+    """Эталонная нагрузка на нативном коде: разбор и сериализация pydantic-core, поиск re."""
+    pydantic_core.to_json(pydantic_core.from_json(CALIBRATION_JSON))
+    re.findall(r"стиль \d+: (?:описание )+", CALIBRATION_TEXT)
+
+
+CALIBRATION_WORKLOADS = {"python": python_calibration_workload, "native": native_calibration_workload}
+
+
+def calibrate() -> dict:
+    """Время каждой калибровочной нагрузки в секундах."""
+    return {kind: time_per_call(workload) for kind, workload in CALIBRATION_WORKLOADS.items()}
+
+
+@pytest.fixture(scope="session")
+def benchmark_session(request):
+    """Фикстура сессии: режим запуска, калибровка, базовая линия и записываемые результаты"""
+    config = request.config
+    update = config.getoption("--benchmark-update")
+    if not (update or config.getoption("--benchmark")):
+        pytest.skip("микробенчмарки запускаются с --benchmark или --benchmark-update")
+
+    baseline = json.loads(BASELINE_FILE.read_text(encoding="utf-8")) if BASELINE_FILE.exists() else None
+    session = {
+        "update": update,
+        "tolerance": config.getoption("--benchmark-tolerance"),
+        "calibration_seconds": calibrate(),
+        "baseline": baseline,
+        "results": {},
+    }
+    yield session
+
+    if update:
+        BASELINE_FILE.write_text(json.dumps({
+            "calibration_seconds": session["calibration_seconds"],
+            "python": platform.python_version(),
+            "paths": dict(sorted(session["results"].items())),
+        }, ensure_ascii=False, indent=4) + "\n", encoding="utf-8")
+
+
+@pytest.fixture
+def benchmark(benchmark_session):
+
+    """
+    Фикстура замера пути: benchmark(name, function, calibration) измеряет время
+    вызова вперемежку с калибровочной нагрузкой calibration ("python" или "native")
+    и сравнивает их отношение с базовой линией.
+    """
+
+    def measure(name: str, function, calibration: str = "python") -> float:
+        update = benchmark_session["update"]
+        baseline = benchmark_session["baseline"]
+        if not update and (
+            baseline is None or name not in baseline["paths"] or not isinstance(baseline["calibration_seconds"], dict)
+        ):
+            pytest.skip(f"нет базовой линии для {name}, запустите pytest --benchmark-update")
+
+        def allowed(calibration_seconds: float) -> float:
+            tolerance = benchmark_session["tolerance"]
+            return baseline["paths"][name] * (1 + tolerance) + NOISE_FLOOR_SECONDS / calibration_seconds
+
+        best = None
+        for attempt in range(1 if update else MEASURE_ATTEMPTS):
+            seconds, calibration_seconds = interleaved_times(function, CALIBRATION_WORKLOADS[calibration])
+            relative = seconds / calibration_seconds
+            print(f"{name}: {seconds * 1e6:.1f} мкс ({relative:.2f} калибровок {calibration}, попытка {attempt + 1})")
+            if best is None or relative < best[0]:
+                best = (relative, seconds, calibration_seconds)
+            if update or relative <= allowed(calibration_seconds):
+                break
+        relative, seconds, calibration_seconds = best
+        benchmark_session["results"][name] = relative
+        if update:
+            return seconds
+
+        assert relative <= allowed(calibration_seconds), (
+            f"{name} замедлился: {relative:.2f} калибровок {calibration} при базовой линии "
+            f"{baseline['paths'][name]:.2f}, допуске {benchmark_session['tolerance']:.0%} "
+            f"и пороге шума {NOISE_FLOOR_SECONDS * 1e6:.0f} мкс ({MEASURE_ATTEMPTS} попыток)"
+        )
+        return seconds
+
+    return measure
@@ -0,0 +1,133 @@
+"""
+Микробенчмарки путей, которые выполняются на каждом запросе помимо модели.
+
+Запуск и сравнение с базовой линией:
+    python -m pytest tests/test_benchmarks --benchmark -s
+Перезапись базовой линии после намеренного изменения:
+    python -m pytest tests/test_benchmarks --benchmark-update -s
+
+Пути, которые сами по себе занимают доли микросекунды (снимок каталога,
+разбор одного запроса), измеряются в составе единицы работы, на которой они
+встречаются: батча очереди генерации и JSONL пакетного задания.
+"""
+
+import json
+
+import pytest
+
+import utils
+from ai.speech_generator import SpeechGenerator, SpeechText
+from ai.stopping import find_stop
+from http_encoding import FastJSONResponse
+from schemas.model import GenerationMetadata, SpeechRequest, SpeechResponse
+from style_catalog import StyleCatalog
+from utils import load_styles, parse_speech_requests, save_styles
+
+STYLES_COUNT = 10000
+BATCH_SIZE = 8
+JOB_REQUESTS = 100
+KEY_POINTS_COUNT = 200
+CUSTOM_INSTRUCTIONS_CHARS = 20000
+SPEECH_PARAGRAPH = (
+    "Дорогие коллеги! Сегодня мы подводим итоги года, который стал для нашей команды "
+    "временем смелых решений и настоящих открытий. Мы запустили три новых продукта.\n\n"
+)
+
+
+@pytest.fixture(scope="module")
+def large_styles():
+    """Фикстура: большой каталог стилей"""
+    return {
+        f"стиль {index}": f"Описание стиля {index}: тон, структура и лексика выступления. " * 3
+        for index in range(STYLES_COUNT)
+    }
+
+
+@pytest.fixture(scope="module")
+def large_request():
+    """Фикстура: запрос с длинным списком ключевых моментов и большими требованиями"""
+    return SpeechRequest(
+        topic="Итоги года и планы развития компании на ближайшие три года",
+        duration_minutes=15,
+        style=f"стиль {STYLES_COUNT - 1}",
+        key_points=[f"Ключевой момент номер {index}: результаты направления и выводы" for index in range(KEY_POINTS_COUNT)],
+        custom_instructions=("Сделать акцент на вкладе каждой команды. " * 500)[:CUSTOM_INSTRUCTIONS_CHARS]
+    )
+
+
+@pytest.fixture
+def styles_file(tmp_path, monkeypatch, large_styles):
+    """Фикстура: файл стилей с большим каталогом"""
+    path = tmp_path / "speech_styles.json"
+    path.write_text(json.dumps(large_styles, ensure_ascii=False), encoding="utf-8")
+    monkeypatch.setattr(utils, "STYLES_FILE", str(path))
+    # tests/test_routers/test_styles.py подменяет функции модуля utils при импорте
+    monkeypatch.setattr(utils, "load_styles", load_styles)
+    monkeypatch.setattr(utils, "save_styles", save_styles)
+    return path
+
+
+class TestHotPaths:
+    """Микробенчмарки горячих путей обработки запроса"""
+
+    def test_generate_prompt(self, benchmark, large_request, large_styles):
+        """Сборка промпта с большим каталогом, длинными ключевыми моментами и требованиями"""
+        generator = SpeechGenerator()
+        benchmark("generate_prompt", lambda: generator.generate_prompt(large_request, large_styles))
+
+    def test_load_styles(self, benchmark, styles_file):
+        """Чтение большого файла стилей"""
+        assert len(load_styles()) == STYLES_COUNT
+        benchmark("load_styles", load_styles)
+
+    def test_save_styles(self, benchmark, styles_file, large_styles):
+        """Запись большого файла стилей"""
+        benchmark("save_styles", lambda: save_styles(large_styles))
+
+    def test_batch_prompt_assembly(self, benchmark, styles_file):
+        """Снимок каталога и сборка промптов батча - работа очереди генерации на каждый батч"""
+        catalog = StyleCatalog()
+        generator = SpeechGenerator()
+        requests = [
+            SpeechRequest(topic=f"Тема {index}", duration_minutes=5, style=f"стиль {index * 1000}")
+            for index in range(BATCH_SIZE)
+        ]
+        assert len(catalog.snapshot()) == STYLES_COUNT
+
+        def assemble():
+            styles = catalog.snapshot()
+            return [generator.generate_prompt(request, styles) for request in requests]
+
+        benchmark("batch_prompt_assembly", assemble)
+
+    def test_style_catalog_page(self, benchmark, styles_file):
+        """Страница каталога по курсору с поиском по подстроке имени"""
+        catalog = StyleCatalog()
+        first = catalog.page(50, contains="стиль 9")
+        assert len(first["styles"]) == 50
+        benchmark("style_catalog_page", lambda: catalog.page(50, cursor=first["next_cursor"], contains="стиль 9"))
+
+    def test_job_requests_validation(self, benchmark, large_request):
+        """Разбор и проверка запросов пакетного задания в JSONL"""
+        lines = [
+            large_request.model_copy(update={"topic": f"Тема {index}"}).model_dump_json() for index in range(JOB_REQUESTS)
+        ]
+        assert len(parse_speech_requests(lines)) == JOB_REQUESTS
+        benchmark("job_requests_validation", lambda: parse_speech_requests(lines), calibration="native")
+
+    def test_response_postprocessing(self, benchmark):
+        """Очистка ответа модели, поиск места остановки и сериализация ответа API"""
+        generated = "<|assistant|>\n" + SPEECH_PARAGRAPH * 100 + "<|end|>"
+
+        def postprocess():
+            text = generated
+            cut = find_stop(text)
+            if cut is not None:
+                text = text[:cut[0]]
+            speech = SpeechText(SpeechGenerator._extract_speech(text), prompt_tokens=900, completion_tokens=2048)
+            return FastJSONResponse(SpeechResponse(speech=speech, metadata=GenerationMetadata(
+                model="phi-3-mini", prompt_tokens=speech.prompt_tokens, completion_tokens=speech.completion_tokens,
+                generation_ms=41250.0, total_ms=41302.7, settings_version=0
+            ))).body
+
+        benchmark("response_postprocessing", postprocess, calibration="native")
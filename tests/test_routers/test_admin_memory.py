@@ -0,0 +1,80 @@
+import tracemalloc
+from unittest.mock import Mock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+import ai.serving_parameters as serving_parameters
+from ai.memory import MemoryAccountant
+from main import app
+from conftest import registry_with
+
+client = TestClient(app)
+
+ADMIN_HEADERS = {"X-Admin-Token": "secret"}
+
+
+@pytest.fixture(autouse=True)
+def admin_token(monkeypatch):
+    """Фикстура: административные эндпоинты по токену"""
+    monkeypatch.setattr(serving_parameters, "admin_token", "secret")
+
+
+class TestAdminMemory:
+    """Тесты административных эндпоинтов памяти"""
+
+    def test_memory_reports_generations_and_trend(self):
+        """Проверяет журнал памяти загруженной модели и наклон удержанной памяти."""
+        generator = Mock(memory=MemoryAccountant(history_size=10, count_tensors=False))
+        for step in range(3):
+            with generator.memory.measure(f"Тема {step}"):
+                pass
+        registry = registry_with(generator)
+        registry.get("default")
+
+        with patch("dependencies._model_registry", registry):
+            response = client.get("/api/admin/memory?limit=2", headers=ADMIN_HEADERS)
+
+        assert response.status_code == 200
+        report = response.json()
+        assert report["rss_bytes"] > 0
+        [model] = report["models"]
+        assert model["model"] == "default" and model["tensor_trend_bytes"] is None
+        assert [generation["label"] for generation in model["generations"]] == ["Тема 1", "Тема 2"]
+        assert client.get("/api/admin/memory").status_code == 403
+
+    def test_tensor_counting_toggles_loaded_and_future_models(self, monkeypatch):
+        """Проверяет, что подсчёт тензоров выключен по умолчанию и включается и выключается администратором."""
+        monkeypatch.setattr(serving_parameters, "memory_count_tensors", False)
+        generator = Mock(memory=MemoryAccountant(history_size=10, count_tensors=False))
+        registry = registry_with(generator)
+        registry.get("default")
+
+        with patch("dependencies._model_registry", registry):
+            assert client.post("/api/admin/memory/tensors", headers=ADMIN_HEADERS).status_code == 204
+            assert generator.memory.count_tensors and serving_parameters.memory_count_tensors
+            assert client.get("/api/admin/memory", headers=ADMIN_HEADERS).json()["models"][0]["count_tensors"]
+
+            assert client.delete("/api/admin/memory/tensors", headers=ADMIN_HEADERS).status_code == 204
+            assert not generator.memory.count_tensors and not serving_parameters.memory_count_tensors
+        assert client.post("/api/admin/memory/tensors").status_code == 403
+
+    def test_allocations_start_tracing_then_report_sites(self):
+        """Проверяет, что первый вызов включает tracemalloc, а следующий показывает места выделения."""
+        assert not tracemalloc.is_tracing()
+        try:
+            first = client.get("/api/admin/memory/allocations", headers=ADMIN_HEADERS).json()
+            assert first["tracing_started"] and first["sites"] == []
+
+            retained = [bytearray(1024) for _ in range(1024)]
+            second = client.get("/api/admin/memory/allocations?limit=5", headers=ADMIN_HEADERS).json()
+            assert not second["tracing_started"] and second["traced_bytes"] >= 1024 ** 2
+            assert any(__file__ in site["location"] for site in second["sites"])
+            grouped = client.get(
+                "/api/admin/memory/allocations?group_by=traceback&limit=1", headers=ADMIN_HEADERS
+            ).json()
+            assert grouped["sites"][0]["traceback"]
+            del retained
+        finally:
+            assert client.delete("/api/admin/memory/allocations", headers=ADMIN_HEADERS).status_code == 204
+        assert not tracemalloc.is_tracing()
@@ -0,0 +1,53 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from ai.degradation import DegradationPolicy
+from ai.response_cache import ResponseCache
+from main import app
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def greedy_tier(monkeypatch):
+    """Фикстура уровня деградации, действующего при любой нагрузке: жадное декодирование, короткий ответ и кэш"""
+    policy = DegradationPolicy.from_config([
+        {"name": "greedy", "queue_depth": 0, "do_sample": False, "max_new_tokens": 256, "use_cache": True}
+    ])
+    monkeypatch.setattr("dependencies._degradation_policy", policy)
+    monkeypatch.setattr("dependencies._response_cache", ResponseCache(size=8, min_similarity=0.8))
+    return policy
+
+
+class TestDegradationTiers:
+    """Тесты уровней деградации при перегрузке"""
+
+    def test_degraded_request_is_tagged_and_then_cached(self, greedy_tier, sample_speech_request, mock_speech_generator):
+        """Проверяет удешевление запроса уровнем, пометку ответа и ответ из кэша для того же запроса"""
+
+        first = client.post("/api/model/generate_speech", json=sample_speech_request.model_dump())
+        second = client.post("/api/model/generate_speech", json=sample_speech_request.model_dump())
+
+        assert first.status_code == second.status_code == 200
+        assert first.headers["x-degradation-tier"] == "greedy"
+        assert first.json()["metadata"]["tier"] == "greedy"
+        assert first.json()["metadata"]["cached"] is False
+        assert second.json()["metadata"]["cached"] is True
+        assert second.json()["speech"] == first.json()["speech"]
+        mock_speech_generator.generate_speech.assert_called_once()
+        generated = mock_speech_generator.generate_speech.call_args.args[0]
+        assert (generated.do_sample, generated.max_new_tokens) == (False, 256)
+
+        status = client.get("/api/model/degradation").json()
+        assert status["tier"] == "greedy"
+        assert status["requests"] == {"greedy": 2}
+        assert status["transitions"] == {"normal->greedy": 1}
+        assert status["cache_hits"] == 1
+
+    def test_normal_tier_without_load(self, sample_speech_request, mock_speech_generator):
+        """Проверяет, что без уровней деградации ответ помечен уровнем normal"""
+
+        response = client.post("/api/model/generate_speech", json=sample_speech_request.model_dump())
+
+        assert response.headers["x-degradation-tier"] == "normal"
+        assert response.json()["metadata"]["tier"] == "normal"
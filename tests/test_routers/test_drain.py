@@ -0,0 +1,114 @@
+import json
+import threading
+from unittest.mock import Mock, patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+import ai.serving_parameters as serving_parameters
+from ai.jobs import JobManager
+from ai.scheduler import GenerationScheduler
+from drain import DrainController, InstanceDraining
+from main import app
+from readiness import Readiness
+
+client = TestClient(app)
+
+ADMIN_HEADERS = {"X-Admin-Token": "secret"}
+
+
+class BlockingGenerator:
+    """Генератор, который не завершает речь, пока тест не отпустит его"""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def generate_speech(self, request, styles, on_text=None):
+        self.started.set()
+        assert self.release.wait(5)
+        return f"Речь: {request.topic}"
+
+
+@pytest.fixture
+def draining_instance(monkeypatch):
+    """Фикстура: очередь с блокирующимся генератором и остановка экземпляра поверх неё"""
+    monkeypatch.setattr(serving_parameters, "admin_token", "secret")
+    monkeypatch.setattr(serving_parameters, "scheduling_policy", "fifo")
+    generator = BlockingGenerator()
+    scheduler = GenerationScheduler(styles_provider=dict, model_provider=lambda model: generator)
+    jobs = JobManager(scheduler)
+    readiness = Readiness()
+    readiness.mark_ready()
+    release = Mock()
+    controller = DrainController(readiness, lambda: scheduler, lambda: jobs, release)
+    with patch("dependencies._readiness", readiness), patch("dependencies._drain_controller", controller):
+        yield generator, scheduler, jobs, controller, release
+    generator.release.set()
+
+
+class TestDrain:
+    """Тесты плавной остановки экземпляра"""
+
+    def test_drain_finishes_in_flight_and_rejects_new(self, draining_instance, sample_speech_request):
+        """Проверяет, что остановка отклоняет новые запросы, дожидается генерации и только потом выгружает модели."""
+        generator, scheduler, _, controller, release = draining_instance
+        running = scheduler.submit("default", sample_speech_request)
+        assert generator.started.wait(2)
+
+        response = client.post("/api/admin/drain", headers=ADMIN_HEADERS)
+        assert response.status_code == 202
+        assert response.json()["state"] == "draining"
+        assert response.json()["in_flight"] == 1
+
+        ready = client.get("/api/health/ready")
+        assert (ready.status_code, ready.json()["status"]) == (503, "draining")
+        rejected = client.post("/api/model/generate_speech", json=sample_speech_request.model_dump())
+        assert rejected.status_code == 503
+        assert rejected.headers["retry-after"] == "1"
+        assert not controller.wait(0.2)
+        release.assert_not_called()
+
+        generator.release.set()
+        assert controller.wait(2)
+        assert running.result() == f"Речь: {sample_speech_request.topic}"
+        release.assert_called_once()
+        status = client.get("/api/admin/drain", headers=ADMIN_HEADERS).json()
+        assert (status["state"], status["reason"], status["in_flight"]) == ("drained", "admin", 0)
+
+    def test_grace_period_hands_off_jobs_and_rejects_waiting(
+        self, draining_instance, sample_speech_request, monkeypatch, tmp_path
+    ):
+        """Проверяет передачу запросов заданий в файл и отказ ожидающим запросам по истечении периода ожидания."""
+        generator, scheduler, jobs, controller, release = draining_instance
+        handoff_path = tmp_path / "handoff" / "requests.jsonl"
+        monkeypatch.setattr(serving_parameters, "drain_grace_period_s", 0.2)
+        monkeypatch.setattr(serving_parameters, "drain_handoff", True)
+        monkeypatch.setattr(serving_parameters, "drain_handoff_path", str(handoff_path))
+
+        scheduler.submit("default", sample_speech_request)
+        assert generator.started.wait(2)
+        job = jobs.submit([sample_speech_request.model_copy(update={"topic": f"Тема {i}"}) for i in range(2)], ["default"] * 2)
+        waiting = scheduler.submit("default", sample_speech_request)
+
+        controller.start("SIGTERM")
+        assert controller.wait(2)
+
+        handed_off = [json.loads(line) for line in handoff_path.read_text(encoding="utf-8").splitlines()]
+        assert [line["topic"] for line in handed_off] == ["Тема 0", "Тема 1"]
+        assert job.failed == 2 and "handoff" in job.results[0]["error"]
+        with pytest.raises(InstanceDraining):
+            waiting.result()
+        status = controller.status()
+        assert (status.handed_off, status.abandoned, status.in_flight) == (2, 1, 1)
+        release.assert_called_once()
+
+    def test_admin_endpoints_require_token(self, monkeypatch):
+        """Проверяет, что без токена администратора остановку запустить нельзя."""
+        monkeypatch.setattr(serving_parameters, "admin_token", "secret")
+        assert client.post("/api/admin/drain").status_code == 403
+        assert client.post("/api/admin/drain", headers={"X-Admin-Token": "wrong"}).status_code == 403
+
+        monkeypatch.setattr(serving_parameters, "admin_token", "")
+        # Без настроенного токена эндпоинты доступны только с локального адреса
+        assert client.get("/api/admin/drain").status_code == 403
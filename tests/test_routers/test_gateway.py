@@ -0,0 +1,145 @@
+import asyncio
+import gzip
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import gateway
+from load_balancer import BackendPool, estimate_request_tokens
+
+BACKEND_A = "http://backend-a:8001"
+BACKEND_B = "http://backend-b:8002"
+
+
+async def chunked(*chunks: bytes):
+    """Тело ответа потоком: httpx читает bytes-тело сразу, а прокси нужен непрочитанный поток"""
+    for chunk in chunks:
+        yield chunk
+
+
+class FakeBackends(httpx.AsyncBaseTransport):
+    """Экземпляры сервиса за шлюзом; тело ответа, как у настоящего сервера, ещё не прочитано"""
+
+    def __init__(self):
+        self.ready = {BACKEND_A: True, BACKEND_B: True}
+        self.down = set()
+        self.requests = []
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        url = f"{request.url.scheme}://{request.url.host}:{request.url.port}"
+        if url in self.down:
+            raise httpx.ConnectError("connection refused", request=request)
+        if request.url.path == "/api/health/ready":
+            return httpx.Response(200 if self.ready[url] else 503)
+        self.requests.append((url, request))
+        if request.url.path == "/api/model/generate_speech_stream":
+            return httpx.Response(200, headers={"content-type": "text/plain; charset=utf-8"},
+                                  content=chunked("Добрый".encode("utf-8"), " день".encode("utf-8")))
+        if request.headers.get("accept-encoding") == "gzip":
+            return httpx.Response(200, headers={"content-type": "application/json", "content-encoding": "gzip"},
+                                  content=chunked(gzip.compress(f'{{"speech":"from {url}"}}'.encode())))
+        return httpx.Response(200, headers={"content-type": "application/json"},
+                              content=chunked(f'{{"speech":"from {url}"}}'.encode()))
+
+
+@pytest.fixture
+def backends(monkeypatch):
+    """Фикстура: шлюз с двумя поддельными экземплярами и чистым пулом"""
+    fake = FakeBackends()
+    monkeypatch.setattr(gateway, "pool", BackendPool([BACKEND_A, BACKEND_B], affinity_slack_tokens=1000))
+    monkeypatch.setattr(gateway, "_client", httpx.AsyncClient(transport=fake))
+    return fake
+
+
+client = TestClient(gateway.app)
+
+
+class TestBackendPool:
+    """Тесты выбора экземпляра по токенам в работе и стилю"""
+
+    def test_least_outstanding_tokens(self):
+        """Проверяет, что запрос уходит на экземпляр с меньшим количеством токенов в работе."""
+        pool = BackendPool([BACKEND_A, BACKEND_B])
+        a, b = pool.backends
+        pool.acquire(a, "formal", 3000)
+        pool.acquire(b, "casual", 500)
+        assert pool.choose("inspirational") is b
+        pool.release(a, 3000)
+        assert pool.choose("inspirational") is a
+
+    def test_style_affinity_within_slack(self):
+        """Проверяет, что экземпляр со стилем в кэше предпочтителен, пока перевес не больше допустимого."""
+        pool = BackendPool([BACKEND_A, BACKEND_B], affinity_slack_tokens=1000)
+        a, b = pool.backends
+        pool.acquire(a, "formal", 800)
+        assert pool.choose("formal") is a
+        assert pool.choose("casual") is b
+        pool.acquire(a, "casual", 800)
+        assert pool.choose("formal") is b
+
+    def test_unhealthy_and_excluded_are_skipped(self):
+        """Проверяет, что неисправные и исключённые экземпляры не выбираются."""
+        pool = BackendPool([BACKEND_A, BACKEND_B])
+        pool.mark(pool.backends[0], False)
+        assert pool.choose("formal") is pool.backends[1]
+        assert pool.choose("formal", exclude=[BACKEND_B]) is None
+
+    def test_estimate_grows_with_duration(self, sample_speech_request):
+        """Проверяет, что оценка токенов растёт с длительностью речи."""
+        longer = sample_speech_request.model_copy(update={"duration_minutes": 20})
+        assert estimate_request_tokens(longer) > estimate_request_tokens(sample_speech_request)
+
+
+class TestGateway:
+    """Тесты проксирования генерации через шлюз"""
+
+    def test_health_check_excludes_not_ready_backend(self, backends, sample_speech_request):
+        """Проверяет, что экземпляр, ответивший 503 на /ready, не получает запросов."""
+        backends.ready[BACKEND_A] = False
+        asyncio.run(gateway.check_backends())
+
+        for _ in range(3):
+            response = client.post("/api/model/generate_speech", json=sample_speech_request.model_dump())
+            assert response.status_code == 200
+            assert response.json() == {"speech": f"from {BACKEND_B}"}
+        assert {url for url, _ in backends.requests} == {BACKEND_B}
+
+    def test_failover_on_refused_connection(self, backends, sample_speech_request):
+        """Проверяет, что запрос уходит на другой экземпляр, если первый не принимает соединение."""
+        backends.down.add(BACKEND_A)
+
+        response = client.post("/api/model/generate_speech", json=sample_speech_request.model_dump())
+
+        assert response.status_code == 200
+        assert response.headers["X-Backend"] == BACKEND_B
+        assert gateway.pool.backends[0].healthy is False
+        assert all(backend.outstanding_tokens == 0 for backend in gateway.pool.backends)
+
+    def test_compressed_response_passes_through(self, backends, sample_speech_request):
+        """Проверяет, что сжатый ответ экземпляра передаётся клиенту без распаковки."""
+        with client.stream(
+            "POST", "/api/model/generate_speech",
+            json=sample_speech_request.model_dump(), headers={"Accept-Encoding": "gzip"}
+        ) as response:
+            raw = b"".join(response.iter_raw())
+
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert gzip.decompress(raw).startswith(b'{"speech":"from ')
+
+    def test_stream_passthrough(self, backends, sample_speech_request):
+        """Проверяет, что поток экземпляра передаётся клиенту полностью, а учёт токенов снимается."""
+        response = client.post("/api/model/generate_speech_stream", json=sample_speech_request.model_dump())
+
+        assert response.status_code == 200
+        assert response.text == "Добрый день"
+        assert response.headers["Content-Type"].startswith("text/plain")
+        assert all(backend.outstanding_requests == 0 for backend in gateway.pool.backends)
+
+    def test_no_ready_backends(self, backends, sample_speech_request):
+        """Проверяет ответ 503, когда все экземпляры неисправны."""
+        backends.ready = {BACKEND_A: False, BACKEND_B: False}
+        asyncio.run(gateway.check_backends())
+
+        assert client.post("/api/model/generate_speech", json=sample_speech_request.model_dump()).status_code == 503
+        assert client.get("/api/health/ready").status_code == 503
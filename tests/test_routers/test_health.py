@@ -0,0 +1,91 @@
+import threading
+from unittest.mock import Mock, patch
+
+from fastapi.testclient import TestClient
+
+import ai.serving_parameters as serving_parameters
+import dependencies
+from ai.speech_generator import WarmupStep
+from main import app
+from readiness import Readiness
+
+client = TestClient(app)
+
+
+class TestHealthEndpoints:
+    """Тесты эндпоинтов проверки состояния"""
+
+    def test_live(self):
+        """Проверяет, что проверка живости отвечает без загруженной модели."""
+        response = client.get("/api/health/live")
+        assert response.status_code == 200
+        assert response.json() == {"status": "ok"}
+
+    def test_not_ready_before_warmup(self):
+        """Проверяет, что до загрузки и прогрева модели экземпляр не готов."""
+        with patch("dependencies._readiness", Readiness()):
+            response = client.get("/api/health/ready")
+
+        assert response.status_code == 503
+        assert response.json()["status"] == "starting"
+
+    def test_ready_after_load_reports_warmup(self, monkeypatch):
+        """Проверяет, что после загрузки модели с прогревом экземпляр готов и сообщает длительности прогрева."""
+        generator = Mock()
+        generator.warm_up.return_value = [WarmupStep(style="formal", batch_size=1, prompt_tokens=130, seconds=0.5)]
+        monkeypatch.setattr(serving_parameters, "warmup", True)
+
+        with patch("dependencies._readiness", Readiness()), \
+                patch("dependencies._model_registry", None), \
+                patch("dependencies.SpeechGenerator", return_value=generator):
+            dependencies.init_speech_generator().join()
+            response = client.get("/api/health/ready")
+
+        generator.load_model.assert_called_once()
+        generator.warm_up.assert_called_once()
+        assert response.status_code == 200
+        data = response.json()
+        assert data["ready"] is True
+        assert data["warmup"][0]["total_seconds"] == 0.5
+        assert data["warmup"][0]["steps"][0]["prompt_tokens"] == 130
+
+    def test_not_ready_while_loading_in_background(self):
+        """Проверяет, что модель грузится в фоне: живость отвечает сразу, готовность - 503 до конца загрузки."""
+        loading = threading.Event()
+        release = threading.Event()
+        generator = Mock()
+
+        def load_model():
+            loading.set()
+            release.wait(5)
+
+        generator.load_model.side_effect = load_model
+        generator.warm_up.return_value = []
+
+        with patch("dependencies._readiness", Readiness()), \
+                patch("dependencies._model_registry", None), \
+                patch("dependencies.SpeechGenerator", return_value=generator):
+            thread = dependencies.init_speech_generator()
+            assert loading.wait(5)
+            assert client.get("/api/health/live").status_code == 200
+            response = client.get("/api/health/ready")
+            release.set()
+            thread.join()
+            ready = client.get("/api/health/ready")
+
+        assert (response.status_code, response.json()["status"]) == (503, "starting")
+        assert (ready.status_code, ready.json()["status"]) == (200, "ready")
+
+    def test_failed_load_stays_not_ready(self):
+        """Проверяет, что при ошибке загрузки модели экземпляр остаётся неготовым и сообщает ошибку."""
+        generator = Mock()
+        generator.load_model.side_effect = RuntimeError("нет весов")
+
+        with patch("dependencies._readiness", Readiness()), \
+                patch("dependencies._model_registry", None), \
+                patch("dependencies.SpeechGenerator", return_value=generator):
+            dependencies.init_speech_generator().join()
+            response = client.get("/api/health/ready")
+
+        assert response.status_code == 503
+        assert response.json()["status"] == "failed" and "нет весов" in response.json()["error"]
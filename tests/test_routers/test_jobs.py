@@ -0,0 +1,119 @@
+import json
+import time
+
+from fastapi.testclient import TestClient
+
+import ai.serving_parameters as serving_parameters
+from ai.speech_generator import TokenBudget
+from main import app
+
+client = TestClient(app)
+
+
+def _jsonl(requests):
+    return "\n".join(json.dumps(request, ensure_ascii=False) for request in requests)
+
+
+def _wait_completed(job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = client.get(f"/api/jobs/{job_id}").json()
+        if status["status"] == "completed":
+            return status
+        time.sleep(0.05)
+    raise AssertionError("Задание не завершилось вовремя")
+
+
+class TestJobsAPI:
+    """Тесты для api пакетных заданий"""
+
+    def test_submit_and_stream_results(self, sample_speech_request, mock_speech_generator):
+        """Проверяет создание задания, прогресс и потоковую выдачу результатов."""
+        mock_speech_generator.generate_batch.side_effect = lambda requests, styles: [
+            f"Речь: {request.topic}" for request in requests
+        ]
+        requests = [dict(sample_speech_request.model_dump(), topic=f"Тема {i}") for i in range(5)]
+
+        response = client.post("/api/jobs", content=_jsonl(requests))
+        assert response.status_code == 200
+        job = response.json()
+        assert job["total"] == 5
+
+        status = _wait_completed(job["job_id"])
+        assert status["completed"] == 5
+        assert status["failed"] == 0
+
+        response = client.get(f"/api/jobs/{job['job_id']}/results")
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        speeches = {line["index"]: line["speech"] for line in lines}
+        assert speeches == {i: f"Речь: Тема {i}" for i in range(5)}
+
+    def test_failed_request_does_not_fail_job(self, sample_speech_request, mock_speech_generator):
+        """Проверяет, что ошибка одного запроса попадает только в его строку результата."""
+        def generate_speech(request, styles):
+            if request.topic == "плохая":
+                raise ValueError("Стиль не найден")
+            return "ok"
+
+        mock_speech_generator.generate_batch.side_effect = RuntimeError("batch failed")
+        mock_speech_generator.generate_speech.side_effect = generate_speech
+        requests = [dict(sample_speech_request.model_dump(), topic=topic) for topic in ["хорошая", "плохая"]]
+
+        job = client.post("/api/jobs", content=_jsonl(requests)).json()
+        status = _wait_completed(job["job_id"])
+        assert status["completed"] == 1
+        assert status["failed"] == 1
+
+        lines = [json.loads(line) for line in client.get(f"/api/jobs/{job['job_id']}/results").text.splitlines()]
+        errors = [line for line in lines if "error" in line]
+        assert len(errors) == 1
+        assert requests[errors[0]["index"]]["topic"] == "плохая"
+
+    def test_invalid_line_returns_422(self, mock_speech_generator):
+        """Проверяет, что некорректная строка JSONL отклоняется с номером строки."""
+        response = client.post("/api/jobs", content='{"topic": "ok", "duration_minutes": 3}\n{"topic": "нет длительности"}')
+        assert response.status_code == 422
+        assert "Строка 2" in response.json()["detail"]
+
+    def test_oversized_request_rejects_job_with_413(self, sample_speech_request, mock_speech_generator):
+        """Проверяет, что задание с запросом сверх контекста модели отклоняется при приёме, а не в очереди."""
+        def token_budget(request, styles):
+            prompt_tokens = 2230 if request.topic == "длинная" else 250
+            return TokenBudget(
+                base_tokens=200, key_points_tokens=30, custom_instructions_tokens=prompt_tokens - 230,
+                prompt_tokens=prompt_tokens, planned_output_tokens=512, max_prompt_tokens=2048, context_tokens=4096
+            )
+
+        mock_speech_generator.token_budget.side_effect = token_budget
+        requests = [dict(sample_speech_request.model_dump(), topic=topic) for topic in ["короткая", "длинная"]]
+
+        response = client.post("/api/jobs", content=_jsonl(requests))
+
+        assert response.status_code == 413
+        detail = response.json()["detail"]
+        assert detail["index"] == 1 and detail["budget"]["fits"] is False
+        mock_speech_generator.generate_batch.assert_not_called()
+        mock_speech_generator.generate_speech.assert_not_called()
+
+    def test_unknown_job_returns_404(self):
+        """Проверяет, что запрос несуществующего задания возвращает 404."""
+        assert client.get("/api/jobs/missing").status_code == 404
+        assert client.get("/api/jobs/missing/results").status_code == 404
+
+    def test_expired_job_returns_410(self, sample_speech_request, mock_speech_generator, monkeypatch):
+        """Проверяет, что завершённые задания сверх jobs_max_retained удаляются и отвечают 410."""
+        monkeypatch.setattr(serving_parameters, "jobs_max_retained", 1)
+        mock_speech_generator.generate_speech.return_value = "ok"
+        jobs = []
+        for _ in range(2):
+            job = client.post("/api/jobs", content=_jsonl([sample_speech_request.model_dump()])).json()
+            _wait_completed(job["job_id"])
+            jobs.append(job["job_id"])
+
+        assert client.get(f"/api/jobs/{jobs[1]}").status_code == 200
+        # Третье задание вытесняет самое давнее из двух завершённых
+        client.post("/api/jobs", content=_jsonl([sample_speech_request.model_dump()]))
+        assert client.get(f"/api/jobs/{jobs[0]}").status_code == 410
+        assert client.get(f"/api/jobs/{jobs[0]}/results").status_code == 410
+        assert client.get(f"/api/jobs/{jobs[1]}").status_code == 200
@@ -0,0 +1,149 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import ai.serving_parameters as serving_parameters
+from ai.speech_generator import SpeechText, TokenBudget
+from main import app
+from quotas import MemoryQuotaBackend, QuotaExceeded, QuotaManager, SQLiteQuotaBackend
+
+client = TestClient(app)
+
+
+class FakeClock:
+    """Часы, которые двигает тест"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def quota_backend(request, tmp_path):
+    """Фикстура хранилища квот обоих видов"""
+    backend = MemoryQuotaBackend() if request.param == "memory" else SQLiteQuotaBackend(str(tmp_path / "quotas.sqlite3"))
+    yield backend
+    backend.close()
+
+
+@pytest.fixture
+def quota_manager(monkeypatch):
+    """Фикстура включает квоты: 600 токенов в минуту, запас 3000 токенов"""
+    manager = QuotaManager(MemoryQuotaBackend(), tokens_per_minute=600, burst_tokens=3000, keys={"key-a": (600, 3000)})
+    monkeypatch.setattr(serving_parameters, "quota_enabled", True)
+    monkeypatch.setattr("dependencies._quota_manager", manager)
+    return manager
+
+
+class TestQuotas:
+    """Тесты квот токенов по API-ключам"""
+
+    def test_bucket_admits_reconciles_and_refills(self, quota_backend):
+        """Проверяет списание оценки, возврат неизрасходованного, отказ и пополнение со временем."""
+        clock = FakeClock()
+        manager = QuotaManager(
+            quota_backend, tokens_per_minute=600, burst_tokens=1000, keys={"key-a": (600, 1000), "key-b": (600, 1000)},
+            clock=clock
+        )
+
+        charge = manager.admit("key-a", 800)
+        assert charge.remaining_tokens == 200
+        charge = manager.settle(charge, 300)
+        assert (charge.tokens, charge.remaining_tokens) == (300, 700)
+        assert charge.reset_seconds == 30
+
+        manager.admit("key-a", 700)
+        with pytest.raises(QuotaExceeded) as error:
+            manager.admit("key-a", 100)
+        assert error.value.retry_after == 10
+        # Квоты ключей независимы
+        assert manager.admit("key-b", 1000).remaining_tokens == 0
+
+        clock.now += 10
+        assert manager.admit("key-a", 100).remaining_tokens == 0
+
+    def test_unknown_keys_share_anonymous_bucket(self, quota_backend):
+        """Проверяет, что ключ не из keys списывается с общего ведра и не получает своей полной квоты."""
+        manager = QuotaManager(
+            quota_backend, tokens_per_minute=600, burst_tokens=1000, keys={"key-a": (600, 1000)}, clock=FakeClock()
+        )
+
+        assert manager.admit("random-1", 600).key == "anonymous"
+        with pytest.raises(QuotaExceeded):
+            manager.admit("random-2", 600)
+        with pytest.raises(QuotaExceeded):
+            manager.admit(None, 600)
+        assert manager.admit("key-a", 600).remaining_tokens == 400
+
+    def test_estimate_above_burst_needs_full_bucket(self, quota_backend):
+        """Проверяет, что запрос дороже запаса принимается при полном ведре и уводит его в минус."""
+        clock = FakeClock()
+        manager = QuotaManager(quota_backend, tokens_per_minute=600, burst_tokens=1000, clock=clock)
+
+        charge = manager.admit(None, 1500)
+        assert (charge.key, charge.remaining_tokens) == ("anonymous", 0)
+        with pytest.raises(QuotaExceeded) as error:
+            manager.admit(None, 1500)
+        assert error.value.retry_after == 150
+
+    def test_generate_speech_returns_quota_headers(self, quota_manager, sample_speech_request, mock_speech_generator):
+        """Проверяет заголовки остатка квоты после сверки с фактическим расходом."""
+        mock_speech_generator.generate_speech.return_value = SpeechText("Речь", prompt_tokens=250, completion_tokens=150)
+
+        response = client.post(
+            "/api/model/generate_speech", json=sample_speech_request.model_dump(), headers={"X-API-Key": "key-a"}
+        )
+
+        assert response.status_code == 200
+        assert response.headers["x-ratelimit-limit-tokens"] == "3000"
+        assert response.headers["x-ratelimit-remaining-tokens"] == "2600"
+
+    def test_generate_speech_rejects_over_quota(self, quota_manager, sample_speech_request, mock_speech_generator):
+        """Проверяет код 429 и Retry-After, когда квоты не хватает на оценку запроса."""
+        # Оценка запроса: 250 токенов промпта и 2048 планируемых токенов ответа
+        quota_manager.admit("key-a", 1000)
+
+        response = client.post(
+            "/api/model/generate_speech", json=sample_speech_request.model_dump(), headers={"X-API-Key": "key-a"}
+        )
+
+        assert response.status_code == 429
+        assert int(response.headers["retry-after"]) > 0
+        assert response.json()["detail"]["estimated_tokens"] == 2298
+        mock_speech_generator.generate_speech.assert_not_called()
+
+    def test_job_is_charged_and_settled(self, quota_manager, sample_speech_request, mock_speech_generator):
+        """Проверяет, что пакетное задание списывает оценку всех запросов и сверяется с расходом по завершении."""
+        mock_speech_generator.token_budget.return_value = TokenBudget(
+            base_tokens=200, key_points_tokens=30, custom_instructions_tokens=20, prompt_tokens=250,
+            planned_output_tokens=500, max_prompt_tokens=2048, context_tokens=4096
+        )
+        mock_speech_generator.generate_batch.side_effect = lambda requests, styles: [
+            SpeechText("Речь", prompt_tokens=250, completion_tokens=150) for _ in requests
+        ]
+        body = "\n".join(sample_speech_request.model_dump_json() for _ in range(2))
+
+        response = client.post("/api/jobs", content=body, headers={"X-API-Key": "key-a"})
+
+        assert response.status_code == 200
+        assert response.headers["x-ratelimit-remaining-tokens"] == "1500"
+        deadline = time.monotonic() + 5
+        while client.get(f"/api/jobs/{response.json()['job_id']}").json()["status"] != "completed":
+            assert time.monotonic() < deadline, "задание не завершилось вовремя"
+            time.sleep(0.05)
+        assert 2200 <= quota_manager.admit("key-a", 0).remaining_tokens < 2300
+
+    def test_job_rejected_over_quota(self, quota_manager, sample_speech_request, mock_speech_generator):
+        """Проверяет, что задание, на оценку которого не хватает квоты, отклоняется с кодом 429 без генерации."""
+        quota_manager.admit("key-a", 2000)
+        body = "\n".join(sample_speech_request.model_dump_json() for _ in range(2))
+
+        response = client.post("/api/jobs", content=body, headers={"X-API-Key": "key-a"})
+
+        assert response.status_code == 429
+        assert response.json()["detail"]["estimated_tokens"] == 2 * 2298
+        mock_speech_generator.generate_batch.assert_not_called()
+        mock_speech_generator.generate_speech.assert_not_called()
@@ -0,0 +1,104 @@
+import gzip
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import ai.serving_parameters as serving_parameters
+from ai.speech_generator import SpeechText
+from http_encoding import COMPRESSORS, brotli, choose_encoding, zstandard
+from main import app
+
+client = TestClient(app)
+
+LONG_SPEECH = "Добрый день, уважаемые коллеги! Сегодня мы подводим итоги года. " * 100
+
+DECOMPRESSORS = {"gzip": gzip.decompress}
+if brotli is not None:
+    DECOMPRESSORS["br"] = brotli.decompress
+if zstandard is not None:
+    DECOMPRESSORS["zstd"] = lambda body: zstandard.ZstdDecompressor().decompress(body)
+
+
+class TestChooseEncoding:
+    """Тесты выбора кодировки сжатия по Accept-Encoding"""
+
+    def test_server_preference_among_equal_weights(self, monkeypatch):
+        """Проверяет, что при равных весах выбирается кодировка, предпочтительная для сервера."""
+        monkeypatch.setattr(serving_parameters, "compression_encodings", ["br", "gzip"])
+        expected = "br" if "br" in COMPRESSORS else "gzip"
+        assert choose_encoding("gzip, br") == expected
+
+    def test_client_weights_and_refusals(self):
+        """Проверяет учёт весов q, запрета q=0 и подстановочного символа."""
+        assert choose_encoding("gzip;q=1.0, zstd;q=0.1, br;q=0.1") == "gzip"
+        assert choose_encoding("gzip;q=0") is None
+        assert choose_encoding("identity") is None
+        assert choose_encoding("*") is not None
+        assert choose_encoding("") is None
+
+
+class TestCompressionMiddleware:
+    """Тесты сжатия ответов и метаданных генерации"""
+
+    def test_long_speech_is_gzipped_with_metadata(self, sample_speech_request, mock_speech_generator):
+        """Проверяет, что длинная речь сжимается gzip и ответ содержит метаданные генерации."""
+        mock_speech_generator.generate_speech.return_value = SpeechText(
+            LONG_SPEECH, prompt_tokens=120, completion_tokens=640, generation_seconds=1.5
+        )
+
+        response = client.post(
+            "/api/model/generate_speech",
+            json=sample_speech_request.model_dump(),
+            headers={"Accept-Encoding": "gzip"}
+        )
+
+        assert response.status_code == 200
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert "Accept-Encoding" in response.headers["Vary"]
+        assert int(response.headers["Content-Length"]) < len(LONG_SPEECH.encode("utf-8")) / 4
+        data = response.json()
+        assert data["speech"] == LONG_SPEECH
+        assert data["metadata"]["prompt_tokens"] == 120
+        assert data["metadata"]["completion_tokens"] == 640
+        assert data["metadata"]["generation_ms"] == 1500.0
+        assert data["metadata"]["model"] == "default"
+
+    @pytest.mark.parametrize("encoding", sorted(COMPRESSORS))
+    def test_every_available_encoding_roundtrips(self, encoding, sample_speech_request, mock_speech_generator):
+        """Проверяет, что тело в каждой доступной кодировке распаковывается в исходный UTF-8 JSON."""
+        mock_speech_generator.generate_speech.return_value = LONG_SPEECH
+
+        with client.stream(
+            "POST",
+            "/api/model/generate_speech",
+            json=sample_speech_request.model_dump(),
+            headers={"Accept-Encoding": encoding}
+        ) as response:
+            raw = b"".join(response.iter_raw())
+
+        assert response.headers["Content-Encoding"] == encoding
+        body = DECOMPRESSORS[encoding](raw)
+        assert LONG_SPEECH.encode("utf-8") in body
+        assert json.loads(body)["speech"] == LONG_SPEECH
+
+    def test_small_response_not_compressed(self, sample_speech_request, mock_speech_generator):
+        """Проверяет, что ответ меньше порога отдаётся без сжатия."""
+        response = client.post(
+            "/api/model/generate_speech",
+            json=sample_speech_request.model_dump(),
+            headers={"Accept-Encoding": "gzip"}
+        )
+
+        assert response.status_code == 200
+        assert "Content-Encoding" not in response.headers
+        assert response.json()["metadata"]["completion_tokens"] == 0
+
+    def test_settings_version_increments(self, sample_model_parameters, model_parameters_module, monkeypatch):
+        """Проверяет, что изменение параметров генерации увеличивает их версию."""
+        # Параметры модуля восстанавливаются после теста
+        for name in list(sample_model_parameters.model_dump()) + ["settings_version"]:
+            monkeypatch.setattr(model_parameters_module, name, getattr(model_parameters_module, name))
+        version = model_parameters_module.settings_version
+        client.post("/api/model/set_model_settings", json=sample_model_parameters.model_dump())
+        assert model_parameters_module.settings_version == version + 1
@@ -2,6 +2,8 @@ import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import Mock, patch
 from main import app
+from ai.speech_generator import SpeechText, TokenBudget
+from conftest import registry_with
 
 client = TestClient(app)
 
@@ -34,14 +36,14 @@ class TestGenerateSpeechEndpoint:
         mock_instance.model_loaded = False
         mock_instance.generate_speech.side_effect = RuntimeError("Модель не загружена. Подождите.")
         with pytest.raises(RuntimeError):
-            with patch('dependencies._speech_generator', mock_instance):
+            with patch('dependencies._model_registry', registry_with(mock_instance)):
                 response = client.post("/api/model/generate_speech", json=sample_speech_request.model_dump())
                 assert response.status_code == 500
 
     def test_generate_speech_missing_required_field(self):
         """Тест ошибки при отсутствии обязательного поля"""
 
-        with patch('dependencies._speech_generator'):
+        with patch('dependencies._model_registry'):
             response = client.post("/api/model/generate_speech", json={
                 "duration_minutes": 5,
                 "style": "formal",
@@ -49,3 +51,105 @@ class TestGenerateSpeechEndpoint:
             })
 
             assert response.status_code == 422
+
+    def test_generate_speech_stream(self, sample_speech_request, mock_speech_generator):
+        """Тест потоковой генерации речи"""
+
+        def generate_speech(request, styles, on_text=None):
+            for chunk in ["Добрый ", "день!"]:
+                on_text(chunk)
+            return "Добрый день!"
+
+        mock_speech_generator.generate_speech.side_effect = generate_speech
+
+        response = client.post("/api/model/generate_speech_stream", json=sample_speech_request.model_dump())
+
+        assert response.status_code == 200
+        assert response.text == "Добрый день!"
+
+    def test_generate_speech_unknown_model(self, sample_speech_request, mock_speech_generator):
+        """Тест ошибки 400 при запросе несконфигурированной модели"""
+
+        payload = dict(sample_speech_request.model_dump(), model="ghost")
+        response = client.post("/api/model/generate_speech", json=payload)
+
+        assert response.status_code == 400
+        mock_speech_generator.generate_speech.assert_not_called()
+
+    def test_generate_speech_candidates(self, sample_speech_request, mock_speech_generator):
+        """Тест нескольких вариантов речи в ответе и ошибки 400 для потока и превышения лимита"""
+
+        best, other = SpeechText("Лучшая речь", completion_tokens=12), SpeechText("Другая речь", completion_tokens=9)
+        best.score, other.score = 0.9, 0.4
+        best.candidates = [best, other]
+        mock_speech_generator.generate_speech.return_value = best
+        payload = dict(sample_speech_request.model_dump(), n=2, rank=True)
+
+        response = client.post("/api/model/generate_speech", json=payload)
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["speech"] == "Лучшая речь"
+        assert data["candidates"] == [
+            {"speech": "Лучшая речь", "completion_tokens": 12, "score": 0.9},
+            {"speech": "Другая речь", "completion_tokens": 9, "score": 0.4}
+        ]
+        assert client.post("/api/model/generate_speech_stream", json=payload).status_code == 400
+        assert client.post("/api/model/generate_speech", json=dict(payload, n=100)).status_code == 400
+        mock_speech_generator.generate_speech.assert_called_once()
+
+    def test_registry_metrics(self, sample_speech_request, mock_speech_generator):
+        """Тест метрик реестра моделей после генерации"""
+
+        client.post("/api/model/generate_speech", json=sample_speech_request.model_dump())
+
+        response = client.get("/api/model/registry")
+
+        assert response.status_code == 200
+        models = response.json()
+        assert models[0]["name"] == "default"
+        assert models[0]["loaded"] is True
+        assert models[0]["loads"] == 1
+
+
+class TestTokenPreflight:
+    """Тесты предварительной проверки бюджета токенов"""
+
+    def test_oversized_request_rejected_with_breakdown(self, sample_speech_request, mock_speech_generator):
+        """Тест: запрос с обрезаемым промптом отклоняется с кодом 413 до генерации"""
+
+        mock_speech_generator.token_budget.return_value = TokenBudget(
+            base_tokens=200, key_points_tokens=30, custom_instructions_tokens=2000, prompt_tokens=2230,
+            planned_output_tokens=512, max_prompt_tokens=2048, context_tokens=4096
+        )
+
+        response = client.post("/api/model/generate_speech", json=sample_speech_request.model_dump())
+
+        assert response.status_code == 413
+        budget = response.json()["detail"]["budget"]
+        assert budget["prompt_tokens"] == 2230
+        assert budget["breakdown"]["custom_instructions"] == 2000
+        assert budget["fits"] is False
+        mock_speech_generator.generate_speech.assert_not_called()
+
+    def test_estimate(self, sample_speech_request, mock_speech_generator):
+        """Тест оценки запроса без генерации"""
+
+        response = client.post("/api/model/estimate", json=sample_speech_request.model_dump())
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["model"] == "default"
+        assert data["prompt_tokens"] == 250
+        assert data["breakdown"] == {"base": 200, "key_points": 30, "custom_instructions": 20}
+        assert data["fits"] is True
+        mock_speech_generator.generate_speech.assert_not_called()
+
+    def test_estimate_unknown_style(self, sample_speech_request, mock_speech_generator):
+        """Тест ошибки 400 при оценке запроса с неизвестным стилем"""
+
+        mock_speech_generator.token_budget.side_effect = ValueError("Стиль 'ghost' не найден")
+
+        response = client.post("/api/model/estimate", json=sample_speech_request.model_dump())
+
+        assert response.status_code == 400
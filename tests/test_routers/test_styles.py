@@ -1,4 +1,5 @@
 import json
+import random
 from pathlib import Path
 import pytest
 from fastapi.testclient import TestClient
@@ -33,10 +34,14 @@ def save_styles(styles: dict):
 
 import utils
 
+# Настоящая запись файла стилей - для проверки атомарной замены
+atomic_save_styles = utils.save_styles
 utils.load_styles = load_styles
 utils.save_styles = save_styles
+utils.STYLES_FILE = str(TEST_STYLES_FILE)
 
 from main import app
+from style_catalog import StyleIndex
 
 client = TestClient(app)
 
@@ -133,3 +138,187 @@ class TestStylesAPI:
         """Проверяет, что PUT с невалидным payload (без name) возвращает ошибку 422."""
         response = client.put("/api/styles", json={"description": "только описание"})
         assert response.status_code == 422
+
+
+class TestStylesCatalogVersioning:
+    """Тесты версионирования каталога стилей"""
+
+    def test_get_returns_etag_and_304_on_match(self):
+        """Проверяет, что повторный GET с актуальным ETag возвращает 304 без тела."""
+        client.post("/api/styles", json=[{"name": "formal", "description": "Официальный"}])
+
+        response = client.get("/api/styles")
+        etag = response.headers["ETag"]
+        assert response.headers["X-Styles-Version"] == etag.strip('"')
+
+        cached = client.get("/api/styles", headers={"If-None-Match": etag})
+        assert cached.status_code == 304
+        assert cached.content == b""
+
+    def test_etag_changes_after_update(self):
+        """Проверяет, что изменение стиля меняет версию и старый ETag перестаёт совпадать."""
+        client.post("/api/styles", json=[{"name": "formal", "description": "Официальный"}])
+        etag = client.get("/api/styles").headers["ETag"]
+
+        client.put("/api/styles", json={"name": "formal", "description": "Строгий"})
+
+        response = client.get("/api/styles", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.json() == {"styles": {"formal": "Строгий"}}
+        assert int(response.headers["X-Styles-Version"]) > int(etag.strip('"'))
+
+    def test_since_returns_only_changes(self):
+        """Проверяет, что since возвращает только изменённые после версии стили."""
+        client.post("/api/styles", json=[{"name": "formal", "description": "Официальный"}])
+        version = int(client.get("/api/styles").headers["X-Styles-Version"])
+
+        client.post("/api/styles", json=[{"name": "casual", "description": "Неформальный"}])
+
+        response = client.get("/api/styles", params={"since": version})
+        assert response.status_code == 200
+        delta = response.json()
+        assert delta["full"] is False
+        assert delta["styles"] == {"casual": "Неформальный"}
+        assert delta["removed"] == []
+        assert delta["version"] > version
+
+    def test_since_reports_removed_styles_after_external_edit(self):
+        """Проверяет, что правка файла стилей вне API замечается и удалённые стили попадают в дельту."""
+        client.post("/api/styles", json=[
+            {"name": "formal", "description": "Официальный"},
+            {"name": "casual", "description": "Неформальный"}
+        ])
+        version = int(client.get("/api/styles").headers["X-Styles-Version"])
+
+        save_styles({"formal": "Официальный"})
+
+        delta = client.get("/api/styles", params={"since": version}).json()
+        assert delta["styles"] == {}
+        assert delta["removed"] == ["casual"]
+
+    def test_since_before_known_history_returns_full_list(self):
+        """Проверяет, что для неизвестной истории изменений возвращается полный список."""
+        client.post("/api/styles", json=[{"name": "formal", "description": "Официальный"}])
+
+        delta = client.get("/api/styles", params={"since": 0}).json()
+        assert delta["full"] is True
+        assert delta["styles"] == {"formal": "Официальный"}
+
+
+class TestStylesCatalogPaging:
+    """Тесты постраничного вывода, поиска, выгрузки и загрузки стилей"""
+
+    def test_pages_follow_cursor_in_case_insensitive_order(self):
+        """Проверяет обход каталога по курсору: стили, добавленные между страницами, не дают пропусков и повторов."""
+        client.post("/api/styles", json=[
+            {"name": name, "description": name.lower()} for name in ["delta", "Alpha", "charlie", "Bravo", "echo"]
+        ])
+
+        first = client.get("/api/styles", params={"limit": 2}).json()
+        assert [style["name"] for style in first["styles"]] == ["Alpha", "Bravo"]
+        assert first["styles"][0]["description"] == "alpha"
+
+        client.post("/api/styles", json=[{"name": "Aardvark", "description": "раньше курсора"},
+                                         {"name": "Cobra", "description": "после курсора"}])
+        names = []
+        cursor = first["next_cursor"]
+        while cursor is not None:
+            page = client.get("/api/styles", params={"limit": 2, "cursor": cursor}).json()
+            names += [style["name"] for style in page["styles"]]
+            cursor = page["next_cursor"]
+        assert names == ["charlie", "Cobra", "delta", "echo"]
+
+        assert client.get("/api/styles", params={"cursor": "не курсор!"}).status_code == 400
+
+    def test_prefix_and_substring_search_ignore_case(self):
+        """Проверяет поиск по префиксу и подстроке имени без учёта регистра."""
+        client.post("/api/styles", json=[
+            {"name": name, "description": "-"} for name in ["Научный доклад", "научно-популярный", "Деловой", "Ненаучный"]
+        ])
+
+        prefix = client.get("/api/styles", params={"prefix": "НАУЧ"}).json()
+        assert [style["name"] for style in prefix["styles"]] == ["научно-популярный", "Научный доклад"]
+
+        contains = client.get("/api/styles", params={"q": "аучн"}).json()
+        assert [style["name"] for style in contains["styles"]] == ["научно-популярный", "Научный доклад", "Ненаучный"]
+
+        client.put("/api/styles", json={"name": "Деловой", "description": "Строгий"})
+        combined = client.get("/api/styles", params={"prefix": "не", "q": "НАУЧНЫЙ"}).json()
+        assert [style["name"] for style in combined["styles"]] == ["Ненаучный"]
+        assert combined["next_cursor"] is None
+
+    def test_search_index_matches_full_scan(self):
+        """Проверяет, что поиск через индекс совпадает с полным перебором, в том числе после удалений."""
+        generator = random.Random(7)
+        names = {"".join(generator.choice("abcAB") for _ in range(generator.randint(1, 8))) for _ in range(400)}
+        index = StyleIndex(names)
+        for name in generator.sample(sorted(names), 50):
+            index.remove(name)
+            names.discard(name)
+        index.add("ZZ-abcab")
+        names.add("ZZ-abcab")
+
+        for query in ["abc", "bab", "aaaa", "cba", "zz-", "b"]:
+            expected = sorted((name for name in names if query in name.casefold()), key=lambda name: (name.casefold(), name))
+            found, after = [], None
+            while True:
+                page, more = index.page(7, after=after, contains=query)
+                found += page
+                if not more:
+                    break
+                after = page[-1]
+            assert found == expected
+
+    def test_import_export_round_trip(self):
+        """Проверяет загрузку JSONL с разрешением конфликтов, ошибку в строке и выгрузку."""
+        client.post("/api/styles", json=[{"name": "formal", "description": "Официальный"}])
+        body = "\n".join(json.dumps({"name": name, "description": description}, ensure_ascii=False) for name, description in [
+            ("formal", "Строгий"), ("casual", "Неформальный"), ("Epic", "Эпический")
+        ]) + "\n"
+
+        conflict = client.post("/api/styles/import", content=body.encode("utf-8"))
+        assert conflict.status_code == 400
+        bad_line = client.post("/api/styles/import", content=body + '{"name": "broken"}')
+        assert bad_line.status_code == 400
+        assert "Строка 4" in bad_line.json()["detail"]
+
+        response = client.post("/api/styles/import", params={"on_conflict": "skip"}, content=body.encode("utf-8"))
+        assert response.status_code == 200
+        imported = response.json()
+        assert (imported["added"], imported["updated"], imported["skipped"]) == (2, 0, 1)
+
+        replaced = client.post("/api/styles/import", params={"on_conflict": "replace"}, content=body.encode("utf-8")).json()
+        assert (replaced["updated"], replaced["skipped"]) == (1, 2)
+
+        exported = client.get("/api/styles/export")
+        assert exported.headers["content-type"] == "application/x-ndjson"
+        assert exported.headers["X-Styles-Version"] == str(replaced["version"])
+        assert [json.loads(line) for line in exported.text.splitlines()] == [
+            {"name": "casual", "description": "Неформальный"},
+            {"name": "Epic", "description": "Эпический"},
+            {"name": "formal", "description": "Строгий"}
+        ]
+
+
+class TestSaveStyles:
+    """Тесты записи файла стилей"""
+
+    def test_save_replaces_file_atomically(self, tmp_path, monkeypatch):
+        """Проверяет, что запись заменяет файл целиком, а сбой записи оставляет прежний файл без изменений."""
+        path = tmp_path / "speech_styles.json"
+        monkeypatch.setattr(utils, "STYLES_FILE", str(path))
+        atomic_save_styles({"formal": "Официальный"})
+        path.chmod(0o640)
+
+        atomic_save_styles({"formal": "Официальный", "casual": "Неформальный"})
+        assert json.loads(path.read_text(encoding="utf-8")) == {"formal": "Официальный", "casual": "Неформальный"}
+        assert path.stat().st_mode & 0o777 == 0o640
+
+        def fail(*args):
+            raise OSError("диск заполнен")
+
+        monkeypatch.setattr(utils.os, "replace", fail)
+        with pytest.raises(OSError):
+            atomic_save_styles({"formal": "Обрезанный"})
+        assert json.loads(path.read_text(encoding="utf-8"))["formal"] == "Официальный"
+        assert [file.name for file in tmp_path.iterdir()] == ["speech_styles.json"]
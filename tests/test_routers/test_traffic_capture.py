@@ -0,0 +1,96 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import ai.serving_parameters as serving_parameters
+from main import app
+from replay_cli import compare, load_capture, replay
+from traffic_capture import close_recorder, sanitize_request
+from utils import parse_speech_requests
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def capture_path(tmp_path, monkeypatch):
+    """Фикстура включает запись трафика во временный файл"""
+    path = tmp_path / "captures" / "requests.jsonl"
+    monkeypatch.setattr(serving_parameters, "capture_enabled", True)
+    monkeypatch.setattr(serving_parameters, "capture_path", str(path))
+    yield path
+    close_recorder()
+
+
+class TestTrafficCapture:
+    """Тесты записи трафика генерации и его воспроизведения"""
+
+    def test_sanitize_keeps_shape(self, sample_speech_request):
+        """Проверяет, что из запроса удаляются контакты, а параметры нагрузки сохраняются."""
+        request = sample_speech_request.model_copy(update={
+            "topic": "Юбилей Ивана, пишите на ivan.petrov@example.com",
+            "key_points": ["Звоните +7 (912) 345-67-89", "Сайт https://example.com/about"],
+            "custom_instructions": "Номер договора 12345678"
+        })
+
+        sanitized = sanitize_request(request)
+
+        assert sanitized.topic == "Юбилей Ивана, пишите на [email]"
+        assert sanitized.key_points == ["Звоните [phone]", "Сайт [url]"]
+        assert sanitized.custom_instructions == "Номер договора [number]"
+        assert (sanitized.style, sanitized.duration_minutes, sanitized.language) == (
+            request.style, request.duration_minutes, request.language
+        )
+
+    def test_capture_records_requests_jsonl(self, capture_path, sample_speech_request, mock_speech_generator):
+        """Проверяет, что запись содержит запрос в формате requests.jsonl, время поступления и задержку."""
+        client.post("/api/model/generate_speech", json=sample_speech_request.model_dump())
+        client.post("/api/model/generate_speech_stream", json=sample_speech_request.model_dump())
+        client.post("/api/model/generate_speech", json={"topic": "Без длительности"})
+        close_recorder()
+
+        lines = capture_path.read_text(encoding="utf-8").splitlines()
+        assert len(lines) == 2
+        assert parse_speech_requests(lines)[0] == sample_speech_request
+        entries = [json.loads(line) for line in lines]
+        assert [entry["endpoint"] for entry in entries] == [
+            "/api/model/generate_speech", "/api/model/generate_speech_stream"
+        ]
+        assert all(entry["status"] == 200 for entry in entries)
+        assert all(0 <= entry["ttfb_ms"] <= entry["latency_ms"] for entry in entries)
+        assert entries[0]["captured_at"] <= entries[1]["captured_at"]
+
+    def test_capture_disabled_by_default(self, tmp_path, monkeypatch, sample_speech_request, mock_speech_generator):
+        """Проверяет, что без capture_enabled файл записи не создаётся."""
+        monkeypatch.setattr(serving_parameters, "capture_path", str(tmp_path / "requests.jsonl"))
+        client.post("/api/model/generate_speech", json=sample_speech_request.model_dump())
+        assert not (tmp_path / "requests.jsonl").exists()
+
+    def test_replay_scales_timing_and_compares(self, tmp_path, sample_speech_request, mock_speech_generator):
+        """Проверяет, что воспроизведение ускоряет интервалы в speed раз и сравнивается с записью."""
+        capture = tmp_path / "capture.jsonl"
+        with open(capture, "w", encoding="utf-8") as f:
+            for offset in (0.4, 0.0, 0.2):
+                entry = sample_speech_request.model_dump(exclude_none=True)
+                entry.update({"captured_at": 1000 + offset, "latency_ms": 50.0, "status": 200,
+                              "endpoint": "/api/model/generate_speech"})
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+        captured = load_capture([str(capture)])
+
+        async def run():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as async_client:
+                return await replay(captured, async_client, speed=2)
+
+        results = asyncio.run(run())
+        report = compare(captured, results)
+
+        assert [item.captured_at for item in captured] == [1000.0, 1000.2, 1000.4]
+        assert all(result.status == 200 for result in results)
+        assert [round(result.sent_at, 1) for result in results] == [0.0, 0.1, 0.2]
+        assert report["recorded"]["requests"] == report["replay"]["requests"] == 3
+        assert report["recorded"]["latency_p50_ms"] == 50.0
+        assert report["replay"]["throughput_rps"] > 0
@@ -0,0 +1,113 @@
+"""
+Длительный тест утечек памяти генерации.
+
+Запускается только с --soak (параметры объявлены в tests/conftest.py):
+    python -m pytest tests/test_soak --soak --soak-generations 500 -s
+
+Маленькая модель со случайными весами и посимвольным токенизатором
+собирается во временном каталоге, после чего выполняется --soak-generations
+генераций всех видов: одиночные, батчи, потоковые, с несколькими вариантами
+и структурные. Первые WARMUP_GENERATIONS генераций (или пятая часть, если
+генераций больше) считаются прогревом: пулы аллокатора и кэши растут до
+установившегося размера несколько десятков генераций, и RSS за это время
+прибавляет десятки мегабайт без всякой утечки. Прогрев в оценку не входит.
+
+Главный признак утечки - рост живых тензоров после генераций: он считается
+точно и от шума аллокатора не зависит. Дополнительно тест падает, если RSS
+после прогрева по наклону тренда вырастает больше чем на --soak-max-growth-mb.
+"""
+
+import string
+
+import pytest
+import torch
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers
+from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+
+import ai.model_parameters as model_parameters
+import ai.serving_parameters as serving_parameters
+from ai.memory import linear_trend
+from ai.speech_generator import SpeechGenerator
+from schemas.model import SpeechRequest
+
+STYLES = {"formal": "Формальный стиль выступления", "casual": "Неформальный стиль выступления"}
+# Наименьший прогрев: столько генераций RSS растёт до установившегося размера
+WARMUP_GENERATIONS = 30
+ALPHABET = string.printable + "абвгдеёжзийклмнопрстуфхцчшщъыьэюяАБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ—«»"
+
+
+@pytest.fixture(scope="module")
+def tiny_model_dir(request, tmp_path_factory):
+    """Фикстура: маленькая модель с посимвольным токенизатором в формате from_pretrained"""
+    if not request.config.getoption("--soak"):
+        pytest.skip("тест утечек памяти запускается с --soak")
+    path = tmp_path_factory.mktemp("soak_model")
+    vocab = {"<unk>": 0, "<pad>": 1, "<s>": 2, "</s>": 3}
+    for char in ALPHABET:
+        vocab.setdefault(char, len(vocab))
+    tokenizer = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Split("", "isolated")
+    tokenizer.decoder = decoders.Fuse()
+    PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer, unk_token="<unk>", pad_token="<pad>", bos_token="<s>", eos_token="</s>"
+    ).save_pretrained(path)
+    torch.manual_seed(0)
+    config = LlamaConfig(
+        vocab_size=len(vocab), hidden_size=64, intermediate_size=128, num_hidden_layers=2, num_attention_heads=4,
+        num_key_value_heads=4, max_position_embeddings=4096, bos_token_id=2, eos_token_id=3, pad_token_id=1
+    )
+    LlamaForCausalLM(config).save_pretrained(path)
+    return str(path)
+
+
+def generate(generator: SpeechGenerator, step: int):
+    """Одна генерация; вид генерации чередуется по номеру шага."""
+    request = SpeechRequest(topic=f"Тема номер {step}", duration_minutes=1 + step % 5, style=("formal", "casual")[step % 2])
+    kind = step % 5
+    if kind == 0:
+        generator.generate_batch([request.model_copy(update={"topic": f"Тема {index}"}) for index in range(4)], STYLES)
+    elif kind == 1:
+        generator.generate_speech(request, STYLES, on_text=lambda text: None)
+    elif kind == 2:
+        generator.generate_speech(request.model_copy(update={"n": 2}), STYLES)
+    elif kind == 3:
+        generator.generate_speech(request.model_copy(update={"structured": True}), STYLES)
+    else:
+        generator.generate_speech(request, STYLES)
+
+
+class TestMemorySoak:
+    """Длительный тест удержания памяти между генерациями"""
+
+    def test_retained_memory_does_not_trend_upward(self, tiny_model_dir, request, monkeypatch):
+        """Тест: после прогрева живые тензоры не растут, а RSS не растёт заметно от генерации к генерации"""
+
+        generations = request.config.getoption("--soak-generations")
+        warmup = max(generations // 5, WARMUP_GENERATIONS)
+        if generations < 2 * warmup:
+            pytest.fail(f"для оценки тренда после прогрева нужно не меньше {2 * warmup} генераций, задано {generations}")
+        max_growth_bytes = request.config.getoption("--soak-max-growth-mb") * 1024 ** 2
+        monkeypatch.setattr(model_parameters, "max_new_tokens", 16)
+        monkeypatch.setattr(serving_parameters, "outline_max_new_tokens", 8)
+        monkeypatch.setattr(serving_parameters, "memory_accounting", True)
+        monkeypatch.setattr(serving_parameters, "memory_count_tensors", True)
+        monkeypatch.setattr(serving_parameters, "memory_history_size", generations)
+
+        generator = SpeechGenerator(tiny_model_dir)
+        generator.device = "cpu"
+        generator.load_model()
+        for step in range(generations):
+            generate(generator, step)
+
+        records = generator.memory.records[warmup:]
+        rss_growth = linear_trend([record.rss_after_bytes for record in records]) * len(records)
+        tensor_growth = records[-1].tensor_bytes - records[0].tensor_bytes
+        peak = max(record.peak_rss_bytes - record.rss_before_bytes for record in records)
+        print(
+            f"\nГенераций: {generations}, прогрев {warmup}, после прогрева рост RSS по тренду "
+            f"{rss_growth / 1024 ** 2:+.2f} МБ, тензоров {tensor_growth / 1024 ** 2:+.2f} МБ, "
+            f"наибольший пик генерации +{peak / 1024 ** 2:.1f} МБ"
+        )
+        assert len(generator.memory.records) == generations
+        assert tensor_growth <= 0, "живые тензоры удерживаются между генерациями"
+        assert rss_growth <= max_growth_bytes, "RSS растёт от генерации к генерации"
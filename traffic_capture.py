@@ -0,0 +1,197 @@
+"""
+Модуль записи реального трафика генерации для последующего воспроизведения.
+
+Если включён capture_enabled (ai/serving_parameters.py), CaptureMiddleware
+записывает каждый запрос к эндпоинтам генерации строкой JSONL: поля
+SpeechRequest, как в файлах пакетной генерации, и служебные поля
+- captured_at: время поступления запроса (Unix time, секунды);
+- latency_ms: время до отправки последнего байта ответа;
+- ttfb_ms: время до первого байта ответа;
+- status: код ответа;
+- endpoint: путь эндпоинта.
+SpeechRequest игнорирует лишние поля, поэтому файл записи принимают
+batch_cli.py и /api/jobs без преобразования, а replay_cli.py воспроизводит
+его с исходными интервалами между запросами.
+
+Перед записью из текстовых полей удаляются адреса почты, ссылки, телефоны
+и длинные числа. Запись выполняется в отдельном потоке, файл ротируется
+по размеру capture_max_bytes.
+"""
+
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import threading
+import time
+from typing import Optional
+
+from pydantic import ValidationError
+
+from schemas.model import SpeechRequest
+import ai.serving_parameters as serving_parameters
+
+CAPTURED_PATHS = ("/api/model/generate_speech", "/api/model/generate_speech_stream")
+
+_REDACTIONS = (
+    (re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+"), "[email]"),
+    (re.compile(r"(?:https?://|www\.)\S+", re.IGNORECASE), "[url]"),
+    (re.compile(r"\+?\d[\d\s()-]{8,}\d"), "[phone]"),
+    (re.compile(r"\d{6,}"), "[number]"),
+)
+
+
+def sanitize_text(text: str) -> str:
+    """Заменяет в тексте адреса почты, ссылки, телефоны и длинные числа метками."""
+    for pattern, label in _REDACTIONS:
+        text = pattern.sub(label, text)
+    return text
+
+
+def sanitize_request(request: SpeechRequest) -> SpeechRequest:
+
+    """
+    Удаляет из запроса персональные данные, сохраняя его форму.
+
+    Стиль, язык, длительность, количество ключевых моментов и флаги не меняются,
+    поэтому записанный трафик сохраняет реальную смесь нагрузки.
+
+    Args:
+        request (SpeechRequest): Запрос клиента.
+
+    Returns:
+        SpeechRequest: Копия запроса с очищенными темой, ключевыми моментами
+            и дополнительными требованиями.
+    """
+
+    return request.model_copy(update={
+        "topic": sanitize_text(request.topic),
+        "key_points": [sanitize_text(point) for point in request.key_points] if request.key_points else request.key_points,
+        "custom_instructions": (
+            sanitize_text(request.custom_instructions) if request.custom_instructions else request.custom_instructions
+        )
+    })
+
+
+class TrafficRecorder:
+
+    """
+    Запись строк JSONL в ротируемый файл из отдельного потока.
+
+    Обработчик запросов только кладёт строку в очередь, а файл пишет
+    QueueListener, поэтому цикл событий не ждёт диска.
+    """
+
+    def __init__(self, path: str, max_bytes: int, backup_count: int):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._queue = queue.SimpleQueue()
+        self._file_handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+        )
+        self._file_handler.setFormatter(logging.Formatter("%(message)s"))
+        self._listener = logging.handlers.QueueListener(self._queue, self._file_handler)
+        self._listener.start()
+        self.path = path
+
+    def record(self, entry: dict):
+        """Ставит запись в очередь на запись в файл."""
+        self._queue.put_nowait(logging.makeLogRecord({"msg": json.dumps(entry, ensure_ascii=False)}))
+
+    def close(self):
+        """Дописывает очередь в файл и закрывает его."""
+        self._listener.stop()
+        self._file_handler.close()
+
+
+_recorder: Optional[TrafficRecorder] = None
+_recorder_lock = threading.Lock()
+
+
+def get_recorder() -> TrafficRecorder:
+    """Возвращает общий TrafficRecorder, открывая файл capture_path при первой записи."""
+    global _recorder
+    with _recorder_lock:
+        if _recorder is None:
+            _recorder = TrafficRecorder(
+                serving_parameters.capture_path,
+                serving_parameters.capture_max_bytes,
+                serving_parameters.capture_backup_count
+            )
+            print(f'Запись трафика генерации в {serving_parameters.capture_path}')
+        return _recorder
+
+
+def close_recorder():
+    """Закрывает файл записи трафика, если он был открыт."""
+    global _recorder
+    with _recorder_lock:
+        if _recorder is not None:
+            _recorder.close()
+            _recorder = None
+
+
+class CaptureMiddleware:
+
+    """
+    ASGI-middleware записи запросов генерации с временем поступления и задержкой.
+
+    Тело запроса копируется по мере чтения приложением, запись делается после
+    отправки последнего фрагмента ответа. Некорректные запросы (422) не
+    записываются: воспроизводить их бессмысленно.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not serving_parameters.capture_enabled
+            or scope["method"] != "POST"
+            or scope["path"] not in CAPTURED_PATHS
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        captured_at = time.time()
+        started = time.perf_counter()
+        body = bytearray()
+        status = None
+        first_byte = None
+
+        async def receive_captured():
+            message = await receive()
+            if message["type"] == "http.request":
+                body.extend(message.get("body", b""))
+            return message
+
+        async def send_captured(message):
+            nonlocal status, first_byte
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                if first_byte is None:
+                    first_byte = time.perf_counter()
+                if not message.get("more_body", False):
+                    self._record(bytes(body), scope["path"], status, captured_at, started, first_byte)
+            await send(message)
+
+        await self.app(scope, receive_captured, send_captured)
+
+    @staticmethod
+    def _record(body: bytes, path: str, status: int, captured_at: float, started: float, first_byte: float):
+        try:
+            request = SpeechRequest.model_validate_json(body)
+        except ValidationError:
+            return
+        entry = sanitize_request(request).model_dump(exclude_none=True)
+        entry.update({
+            "captured_at": round(captured_at, 3),
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+            "ttfb_ms": round((first_byte - started) * 1000, 1),
+            "status": status,
+            "endpoint": path
+        })
+        get_recorder().record(entry)
@@ -4,10 +4,20 @@
 Этот модуль предоставляет функции для загрузки и сохранения стилей выступлений
 в формате JSON. Стили хранятся в файле `speech_styles.json` и представляют собой
 словарь, где ключ - название стиля, а значение - его описание.
+
+Также содержит разбор JSONL-файлов с запросами на генерацию речей.
 """
 
 import json
-from typing import Dict
+import os
+import stat
+import tempfile
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pydantic_core
+from pydantic import ValidationError
+
+from schemas.model import SpeechRequest
 
 # Константа с именем файла для хранения стилей
 STYLES_FILE = "speech_styles.json"
@@ -34,7 +44,7 @@ def load_styles() -> Dict[str, str]:
         Файл должен быть в формате JSON и содержать словарь строк.
     """
     try:
-        with open(STYLES_FILE, 'r') as f:
+        with open(STYLES_FILE, 'r', encoding='utf-8') as f:
             return json.load(f)
     except FileNotFoundError:
         return {}
@@ -58,8 +68,78 @@ def save_styles(styles: Dict[str, str]):
         >>> save_styles(styles)
 
     Note:
-        Файл будет перезаписан, если существует. Создается с отступами в 4 пробела.
+        Файл будет перезаписан, если существует. Создается с отступами в 4 пробела
+        в кодировке UTF-8; сериализация выполняется pydantic-core на стороне Rust,
+        поэтому перезапись каталога из десятков тысяч стилей занимает миллисекунды.
+        Стили записываются во временный файл в том же каталоге, который затем
+        атомарно заменяет прежний: ни падение процесса посреди записи, ни
+        одновременное чтение не видят обрезанный файл.
+    """
+
+    path = os.path.abspath(STYLES_FILE)
+    descriptor, temp_path = tempfile.mkstemp(prefix=".speech_styles.", suffix=".tmp", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(descriptor, 'wb') as f:
+            f.write(pydantic_core.to_json(styles, indent=4))
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp создаёт файл с правами 0600, новый файл получает права прежнего
+        try:
+            os.chmod(temp_path, stat.S_IMODE(os.stat(path).st_mode))
+        except FileNotFoundError:
+            os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def styles_file_signature() -> Optional[Tuple[int, int, int]]:
+
+    """
+    Возвращает сигнатуру файла стилей для проверки его изменения без чтения.
+
+    Returns:
+        Optional[Tuple[int, int, int]]: Время изменения в наносекундах, размер
+            и inode файла или None, если файла нет.
+    """
+
+    try:
+        stat = os.stat(STYLES_FILE)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def parse_speech_requests(lines: Iterable[str]) -> List[SpeechRequest]:
+
+    """
+    Разбирает JSONL с запросами на генерацию речей.
+
+    Каждая непустая строка должна содержать JSON-объект SpeechRequest.
+    Пустые строки пропускаются.
+
+    Args:
+        lines (Iterable[str]): Строки JSONL-файла.
+
+    Returns:
+        List[SpeechRequest]: Запросы в порядке следования в файле.
+
+    Raises:
+        ValueError: Если строка не является корректным SpeechRequest.
+            В сообщении указывается номер строки (с единицы).
+
+    Example:
+        >>> parse_speech_requests(['{"topic": "Выпускной", "duration_minutes": 3}'])[0].topic
+        'Выпускной'
     """
 
-    with open(STYLES_FILE, 'w') as f:
-        json.dump(styles, f, indent=4)
+    requests = []
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            requests.append(SpeechRequest.model_validate_json(line))
+        except ValidationError as e:
+            raise ValueError(f"Строка {line_number}: некорректный запрос: {e}") from e
+    return requests